@@ -0,0 +1,225 @@
+#include "aggregate.h"
+#include "storage.h"
+#include "index.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+#include <math.h>
+
+/*
+ * Агрегация с группировкой хешированием: ключ группы ищется в таблице
+ * с открытой адресацией (хранит номер группы), аккумуляторы групп лежат
+ * в непрерывных массивах и растут удвоением.
+ */
+
+typedef struct {
+    int* slots;          // номер группы или -1
+    unsigned int* hashes;
+    int capacity;        // степень двойки
+} GroupMap;
+
+static DataValue group_key(const Table* table, int slot, int col) {
+    DataValue key = storage_get(table, slot, col);
+    if (table->columns[col].type == TYPE_STRING && !key.s) {
+        key.s = "";  // NULL группируется вместе с пустой строкой
+    }
+    return key;
+}
+
+static int group_map_init(GroupMap* map, int capacity) {
+    map->slots = (int*)malloc(capacity * sizeof(int));
+    map->hashes = (unsigned int*)malloc(capacity * sizeof(unsigned int));
+    if (!map->slots || !map->hashes) {
+        free(map->slots);
+        free(map->hashes);
+        return -1;
+    }
+    for (int i = 0; i < capacity; i++) {
+        map->slots[i] = -1;
+    }
+    map->capacity = capacity;
+    return 0;
+}
+
+static int group_map_grow(GroupMap* map) {
+    GroupMap bigger;
+    if (group_map_init(&bigger, map->capacity * 2) != 0) return -1;
+    unsigned int mask = (unsigned int)bigger.capacity - 1;
+    for (int i = 0; i < map->capacity; i++) {
+        if (map->slots[i] < 0) continue;
+        unsigned int pos = map->hashes[i] & mask;
+        while (bigger.slots[pos] >= 0) pos = (pos + 1) & mask;
+        bigger.slots[pos] = map->slots[i];
+        bigger.hashes[pos] = map->hashes[i];
+    }
+    free(map->slots);
+    free(map->hashes);
+    *map = bigger;
+    return 0;
+}
+
+typedef struct {
+    AggResult* result;
+    int capacity;        // ёмкость массивов групп
+    int* first_slot;     // слот первой строки группы (для сравнения ключей)
+} Groups;
+
+static int groups_add(Groups* g, int slot, int row_id) {
+    AggResult* r = g->result;
+    if (r->num_groups >= g->capacity) {
+        int cap = g->capacity * 2;
+        int* ids = (int*)realloc(r->key_row_ids, cap * sizeof(int));
+        if (ids) r->key_row_ids = ids;
+        int* counts = (int*)realloc(r->counts, cap * sizeof(int));
+        if (counts) r->counts = counts;
+        double* values = (double*)realloc(r->values, (size_t)cap * r->num_aggs * sizeof(double));
+        if (values) r->values = values;
+        int* value_counts = (int*)realloc(r->value_counts, (size_t)cap * r->num_aggs * sizeof(int));
+        if (value_counts) r->value_counts = value_counts;
+        int* first = (int*)realloc(g->first_slot, cap * sizeof(int));
+        if (first) g->first_slot = first;
+        if (!ids || !counts || !values || !value_counts || !first) return -1;
+        g->capacity = cap;
+    }
+    int group = r->num_groups++;
+    r->key_row_ids[group] = row_id;
+    r->counts[group] = 0;
+    g->first_slot[group] = slot;
+    for (int k = 0; k < r->num_aggs; k++) {
+        r->values[(size_t)group * r->num_aggs + k] = 0.0;
+        r->value_counts[(size_t)group * r->num_aggs + k] = 0;
+    }
+    return group;
+}
+
+API void free_agg_result(AggResult* result) {
+    if (!result) return;
+    free(result->key_row_ids);
+    free(result->counts);
+    free(result->values);
+    free(result->value_counts);
+    free(result);
+}
+
+static double numeric_value(const Table* table, int slot, int col) {
+    DataValue v = storage_get(table, slot, col);
+    return table->columns[col].type == TYPE_INT ? (double)v.i : (double)v.f;
+}
+
+API AggResult* aggregate_table(Table* table, int group_col, const int* agg_cols, const int* ops,
+                               int num_aggs, const unsigned char* mask) {
+    if (!table || num_aggs < 0 || (num_aggs > 0 && (!agg_cols || !ops)) ||
+        group_col < -1 || group_col >= table->num_columns) {
+        return NULL;
+    }
+    for (int k = 0; k < num_aggs; k++) {
+        if (ops[k] < AGG_COUNT || ops[k] > AGG_AVG) {
+            fprintf(stderr, "aggregate_table: неизвестная функция %d\n", ops[k]);
+            return NULL;
+        }
+        if (ops[k] == AGG_COUNT) continue;
+        if (agg_cols[k] < 0 || agg_cols[k] >= table->num_columns ||
+            table->columns[agg_cols[k]].type == TYPE_STRING) {
+            fprintf(stderr, "aggregate_table: столбец %d не числовой\n", agg_cols[k]);
+            return NULL;
+        }
+    }
+    if (group_col >= 0 && storage_readable(table, group_col) != 0) {
+        return NULL;
+    }
+
+    AggResult* r = (AggResult*)calloc(1, sizeof(AggResult));
+    Groups g = { r, 16, NULL };
+    GroupMap map = { NULL, NULL, 0 };
+    if (!r) return NULL;
+    r->num_aggs = num_aggs;
+    r->key_row_ids = (int*)malloc(g.capacity * sizeof(int));
+    r->counts = (int*)malloc(g.capacity * sizeof(int));
+    r->values = (double*)malloc((size_t)g.capacity * (num_aggs > 0 ? num_aggs : 1) * sizeof(double));
+    r->value_counts = (int*)malloc((size_t)g.capacity * (num_aggs > 0 ? num_aggs : 1) * sizeof(int));
+    g.first_slot = (int*)malloc(g.capacity * sizeof(int));
+    if (!r->key_row_ids || !r->counts || !r->values || !r->value_counts || !g.first_slot ||
+        (group_col >= 0 && group_map_init(&map, 64) != 0)) {
+        goto fail;
+    }
+    if (group_col < 0 && groups_add(&g, -1, -1) < 0) {
+        goto fail;
+    }
+
+    int key_type = group_col >= 0 ? table->columns[group_col].type : TYPE_INT;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        if (table->deleted[slot] || (mask && !mask[slot])) continue;
+
+        int group = 0;
+        if (group_col >= 0) {
+            DataValue key = group_key(table, slot, group_col);
+            unsigned int hash = value_hash(key_type, key);
+            unsigned int bits = (unsigned int)map.capacity - 1;
+            unsigned int pos = hash & bits;
+            group = -1;
+            while (map.slots[pos] >= 0) {
+                int candidate = map.slots[pos];
+                if (map.hashes[pos] == hash &&
+                    values_equal(key_type, group_key(table, g.first_slot[candidate], group_col), key)) {
+                    group = candidate;
+                    break;
+                }
+                pos = (pos + 1) & bits;
+            }
+            if (group < 0) {
+                group = groups_add(&g, slot, table->row_ids[slot]);
+                if (group < 0) goto fail;
+                map.slots[pos] = group;
+                map.hashes[pos] = hash;
+                if (r->num_groups * 4 > map.capacity * 3 && group_map_grow(&map) != 0) goto fail;
+            }
+        } else if (r->key_row_ids[0] < 0) {
+            r->key_row_ids[0] = table->row_ids[slot];
+        }
+
+        r->counts[group]++;
+        double* acc = &r->values[(size_t)group * num_aggs];
+        int* seen = &r->value_counts[(size_t)group * num_aggs];
+        for (int k = 0; k < num_aggs; k++) {
+            if (ops[k] == AGG_COUNT) {
+                seen[k]++;
+                continue;
+            }
+            double x = numeric_value(table, slot, agg_cols[k]);
+            if (isnan(x)) continue;  // отсутствующее значение
+            int n = ++seen[k];
+            switch (ops[k]) {
+                case AGG_SUM:
+                case AGG_AVG: acc[k] += x; break;
+                case AGG_MIN: if (n == 1 || x < acc[k]) acc[k] = x; break;
+                case AGG_MAX: if (n == 1 || x > acc[k]) acc[k] = x; break;
+            }
+        }
+    }
+
+    // Итоговые значения
+    for (int group = 0; group < r->num_groups; group++) {
+        double* acc = &r->values[(size_t)group * num_aggs];
+        const int* seen = &r->value_counts[(size_t)group * num_aggs];
+        for (int k = 0; k < num_aggs; k++) {
+            if (ops[k] == AGG_COUNT) {
+                acc[k] = r->counts[group];
+            } else if (ops[k] == AGG_AVG && seen[k]) {
+                acc[k] /= seen[k];
+            }
+        }
+    }
+
+    free(map.slots);
+    free(map.hashes);
+    free(g.first_slot);
+    return r;
+
+fail:
+    fprintf(stderr, "Ошибка выделения памяти для агрегации\n");
+    free(map.slots);
+    free(map.hashes);
+    free(g.first_slot);
+    free_agg_result(r);
+    return NULL;
+}
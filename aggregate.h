@@ -0,0 +1,39 @@
+#ifndef AGGREGATE_H
+#define AGGREGATE_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+typedef enum {
+    AGG_COUNT,
+    AGG_SUM,
+    AGG_MIN,
+    AGG_MAX,
+    AGG_AVG
+} AggOp;
+
+/*
+ * Результат агрегации: num_groups групп по num_aggs значений.
+ * key_row_ids[g] - идентификатор первой строки группы (по нему читается
+ * значение ключа), counts[g] - число строк в группе,
+ * values[g * num_aggs + k] - значение k-й агрегатной функции,
+ * value_counts[g * num_aggs + k] - сколько значений в неё вошло.
+ * NaN в вещественном столбце - отсутствующее значение: SUM, MIN, MAX и AVG
+ * его пропускают, COUNT считает строки. Если значений нет, MIN, MAX и AVG
+ * не определены (value_counts = 0, values = 0), SUM равна 0.
+ */
+typedef struct {
+    int num_groups;
+    int num_aggs;
+    int* key_row_ids;
+    int* counts;
+    double* values;
+    int* value_counts;
+} AggResult;
+
+// group_col = -1 - без группировки (ровно одна группа);
+// mask - необязательная маска строк из scan_column (NULL - все строки)
+API AggResult* aggregate_table(Table* table, int group_col, const int* agg_cols, const int* ops,
+                               int num_aggs, const unsigned char* mask);
+API void free_agg_result(AggResult* result);
+
+#endif // AGGREGATE_H
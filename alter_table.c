@@ -1,10 +1,14 @@
 #include "alter_table.h"
+#include "snapshot.h"
+#include "storage.h"
+#include "index.h"
 #include <stdlib.h>
 #include <string.h>
 #include <stdio.h>
 
-API int add_column(Table* table, const char* col_name, int new_type, DataValue default_value) {
+static int add_column_locked(Table* table, const char* col_name, int new_type, DataValue default_value) {
     if (!table || !col_name) return -1;
+    if (storage_writable(table) != 0) return -1;  // до изменения массива столбцов
 
     int old_cols = table->num_columns;
     int new_cols = old_cols + 1;
@@ -34,31 +38,14 @@ API int add_column(Table* table, const char* col_name, int new_type, DataValue d
     table->columns = new_columns;
     table->num_columns = new_cols;
     
-    // Перераспределяем массив значений для каждой строки
-    for (int i = 0; i < table->num_rows; i++) {
-         DataValue* old_values = table->rows[i].values;
-         DataValue* new_values = (DataValue*)malloc(new_cols * sizeof(DataValue));
-         if (!new_values) {
-              fprintf(stderr, "add_column: Ошибка выделения памяти для значений строки %d\n", i);
-              return -1;
-         }
-         // Копируем старые значения
-         for (int j = 0; j < old_cols; j++){
-              new_values[j] = old_values[j];
-         }
-         // Устанавливаем значение по умолчанию для нового столбца
-         if (new_type == TYPE_STRING) {
-              if (default_value.s != NULL) {
-                  new_values[old_cols].s = strdup(default_value.s);
-              } else {
-                  new_values[old_cols].s = NULL;
-              }
-         } else {
-              new_values[old_cols] = default_value;
-         }
-         
-         free(old_values);
-         table->rows[i].values = new_values;
+    // Перераспределяем данные строк (или добавляем массив столбца) и
+    // устанавливаем значение по умолчанию для нового столбца
+    if (storage_add_column(table, new_type, default_value) != 0) {
+         return -1;
+    }
+    if (table_index_add_column(table) != 0) {
+         fprintf(stderr, "add_column: Ошибка выделения памяти для индексов\n");
+         return -1;
     }
     // Обновляем индексы внешних ключей (если есть)
     if (table->num_foreign_keys > 0 && table->foreign_keys != NULL) {
@@ -72,11 +59,20 @@ API int add_column(Table* table, const char* col_name, int new_type, DataValue d
             }
         }
     }
+    table_schema_changed(table);
     return 0;
 }
 
-API int drop_column(Table* table, const char* col_name) {
+API int add_column(Table* table, const char* col_name, int new_type, DataValue default_value) {
+    lock_mutations();
+    int result = add_column_locked(table, col_name, new_type, default_value);
+    unlock_mutations();
+    return result;
+}
+
+static int drop_column_locked(Table* table, const char* col_name) {
     if (!table || !col_name) return -1;
+    if (storage_writable(table) != 0) return -1;  // до удаления индекса и данных столбца
     
     int old_cols = table->num_columns;
     int idx = -1;
@@ -92,9 +88,6 @@ API int drop_column(Table* table, const char* col_name) {
          return -1;
     }
     
-    // Сохраняем тип удаляемого столбца
-    int drop_type = table->columns[idx].type;
-    
     int new_cols = old_cols - 1;
     Column* new_columns = (Column*)malloc(new_cols * sizeof(Column));
     if (!new_columns) {
@@ -106,31 +99,25 @@ API int drop_column(Table* table, const char* col_name) {
          if (i == idx) continue;
          new_columns[j++] = table->columns[i];
     }
+    
+    // Освобождаем данные и индекс удаляемого столбца
+    if (storage_drop_column(table, idx) != 0) {
+         free(new_columns);
+         return -1;
+    }
+    table_index_drop_column(table, idx);
+    
     free(table->columns);
     table->columns = new_columns;
     table->num_columns = new_cols;
     
-    // Перераспределяем массив значений для каждой строки
-    for (int i = 0; i < table->num_rows; i++){
-         DataValue* old_values = table->rows[i].values;
-         DataValue* new_values = (DataValue*)malloc(new_cols * sizeof(DataValue));
-         if (!new_values) {
-              fprintf(stderr, "drop_column: Ошибка выделения памяти для значений строки %d\n", i);
-              return -1;
-         }
-         for (int j = 0, k = 0; j < old_cols; j++){
-              if (j == idx) {
-                   // Освобождаем память для строкового значения, если применимо
-                   if (drop_type == TYPE_STRING && old_values[j].s != NULL) {
-                         free(old_values[j].s);
-                   }
-                   continue;
-              }
-              new_values[k++] = old_values[j];
-         }
-         free(old_values);
-         table->rows[i].values = new_values;
-    }
-    
+    table_schema_changed(table);  // номера столбцов сдвинулись
     return 0;
 }
+
+API int drop_column(Table* table, const char* col_name) {
+    lock_mutations();
+    int result = drop_column_locked(table, col_name);
+    unlock_mutations();
+    return result;
+}
@@ -0,0 +1,130 @@
+#include "backup.h"
+#include "snapshot.h"
+#include "storage.h"
+#include "index.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+API int advance_change_epoch(void) {
+    return storage_epoch++;
+}
+
+API int get_changed_row_ids(Table* table, int since, int* out_ids) {
+    if (!table || !out_ids) return -1;
+    // У таблицы, открытой из файла и ещё не изменённой, отметок нет
+    if (!table->row_versions || table->data_version <= since) return 0;
+    int count = 0;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        if (!table->deleted[slot] && table->row_versions[slot] > since) {
+            out_ids[count++] = table->row_ids[slot];
+        }
+    }
+    return count;
+}
+
+API int get_row_id_runs(Table* table, int* out_runs) {
+    if (!table || !out_runs) return -1;
+    int num_runs = 0;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        if (table->deleted[slot]) continue;
+        int row_id = table->row_ids[slot];
+        // Слоты упорядочены по идентификаторам, отрезок продолжается соседним id
+        if (num_runs > 0 && out_runs[2 * num_runs - 2] + out_runs[2 * num_runs - 1] == row_id) {
+            out_runs[2 * num_runs - 1]++;
+        } else {
+            out_runs[2 * num_runs] = row_id;
+            out_runs[2 * num_runs + 1] = 1;
+            num_runs++;
+        }
+    }
+    return num_runs;
+}
+
+// Копия значения ячейки: строки дублируются, владение переходит к вызывающему
+static DataValue copy_value(int type, DataValue value) {
+    if (type == TYPE_STRING && value.s) {
+        value.s = strdup(value.s);
+    }
+    return value;
+}
+
+static void write_row(Table* target, int slot, Table* delta, int src) {
+    for (int j = 0; j < target->num_columns; j++) {
+        int type = target->columns[j].type;
+        if (type == TYPE_STRING) {
+            free(storage_get(target, slot, j).s);
+        }
+        storage_set(target, slot, j, copy_value(type, storage_get(delta, src, j)));
+    }
+}
+
+static int apply_table_delta_locked(Table* target, Table* delta, const int* runs, int num_runs) {
+    if (!target || !delta || (num_runs > 0 && !runs)) return -1;
+    if (transaction_in_progress()) {
+        fprintf(stderr, "Error: cannot apply backup to table %s during a transaction\n", target->name);
+        return -1;
+    }
+    if (target->num_columns != delta->num_columns) {
+        fprintf(stderr, "Error: backup of table %s has a different number of columns\n", target->name);
+        return -1;
+    }
+    for (int j = 0; j < target->num_columns; j++) {
+        if (target->columns[j].type != delta->columns[j].type) {
+            fprintf(stderr, "Error: backup of table %s has a different type of column %s\n",
+                    target->name, target->columns[j].name);
+            return -1;
+        }
+    }
+    if (storage_writable(target) != 0) return -1;
+
+    // Удаляем строки, которых нет в отрезках (и слоты, и отрезки идут по возрастанию id)
+    int run = 0;
+    for (int slot = 0; slot < target->num_rows; slot++) {
+        if (target->deleted[slot]) continue;
+        int row_id = target->row_ids[slot];
+        while (run < num_runs && runs[2 * run] + runs[2 * run + 1] <= row_id) {
+            run++;
+        }
+        if (run < num_runs && runs[2 * run] <= row_id) continue;
+        target->deleted[slot] = 1;
+        target->num_deleted++;
+        storage_clear_row(target, slot);
+    }
+
+    for (int src = 0; src < delta->num_rows; src++) {
+        if (delta->deleted[src]) continue;
+        int row_id = delta->row_ids[src];
+        int slot;
+        if (row_id < target->next_row_id) {
+            slot = storage_slot(target, row_id);
+            if (slot < 0) {
+                fprintf(stderr, "Error: backup of table %s refers to unknown row %d\n",
+                        target->name, row_id);
+                return -1;
+            }
+        } else {
+            if (storage_skip_ids(target, row_id) != 0) return -1;
+            slot = storage_append_slot(target);
+            if (slot < 0) return -1;
+        }
+        write_row(target, slot, delta, src);
+    }
+
+    if (delta->next_row_id > target->next_row_id && storage_skip_ids(target, delta->next_row_id) != 0) {
+        return -1;
+    }
+    if (target->num_deleted > 0) {
+        storage_compact(target);
+    }
+    // Данные заменены целиком: снимки, начатые раньше, таблицу уже не прочитают
+    table_schema_changed(target);
+    return table_index_rebuild_all(target);
+}
+
+API int apply_table_delta(Table* target, Table* delta, const int* runs, int num_runs) {
+    lock_mutations();
+    int result = apply_table_delta_locked(target, delta, runs, num_runs);
+    unlock_mutations();
+    return result;
+}
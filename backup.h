@@ -0,0 +1,29 @@
+#ifndef BACKUP_H
+#define BACKUP_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Поддержка инкрементных резервных копий (backup.py).
+ *
+ * Каждое изменение строки отмечает её слот текущей эпохой (storage.h).
+ * Резервная копия закрывает эпоху: advance_change_epoch возвращает номер
+ * закрытой эпохи, и следующая копия берёт только строки с большей отметкой.
+ * Удаления по отметкам не видны, поэтому вместе с изменёнными строками
+ * сохраняется список существующих идентификаторов в виде отрезков
+ * (начало, длина): строки, которых в нём нет, при восстановлении удаляются.
+ */
+
+// Закрывает текущую эпоху изменений; возвращает её номер
+API int advance_change_epoch(void);
+// Идентификаторы существующих строк, изменённых после эпохи since; возвращает их число
+API int get_changed_row_ids(Table* table, int since, int* out_ids);
+// Отрезки существующих идентификаторов: пары (начало, длина) в out_runs
+// (не больше 2 * get_row_count чисел); возвращает число отрезков
+API int get_row_id_runs(Table* table, int* out_runs);
+// Применяет к таблице изменения: строки delta заменяют или добавляют строки
+// с теми же идентификаторами, строки вне отрезков runs удаляются.
+// Схема delta должна совпадать со схемой target; вне транзакции
+API int apply_table_delta(Table* target, Table* delta, const int* runs, int num_runs);
+
+#endif // BACKUP_H
@@ -0,0 +1,313 @@
+"""
+Инкрементное резервное копирование глобальной базы.
+
+Цепочка копий начинается с полной копии (backup_<время>_full.mydb, двоичный
+формат binfile.h), за которой идут инкрементные (backup_<время>_incr.zip).
+Инкрементная копия содержит только изменения после предыдущей копии цепочки:
+
+    manifest.json  {"version", "base", "previous", "epoch", "tables",
+                    "full": {таблица: файл}, "delta": {таблица: {"rows", "ids"}}}
+    <n>.mydb       новая таблица или таблица с изменённой схемой - целиком;
+                   у остальных - только строки, изменённые после прошлой копии
+    <n>.ids        отрезки существующих идентификаторов строк (пары int32
+                   начало, длина); строки вне них при восстановлении удаляются
+
+Изменённые строки находит C по отметкам эпох (backup.h), файлы пишутся из
+снимка базы (snapshot.h) параллельно с изменениями таблиц. Таблица, не
+изменявшаяся с прошлой копии, в архив не попадает, а удалённая - просто
+отсутствует в списке "tables". Каждые full_every копий цепочка начинается
+заново, хранятся последние keep_chains цепочек.
+
+С compress (кодек compression.py) файлы снимка пишутся со словарными
+строковыми столбцами, полная копия сжимается целиком (backup_<время>_full.mydb.gz
+и т.п.), а члены инкрементного архива - методом zip того же кодека. Сжатие и
+упаковка идут в фоновом потоке: make возвращается сразу после записи снимка,
+wait дожидается готовности файлов.
+"""
+import array
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import c_int, c_void_p, cast
+from datetime import datetime
+
+from compression import CODECS, codec_suffix, compress_file, decompressed, zip_method
+from db_interface import lib, SnapshotJob, SNAPSHOT_WHOLE, SAVE_WORKERS, BINFILE_SAVE_DICT
+
+MANIFEST = "manifest.json"
+BACKUP_VERSION = 1
+# Сколько инкрементных копий идёт за полной
+FULL_EVERY = 12
+# Сколько последних цепочек (полная копия и её инкременты) хранится
+KEEP_CHAINS = 2
+
+FULL_SUFFIX = "_full.mydb"
+INCR_SUFFIX = "_incr.zip"
+# Файл снимка полной копии во временном каталоге
+FULL_MEMBER = "full.mydb"
+
+
+def _is_full(name):
+    return name.endswith(FULL_SUFFIX) or any(name.endswith(FULL_SUFFIX + codec.suffix)
+                                             for codec in CODECS.values())
+
+
+def _table_key(table_ptr):
+    """Таблица считается той же, пока у неё тот же адрес и та же версия схемы"""
+    return [cast(table_ptr, c_void_p).value, table_ptr.contents.schema_version]
+
+
+class BackupChain:
+    def __init__(self, backup_dir, full_every=FULL_EVERY, keep_chains=KEEP_CHAINS, workers=SAVE_WORKERS,
+                 compress=None):
+        self.backup_dir = backup_dir
+        self.full_every = full_every
+        self.keep_chains = keep_chains
+        self.workers = workers  # потоков записи таблиц в дочернем процессе снимка
+        self.compress = compress  # кодек сжатия (compression.py) или None
+        self.executor = None    # фоновый поток сжатия, создаётся при первой сжатой копии
+        self.pending = []       # (полная копия цепочки, задание) ещё не проверенных копий
+        self.broken = set()     # цепочки, в которых копию записать не удалось
+        self.last_error = None
+        self.reset()
+
+    def reset(self):
+        """Начинает новую цепочку: следующая копия будет полной (например, после загрузки базы)"""
+        self.base = None
+        self.previous = None
+        self.epoch = None
+        self.tables = {}
+        self.increments = 0
+
+    def make(self, full=False):
+        """
+        Создаёт копию: полную, если full, цепочки ещё нет или в ней уже
+        full_every инкрементов, иначе инкрементную. Возвращает путь к файлу
+        (со сжатием файл появится по окончании фоновой записи, см. wait).
+
+        Копия пишется из снимка базы (snapshot.h): изменения таблиц
+        блокируются только на время его создания, а не на время записи.
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        self._collect(block=False)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        full = full or self.base is None or self.increments >= self.full_every
+        if full:
+            name = f'backup_{stamp}{FULL_SUFFIX}' + (codec_suffix(self.compress) if self.compress else '')
+        else:
+            name = f'backup_{stamp}{INCR_SUFFIX}'
+        path = os.path.join(self.backup_dir, name)
+        options = BINFILE_SAVE_DICT if self.compress else 0
+
+        temp_dir = tempfile.mkdtemp(dir=self.backup_dir)
+        try:
+            # Список таблиц, эпоха и снимок - одно и то же состояние базы;
+            # изменения после снимка получат следующую эпоху
+            lib.lock_mutations()
+            try:
+                epoch = lib.advance_change_epoch()
+                tables = {}
+                for i in range(lib.get_num_tables(None)):
+                    table_ptr = lib.get_table_at(None, i)
+                    tables[table_ptr.contents.name.decode('utf-8')] = table_ptr
+                if full:
+                    manifest = None
+                    full_path = os.fsencode(os.path.join(temp_dir, FULL_MEMBER))
+                    handle = lib.snapshot_start(None, full_path, None, 0, self.workers, options)
+                else:
+                    manifest, jobs = self._plan_increment(tables, epoch, temp_dir)
+                    handle = lib.snapshot_start(None, None, (SnapshotJob * max(len(jobs), 1))(*jobs), len(jobs),
+                                                self.workers, options)
+                keys = {table_name: _table_key(table_ptr) for table_name, table_ptr in tables.items()}
+            finally:
+                lib.unlock_mutations()
+            if lib.snapshot_wait(handle) != 0:
+                raise IOError(f"Не удалось записать резервную копию {path}")
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        base = name if full else self.base
+        if self.compress:
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            future = self.executor.submit(self._finish, path, manifest, temp_dir, base, self.compress)
+            self.pending.append((base, future))
+        else:
+            self._finish(path, manifest, temp_dir, base, None)
+
+        if full:
+            self.base = name
+            self.increments = 0
+        else:
+            self.increments += 1
+        self.previous = name
+        self.epoch = epoch
+        self.tables = keys
+        return path
+
+    def wait(self):
+        """Дожидается фоновой записи копий; ошибку неудачной копии выбрасывает"""
+        self._collect(block=True)
+        error, self.last_error = self.last_error, None
+        if error:
+            try:
+                raise error
+            finally:
+                error = None  # кадр с исключением не должен ссылаться на него самого
+
+    def _collect(self, block):
+        """
+        Проверяет завершённые фоновые записи. Если копия текущей цепочки не
+        записана, следующая копия начнёт новую цепочку; ошибка сохраняется в
+        last_error.
+        """
+        pending, self.pending = self.pending, []
+        for base, future in pending:
+            if not block and not future.done():
+                self.pending.append((base, future))
+                continue
+            error = future.exception()
+            if error:
+                self.last_error = self.last_error or error
+                if base == self.base:
+                    self.reset()
+
+    def _finish(self, path, manifest, temp_dir, base, codec):
+        """Переносит записанный снимок в каталог копий (со сжатием - в фоновом потоке)"""
+        try:
+            if base in self.broken:
+                raise IOError(f"Цепочка копий {base} прервана, копия {path} не записана")
+            if manifest is None:
+                full_path = os.path.join(temp_dir, FULL_MEMBER)
+                if codec:
+                    compress_file(full_path, path, codec)
+                else:
+                    os.replace(full_path, path)
+            else:
+                self._pack_increment(path, manifest, temp_dir, codec)
+            self._cleanup()
+        except BaseException:
+            self.broken.add(base)
+            raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _plan_increment(self, tables, epoch, temp_dir):
+        """Манифест инкремента и задания снимка для изменившихся таблиц"""
+        manifest = {
+            "version": BACKUP_VERSION,
+            "base": self.base,
+            "previous": self.previous,
+            "epoch": epoch,
+            "tables": list(tables),
+            "full": {},
+            "delta": {}
+        }
+        jobs = []
+        for i, (table_name, table_ptr) in enumerate(tables.items()):
+            member = f'{i}.mydb'
+            file_path = os.fsencode(os.path.join(temp_dir, member))
+            if self.tables.get(table_name) != _table_key(table_ptr):
+                jobs.append(SnapshotJob(table_ptr, SNAPSHOT_WHOLE, file_path, None))
+                manifest["full"][table_name] = member
+            elif table_ptr.contents.data_version > self.epoch:
+                ids_member = f'{i}.ids'
+                jobs.append(SnapshotJob(table_ptr, self.epoch, file_path,
+                                        os.fsencode(os.path.join(temp_dir, ids_member))))
+                manifest["delta"][table_name] = {"rows": member, "ids": ids_member}
+        return manifest, jobs
+
+    def _pack_increment(self, path, manifest, temp_dir, codec):
+        temp_path = path + '.tmp'
+        with zipfile.ZipFile(temp_path, 'w', zip_method(codec)) as archive:
+            for member in manifest["full"].values():
+                archive.write(os.path.join(temp_dir, member), member)
+            for entry in manifest["delta"].values():
+                for member in entry.values():
+                    archive.write(os.path.join(temp_dir, member), member)
+            archive.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False))
+        os.replace(temp_path, path)
+
+    def _cleanup(self):
+        """Удаляет цепочки старше keep_chains последних полных копий"""
+        backups = sorted(f for f in os.listdir(self.backup_dir)
+                         if f.startswith('backup_') and (f.endswith(('.mydb', '.json', '.zip')) or _is_full(f)))
+        bases = [f for f in backups if _is_full(f)]
+        if len(bases) <= self.keep_chains:
+            return
+        oldest_kept = bases[-self.keep_chains]
+        for old in backups:
+            if old >= oldest_kept:
+                break
+            try:
+                os.remove(os.path.join(self.backup_dir, old))
+            except OSError:
+                pass
+
+
+def restore_backup(path):
+    """
+    Заменяет глобальную базу содержимым копии path; для инкрементной копии
+    загружается полная копия цепочки и по порядку применяются все инкременты.
+    Сжатая полная копия распаковывается во временный файл.
+    """
+    backup_dir = os.path.dirname(path)
+    chain = []
+    name = os.path.basename(path)
+    while name.endswith(INCR_SUFFIX):
+        chain.append(name)
+        with zipfile.ZipFile(os.path.join(backup_dir, name)) as archive:
+            name = json.loads(archive.read(MANIFEST))["previous"]
+
+    lib.cleanup_database()
+    lib.init_database()
+    base_path = os.path.join(backup_dir, name)
+    with decompressed(base_path) as plain_path:
+        if lib.load_database_file(None, os.fsencode(plain_path)) < 0:
+            raise IOError(f"Не удалось загрузить резервную копию {base_path}")
+    for name in reversed(chain):
+        _apply_increment(os.path.join(backup_dir, name))
+
+
+def _apply_increment(path):
+    with zipfile.ZipFile(path) as archive, tempfile.TemporaryDirectory() as temp_dir:
+        manifest = json.loads(archive.read(MANIFEST))
+        if manifest.get("version") != BACKUP_VERSION:
+            raise IOError(f"Неизвестная версия резервной копии {path}")
+
+        for table_name, member in manifest["full"].items():
+            table_ptr = lib.load_table_file(os.fsencode(archive.extract(member, temp_dir)))
+            if not table_ptr:
+                raise IOError(f"Не удалось загрузить таблицу {table_name} из {path}")
+            if lib.replace_table(None, table_ptr) != 0:
+                lib.free_table(table_ptr)
+                raise IOError(f"Не удалось восстановить таблицу {table_name}")
+
+        for table_name, entry in manifest["delta"].items():
+            target = lib.get_table_by_name(None, table_name.encode('utf-8'))
+            if not target:
+                raise IOError(f"В цепочке копий нет таблицы {table_name}")
+            delta = lib.load_table_file(os.fsencode(archive.extract(entry["rows"], temp_dir)))
+            if not delta:
+                raise IOError(f"Не удалось загрузить строки таблицы {table_name} из {path}")
+            runs = array.array('i')
+            runs.frombytes(archive.read(entry["ids"]))
+            runs_buf = (c_int * len(runs)).from_buffer(runs) if runs else None
+            result = lib.apply_table_delta(target, delta, runs_buf, len(runs) // 2)
+            lib.free_table(delta)
+            if result != 0:
+                raise IOError(f"Не удалось применить изменения таблицы {table_name}")
+
+        # Удалённые таблицы; ссылающиеся внешними ключами удаляются раньше
+        dropped = [lib.get_table_at(None, i).contents.name
+                   for i in range(lib.get_num_tables(None))]
+        dropped = [name for name in dropped if name.decode('utf-8') not in manifest["tables"]]
+        while dropped:
+            remaining = [name for name in dropped if lib.drop_table(None, name) != 0]
+            if len(remaining) == len(dropped):
+                raise IOError(f"Не удалось удалить таблицы: {b', '.join(remaining).decode('utf-8')}")
+            dropped = remaining
@@ -0,0 +1,1238 @@
+#include "binfile.h"
+#include "snapshot.h"
+#include "parallel.h"
+#include "storage.h"
+#include "index.h"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
+
+#define IO_BUFFER_SIZE (1 << 20)
+#define GATHER_ROWS    65536
+#define MAX_NAME_LEN   4096
+
+/* ---------- CRC-32, по 8 байт за шаг ---------- */
+
+static uint32_t crc_table[8][256];
+static int crc_ready = 0;
+
+static void crc_init(void) {
+    for (uint32_t i = 0; i < 256; i++) {
+        uint32_t c = i;
+        for (int k = 0; k < 8; k++) {
+            c = (c & 1) ? 0xEDB88320u ^ (c >> 1) : c >> 1;
+        }
+        crc_table[0][i] = c;
+    }
+    for (int i = 0; i < 256; i++) {
+        for (int s = 1; s < 8; s++) {
+            crc_table[s][i] = (crc_table[s - 1][i] >> 8) ^ crc_table[0][crc_table[s - 1][i] & 0xff];
+        }
+    }
+    crc_ready = 1;
+}
+
+unsigned int binfile_crc32(unsigned int crc, const void* data, size_t len) {
+    if (!crc_ready) crc_init();
+    const unsigned char* p = (const unsigned char*)data;
+    uint32_t c = ~(uint32_t)crc;
+    while (len >= 8) {
+        uint32_t one = ((uint32_t)p[0] | (uint32_t)p[1] << 8 | (uint32_t)p[2] << 16 | (uint32_t)p[3] << 24) ^ c;
+        uint32_t two = (uint32_t)p[4] | (uint32_t)p[5] << 8 | (uint32_t)p[6] << 16 | (uint32_t)p[7] << 24;
+        c = crc_table[7][one & 0xff] ^ crc_table[6][(one >> 8) & 0xff] ^
+            crc_table[5][(one >> 16) & 0xff] ^ crc_table[4][one >> 24] ^
+            crc_table[3][two & 0xff] ^ crc_table[2][(two >> 8) & 0xff] ^
+            crc_table[1][(two >> 16) & 0xff] ^ crc_table[0][two >> 24];
+        p += 8;
+        len -= 8;
+    }
+    while (len--) {
+        c = crc_table[0][(c ^ *p++) & 0xff] ^ (c >> 8);
+    }
+    return ~c;
+}
+
+static uint64_t align8(uint64_t n) {
+    return (n + 7) & ~(uint64_t)7;
+}
+
+/* ---------- Запись ---------- */
+
+typedef struct {
+    FILE* file;
+    unsigned char* buf;
+    size_t used;
+    uint64_t pos;        // смещение от начала файла
+    uint32_t crc;
+    int error;
+} Writer;
+
+static void writer_flush(Writer* w) {
+    if (w->used > 0 && !w->error) {
+        w->crc = binfile_crc32(w->crc, w->buf, w->used);
+        if (fwrite(w->buf, 1, w->used, w->file) != w->used) {
+            w->error = 1;
+        }
+    }
+    w->used = 0;
+}
+
+static void put(Writer* w, const void* data, size_t len) {
+    const unsigned char* p = (const unsigned char*)data;
+    w->pos += len;
+    if (len >= IO_BUFFER_SIZE) {
+        // Большие сегменты пишутся напрямую, минуя буфер
+        writer_flush(w);
+        if (!w->error) {
+            w->crc = binfile_crc32(w->crc, p, len);
+            if (fwrite(p, 1, len, w->file) != len) w->error = 1;
+        }
+        return;
+    }
+    while (len > 0) {
+        if (w->used == IO_BUFFER_SIZE) writer_flush(w);
+        size_t n = IO_BUFFER_SIZE - w->used;
+        if (n > len) n = len;
+        memcpy(w->buf + w->used, p, n);
+        w->used += n;
+        p += n;
+        len -= n;
+    }
+}
+
+static void put_u32(Writer* w, uint32_t v) {
+    put(w, &v, sizeof(v));
+}
+
+static void put_u64(Writer* w, uint64_t v) {
+    put(w, &v, sizeof(v));
+}
+
+static void put_str(Writer* w, const char* s) {
+    uint32_t len = (uint32_t)strlen(s);
+    put_u32(w, len);
+    put(w, s, len);
+}
+
+static void put_pad(Writer* w) {
+    static const unsigned char zeros[8] = {0};
+    put(w, zeros, (size_t)(align8(w->pos) - w->pos));
+}
+
+static uint64_t str_size(const char* s) {
+    return 4 + strlen(s);
+}
+
+/*
+ * Записываемые строки таблицы: все живые слоты или заданный список слотов
+ * (в порядке возрастания идентификаторов).
+ */
+typedef struct {
+    const Table* table;
+    const int* slots;    // NULL - все живые строки
+    int count;           // число записываемых строк
+} Selection;
+
+typedef struct {
+    const Selection* sel;
+    int pos;
+} SlotIter;
+
+static int next_slot(SlotIter* it) {
+    const Selection* sel = it->sel;
+    if (sel->slots) {
+        return it->pos < sel->count ? sel->slots[it->pos++] : -1;
+    }
+    while (it->pos < sel->table->num_rows) {
+        int slot = it->pos++;
+        if (!sel->table->deleted[slot]) return slot;
+    }
+    return -1;
+}
+
+/*
+ * Словарь строкового столбца: различные строки в порядке первого появления
+ * и код каждой записываемой строки (-1 - NULL). Строки не копируются.
+ */
+typedef struct {
+    const char** strings;
+    uint64_t* lengths;
+    int count;
+    uint64_t bytes;      // суммарная длина различных строк
+    int32_t* codes;      // по записываемой строке
+} StringDict;
+
+// Как записывается столбец: байты строк обычного сегмента или словарь
+typedef struct {
+    uint64_t blob_size;
+    StringDict* dict;    // NULL - без словаря
+} ColumnLayout;
+
+static void free_dict(StringDict* dict) {
+    if (!dict) return;
+    free(dict->strings);
+    free(dict->lengths);
+    free(dict->codes);
+    free(dict);
+}
+
+static void free_layout(ColumnLayout* layout, int num_columns) {
+    if (!layout) return;
+    for (int j = 0; j < num_columns; j++) {
+        free_dict(layout[j].dict);
+    }
+    free(layout);
+}
+
+static uint64_t dict_segment_size(const StringDict* dict, int n) {
+    return 8 + align8((uint64_t)n * 4) + align8((uint64_t)(dict->count + 1) * 8 + dict->bytes);
+}
+
+static uint64_t plain_segment_size(uint64_t blob_size, int n) {
+    return align8(n) + align8((uint64_t)(n + 1) * 8 + blob_size);
+}
+
+// Размер тела секции таблицы (после поля размера)
+static uint64_t table_section_size(const Table* table, int n, const ColumnLayout* layout) {
+    uint64_t size = str_size(table->name) + 5 * 4;
+    for (int j = 0; j < table->num_columns; j++) {
+        size += str_size(table->columns[j].name) + 8;
+    }
+    for (int k = 0; k < table->num_foreign_keys; k++) {
+        ForeignKey* fk = table->foreign_keys[k];
+        size += str_size(table->columns[fk->column_index].name) +
+                str_size(fk->referenced_table) + str_size(fk->referenced_column);
+    }
+    size = align8(size) + align8((uint64_t)n * 4);
+    for (int j = 0; j < table->num_columns; j++) {
+        if (table->columns[j].type != TYPE_STRING) {
+            size += align8((uint64_t)n * 4);
+        } else if (layout[j].dict) {
+            size += dict_segment_size(layout[j].dict, n);
+        } else {
+            size += plain_segment_size(layout[j].blob_size, n);
+        }
+    }
+    return size;
+}
+
+// Пишет сегмент из 4-байтовых значений строк (идентификаторы, INT, FLOAT)
+static void put_numeric_segment(Writer* w, const Selection* sel, int col, int32_t* gather) {
+    const Table* table = sel->table;
+    if (col >= 0 && !sel->slots && table->storage == STORAGE_COLUMNAR && table->num_deleted == 0) {
+        put(w, table->column_data[col], (size_t)sel->count * 4);  // непрерывный массив без надгробий
+    } else {
+        int count = 0;
+        SlotIter it = { sel, 0 };
+        for (int slot; (slot = next_slot(&it)) >= 0; ) {
+            if (col < 0) {
+                gather[count++] = table->row_ids[slot];
+            } else {
+                DataValue v = storage_get(table, slot, col);
+                memcpy(&gather[count++], &v, 4);  // i или f, оба занимают 4 байта
+            }
+            if (count == GATHER_ROWS) {
+                put(w, gather, (size_t)count * 4);
+                count = 0;
+            }
+        }
+        put(w, gather, (size_t)count * 4);
+    }
+    put_pad(w);
+}
+
+static void put_string_segment(Writer* w, const Selection* sel, int col, void* gather) {
+    const Table* table = sel->table;
+    unsigned char* nulls = (unsigned char*)gather;
+    uint64_t* offsets = (uint64_t*)gather;
+    int count = 0;
+    SlotIter it = { sel, 0 };
+
+    for (int slot; (slot = next_slot(&it)) >= 0; ) {
+        nulls[count++] = storage_get(table, slot, col).s == NULL;
+        if (count == GATHER_ROWS) {
+            put(w, nulls, count);
+            count = 0;
+        }
+    }
+    put(w, nulls, count);
+    put_pad(w);
+
+    uint64_t offset = 0;
+    count = 0;
+    offsets[count++] = 0;
+    it.pos = 0;
+    for (int slot; (slot = next_slot(&it)) >= 0; ) {
+        const char* s = storage_get(table, slot, col).s;
+        offset += s ? strlen(s) : 0;
+        offsets[count++] = offset;
+        if (count == GATHER_ROWS) {
+            put(w, offsets, (size_t)count * 8);
+            count = 0;
+        }
+    }
+    put(w, offsets, (size_t)count * 8);
+
+    it.pos = 0;
+    for (int slot; (slot = next_slot(&it)) >= 0; ) {
+        const char* s = storage_get(table, slot, col).s;
+        if (s) put(w, s, strlen(s));
+    }
+    put_pad(w);
+}
+
+static void put_dict_segment(Writer* w, const StringDict* dict, int n) {
+    put_u32(w, (uint32_t)dict->count);
+    put_u32(w, 0);
+    put(w, dict->codes, (size_t)n * 4);
+    put_pad(w);
+    uint64_t offset = 0;
+    put_u64(w, offset);
+    for (int k = 0; k < dict->count; k++) {
+        offset += dict->lengths[k];
+        put_u64(w, offset);
+    }
+    for (int k = 0; k < dict->count; k++) {
+        put(w, dict->strings[k], (size_t)dict->lengths[k]);
+    }
+    put_pad(w);
+}
+
+static uint32_t hash_string(const char* s, size_t len) {
+    uint32_t h = 2166136261u;  // FNV-1a
+    for (size_t i = 0; i < len; i++) {
+        h = (h ^ (unsigned char)s[i]) * 16777619u;
+    }
+    return h;
+}
+
+/*
+ * Строит словарь столбца открытой адресацией по хешу строки. Возвращает NULL,
+ * если словарь не окупается (сегмент со словарём не меньше обычного) или не
+ * хватило памяти - тогда столбец пишется как обычно.
+ */
+static StringDict* build_dict(const Selection* sel, int col, uint64_t blob_size) {
+    int n = sel->count;
+    StringDict* dict = (StringDict*)calloc(1, sizeof(StringDict));
+    int capacity = 64;
+    int* slots = (int*)malloc(capacity * sizeof(int));
+    int max_strings = 32;
+    if (dict) {
+        dict->codes = (int32_t*)malloc((n > 0 ? n : 1) * sizeof(int32_t));
+        dict->strings = (const char**)malloc(max_strings * sizeof(char*));
+        dict->lengths = (uint64_t*)malloc(max_strings * sizeof(uint64_t));
+    }
+    int error = !dict || !slots || !dict->codes || !dict->strings || !dict->lengths;
+    if (!error) memset(slots, 0xff, capacity * sizeof(int));
+
+    int row = 0;
+    SlotIter it = { sel, 0 };
+    for (int slot; !error && (slot = next_slot(&it)) >= 0; row++) {
+        const char* s = storage_get(sel->table, slot, col).s;
+        if (!s) {
+            dict->codes[row] = -1;
+            continue;
+        }
+        size_t len = strlen(s);
+        uint32_t pos = hash_string(s, len) & (uint32_t)(capacity - 1);
+        while (slots[pos] >= 0) {
+            int code = slots[pos];
+            if (dict->lengths[code] == len && memcmp(dict->strings[code], s, len) == 0) break;
+            pos = (pos + 1) & (uint32_t)(capacity - 1);
+        }
+        if (slots[pos] >= 0) {
+            dict->codes[row] = slots[pos];
+            continue;
+        }
+        // Словарь больше половины строк уже не окупится
+        if (dict->count >= n / 2) {
+            error = 1;
+            break;
+        }
+        if (dict->count == max_strings) {
+            max_strings *= 2;
+            const char** strings = (const char**)realloc((void*)dict->strings, max_strings * sizeof(char*));
+            if (strings) dict->strings = strings;
+            uint64_t* lengths = (uint64_t*)realloc(dict->lengths, max_strings * sizeof(uint64_t));
+            if (lengths) dict->lengths = lengths;
+            if (!strings || !lengths) {
+                error = 1;
+                break;
+            }
+        }
+        int code = dict->count++;
+        dict->strings[code] = s;
+        dict->lengths[code] = len;
+        dict->bytes += len;
+        dict->codes[row] = code;
+        slots[pos] = code;
+        if (dict->count * 2 > capacity) {
+            // Таблица заполнена наполовину - вдвое больше и перехешировать
+            int* grown = (int*)malloc(capacity * 2 * sizeof(int));
+            if (!grown) {
+                error = 1;
+                break;
+            }
+            capacity *= 2;
+            memset(grown, 0xff, capacity * sizeof(int));
+            for (int k = 0; k < dict->count; k++) {
+                uint32_t p = hash_string(dict->strings[k], (size_t)dict->lengths[k]) & (uint32_t)(capacity - 1);
+                while (grown[p] >= 0) p = (p + 1) & (uint32_t)(capacity - 1);
+                grown[p] = k;
+            }
+            free(slots);
+            slots = grown;
+        }
+    }
+    free(slots);
+    if (!error && dict_segment_size(dict, n) >= plain_segment_size(blob_size, n)) error = 1;
+    if (error) {
+        free_dict(dict);
+        return NULL;
+    }
+    return dict;
+}
+
+/*
+ * Раскладка строковых столбцов: байты строк и, с BINFILE_SAVE_DICT, словари.
+ * NULL при нехватке памяти.
+ */
+static ColumnLayout* measure_table(const Selection* sel, int options) {
+    const Table* table = sel->table;
+    ColumnLayout* layout = (ColumnLayout*)calloc(table->num_columns, sizeof(ColumnLayout));
+    if (!layout) return NULL;
+    for (int j = 0; j < table->num_columns; j++) {
+        if (table->columns[j].type != TYPE_STRING) continue;
+        SlotIter it = { sel, 0 };
+        for (int slot; (slot = next_slot(&it)) >= 0; ) {
+            const char* s = storage_get(table, slot, j).s;
+            layout[j].blob_size += s ? strlen(s) : 0;
+        }
+        if (options & BINFILE_SAVE_DICT) {
+            layout[j].dict = build_dict(sel, j, layout[j].blob_size);
+        }
+    }
+    return layout;
+}
+
+static int write_table(Writer* w, const Selection* sel, const ColumnLayout* layout, void* gather) {
+    const Table* table = sel->table;
+    int n = sel->count;
+
+    put_u64(w, table_section_size(table, n, layout));
+    uint64_t start = w->pos;
+    put_str(w, table->name);
+    put_u32(w, (uint32_t)table->storage);
+    put_u32(w, (uint32_t)table->num_columns);
+    put_u32(w, (uint32_t)n);
+    put_u32(w, (uint32_t)table->next_row_id);
+    put_u32(w, (uint32_t)table->num_foreign_keys);
+    for (int j = 0; j < table->num_columns; j++) {
+        put_str(w, table->columns[j].name);
+        put_u32(w, (uint32_t)table->columns[j].type);
+        put_u32(w, (table->columns[j].is_primary_key ? BINFILE_COL_PRIMARY_KEY : 0) |
+                   (layout[j].dict ? BINFILE_COL_DICT : 0));
+    }
+    for (int k = 0; k < table->num_foreign_keys; k++) {
+        ForeignKey* fk = table->foreign_keys[k];
+        put_str(w, table->columns[fk->column_index].name);
+        put_str(w, fk->referenced_table);
+        put_str(w, fk->referenced_column);
+    }
+    put_pad(w);
+
+    put_numeric_segment(w, sel, -1, (int32_t*)gather);
+    for (int j = 0; j < table->num_columns; j++) {
+        if (layout[j].dict) {
+            put_dict_segment(w, layout[j].dict, n);
+        } else if (table->columns[j].type == TYPE_STRING) {
+            put_string_segment(w, sel, j, gather);
+        } else {
+            put_numeric_segment(w, sel, j, (int32_t*)gather);
+        }
+    }
+
+    uint64_t expected = table_section_size(table, n, layout);
+    if (w->pos - start != expected) {
+        fprintf(stderr, "Ошибка записи таблицы %s: неверный размер секции\n", table->name);
+        return -1;
+    }
+    return 0;
+}
+
+static int sync_file(FILE* f) {
+    if (fflush(f) != 0) return -1;
+#ifdef _WIN32
+    return _commit(_fileno(f));
+#else
+    return fsync(fileno(f));
+#endif
+}
+
+static int seek_file(FILE* f, uint64_t pos) {
+#ifdef _WIN32
+    return _fseeki64(f, (__int64)pos, SEEK_SET);
+#else
+    return fseeko(f, (off_t)pos, SEEK_SET);
+#endif
+}
+
+// Умножение вектора на матрицу над GF(2) (для crc32_combine)
+static uint32_t gf2_times(const uint32_t* mat, uint32_t vec) {
+    uint32_t sum = 0;
+    for (int i = 0; vec; vec >>= 1, i++) {
+        if (vec & 1) sum ^= mat[i];
+    }
+    return sum;
+}
+
+static void gf2_square(uint32_t* square, const uint32_t* mat) {
+    for (int n = 0; n < 32; n++) {
+        square[n] = gf2_times(mat, mat[n]);
+    }
+}
+
+// CRC-32 склейки двух блоков по CRC каждого и длине второго (как crc32_combine в zlib)
+static uint32_t crc32_combine(uint32_t crc1, uint32_t crc2, uint64_t len2) {
+    uint32_t even[32], odd[32];
+    if (len2 == 0) return crc1;
+    odd[0] = 0xEDB88320u;  // оператор сдвига на один нулевой бит
+    uint32_t row = 1;
+    for (int n = 1; n < 32; n++) {
+        odd[n] = row;
+        row <<= 1;
+    }
+    gf2_square(even, odd);  // два нулевых бита
+    gf2_square(odd, even);  // четыре
+    do {
+        gf2_square(even, odd);
+        if (len2 & 1) crc1 = gf2_times(even, crc1);
+        len2 >>= 1;
+        if (len2 == 0) break;
+        gf2_square(odd, even);
+        if (len2 & 1) crc1 = gf2_times(odd, crc1);
+        len2 >>= 1;
+    } while (len2 != 0);
+    return crc1 ^ crc2;
+}
+
+/*
+ * Параллельная запись: размер секции таблицы зависит только от числа строк и
+ * байтов строк, поэтому после подсчёта размеров смещение каждой секции
+ * известно, и потоки пишут свои таблицы в один файл независимо, каждый через
+ * свой FILE*. Контрольная сумма файла собирается из сумм секций.
+ */
+typedef struct {
+    const Selection* tables;
+    int count;
+    int workers;
+    int options;
+    const char* path;        // временный файл, уже содержащий заголовок
+    ColumnLayout** layouts;  // по таблице
+    uint64_t* offsets;       // начало секции таблицы в файле
+    uint64_t* sizes;         // размер секции вместе с полем размера
+    int* owner;              // номер потока, пишущего таблицу
+    uint32_t* crcs;          // CRC-32 секции
+    int* errors;             // по потоку
+} ParallelSave;
+
+static void measure_worker(void* arg, int worker) {
+    ParallelSave* job = (ParallelSave*)arg;
+    for (int i = worker; i < job->count; i += job->workers) {
+        job->layouts[i] = measure_table(&job->tables[i], job->options);
+    }
+}
+
+static void write_worker(void* arg, int worker) {
+    ParallelSave* job = (ParallelSave*)arg;
+    FILE* file = fopen(job->path, "r+b");
+    Writer w = { file, (unsigned char*)malloc(IO_BUFFER_SIZE), 0, 0, 0, 0 };
+    void* gather = malloc(GATHER_ROWS * sizeof(uint64_t));
+    int error = !file || !w.buf || !gather;
+    for (int i = 0; i < job->count && !error; i++) {
+        if (job->owner[i] != worker) continue;
+        w.pos = job->offsets[i];
+        w.crc = 0;
+        if (seek_file(file, w.pos) != 0 ||
+            write_table(&w, &job->tables[i], job->layouts[i], gather) != 0) {
+            error = 1;
+        }
+        writer_flush(&w);
+        if (w.error) error = 1;
+        job->crcs[i] = w.crc;
+    }
+    if (file && fclose(file) != 0) error = 1;
+    free(w.buf);
+    free(gather);
+    job->errors[worker] = error;
+}
+
+// Пишет секции таблиц после заголовка, уже находящегося в буфере w
+static int write_tables_parallel(Writer* w, const char* tmp_path, const Selection* tables,
+                                 int count, int workers, int options) {
+    writer_flush(w);
+    if (w->error || fflush(w->file) != 0) return -1;
+
+    ParallelSave job = { tables, count, workers, options, tmp_path };
+    job.layouts = (ColumnLayout**)calloc(count, sizeof(ColumnLayout*));
+    job.offsets = (uint64_t*)malloc(count * sizeof(uint64_t));
+    job.sizes = (uint64_t*)malloc(count * sizeof(uint64_t));
+    job.owner = (int*)malloc(count * sizeof(int));
+    job.crcs = (uint32_t*)malloc(count * sizeof(uint32_t));
+    job.errors = (int*)calloc(workers, sizeof(int));
+    uint64_t* loads = (uint64_t*)calloc(workers, sizeof(uint64_t));
+    int* order = (int*)malloc(count * sizeof(int));
+    int error = !job.layouts || !job.offsets || !job.sizes || !job.owner ||
+                !job.crcs || !job.errors || !loads || !order;
+
+    if (!error) {
+        parallel_run(workers, measure_worker, &job);
+        uint64_t pos = w->pos;
+        for (int i = 0; i < count; i++) {
+            if (!job.layouts[i]) {
+                error = 1;
+                break;
+            }
+            job.offsets[i] = pos;
+            job.sizes[i] = 8 + table_section_size(tables[i].table, tables[i].count, job.layouts[i]);
+            pos += job.sizes[i];
+        }
+        if (!error) {
+            // Самые большие таблицы - первыми, каждая наименее загруженному потоку
+            for (int i = 0; i < count; i++) {
+                int k = i;
+                while (k > 0 && job.sizes[order[k - 1]] < job.sizes[i]) {
+                    order[k] = order[k - 1];
+                    k--;
+                }
+                order[k] = i;
+            }
+            for (int i = 0; i < count; i++) {
+                int best = 0;
+                for (int k = 1; k < workers; k++) {
+                    if (loads[k] < loads[best]) best = k;
+                }
+                job.owner[order[i]] = best;
+                loads[best] += job.sizes[order[i]];
+            }
+
+            parallel_run(workers, write_worker, &job);
+            for (int k = 0; k < workers; k++) {
+                if (job.errors[k]) error = 1;
+            }
+            for (int i = 0; i < count && !error; i++) {
+                w->crc = crc32_combine(w->crc, job.crcs[i], job.sizes[i]);
+            }
+            w->pos = pos;
+            if (!error && seek_file(w->file, pos) != 0) error = 1;
+        }
+    }
+
+    if (job.layouts) {
+        for (int i = 0; i < count; i++) free_layout(job.layouts[i], tables[i].table->num_columns);
+    }
+    free(job.layouts);
+    free(job.offsets);
+    free(job.sizes);
+    free(job.owner);
+    free(job.crcs);
+    free(job.errors);
+    free(loads);
+    free(order);
+    return error ? -1 : 0;
+}
+
+static int save_tables(const Selection* tables, int count, const char* path, uint32_t mark,
+                       int workers, int options) {
+    if (!path || count < 0) return -1;
+    if (!crc_ready) crc_init();
+    // Строки отображённых таблиц подкачиваются до записи (и до запуска потоков)
+    for (int i = 0; i < count; i++) {
+        if (storage_readable((Table*)tables[i].table, -1) != 0) return -1;
+    }
+
+    size_t path_len = strlen(path);
+    char* tmp_path = (char*)malloc(path_len + 5);
+    Writer w = { NULL, (unsigned char*)malloc(IO_BUFFER_SIZE), 0, 0, 0, 0 };
+    void* gather = malloc(GATHER_ROWS * sizeof(uint64_t));
+    if (!tmp_path || !w.buf || !gather) {
+        free(tmp_path);
+        free(w.buf);
+        free(gather);
+        fprintf(stderr, "Ошибка выделения памяти для сохранения\n");
+        return -1;
+    }
+    memcpy(tmp_path, path, path_len);
+    memcpy(tmp_path + path_len, ".tmp", 5);
+
+    w.file = fopen(tmp_path, "wb");
+    if (!w.file) {
+        fprintf(stderr, "Не удалось открыть файл %s для записи\n", tmp_path);
+        free(tmp_path);
+        free(w.buf);
+        free(gather);
+        return -1;
+    }
+
+    put(&w, BINFILE_MAGIC, 4);
+    // Без словарей файл остаётся читаемым и прежними версиями
+    put_u32(&w, (options & BINFILE_SAVE_DICT) ? BINFILE_VERSION_DICT : 1);
+    put_u32(&w, BINFILE_BYTE_ORDER);
+    put_u32(&w, (uint32_t)count);
+    put_u32(&w, 0);  // флаги
+    put_u32(&w, mark);
+    if (workers > count) workers = count;
+    if (workers > 1) {
+        if (write_tables_parallel(&w, tmp_path, tables, count, workers, options) != 0) {
+            w.error = 1;
+        }
+    }
+    for (int i = 0; i < count && !w.error && workers <= 1; i++) {
+        ColumnLayout* layout = measure_table(&tables[i], options);
+        if (!layout || write_table(&w, &tables[i], layout, gather) != 0) {
+            w.error = 1;
+        }
+        free_layout(layout, tables[i].table->num_columns);
+    }
+    writer_flush(&w);
+    uint32_t crc = w.crc;
+    if (!w.error && fwrite(&crc, sizeof(crc), 1, w.file) != 1) w.error = 1;
+    if (!w.error && sync_file(w.file) != 0) w.error = 1;
+    if (fclose(w.file) != 0) w.error = 1;
+
+    int result = -1;
+    if (w.error) {
+        fprintf(stderr, "Ошибка записи файла %s\n", tmp_path);
+        remove(tmp_path);
+    } else {
+#ifdef _WIN32
+        remove(path);  // rename в Windows не заменяет существующий файл
+#endif
+        if (rename(tmp_path, path) == 0) {
+            result = 0;
+        } else {
+            fprintf(stderr, "Не удалось переименовать %s в %s\n", tmp_path, path);
+            remove(tmp_path);
+        }
+    }
+    free(tmp_path);
+    free(w.buf);
+    free(gather);
+    return result;
+}
+
+API int save_database_file(Database* db, const char* path) {
+    return binfile_save_database(db, path, 0);
+}
+
+static Selection select_all(const Table* table) {
+    Selection sel = { table, NULL, table->num_rows - table->num_deleted };
+    return sel;
+}
+
+static int save_database(Database* db, const char* path, unsigned int mark, int workers, int options) {
+    int count = get_num_tables(db);
+    Selection* tables = (Selection*)malloc((count > 0 ? count : 1) * sizeof(Selection));
+    if (!tables) return -1;
+    for (int i = 0; i < count; i++) {
+        tables[i] = select_all(get_table_at(db, i));
+    }
+    int result = save_tables(tables, count, path, mark, workers, options);
+    free(tables);
+    return result;
+}
+
+int binfile_save_database(Database* db, const char* path, unsigned int mark) {
+    return save_database(db, path, mark, 1, 0);
+}
+
+API int save_database_file_parallel(Database* db, const char* path, int workers) {
+    return save_database(db, path, 0, workers, 0);
+}
+
+API int save_database_file_ex(Database* db, const char* path, int workers, int options) {
+    return save_database(db, path, 0, workers, options);
+}
+
+API int save_table_file(Table* table, const char* path) {
+    return binfile_save_rows(table, NULL, -1, path, 0);
+}
+
+/*
+ * Сохраняет только строки с идентификаторами row_ids (по возрастанию, без
+ * удалённых) - файл того же формата с next_row_id исходной таблицы.
+ */
+API int save_table_rows_file(Table* table, const int* row_ids, int count, const char* path) {
+    if ((!row_ids && count > 0) || count < 0) return -1;
+    return binfile_save_rows(table, row_ids, count, path, 0);
+}
+
+int binfile_save_rows(Table* table, const int* row_ids, int count, const char* path, int options) {
+    if (!table || (!row_ids && count > 0)) return -1;
+    if (count < 0) {
+        Selection sel = select_all(table);
+        return save_tables(&sel, 1, path, 0, 1, options);
+    }
+    int* slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    if (!slots) return -1;
+    for (int i = 0; i < count; i++) {
+        slots[i] = storage_slot(table, row_ids[i]);
+        if (slots[i] < 0 || (i > 0 && row_ids[i] <= row_ids[i - 1])) {
+            fprintf(stderr, "save_table_rows_file: неверный идентификатор строки %d\n", row_ids[i]);
+            free(slots);
+            return -1;
+        }
+    }
+    Selection sel = { table, slots, count };
+    int result = save_tables(&sel, 1, path, 0, 1, options);
+    free(slots);
+    return result;
+}
+
+/* ---------- Чтение ---------- */
+
+typedef struct {
+    FILE* file;
+    unsigned char* buf;
+    size_t len;          // байт в буфере
+    size_t off;          // прочитано из буфера
+    uint64_t pos;
+    uint32_t crc;
+    int error;
+} Reader;
+
+// Читает len байт в dst (NULL - пропустить), обновляя контрольную сумму
+static int take(Reader* r, void* dst, size_t len) {
+    unsigned char* p = (unsigned char*)dst;
+    unsigned char skip[256];
+    while (len > 0 && !r->error) {
+        if (r->off == r->len) {
+            if (len >= IO_BUFFER_SIZE && p) {
+                // Большой сегмент читается сразу на место
+                if (fread(p, 1, len, r->file) != len) {
+                    r->error = 1;
+                    break;
+                }
+                r->crc = binfile_crc32(r->crc, p, len);
+                r->pos += len;
+                return 0;
+            }
+            r->len = fread(r->buf, 1, IO_BUFFER_SIZE, r->file);
+            r->off = 0;
+            if (r->len == 0) {
+                r->error = 1;
+                break;
+            }
+        }
+        size_t n = r->len - r->off;
+        if (n > len) n = len;
+        if (!p && n > sizeof(skip)) n = sizeof(skip);
+        r->crc = binfile_crc32(r->crc, r->buf + r->off, n);
+        if (p) {
+            memcpy(p, r->buf + r->off, n);
+            p += n;
+        }
+        r->off += n;
+        r->pos += n;
+        len -= n;
+    }
+    return r->error ? -1 : 0;
+}
+
+static uint32_t take_u32(Reader* r) {
+    uint32_t v = 0;
+    take(r, &v, sizeof(v));
+    return v;
+}
+
+static uint64_t take_u64(Reader* r) {
+    uint64_t v = 0;
+    take(r, &v, sizeof(v));
+    return v;
+}
+
+// Строка "u32 длина + байты"; результат выделяется malloc
+static char* take_str(Reader* r) {
+    uint32_t len = take_u32(r);
+    if (r->error || len > MAX_NAME_LEN) {
+        r->error = 1;
+        return NULL;
+    }
+    char* s = (char*)malloc(len + 1);
+    if (!s || take(r, s, len) != 0) {
+        free(s);
+        r->error = 1;
+        return NULL;
+    }
+    s[len] = '\0';
+    return s;
+}
+
+static void take_pad(Reader* r) {
+    take(r, NULL, (size_t)(align8(r->pos) - r->pos));
+}
+
+static int read_numeric_segment(Reader* r, Table* table, int col, int n, int32_t* gather) {
+    if (table->storage == STORAGE_COLUMNAR) {
+        take(r, table->column_data[col], (size_t)n * 4);
+    } else {
+        for (int done = 0; done < n && !r->error; ) {
+            int count = n - done < GATHER_ROWS ? n - done : GATHER_ROWS;
+            if (take(r, gather, (size_t)count * 4) != 0) break;
+            for (int i = 0; i < count; i++) {
+                DataValue v;
+                memcpy(&v, &gather[i], 4);
+                storage_set(table, done + i, col, v);
+            }
+            done += count;
+        }
+    }
+    take_pad(r);
+    return r->error ? -1 : 0;
+}
+
+static int read_string_segment(Reader* r, Table* table, int col, int n) {
+    unsigned char* nulls = (unsigned char*)malloc(n > 0 ? n : 1);
+    uint64_t* offsets = (uint64_t*)malloc(((size_t)n + 1) * sizeof(uint64_t));
+    if (!nulls || !offsets) {
+        free(nulls);
+        free(offsets);
+        return -1;
+    }
+    take(r, nulls, n);
+    take_pad(r);
+    take(r, offsets, ((size_t)n + 1) * sizeof(uint64_t));
+    if (!r->error && offsets[0] != 0) r->error = 1;
+    for (int i = 0; i < n && !r->error; i++) {
+        uint64_t len = offsets[i + 1] - offsets[i];
+        if (offsets[i + 1] < offsets[i] || len > (uint64_t)INT32_MAX || (nulls[i] && len)) {
+            r->error = 1;
+            break;
+        }
+        if (nulls[i]) continue;
+        DataValue v;
+        v.s = (char*)malloc((size_t)len + 1);
+        if (!v.s || take(r, v.s, (size_t)len) != 0) {
+            free(v.s);
+            r->error = 1;
+            break;
+        }
+        v.s[len] = '\0';
+        storage_set(table, i, col, v);
+    }
+    take_pad(r);
+    free(nulls);
+    free(offsets);
+    return r->error ? -1 : 0;
+}
+
+// Словарный сегмент (BINFILE_COL_DICT): строки собираются из словаря по кодам
+static int read_dict_segment(Reader* r, Table* table, int col, int n) {
+    uint32_t count = take_u32(r);
+    take_u32(r);
+    if (r->error || count > (uint32_t)n) return -1;
+    int32_t* codes = (int32_t*)malloc(((size_t)n > 0 ? n : 1) * sizeof(int32_t));
+    uint64_t* offsets = (uint64_t*)malloc(((size_t)count + 1) * sizeof(uint64_t));
+    char* bytes = NULL;
+    if (!codes || !offsets) r->error = 1;
+    take(r, codes, (size_t)n * 4);
+    take_pad(r);
+    take(r, offsets, ((size_t)count + 1) * sizeof(uint64_t));
+    if (!r->error && offsets[0] != 0) r->error = 1;
+    for (uint32_t k = 0; k < count && !r->error; k++) {
+        if (offsets[k + 1] < offsets[k] || offsets[k + 1] - offsets[k] > (uint64_t)INT32_MAX) r->error = 1;
+    }
+    if (!r->error) {
+        bytes = (char*)malloc((size_t)offsets[count] + 1);
+        if (!bytes || take(r, bytes, (size_t)offsets[count]) != 0) r->error = 1;
+    }
+    for (int i = 0; i < n && !r->error; i++) {
+        int32_t code = codes[i];
+        if (code < -1 || code >= (int32_t)count) {
+            r->error = 1;
+            break;
+        }
+        if (code < 0) continue;
+        size_t len = (size_t)(offsets[code + 1] - offsets[code]);
+        DataValue v;
+        v.s = (char*)malloc(len + 1);
+        if (!v.s) {
+            r->error = 1;
+            break;
+        }
+        memcpy(v.s, bytes + offsets[code], len);
+        v.s[len] = '\0';
+        storage_set(table, i, col, v);
+    }
+    take_pad(r);
+    free(codes);
+    free(offsets);
+    free(bytes);
+    return r->error ? -1 : 0;
+}
+
+static Table* read_table(Reader* r, void* gather) {
+    Table* table = NULL;
+    Column* columns = NULL;
+    uint32_t* flags = NULL;
+    char** fk_names = NULL;
+    int* ids = NULL;
+    uint32_t num_columns = 0, num_fks = 0;
+
+    take_u64(r);  // размер секции нужен только для пропуска таблиц
+    char* name = take_str(r);
+    uint32_t storage = take_u32(r);
+    num_columns = take_u32(r);
+    uint32_t n = take_u32(r);
+    uint32_t next_row_id = take_u32(r);
+    num_fks = take_u32(r);
+    if (r->error || num_columns == 0 || num_columns > 65535 || n > (uint32_t)INT32_MAX ||
+        next_row_id > (uint32_t)INT32_MAX || num_fks > num_columns) {
+        r->error = 1;
+        goto done;
+    }
+
+    columns = (Column*)calloc(num_columns, sizeof(Column));
+    flags = (uint32_t*)calloc(num_columns, sizeof(uint32_t));
+    fk_names = (char**)calloc((size_t)num_fks * 3 + 1, sizeof(char*));
+    if (!columns || !flags || !fk_names) {
+        r->error = 1;
+        goto done;
+    }
+    for (uint32_t j = 0; j < num_columns && !r->error; j++) {
+        char* col_name = take_str(r);
+        if (col_name) {
+            strncpy(columns[j].name, col_name, sizeof(columns[j].name) - 1);
+            free(col_name);
+        }
+        columns[j].type = (ColumnType)take_u32(r);
+        flags[j] = take_u32(r);
+        if (columns[j].type != TYPE_INT && columns[j].type != TYPE_FLOAT && columns[j].type != TYPE_STRING) {
+            r->error = 1;
+        }
+        if ((flags[j] & BINFILE_COL_DICT) && columns[j].type != TYPE_STRING) r->error = 1;
+    }
+    for (uint32_t k = 0; k < num_fks * 3 && !r->error; k++) {
+        fk_names[k] = take_str(r);
+    }
+    take_pad(r);
+    if (r->error) goto done;
+
+    table = create_table_ex(name, columns, (int)num_columns, (int)storage);
+    ids = (int*)malloc(((size_t)n > 0 ? n : 1) * sizeof(int));
+    if (!table || !ids) {
+        r->error = 1;
+        goto done;
+    }
+    take(r, ids, (size_t)n * sizeof(int));
+    take_pad(r);
+    if (r->error || storage_load_slots(table, ids, (int)n, (int)next_row_id) != 0) {
+        r->error = 1;
+        goto done;
+    }
+    for (uint32_t j = 0; j < num_columns && !r->error; j++) {
+        if (flags[j] & BINFILE_COL_DICT) {
+            if (read_dict_segment(r, table, (int)j, (int)n) != 0) r->error = 1;
+        } else if (columns[j].type == TYPE_STRING) {
+            read_string_segment(r, table, (int)j, (int)n);
+        } else {
+            read_numeric_segment(r, table, (int)j, (int)n, (int32_t*)gather);
+        }
+    }
+    if (r->error) goto done;
+
+    // Ключи объявляются после данных: индекс первичного ключа строится один раз
+    for (uint32_t j = 0; j < num_columns; j++) {
+        if ((flags[j] & BINFILE_COL_PRIMARY_KEY) && set_primary_key(table, columns[j].name) != 0) {
+            fprintf(stderr, "Предупреждение: первичный ключ %s.%s не восстановлен\n", name, columns[j].name);
+        }
+    }
+    for (uint32_t k = 0; k < num_fks; k++) {
+        if (add_foreign_key(table, fk_names[3 * k], fk_names[3 * k + 1], fk_names[3 * k + 2]) != 0) {
+            fprintf(stderr, "Предупреждение: внешний ключ %s.%s не восстановлен\n", name, fk_names[3 * k]);
+        }
+    }
+
+done:
+    if (r->error && table) {
+        free_table(table);
+        table = NULL;
+    }
+    for (uint32_t k = 0; fk_names && k < num_fks * 3; k++) {
+        free(fk_names[k]);
+    }
+    free(fk_names);
+    free(name);
+    free(columns);
+    free(flags);
+    free(ids);
+    return table;
+}
+
+/*
+ * Читает файл целиком в список таблиц. max_tables ограничивает число
+ * читаемых таблиц (остальные не проверяются контрольной суммой, поэтому
+ * для частичного чтения сумма не сверяется). Возвращает число таблиц или -1.
+ */
+static int read_tables(const char* path, Table*** out_tables, int max_tables) {
+    if (!path) return -1;
+    if (!crc_ready) crc_init();
+    FILE* f = fopen(path, "rb");
+    if (!f) {
+        fprintf(stderr, "Не удалось открыть файл %s\n", path);
+        return -1;
+    }
+    Reader r = { f, (unsigned char*)malloc(IO_BUFFER_SIZE), 0, 0, 0, 0, 0 };
+    void* gather = malloc(GATHER_ROWS * sizeof(uint64_t));
+    Table** tables = NULL;
+    int loaded = 0;
+    if (!r.buf || !gather) {
+        r.error = 1;
+        goto done;
+    }
+
+    char magic[4];
+    take(&r, magic, 4);
+    uint32_t version = take_u32(&r);
+    uint32_t order = take_u32(&r);
+    uint32_t count = take_u32(&r);
+    take_u32(&r);  // флаги
+    take_u32(&r);  // отметка журнала
+    if (r.error || memcmp(magic, BINFILE_MAGIC, 4) != 0) {
+        fprintf(stderr, "Файл %s не является файлом базы данных\n", path);
+        r.error = 1;
+        goto done;
+    }
+    if (version > BINFILE_VERSION || order != BINFILE_BYTE_ORDER) {
+        fprintf(stderr, "Неподдерживаемая версия (%u) или порядок байтов файла %s\n", version, path);
+        r.error = 1;
+        goto done;
+    }
+    if (count > 1000000) {
+        r.error = 1;
+        goto done;
+    }
+
+    int wanted = max_tables >= 0 && (uint32_t)max_tables < count ? max_tables : (int)count;
+    tables = (Table**)calloc(wanted > 0 ? wanted : 1, sizeof(Table*));
+    if (!tables) {
+        r.error = 1;
+        goto done;
+    }
+    for (int i = 0; i < wanted && !r.error; i++) {
+        tables[i] = read_table(&r, gather);
+        if (!tables[i]) {
+            r.error = 1;
+            break;
+        }
+        loaded++;
+    }
+    if (!r.error && wanted == (int)count) {
+        uint32_t computed = r.crc;
+        uint32_t stored = 0;
+        // Контрольная сумма сама в себя не входит: читаем её мимо take()
+        for (size_t k = 0; k < sizeof(stored); k++) {
+            int c;
+            if (r.off < r.len) {
+                c = r.buf[r.off++];
+            } else {
+                c = fgetc(f);
+            }
+            if (c == EOF) {
+                r.error = 1;
+                break;
+            }
+            ((unsigned char*)&stored)[k] = (unsigned char)c;
+        }
+        if (!r.error && stored != computed) {
+            fprintf(stderr, "Контрольная сумма файла %s не совпадает\n", path);
+            r.error = 1;
+        }
+    }
+
+done:
+    if (r.error) {
+        fprintf(stderr, "Ошибка чтения файла %s\n", path);
+        for (int i = 0; i < loaded; i++) {
+            free_table(tables[i]);
+        }
+        free(tables);
+        tables = NULL;
+        loaded = -1;
+    }
+    fclose(f);
+    free(r.buf);
+    free(gather);
+    *out_tables = tables;
+    return loaded;
+}
+
+static int load_database_file_locked(Database* db, const char* path) {
+    Table** tables = NULL;
+    int count = read_tables(path, &tables, -1);
+    if (count < 0) return -1;
+
+    // Имена не должны совпадать с уже существующими таблицами
+    for (int i = 0; i < count; i++) {
+        if (get_table_by_name(db, tables[i]->name)) {
+            fprintf(stderr, "Таблица %s уже существует\n", tables[i]->name);
+            for (int k = 0; k < count; k++) {
+                free_table(tables[k]);
+            }
+            free(tables);
+            return -1;
+        }
+    }
+    int added = 0;
+    for (int i = 0; i < count; i++) {
+        if (add_table_to_db(db, tables[i]) == 0) {
+            added++;
+        } else {
+            free_table(tables[i]);
+        }
+    }
+    free(tables);
+    return added;
+}
+
+API int load_database_file(Database* db, const char* path) {
+    lock_mutations();
+    int result = load_database_file_locked(db, path);
+    unlock_mutations();
+    return result;
+}
+
+int binfile_read_mark(const char* path, unsigned int* mark) {
+    unsigned char header[BINFILE_HEADER_SIZE];
+    FILE* f = path ? fopen(path, "rb") : NULL;
+    if (!f) return -1;
+    size_t got = fread(header, 1, sizeof(header), f);
+    fclose(f);
+    uint32_t version, order;
+    memcpy(&version, header + 4, 4);
+    memcpy(&order, header + 8, 4);
+    if (got != sizeof(header) || memcmp(header, BINFILE_MAGIC, 4) != 0 ||
+        version > BINFILE_VERSION || order != BINFILE_BYTE_ORDER) {
+        return -1;
+    }
+    memcpy(mark, header + 20, 4);
+    return 0;
+}
+
+API Table* load_table_file(const char* path) {
+    Table** tables = NULL;
+    int count = read_tables(path, &tables, 1);
+    if (count <= 0) {
+        free(tables);
+        return NULL;
+    }
+    Table* table = tables[0];
+    free(tables);
+    return table;
+}
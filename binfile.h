@@ -0,0 +1,70 @@
+#ifndef BINFILE_H
+#define BINFILE_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Двоичный формат файла базы данных (все числа в порядке байтов машины,
+ * порядок проверяется меткой в заголовке):
+ *
+ *   заголовок   "MYDB", u32 версия, u32 метка порядка байтов, u32 число таблиц,
+ *               u32 флаги, u32 отметка журнала (всего 24 байта)
+ *   таблица     u64 размер секции, затем: имя, u32 формат хранения, u32 столбцов,
+ *               u32 строк, u32 next_row_id, u32 внешних ключей; столбцы (имя, u32 тип,
+ *               u32 флаги); внешние ключи (столбец, таблица, столбец); сегменты:
+ *               идентификаторы строк i32[n], затем по сегменту на столбец:
+ *               INT - i32[n], FLOAT - f32[n], STRING - u8 NULL[n], u64 смещения[n + 1]
+ *               и байты строк без завершающих нулей; STRING с флагом BINFILE_COL_DICT -
+ *               u32 размер словаря d, u32 0, коды строк i32[n] (-1 - NULL),
+ *               u64 смещения[d + 1] и байты различных строк
+ *   окончание   u32 CRC-32 всех предыдущих байтов
+ *
+ * Строки-имена записываются как u32 длина + байты. Каждый сегмент и каждая
+ * секция выровнены на 8 байт от начала файла. Словарные столбцы появились в
+ * версии 2; файлы без них по-прежнему записываются версией 1.
+ */
+
+#define BINFILE_MAGIC       "MYDB"
+#define BINFILE_VERSION     2   // последняя читаемая версия
+#define BINFILE_VERSION_DICT 2  // версия файлов, в которых могут быть словарные столбцы
+#define BINFILE_BYTE_ORDER  0x01020304u
+#define BINFILE_HEADER_SIZE 24
+
+// Флаги столбца
+#define BINFILE_COL_PRIMARY_KEY 1
+#define BINFILE_COL_DICT        2   // строковый столбец записан словарём
+
+// Параметры записи
+#define BINFILE_SAVE_DICT 1  // строковые столбцы с повторами записывать словарём
+
+// Сохраняет все таблицы базы (NULL - глобальная); запись во временный файл и
+// переименование, поэтому при ошибке старый файл остаётся целым
+API int save_database_file(Database* db, const char* path);
+// То же, но таблицы записываются параллельно в workers потоков (формат файла
+// тот же: каждый поток пишет свои секции по заранее вычисленным смещениям)
+API int save_database_file_parallel(Database* db, const char* path, int workers);
+// Сохранение с параметрами записи (BINFILE_SAVE_*)
+API int save_database_file_ex(Database* db, const char* path, int workers, int options);
+// Сохраняет одну таблицу в файл того же формата
+API int save_table_file(Table* table, const char* path);
+// Сохраняет только строки с заданными идентификаторами (по возрастанию)
+API int save_table_rows_file(Table* table, const int* row_ids, int count, const char* path);
+// Общая часть save_table_file и save_table_rows_file: count < 0 - все живые
+// строки, options - параметры записи (BINFILE_SAVE_*)
+int binfile_save_rows(Table* table, const int* row_ids, int count, const char* path, int options);
+// Загружает все таблицы файла в базу (NULL - глобальная), восстанавливая
+// первичные и внешние ключи; возвращает число таблиц или -1. При ошибке
+// (в том числе несовпадении контрольной суммы) база не изменяется
+API int load_database_file(Database* db, const char* path);
+// Загружает первую таблицу файла без добавления в базу
+API Table* load_table_file(const char* path);
+
+// Сохранение с отметкой журнала в заголовке (контрольная точка, см. wal.h)
+int binfile_save_database(Database* db, const char* path, unsigned int mark);
+// Читает отметку журнала из заголовка файла; -1, если файла нет или он не того формата
+int binfile_read_mark(const char* path, unsigned int* mark);
+
+// CRC-32 (полином 0xEDB88320), crc - значение для предыдущих данных или 0
+unsigned int binfile_crc32(unsigned int crc, const void* data, size_t len);
+
+#endif // BINFILE_H
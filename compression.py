@@ -0,0 +1,138 @@
+"""
+Сжатые файлы базы и резервных копий.
+
+Сжатый файл - обычный файл базы (двоичный binfile.h или JSON), целиком
+упакованный стандартным форматом одного из кодеков стандартной библиотеки:
+
+    "zlib"  gzip (.gz)    быстрый, для регулярных резервных копий
+    "lzma"  xz (.xz)      самый плотный и самый медленный
+    "bz2"   bzip2 (.bz2)
+
+При чтении кодек определяется по первым байтам файла, поэтому загрузка
+распаковывает файл прозрачно, независимо от его имени. Двоичный файл перед
+сжатием пишется со словарными строковыми столбцами (BINFILE_SAVE_DICT):
+повторяющаяся строка хранится один раз, а её коды сжимаются лучше самих
+строк. Файл сжимается и распаковывается потоком блоками по BLOCK_SIZE;
+кодеки освобождают GIL, так что сжатие в фоновом потоке не останавливает
+остальную программу.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+BLOCK_SIZE = 1 << 20
+
+Codec = namedtuple('Codec', 'open_write level open_read magic suffix zip_method')
+
+CODECS = {
+    "zlib": Codec(lambda file, level: gzip.open(file, 'wb', compresslevel=level), 6, gzip.open,
+                  b'\x1f\x8b', '.gz', zipfile.ZIP_DEFLATED),
+    "lzma": Codec(lambda file, level: lzma.open(file, 'wb', preset=level), 6, lzma.open,
+                  b'\xfd7zXZ\x00', '.xz', zipfile.ZIP_LZMA),
+    "bz2": Codec(lambda file, level: bz2.open(file, 'wb', compresslevel=level), 9, bz2.open,
+                 b'BZh', '.bz2', zipfile.ZIP_BZIP2),
+}
+
+
+def _codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f"Неизвестный кодек сжатия: {codec} (доступны: {', '.join(CODECS)})")
+    return CODECS[codec]
+
+
+def codec_suffix(codec):
+    """Расширение файла, сжатого кодеком"""
+    return _codec(codec).suffix
+
+
+def zip_method(codec):
+    """Метод сжатия zip для кодека (None - без сжатия)"""
+    return _codec(codec).zip_method if codec else zipfile.ZIP_STORED
+
+
+def codec_of_name(filename):
+    """Кодек по расширению имени файла или None"""
+    for codec, info in CODECS.items():
+        if filename.lower().endswith(info.suffix):
+            return codec
+    return None
+
+
+def codec_of_file(path):
+    """Кодек, которым сжат файл (по сигнатуре), или None"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for codec, info in CODECS.items():
+        if head.startswith(info.magic):
+            return codec
+    return None
+
+
+def compress_file(src, dst, codec, level=None):
+    """
+    Сжимает файл src в dst. Прежний dst заменяется только после успешной
+    записи.
+    """
+    info = _codec(codec)
+    temp_path = dst + '.tmp'
+    try:
+        with open(src, 'rb') as source, open(temp_path, 'wb') as raw:
+            with info.open_write(raw, info.level if level is None else level) as target:
+                shutil.copyfileobj(source, target, BLOCK_SIZE)
+            raw.flush()
+            os.fsync(raw.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, dst)
+
+
+def write_compressed(filename, codec, write):
+    """
+    Сохраняет файл сжатым: write(путь, as_json) пишет несжатый файл по
+    временному пути, который затем сжимается в filename. as_json - имя без
+    расширения кодека оканчивается на .json (base.json.gz).
+    """
+    suffix = codec_suffix(codec)
+    plain_name = filename[:-len(suffix)] if filename.lower().endswith(suffix) else filename
+    temp_path = filename + '.raw'
+    try:
+        write(temp_path, plain_name.lower().endswith('.json'))
+        compress_file(temp_path, filename, codec)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def decompress_file(src, dst):
+    """Распаковывает файл src (кодек определяется по сигнатуре) в dst"""
+    codec = codec_of_file(src)
+    if codec is None:
+        raise IOError(f"Файл {src} не сжат известным кодеком")
+    with _codec(codec).open_read(src, 'rb') as source, open(dst, 'wb') as target:
+        shutil.copyfileobj(source, target, BLOCK_SIZE)
+
+
+@contextmanager
+def decompressed(path):
+    """
+    Путь к несжатому содержимому файла: сам path или временный файл рядом
+    с ним, удаляемый по выходе из блока.
+    """
+    if codec_of_file(path) is None:
+        yield path
+        return
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        decompress_file(path, temp_path)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
@@ -0,0 +1,13 @@
+from db_interface import Database, lib
+
+
+def new_database():
+    """Пустая база: глобальное состояние C-библиотеки сбрасывается"""
+    lib.cleanup_database()
+    lib.init_database()
+    return Database()
+
+
+def snapshot_state(db):
+    """Содержимое всех таблиц базы (с идентификаторами строк) для сравнения"""
+    return {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()}
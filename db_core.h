@@ -18,6 +18,7 @@
 #define DB_INITIAL_CAPACITY 10
 #define TABLE_INITIAL_CAPACITY 10
 #define TRANSACTION_INITIAL_CAPACITY 100
+#define VACUUM_MIN_DELETED 1024  // минимум надгробий для автоматического уплотнения
 
 typedef enum {
     TYPE_INT,
@@ -25,6 +26,12 @@ typedef enum {
     TYPE_STRING
 } ColumnType;
 
+// Формат хранения данных таблицы
+typedef enum {
+    STORAGE_ROW,       // строка - отдельный массив DataValue
+    STORAGE_COLUMNAR   // столбец - непрерывный типизированный массив
+} StorageType;
+
 // Структура для хранения значения ячейки
 typedef union {
     int i;
@@ -46,23 +53,46 @@ typedef struct {
     char referenced_table[50];
     char referenced_column[50];
     int column_index;
+    // Кеш разрешённой ссылки, действителен пока schema_version базы не изменилась
+    struct Table* ref_table;
+    int ref_col_index;
+    int cache_version;
 } ForeignKey;
 
+// Хеш-индекс по столбцу (определён в index.h)
+typedef struct HashIndex HashIndex;
+
+// Данные таблицы, отображённые из файла (определены в mmapfile.h)
+typedef struct MappedTable MappedTable;
+
 // Структура для хранения строки
 typedef struct {
     DataValue* values;
 } Row;
 
 // Структура для хранения таблицы
-typedef struct {
+typedef struct Table {
     char name[50];
     Column* columns;
     int num_columns;
     Row* rows;
-    int num_rows;
+    int num_rows;         // количество занятых слотов, включая удалённые строки
     int max_rows;
     ForeignKey** foreign_keys;
     int num_foreign_keys;
+    int storage;          // StorageType
+    void** column_data;   // массивы столбцов для STORAGE_COLUMNAR (int*, float*, char**)
+    HashIndex** indexes;  // индекс для каждого столбца или NULL
+    int* row_ids;         // слот -> стабильный идентификатор строки
+    int* id_slots;        // идентификатор -> слот (-1 после уплотнения)
+    int next_row_id;
+    int id_capacity;
+    unsigned char* deleted;  // признак удалённой строки (надгробие) для каждого слота
+    int num_deleted;
+    int schema_version;   // версия схемы таблицы, уникальна среди всех таблиц
+    MappedTable* mapped;  // данные в отображённом файле (до первого изменения) или NULL
+    int* row_versions;    // эпоха последнего изменения каждого слота (storage_epoch)
+    int data_version;     // эпоха последнего изменения данных таблицы
 } Table;
 
 // Структура для хранения глобального состояния базы данных
@@ -71,6 +101,9 @@ typedef struct {
     int num_tables;
     int max_tables;
     void* current_transaction;
+    Table** table_map;    // хеш-таблица имён (открытая адресация), NULL - пустая ячейка
+    int map_capacity;     // всегда степень двойки
+    int schema_version;   // увеличивается при любом изменении схемы
 } Database;
 
 // Перечисление для типов операций транзакции
@@ -84,7 +117,7 @@ typedef enum {
 typedef struct {
     OperationType operation;
     Table* table;
-    int row_index;
+    int row_index;        // идентификатор строки (см. storage.c)
     int col_index;
     DataValue old_value;
     DataValue new_value;
@@ -102,9 +135,12 @@ typedef struct {
 // Функции для работы с таблицами
 API Table* create_table(const char* name, Column* columns, int num_columns);
 API int insert_row(Table* table, DataValue* values);
+API int insert_rows(Table* table, DataValue* values, int nrows);
+API int insert_columns(Table* table, void** columns, int nrows);
 API void print_table(Table* table);
-API int update_row(Table* table, int row_index, int col_index, DataValue new_value);
-API int delete_row(Table* table, int row_index);
+API int update_row(Table* table, int row_id, int col_index, DataValue new_value);
+API int delete_row(Table* table, int row_id);
+API int vacuum_table(Table* table);
 API void free_table(Table* table);
 API Table* transform_table(Table* table, Column* new_columns, int num_new_columns);
 API int add_column(Table* table, const char* col_name, int new_type, DataValue default_value);
@@ -118,6 +154,18 @@ API void init_database(void);
 API void cleanup_database(void);
 API int add_table_to_db(Database* db, Table* table);
 API Table* get_table_by_name(Database* db, const char* name);
+API int drop_table(Database* db, const char* name);
+API int replace_table(Database* db, Table* table);
+API int get_schema_version(void);
+API int get_num_tables(Database* db);
+API Table* get_table_at(Database* db, int index);
+
+// Отмечает изменение схемы глобальной базы (сбрасывает кеши ссылок)
+void schema_changed(void);
+// Изменение схемы таблицы: столбцы, ключи; выдаёт таблице новую версию
+void table_schema_changed(Table* table);
+// Последняя выданная версия схемы таблиц (таблицы с большей созданы или изменены позже)
+int last_table_schema_version(void);
 API int check_foreign_key_constraint(Database* db, Table* table, int col_index, DataValue value);
 
 // Функции для работы с транзакциями
@@ -125,5 +173,7 @@ API void* begin_transaction();
 API int commit_transaction(void* transaction);
 API void rollback_transaction(void* transaction);
 API void free_transaction(Transaction* transaction);
+// Начата ли транзакция (в том числе идёт её откат)
+int transaction_in_progress(void);
 
 #endif  // DB_CORE_H
@@ -1,13 +1,26 @@
+import array
 import ctypes
-from ctypes import c_int, c_float, c_char_p, c_char, Structure, POINTER, Union, c_void_p
+from ctypes import c_int, c_float, c_char_p, c_char, Structure, POINTER, Union, c_void_p, c_ubyte, c_longlong
 import os
 import json
+import math
 import sys
+from collections import OrderedDict
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него используются memoryview
+    np = None
 
 TYPE_INT    = 0
 TYPE_FLOAT  = 1
 TYPE_STRING = 2
 
+# Форматы хранения таблицы
+STORAGE_ROW      = 0
+STORAGE_COLUMNAR = 1
+
 class DataValue(Union):
     _fields_ = [
         ("i", c_int),
@@ -29,7 +42,10 @@ class ForeignKey(Structure):
     _fields_ = [
         ("referenced_table", c_char * 50),
         ("referenced_column", c_char * 50),
-        ("column_index", c_int)
+        ("column_index", c_int),
+        ("ref_table", c_void_p),
+        ("ref_col_index", c_int),
+        ("cache_version", c_int)
     ]
 
 class Row(Structure):
@@ -46,7 +62,71 @@ class Table(Structure):
         ("num_rows", c_int),
         ("max_rows", c_int),
         ("foreign_keys", POINTER(POINTER(ForeignKey))),
-        ("num_foreign_keys", c_int)
+        ("num_foreign_keys", c_int),
+        ("storage", c_int),
+        ("column_data", POINTER(c_void_p)),
+        ("indexes", POINTER(c_void_p)),
+        ("row_ids", POINTER(c_int)),
+        ("id_slots", POINTER(c_int)),
+        ("next_row_id", c_int),
+        ("id_capacity", c_int),
+        ("deleted", POINTER(c_ubyte)),
+        ("num_deleted", c_int),
+        ("schema_version", c_int),
+        ("mapped", c_void_p),
+        ("row_versions", POINTER(c_int)),
+        ("data_version", c_int)
+    ]
+
+class RowBatch(Structure):
+    _fields_ = [
+        ("num_rows", c_int),
+        ("num_columns", c_int),
+        ("row_ids", POINTER(c_int)),
+        ("columns", POINTER(c_void_p)),
+        ("string_offsets", POINTER(POINTER(c_int)))
+    ]
+
+class AggResult(Structure):
+    _fields_ = [
+        ("num_groups", c_int),
+        ("num_aggs", c_int),
+        ("key_row_ids", POINTER(c_int)),
+        ("counts", POINTER(c_int)),
+        ("values", POINTER(ctypes.c_double)),
+        ("value_counts", POINTER(c_int))
+    ]
+
+class JoinResult(Structure):
+    _fields_ = [
+        ("num_rows", c_int),
+        ("child_ids", POINTER(c_int)),
+        ("parent_ids", POINTER(c_int))
+    ]
+
+# Снимок таблицы целиком (SnapshotJob.since, snapshot.h)
+SNAPSHOT_WHOLE = -1
+
+# Параметры записи двоичного файла (binfile.h): строковые столбцы с повторами - словарём
+BINFILE_SAVE_DICT = 1
+
+# Режимы блокировок и результаты lock_acquire (locks.h)
+LOCK_INTENT_SHARED = 0
+LOCK_INTENT_EXCLUSIVE = 1
+LOCK_SHARED = 2
+LOCK_EXCLUSIVE = 3
+LOCK_WHOLE_TABLE = -1
+LOCK_OK = 0
+LOCK_TIMEOUT = 1
+LOCK_DEADLOCK = 2
+LOCK_FAILED = -1
+
+class SnapshotJob(Structure):
+    _fields_ = [
+        ("table", POINTER(Table)),
+        ("since", c_int),
+        ("path", c_char_p),
+        ("ids_path", c_char_p)
     ]
 
 # Получаем путь к папке, где находится этот скрипт
@@ -73,9 +153,20 @@ lib.transform_table.restype  = POINTER(Table)
 lib.create_table.argtypes = [c_char_p, POINTER(Column), c_int]
 lib.create_table.restype  = POINTER(Table)
 
+lib.create_table_ex.argtypes = [c_char_p, POINTER(Column), c_int, c_int]
+lib.create_table_ex.restype  = POINTER(Table)
+
+lib.get_cell.argtypes = [POINTER(Table), c_int, c_int]
+lib.get_cell.restype  = DataValue
+lib.check_column_readable.argtypes = [POINTER(Table), c_int]
+lib.check_column_readable.restype  = c_int
+
 lib.insert_row.argtypes = [POINTER(Table), POINTER(DataValue)]
 lib.insert_row.restype  = c_int
 
+lib.insert_rows.argtypes = [POINTER(Table), POINTER(DataValue), c_int]
+lib.insert_rows.restype  = c_int
+
 lib.print_table.argtypes = [POINTER(Table)]
 lib.print_table.restype  = None
 
@@ -85,6 +176,63 @@ lib.update_row.restype  = c_int
 lib.delete_row.argtypes = [POINTER(Table), c_int]
 lib.delete_row.restype  = c_int
 
+lib.vacuum_table.argtypes = [POINTER(Table)]
+lib.vacuum_table.restype  = c_int
+
+lib.export_rows.argtypes = [POINTER(Table), c_int, c_int]
+lib.export_rows.restype  = POINTER(RowBatch)
+
+lib.free_row_batch.argtypes = [POINTER(RowBatch)]
+lib.free_row_batch.restype  = None
+
+lib.export_row_ids.argtypes = [POINTER(Table), POINTER(c_int), c_int]
+lib.export_row_ids.restype  = POINTER(RowBatch)
+
+lib.scan_column.argtypes = [POINTER(Table), c_int, c_int, DataValue, DataValue, POINTER(c_ubyte), c_int]
+lib.scan_column.restype  = c_int
+
+lib.combine_masks.argtypes = [POINTER(c_ubyte), POINTER(c_ubyte), c_int, c_int]
+lib.combine_masks.restype  = c_int
+
+lib.mask_to_row_ids.argtypes = [POINTER(Table), POINTER(c_ubyte), POINTER(c_int)]
+lib.mask_to_row_ids.restype  = c_int
+
+lib.sort_table_index.argtypes = [POINTER(Table), c_int, c_int, POINTER(c_int)]
+lib.sort_table_index.restype  = c_int
+
+lib.sort_row_ids.argtypes = [POINTER(Table), POINTER(c_int), c_int, POINTER(c_int), POINTER(c_int), c_int]
+lib.sort_row_ids.restype  = c_int
+
+lib.top_row_ids.argtypes = [POINTER(Table), POINTER(c_int), c_int, POINTER(c_int), POINTER(c_int), c_int, c_int]
+lib.top_row_ids.restype  = c_int
+
+lib.get_index_kind.argtypes = [POINTER(Table), c_int]
+lib.get_index_kind.restype = c_int
+
+lib.index_lookup.argtypes = [POINTER(Table), c_int, DataValue, POINTER(c_int), c_int]
+lib.index_lookup.restype = c_int
+
+lib.aggregate_table.argtypes = [POINTER(Table), c_int, POINTER(c_int), POINTER(c_int), c_int, POINTER(c_ubyte)]
+lib.aggregate_table.restype = POINTER(AggResult)
+
+lib.free_agg_result.argtypes = [POINTER(AggResult)]
+lib.free_agg_result.restype = None
+
+lib.join_tables.argtypes = [POINTER(Table), c_int, POINTER(Table), c_int, POINTER(c_ubyte)]
+lib.join_tables.restype = POINTER(JoinResult)
+
+lib.free_join_result.argtypes = [POINTER(JoinResult)]
+lib.free_join_result.restype = None
+
+lib.copy_column.argtypes = [POINTER(Table), c_int, c_void_p]
+lib.copy_column.restype  = c_int
+
+lib.insert_columns.argtypes = [POINTER(Table), POINTER(c_void_p), c_int]
+lib.insert_columns.restype  = c_int
+
+lib.get_row_ids.argtypes = [POINTER(Table), POINTER(c_int)]
+lib.get_row_ids.restype  = c_int
+
 lib.free_table.argtypes = [POINTER(Table)]
 lib.free_table.restype  = None
 
@@ -103,6 +251,12 @@ lib.remove_foreign_key.restype = c_int
 lib.validate_foreign_keys.argtypes = [POINTER(Table)]
 lib.validate_foreign_keys.restype = c_int
 
+lib.set_primary_key.argtypes = [POINTER(Table), c_char_p]
+lib.set_primary_key.restype = c_int
+
+lib.drop_primary_key.argtypes = [POINTER(Table), c_char_p]
+lib.drop_primary_key.restype = c_int
+
 # Добавляем определения для новых функций
 lib.init_database.argtypes = []
 lib.init_database.restype = None
@@ -113,6 +267,117 @@ lib.cleanup_database.restype = None
 lib.add_table_to_db.argtypes = [c_void_p, POINTER(Table)]
 lib.add_table_to_db.restype = c_int
 
+lib.get_table_by_name.argtypes = [c_void_p, c_char_p]
+lib.get_table_by_name.restype = POINTER(Table)
+
+lib.drop_table.argtypes = [c_void_p, c_char_p]
+lib.drop_table.restype = c_int
+
+lib.get_num_tables.argtypes = [c_void_p]
+lib.get_num_tables.restype = c_int
+
+lib.get_table_at.argtypes = [c_void_p, c_int]
+lib.get_table_at.restype = POINTER(Table)
+
+lib.replace_table.argtypes = [c_void_p, POINTER(Table)]
+lib.replace_table.restype = c_int
+
+lib.save_database_file.argtypes = [c_void_p, c_char_p]
+lib.save_database_file.restype = c_int
+
+lib.save_database_file_parallel.argtypes = [c_void_p, c_char_p, c_int]
+lib.save_database_file_parallel.restype = c_int
+
+lib.save_database_file_ex.argtypes = [c_void_p, c_char_p, c_int, c_int]
+lib.save_database_file_ex.restype = c_int
+
+lib.save_table_file.argtypes = [POINTER(Table), c_char_p]
+lib.save_table_file.restype = c_int
+
+lib.save_table_rows_file.argtypes = [POINTER(Table), POINTER(c_int), c_int, c_char_p]
+lib.save_table_rows_file.restype = c_int
+
+lib.load_database_file.argtypes = [c_void_p, c_char_p]
+lib.load_database_file.restype = c_int
+
+lib.load_table_file.argtypes = [c_char_p]
+lib.load_table_file.restype = POINTER(Table)
+
+lib.open_database_file.argtypes = [c_void_p, c_char_p]
+lib.open_database_file.restype = c_int
+
+lib.wal_open.argtypes = [c_char_p, c_char_p, c_int]
+lib.wal_open.restype = c_int
+
+lib.wal_checkpoint.argtypes = []
+lib.wal_checkpoint.restype = c_int
+
+lib.wal_flush.argtypes = []
+lib.wal_flush.restype = c_int
+
+lib.wal_close.argtypes = []
+lib.wal_close.restype = None
+
+lib.advance_change_epoch.argtypes = []
+lib.advance_change_epoch.restype = c_int
+
+lib.get_changed_row_ids.argtypes = [POINTER(Table), c_int, POINTER(c_int)]
+lib.get_changed_row_ids.restype = c_int
+
+lib.get_row_id_runs.argtypes = [POINTER(Table), POINTER(c_int)]
+lib.get_row_id_runs.restype = c_int
+
+lib.apply_table_delta.argtypes = [POINTER(Table), POINTER(Table), POINTER(c_int), c_int]
+lib.apply_table_delta.restype = c_int
+
+lib.lock_mutations.argtypes = []
+lib.lock_mutations.restype = None
+
+lib.unlock_mutations.argtypes = []
+lib.unlock_mutations.restype = None
+
+lib.snapshot_start.argtypes = [c_void_p, c_char_p, POINTER(SnapshotJob), c_int, c_int, c_int]
+lib.snapshot_start.restype = c_int
+
+lib.snapshot_wait.argtypes = [c_int]
+lib.snapshot_wait.restype = c_int
+
+lib.lock_acquire.argtypes = [c_int, POINTER(Table), c_int, c_int, c_int]
+lib.lock_acquire.restype = c_int
+
+lib.lock_release_all.argtypes = [c_int]
+lib.lock_release_all.restype = None
+
+lib.lock_held_mode.argtypes = [c_int, POINTER(Table), c_int]
+lib.lock_held_mode.restype = c_int
+
+lib.lock_count.argtypes = []
+lib.lock_count.restype = c_int
+
+lib.mvcc_begin_read.argtypes = []
+lib.mvcc_begin_read.restype = c_void_p
+
+lib.mvcc_end_read.argtypes = [c_void_p]
+lib.mvcc_end_read.restype = None
+
+lib.mvcc_snapshot_seq.argtypes = [c_void_p]
+lib.mvcc_snapshot_seq.restype = c_longlong
+
+lib.mvcc_export_rows.argtypes = [c_void_p, POINTER(Table), c_int, c_int]
+lib.mvcc_export_rows.restype = POINTER(RowBatch)
+
+lib.mvcc_collect.argtypes = []
+lib.mvcc_collect.restype = c_int
+
+lib.mvcc_version_count.argtypes = []
+lib.mvcc_version_count.restype = c_int
+
+lib.get_schema_version.argtypes = []
+lib.get_schema_version.restype = c_int
+
+lib.check_foreign_key_constraint.argtypes = [c_void_p, POINTER(Table), c_int, DataValue]
+lib.check_foreign_key_constraint.restype = c_int
+
 # Добавляем определения для функций транзакций
 lib.begin_transaction.argtypes = []
 lib.begin_transaction.restype = c_void_p
@@ -126,16 +391,215 @@ lib.rollback_transaction.restype = None
 # Инициализируем базу данных при импорте модуля
 lib.init_database()
 
+# Сколько строк передаётся в C за один вызов insert_rows
+INSERT_CHUNK_SIZE = 10000
+
+# Сколько строк снимок выгружает за одно взятие блокировки изменений (mvcc.h)
+READ_CHUNK_SIZE = 10000
+
+# Потоков для записи файлов по умолчанию (GUI, резервные копии)
+SAVE_WORKERS = min(os.cpu_count() or 1, 16)
+
+# Первые байты двоичного файла базы (см. binfile.h)
+BINARY_MAGIC = b"MYDB"
+
+
+def decode_string(s):
+    """Декодирует байты строки из C: UTF-8, затем cp1251, иначе как есть"""
+    try:
+        return s.decode('utf-8')
+    except UnicodeDecodeError:
+        try:
+            return s.decode('cp1251')
+        except UnicodeDecodeError:
+            return str(s)
+
+
+def _memory_at(address, size):
+    # Представление памяти C без копирования
+    return memoryview((ctypes.c_ubyte * size).from_address(address)).cast('B')
+
+
+def _array_type(values):
+    """Определяет тип столбца по массиву NumPy, array.array, memoryview или списку"""
+    if np is not None and isinstance(values, np.ndarray):
+        kind = values.dtype.kind
+        return TYPE_INT if kind in "iub" else TYPE_FLOAT if kind == "f" else TYPE_STRING
+    fmt = getattr(values, "typecode", None) or getattr(values, "format", None)
+    if fmt:
+        fmt = fmt.lstrip("<>=!@")
+        return TYPE_INT if fmt in "bBhHiIlLqQ?" else TYPE_FLOAT if fmt in "fd" else TYPE_STRING
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (bool, int)):
+            return TYPE_INT
+        return TYPE_FLOAT if isinstance(value, float) else TYPE_STRING
+    return TYPE_STRING
+
+
+def decode_row_batch(batch_ptr, types):
+    """
+    Разбирает RowBatch из C: возвращает (идентификаторы строк, список столбцов),
+    каждый столбец - список значений Python.
+    """
+    batch = batch_ptr.contents
+    n = batch.num_rows
+    ids = _memory_at(ctypes.addressof(batch.row_ids.contents), 4 * n).cast('i').tolist() if n else []
+    columns = []
+    for j, col_type in enumerate(types):
+        if n == 0:
+            columns.append([])
+            continue
+        address = batch.columns[j]
+        if col_type == TYPE_INT:
+            columns.append(_memory_at(address, 4 * n).cast('i').tolist())
+        elif col_type == TYPE_FLOAT:
+            columns.append(_memory_at(address, 4 * n).cast('f').tolist())
+        else:
+            offsets = batch.string_offsets[j]
+            blob = ctypes.string_at(address, offsets[n])
+            try:
+                # Строки в блоке разделены '\0', последний элемент после split пустой
+                columns.append(blob.decode('utf-8').split('\0')[:-1])
+            except UnicodeDecodeError:
+                columns.append([decode_string(part) for part in blob.split(b'\0')[:-1]])
+    return ids, columns
+
+# Операции сканирования (см. scan.h)
+SCAN_EQ, SCAN_NE, SCAN_LT, SCAN_LE, SCAN_GT, SCAN_GE, SCAN_BETWEEN, SCAN_PREFIX, SCAN_CONTAINS = range(9)
+SCAN_ICASE = 0x100
+MASK_SET, MASK_AND, MASK_OR = range(3)
+
+_SCAN_OPS = {
+    "=": SCAN_EQ, "==": SCAN_EQ, "!=": SCAN_NE,
+    "<": SCAN_LT, "<=": SCAN_LE, ">": SCAN_GT, ">=": SCAN_GE,
+    "between": SCAN_BETWEEN, "prefix": SCAN_PREFIX, "contains": SCAN_CONTAINS,
+}
+
+# Агрегатные функции (см. aggregate.h)
+AGG_COUNT, AGG_SUM, AGG_MIN, AGG_MAX, AGG_AVG = range(5)
+
+_AGG_FUNCS = {"count": AGG_COUNT, "sum": AGG_SUM, "min": AGG_MIN, "max": AGG_MAX, "avg": AGG_AVG}
+
+
+def _scan_bytes(value):
+    if value is None:
+        return None
+    return (value if isinstance(value, str) else str(value)).encode('utf-8')
+
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def int_literal(value):
+    """
+    Литерал для сравнения с целочисленным столбцом: int, если значение
+    целое, иначе float (дробная часть не отбрасывается). ValueError -
+    значение не число.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return int(value)
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _int_condition(op, value, value2):
+    """
+    Переводит условие на целочисленный столбец в равносильное с границами
+    типа int: = 3.7 не совпадает ни с чем, != 3.7 - со всеми, < 2.5 и
+    <= 2.5 дают <= 2, > 2.5 и >= 2.5 дают >= 3, between 1.5 и 3.5 - between 2 и 3.
+    Литерал вне диапазона int32 (и бесконечность) не переполняется: < 3e9
+    совпадает со всеми строками, > 3e9 - ни с одной.
+    Возвращает (операция, значение, значение2).
+    """
+    nothing, everything = (SCAN_BETWEEN, 1, 0), (SCAN_GE, INT_MIN, 0)
+    low, high = int_literal(value), int_literal(value2)
+    base = op & ~SCAN_ICASE
+    if base == SCAN_BETWEEN:
+        if low != low or high != high or low > INT_MAX or high < INT_MIN:
+            return nothing
+        low = INT_MIN if low < INT_MIN else math.ceil(low)
+        high = INT_MAX if high > INT_MAX else math.floor(high)
+        return op, low, high
+    if (isinstance(low, int) and INT_MIN <= low <= INT_MAX) or \
+            base not in (SCAN_EQ, SCAN_NE, SCAN_LT, SCAN_LE, SCAN_GT, SCAN_GE):
+        return op, int(low), 0
+    if base == SCAN_EQ:
+        return nothing
+    if base == SCAN_NE:
+        return everything
+    if low != low:
+        return nothing  # сравнение с NaN ложно
+    if base in (SCAN_LT, SCAN_LE):
+        if low < INT_MIN:
+            return nothing
+        return everything if low > INT_MAX else (SCAN_LE, math.floor(low), 0)
+    if low > INT_MAX:
+        return nothing
+    return everything if low < INT_MIN else (SCAN_GE, math.ceil(low), 0)
+
+
+class Condition:
+    """
+    Условие на столбец: операция одна из =, !=, <, <=, >, >=, between,
+    prefix, contains. ignore_case - сравнение строк без учёта регистра.
+    Условия объединяются операторами & и |.
+    """
+    def __init__(self, column, op, value, value2=None, ignore_case=False):
+        if op not in _SCAN_OPS:
+            raise ValueError(f"Неизвестная операция {op!r}")
+        self.column = column
+        self.op = op
+        self.value = value
+        self.value2 = value2
+        self.ignore_case = ignore_case
+
+    @staticmethod
+    def of(condition):
+        """Приводит кортеж (столбец, операция, значение[, значение2]) к Condition"""
+        if isinstance(condition, (Condition, ConditionGroup)):
+            return condition
+        return Condition(*condition)
+
+    def scan_op(self):
+        return _SCAN_OPS[self.op] | (SCAN_ICASE if self.ignore_case else 0)
+
+    def __and__(self, other):
+        return ConditionGroup("and", [self, Condition.of(other)])
+
+    def __or__(self, other):
+        return ConditionGroup("or", [self, Condition.of(other)])
+
+
+class ConditionGroup:
+    """Группа условий, объединённых через and или or"""
+    def __init__(self, mode, conditions):
+        self.mode = mode
+        self.conditions = list(conditions)
+
+    def __and__(self, other):
+        return ConditionGroup("and", [self, Condition.of(other)])
+
+    def __or__(self, other):
+        return ConditionGroup("or", [self, Condition.of(other)])
+
+
 class DBTable:
-    def __init__(self, name, columns):
+    def __init__(self, name, columns, storage=STORAGE_ROW):
         """
         Создаёт таблицу с заданным именем и списком столбцов.
         Аргумент columns – список кортежей: (имя_столбца, тип),
         где тип – одно из значений: TYPE_INT, TYPE_FLOAT, TYPE_STRING.
+        storage – формат хранения: STORAGE_ROW (по строкам) или
+        STORAGE_COLUMNAR (каждый столбец – непрерывный массив).
         """
         self.name = name.encode("utf-8")
         self.columns_info = columns  
         self.num_columns = len(columns)
+        self.storage = storage
 
         columns_array = (Column * self.num_columns)()
         for i, (col_name, col_type) in enumerate(columns):
@@ -147,7 +611,7 @@ class DBTable:
             columns_array[i].is_foreign_key = 0
             columns_array[i].foreign_key = None
 
-        self.table_ptr = lib.create_table(self.name, columns_array, self.num_columns)
+        self.table_ptr = lib.create_table_ex(self.name, columns_array, self.num_columns, storage)
         
         # Добавляем таблицу в базу данных
         if self.table_ptr:
@@ -158,6 +622,19 @@ class DBTable:
                 lib.free_table(self.table_ptr)
                 self.table_ptr = None
 
+    @classmethod
+    def wrap(cls, table_ptr):
+        """Создаёт DBTable для уже существующей C-таблицы (например, загруженной из файла)"""
+        table = cls.__new__(cls)
+        contents = table_ptr.contents
+        table.table_ptr = table_ptr
+        table.name = contents.name
+        table.columns_info = [(contents.columns[i].name.decode('utf-8'), contents.columns[i].type)
+                              for i in range(contents.num_columns)]
+        table.num_columns = contents.num_columns
+        table.storage = contents.storage
+        return table
+
     def insert(self, values):
         """
         Вставляет строку в таблицу.
@@ -188,10 +665,58 @@ class DBTable:
             messagebox.showerror("Ошибка", "Ошибка при вставке строки.")
         return ret
 
+    def pack_rows(self, rows):
+        """
+        Упаковывает список строк в один массив DataValue (строка за строкой)
+        для передачи в insert_rows.
+        """
+        n = self.num_columns
+        types = [col_type for _, col_type in self.columns_info]
+        values_array = (DataValue * (len(rows) * n))()
+        pos = 0
+        for row in rows:
+            if len(row) != n:
+                raise ValueError(f"Неверное количество значений. Ожидается {n}, получено {len(row)}")
+            for col_type, val in zip(types, row):
+                if col_type == TYPE_INT:
+                    values_array[pos].i = int(val) if val is not None else 0
+                elif col_type == TYPE_FLOAT:
+                    values_array[pos].f = float(val) if val is not None else 0.0
+                elif val is not None:
+                    values_array[pos].s = (val if isinstance(val, str) else str(val)).encode('utf-8')
+                pos += 1
+        return values_array
+
+    def insert_many(self, rows, chunk_size=INSERT_CHUNK_SIZE):
+        """
+        Вставляет строки из любого итерируемого объекта (в том числе генератора),
+        передавая их в C пакетами по chunk_size строк.
+        Каждый пакет вставляется целиком или не вставляется вовсе;
+        при ошибке вставка останавливается. Возвращает число вставленных строк.
+        """
+        inserted = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return inserted
+            try:
+                values_array = self.pack_rows(chunk)
+            except (TypeError, ValueError) as e:
+                from tkinter import messagebox
+                messagebox.showerror("Ошибка", f"Неверные данные строки: {e}")
+                return inserted
+            ret = lib.insert_rows(self.table_ptr, values_array, len(chunk))
+            if ret < 0:
+                from tkinter import messagebox
+                messagebox.showerror("Ошибка", "Ошибка при вставке строк.")
+                return inserted
+            inserted += ret
+
     def update(self, row_index, col_index, new_value):
         """
-        Обновляет значение в таблице для заданной строки (row_index)
-        и столбца (col_index). new_value должен соответствовать типу столбца.
+        Обновляет значение в таблице для заданной строки (row_index -
+        идентификатор строки, см. get_row_ids) и столбца (col_index). new_value должен соответствовать типу столбца.
         """
         col_type = self.columns_info[col_index][1]
         dv = DataValue()
@@ -214,7 +739,8 @@ class DBTable:
 
     def delete(self, row_index):
         """
-        Удаляет строку с индексом row_index.
+        Удаляет строку с идентификатором row_index. Идентификаторы
+        остальных строк при этом не меняются.
         """
         ret = lib.delete_row(self.table_ptr, row_index)
         if ret != 0:
@@ -235,6 +761,19 @@ class DBTable:
         lib.free_table(self.table_ptr)
         self.table_ptr = None
 
+    def drop(self):
+        """
+        Удаляет таблицу из базы данных и освобождает её память.
+        Таблицу, на которую ссылаются внешние ключи, удалить нельзя.
+        """
+        ret = lib.drop_table(None, self.name)
+        if ret != 0:
+            from tkinter import messagebox
+            messagebox.showerror("Ошибка", "Не удалось удалить таблицу: на неё ссылаются внешние ключи или идёт транзакция.")
+        else:
+            self.table_ptr = None
+        return ret
+
     def transform(self, new_columns):
         """
         Преобразует таблицу к новой схеме.
@@ -254,6 +793,7 @@ class DBTable:
         new_dbtable.columns_info = new_columns
         new_dbtable.name = self.name
         new_dbtable.num_columns = num_columns
+        new_dbtable.storage = self.storage
         return new_dbtable
 
 
@@ -293,64 +833,349 @@ class DBTable:
         return ret
 
     def get_value(self, row_idx, col_idx):
-        # Получить значение ячейки из C-структуры
-        class RowStruct(ctypes.Structure):
-            _fields_ = [("values", ctypes.POINTER(DataValue))]
-        class TableStruct(ctypes.Structure):
-            _fields_ = [("name", ctypes.c_char * 50),
-                        ("columns", ctypes.c_void_p),
-                        ("num_columns", ctypes.c_int),
-                        ("rows", ctypes.POINTER(RowStruct)),
-                        ("num_rows", ctypes.c_int),
-                        ("max_rows", ctypes.c_int)]
-        t = TableStruct.from_address(ctypes.addressof(self.table_ptr.contents))
-        row = t.rows[row_idx]
+        # Получить значение ячейки из C-структуры (для любого формата хранения)
+        value = lib.get_cell(self.table_ptr, row_idx, col_idx)
         col_type = self.columns_info[col_idx][1]
         if col_type == TYPE_INT:
-            return row.values[col_idx].i
+            return value.i
         elif col_type == TYPE_FLOAT:
-            return row.values[col_idx].f
+            return value.f
         elif col_type == TYPE_STRING:
-            s = row.values[col_idx].s
+            s = value.s
             if s:
-                try:
-                    # Пробуем декодировать как UTF-8
-                    return s.decode('utf-8')
-                except UnicodeDecodeError:
-                    try:
-                        # Если не получилось, пробуем cp1251
-                        return s.decode('cp1251')
-                    except UnicodeDecodeError:
-                        # Если и это не получилось, возвращаем как есть
-                        return str(s)
+                return decode_string(s)
+            # Повреждённый столбец отображённого файла тоже читается как NULL
+            if lib.check_column_readable(self.table_ptr, col_idx) != 0:
+                raise IOError(f"Не удалось прочитать столбец {self.columns_info[col_idx][0]}")
             return ""
 
-    def get_all_rows(self):
+    def fetch_rows(self, start=0, stop=None, with_ids=False):
+        """
+        Возвращает строки с позициями [start, stop) как список кортежей.
+        Данные выгружаются из C одним блоком и разбираются по столбцам.
+        При with_ids=True первым элементом кортежа идёт идентификатор строки.
+        """
+        if stop is None:
+            stop = self.get_num_rows()
+        return self._decode_batch(lib.export_rows(self.table_ptr, start, stop), with_ids)
+
+    def fetch_by_ids(self, row_ids, with_ids=False):
+        """
+        Возвращает строки с заданными идентификаторами (в том же порядке)
+        как список кортежей; удалённые строки пропускаются.
+        """
+        ids = (c_int * len(row_ids))(*row_ids)
+        return self._decode_batch(lib.export_row_ids(self.table_ptr, ids, len(row_ids)), with_ids)
+
+    def _decode_batch(self, batch, with_ids):
+        if not batch:
+            raise MemoryError(f"Не удалось выгрузить строки таблицы {self.name.decode('utf-8')}")
+        try:
+            ids, columns = decode_row_batch(batch, [col_type for _, col_type in self.columns_info])
+        finally:
+            lib.free_row_batch(batch)
+        if with_ids:
+            return list(zip(ids, *columns))
+        if not columns:
+            return [() for _ in ids]
+        return list(zip(*columns))
+
+    def where(self, *conditions):
+        """
+        Возвращает идентификаторы строк, удовлетворяющих всем условиям.
+        Условие - Condition, группа условий (cond1 & cond2, cond1 | cond2)
+        или кортеж (столбец, операция, значение[, значение2]).
+        Сравнение выполняется в C по столбцу целиком.
+        """
+        if not conditions:
+            return self.get_row_ids()
+        node = ConditionGroup("and", [Condition.of(c) for c in conditions])
+        mask = self.where_mask(node)
+        out = (c_int * max(len(mask), 1))()
+        count = lib.mask_to_row_ids(self.table_ptr, mask, out)
+        return list(out[:count])
+
+    def order_by(self, *keys, row_ids=None, limit=None):
+        """
+        Возвращает идентификаторы строк, отсортированные в C по ключам.
+        Ключ - имя столбца или кортеж (имя, по_убыванию). Сортировка
+        устойчивая. row_ids - сортировать только эти строки (например,
+        результат where), иначе все строки таблицы. limit - вернуть только
+        первые limit строк (отбор кучей без полной сортировки).
+        """
+        names = [col_name for col_name, _ in self.columns_info]
+        cols, desc = [], []
+        for key in keys:
+            name, descending = (key, False) if isinstance(key, str) else key
+            if name not in names:
+                raise KeyError(f"Столбец {name} не найден")
+            cols.append(names.index(name))
+            desc.append(1 if descending else 0)
+        if row_ids is None:
+            row_ids = self.get_row_ids()
+        ids = (c_int * max(len(row_ids), 1))(*row_ids)
+        c_cols = (c_int * max(len(cols), 1))(*cols)
+        c_desc = (c_int * max(len(desc), 1))(*desc)
+        if limit is None:
+            count = lib.sort_row_ids(self.table_ptr, ids, len(row_ids), c_cols, c_desc, len(cols))
+        else:
+            count = lib.top_row_ids(self.table_ptr, ids, len(row_ids), c_cols, c_desc, len(cols), max(limit, 0))
+        if count < 0:
+            raise MemoryError("Ошибка сортировки таблицы")
+        return list(ids[:count])
+
+    def aggregate(self, *aggregates, group_by=None, where=None):
+        """
+        Вычисляет агрегатные функции count, sum, min, max, avg в C.
+        Агрегат - имя функции ("count") или кортеж (функция, столбец).
+        Без group_by возвращает значение (или кортеж значений для
+        нескольких агрегатов), с group_by - словарь {ключ: значение}.
+        where - условие как в where(). NaN вещественного столбца - пропуск:
+        sum/min/max/avg его не учитывают, count считает строки; min/max/avg
+        без значений - None.
+        """
+        names = [col_name for col_name, _ in self.columns_info]
+        cols, ops = [], []
+        for agg in aggregates or ("count",):
+            func, column = (agg, None) if isinstance(agg, str) else agg
+            if func not in _AGG_FUNCS:
+                raise ValueError(f"Неизвестная агрегатная функция {func!r}")
+            if column is not None and column not in names:
+                raise KeyError(f"Столбец {column} не найден")
+            if func != "count" and (column is None or self.columns_info[names.index(column)][1] == TYPE_STRING):
+                raise ValueError(f"Функция {func} применима только к числовому столбцу")
+            cols.append(names.index(column) if column is not None else -1)
+            ops.append(_AGG_FUNCS[func])
+        group_col = -1
+        if group_by is not None:
+            if group_by not in names:
+                raise KeyError(f"Столбец {group_by} не найден")
+            group_col = names.index(group_by)
+        mask = None
+        if where is not None:
+            conditions = where if isinstance(where, list) else [where]
+            mask = self.where_mask(ConditionGroup("and", [Condition.of(c) for c in conditions]))
+
+        n = len(ops)
+        result = lib.aggregate_table(self.table_ptr, group_col, (c_int * n)(*cols), (c_int * n)(*ops), n, mask)
+        if not result:
+            raise MemoryError("Ошибка агрегации таблицы")
+        try:
+            res = result.contents
+            groups = []
+            for g in range(res.num_groups):
+                values = []
+                for k, op in enumerate(ops):
+                    value = res.values[g * n + k]
+                    if op in (AGG_MIN, AGG_MAX, AGG_AVG) and not res.value_counts[g * n + k]:
+                        values.append(None)  # в группе нет значений
+                    elif op == AGG_COUNT or (op != AGG_AVG and self.columns_info[cols[k]][1] == TYPE_INT):
+                        values.append(int(value))
+                    else:
+                        values.append(value)
+                groups.append(values[0] if n == 1 else tuple(values))
+            key_ids = res.key_row_ids[:res.num_groups]
+        finally:
+            lib.free_agg_result(result)
+
+        if group_col < 0:
+            return groups[0]
+        # Ключ группы читается из её первой строки
+        keys = [row[group_col] for row in self.fetch_by_ids(key_ids)]
+        return dict(zip(keys, groups))
+
+    def index_kind(self, column):
+        """Индекс по столбцу: None, "hash" (неуникальный) или "unique" """
+        names = [col_name for col_name, _ in self.columns_info]
+        if column not in names:
+            raise KeyError(f"Столбец {column} не найден")
+        return (None, "hash", "unique")[lib.get_index_kind(self.table_ptr, names.index(column))]
+
+    def lookup(self, column, value):
+        """
+        Идентификаторы строк со значением value в столбце column (по
+        возрастанию) через хеш-индекс; None, если индекса по столбцу нет.
+        """
+        names = [col_name for col_name, _ in self.columns_info]
+        if column not in names:
+            raise KeyError(f"Столбец {column} не найден")
+        col_idx = names.index(column)
+        key = DataValue()
+        col_type = self.columns_info[col_idx][1]
+        if col_type == TYPE_INT:
+            value = int_literal(value)
+            if not isinstance(value, int) or not INT_MIN <= value <= INT_MAX:
+                return []  # дробное или вне int32 значение не равно ни одному целому
+            key.i = value
+        elif col_type == TYPE_FLOAT:
+            key.f = float(value)
+        else:
+            key.s = _scan_bytes(value)
+        count = lib.index_lookup(self.table_ptr, col_idx, key, None, 0)
+        if count < 0:
+            return None
+        out = (c_int * max(count, 1))()
+        lib.index_lookup(self.table_ptr, col_idx, key, out, count)
+        return sorted(out[:count])
+
+    def where_mask(self, condition):
+        """Вычисляет условие и возвращает байтовую маску по слотам таблицы"""
+        mask = (c_ubyte * max(self.table_ptr.contents.num_rows, 1))()
+        self._eval_condition(Condition.of(condition), mask, MASK_SET)
+        return mask
+
+    def _eval_condition(self, node, mask, mode):
+        if isinstance(node, ConditionGroup):
+            if not node.conditions:
+                raise ValueError("Пустая группа условий")
+            if mode != MASK_SET:
+                # Вложенная группа считается в отдельную маску и объединяется
+                tmp = (c_ubyte * len(mask))()
+                self._eval_condition(node, tmp, MASK_SET)
+                lib.combine_masks(mask, tmp, len(mask), mode)
+                return
+            child_mode = MASK_AND if node.mode == "and" else MASK_OR
+            for i, child in enumerate(node.conditions):
+                self._eval_condition(child, mask, MASK_SET if i == 0 else child_mode)
+            return
+
+        names = [col_name for col_name, _ in self.columns_info]
+        if node.column not in names:
+            raise KeyError(f"Столбец {node.column} не найден")
+        col_idx = names.index(node.column)
+        col_type = self.columns_info[col_idx][1]
+        op = node.scan_op()
+        value, value2 = DataValue(), DataValue()
+        if col_type == TYPE_STRING or op == SCAN_CONTAINS:
+            value.s = _scan_bytes(node.value)
+            value2.s = _scan_bytes(node.value2)
+        elif col_type == TYPE_INT:
+            op, value.i, value2.i = _int_condition(op, node.value, node.value2)
+        else:
+            value.f = float(node.value) if node.value is not None else 0.0
+            value2.f = float(node.value2) if node.value2 is not None else 0.0
+        if lib.scan_column(self.table_ptr, col_idx, op, value, value2, mask, mode) < 0:
+            raise ValueError(f"Операция {node.op!r} не поддерживается для столбца {node.column}")
+
+    def get_all_rows(self, with_ids=False):
         """
         Возвращает все строки таблицы как список кортежей Python.
+        При with_ids=True первым элементом кортежа идёт идентификатор строки.
         """
-        result = []
-        num_rows = self.get_num_rows()
-        num_cols = len(self.columns_info)
-        for row_idx in range(num_rows):
-            row = []
-            for col_idx, (col_name, col_type) in enumerate(self.columns_info):
-                val = self.get_value(row_idx, col_idx)
-                row.append(val)
-            result.append(tuple(row))
-        return result
+        return self.fetch_rows(with_ids=with_ids)
+
+    def column_as_array(self, name):
+        """
+        Возвращает числовой столбец как массив NumPy (int32/float32) или,
+        если NumPy не установлен, как memoryview формата 'i'/'f'.
+        Для колоночной таблицы без удалённых строк массив смотрит прямо
+        в память таблицы без копирования и действителен только до следующего
+        изменения таблицы; в остальных случаях возвращается копия.
+        Массив доступен только для чтения.
+        """
+        names = [col_name for col_name, _ in self.columns_info]
+        if name not in names:
+            raise KeyError(f"Столбец {name} не найден")
+        col_idx = names.index(name)
+        col_type = self.columns_info[col_idx][1]
+        if col_type == TYPE_STRING:
+            raise TypeError(f"Столбец {name} не числовой")
+
+        t = self.table_ptr.contents
+        count = t.num_rows - t.num_deleted
+        if t.storage == STORAGE_COLUMNAR and t.num_deleted == 0 and count:
+            buf = (ctypes.c_ubyte * (4 * count)).from_address(t.column_data[col_idx])
+        else:
+            buf = (ctypes.c_ubyte * (4 * count))()
+            lib.copy_column(self.table_ptr, col_idx, buf)
+
+        if np is not None:
+            arr = np.frombuffer(buf, dtype=np.int32 if col_type == TYPE_INT else np.float32)
+            arr.flags.writeable = False
+            return arr
+        return memoryview(buf).cast('B').cast('i' if col_type == TYPE_INT else 'f').toreadonly()
+
+    def insert_arrays(self, arrays):
+        """
+        Вставляет строки из словаря {имя столбца: массив}. Нужны все столбцы
+        таблицы, массивы одной длины. Числовые столбцы передаются в C одним
+        буфером (массивы NumPy - без поэлементного преобразования в Python).
+        Возвращает число вставленных строк.
+        """
+        missing = [col_name for col_name, _ in self.columns_info if col_name not in arrays]
+        if missing:
+            raise ValueError(f"Нет данных для столбцов: {', '.join(missing)}")
+        lengths = {len(arrays[col_name]) for col_name, _ in self.columns_info}
+        if len(lengths) > 1:
+            raise ValueError("Массивы столбцов разной длины")
+        count = lengths.pop() if lengths else 0
+
+        keep = []  # буферы должны жить до конца вызова C
+        pointers = (c_void_p * self.num_columns)()
+        for j, (col_name, col_type) in enumerate(self.columns_info):
+            values = arrays[col_name]
+            if col_type == TYPE_STRING:
+                buf = (c_char_p * count)(*[None if v is None else str(v).encode('utf-8') for v in values])
+                pointers[j] = ctypes.addressof(buf)
+            elif np is not None and isinstance(values, np.ndarray):
+                buf = np.ascontiguousarray(values, dtype=np.int32 if col_type == TYPE_INT else np.float32)
+                pointers[j] = buf.ctypes.data
+            else:
+                buf = array.array('i' if col_type == TYPE_INT else 'f', values)
+                pointers[j] = buf.buffer_info()[0]
+            keep.append(buf)
+
+        ret = lib.insert_columns(self.table_ptr, pointers, count)
+        if ret < 0:
+            from tkinter import messagebox
+            messagebox.showerror("Ошибка", "Ошибка при вставке строк.")
+            return 0
+        return ret
+
+    @classmethod
+    def from_arrays(cls, name, arrays, storage=STORAGE_COLUMNAR):
+        """
+        Создаёт таблицу из словаря {имя столбца: массив}; тип столбца
+        определяется по массиву (целые, вещественные, остальное - строки).
+        """
+        columns = [(col_name, _array_type(values)) for col_name, values in arrays.items()]
+        table = cls(name, columns, storage)
+        if table.table_ptr:
+            table.insert_arrays(arrays)
+        return table
+
+    def get_schema_version(self):
+        """Версия схемы таблицы: меняется при изменении столбцов и ключей"""
+        return self.table_ptr.contents.schema_version
+
+    def is_mapped(self):
+        """True, пока данные таблицы читаются из отображённого файла (до первого изменения)"""
+        return bool(self.table_ptr.contents.mapped)
+
+    def get_row_ids(self):
+        """
+        Возвращает идентификаторы существующих строк в порядке хранения.
+        """
+        t = self.table_ptr.contents
+        ids = (c_int * max(t.num_rows, 1))()
+        count = lib.get_row_ids(self.table_ptr, ids)
+        return list(ids[:count])
 
     def get_num_rows(self):
-        # Получить количество строк из C-структуры
-        class TableStruct(ctypes.Structure):
-            _fields_ = [("name", ctypes.c_char * 50),
-                        ("columns", ctypes.c_void_p),
-                        ("num_columns", ctypes.c_int),
-                        ("rows", ctypes.c_void_p),
-                        ("num_rows", ctypes.c_int),
-                        ("max_rows", ctypes.c_int)]
-        t = TableStruct.from_address(ctypes.addressof(self.table_ptr.contents))
-        return t.num_rows
+        # Количество строк без учёта удалённых (ещё не убранных уплотнением)
+        t = self.table_ptr.contents
+        return t.num_rows - t.num_deleted
+
+    def vacuum(self):
+        """
+        Физически убирает удалённые строки и освобождает память.
+        Идентификаторы оставшихся строк не меняются.
+        """
+        ret = lib.vacuum_table(self.table_ptr)
+        if ret < 0:
+            from tkinter import messagebox
+            messagebox.showerror("Ошибка", "Нельзя уплотнить таблицу во время транзакции.")
+        return ret
 
     def add_foreign_key(self, column_name, ref_table_name, ref_column_name):
         """Добавить внешний ключ"""
@@ -388,6 +1213,33 @@ class DBTable:
             messagebox.showerror("Ошибка", "Не удалось удалить внешний ключ.")
         return ret
 
+    def set_primary_key(self, column_name):
+        """Объявить столбец первичным ключом (строит уникальный хеш-индекс)"""
+        ret = lib.set_primary_key(self.table_ptr, column_name.encode('utf-8'))
+        if ret != 0:
+            from tkinter import messagebox
+            messagebox.showerror("Ошибка", 
+                f"Не удалось объявить первичный ключ: столбец {column_name} не найден или содержит повторяющиеся значения.")
+        return ret
+
+    def drop_primary_key(self, column_name):
+        """Снять первичный ключ со столбца"""
+        ret = lib.drop_primary_key(self.table_ptr, column_name.encode('utf-8'))
+        if ret != 0:
+            from tkinter import messagebox
+            messagebox.showerror("Ошибка", "Не удалось снять первичный ключ.")
+        return ret
+
+    def get_primary_key(self):
+        """Получить имя столбца первичного ключа или None"""
+        if not self.table_ptr:
+            return None
+        t = self.table_ptr.contents
+        for i in range(t.num_columns):
+            if t.columns[i].is_primary_key:
+                return t.columns[i].name.decode('utf-8')
+        return None
+
     def validate_foreign_keys(self):
         """Проверить целостность внешних ключей"""
         return lib.validate_foreign_keys(self.table_ptr)
@@ -408,6 +1260,80 @@ class DBTable:
             })
         return foreign_keys
 
+class PreparedInsert:
+    """
+    Подготовленная вставка строк в таблицу: массив аргументов для C,
+    типы столбцов и список внешних ключей вычисляются один раз и
+    переиспользуются, пока не изменилась версия схемы таблицы.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.version = None
+
+    def refresh(self):
+        """Пересобирает разметку, если схема таблицы изменилась"""
+        if self.table.get_schema_version() != self.version:
+            self._compile()
+        return self
+
+    def _compile(self):
+        table = self.table
+        self.types = [col_type for _, col_type in table.columns_info]
+        self.values = (DataValue * len(self.types))()
+        names = [col_name for col_name, _ in table.columns_info]
+        self.foreign_keys = [(names.index(fk['column']), fk['referenced_table'])
+                             for fk in table.get_foreign_keys()]
+        self.version = table.get_schema_version()
+
+    def execute(self, row):
+        """Вставляет строку; возвращает её идентификатор"""
+        table = self.table
+        types = self.refresh().types
+        if len(row) != len(types):
+            raise Exception(f"Неверное количество значений. Ожидается {len(types)}, получено {len(row)}")
+        values = self.values
+        for i, (col_type, value) in enumerate(zip(types, row)):
+            if col_type == TYPE_INT:
+                values[i].i = int(value) if value is not None else 0
+            elif col_type == TYPE_FLOAT:
+                values[i].f = float(value) if value is not None else 0.0
+            elif value is None:
+                values[i].s = None
+            else:
+                values[i].s = (value if isinstance(value, str) else str(value)).encode('utf-8')
+        # Проверка внешних ключей здесь только ради понятного сообщения об ошибке
+        for i, ref_table in self.foreign_keys:
+            if row[i] is not None and not lib.check_foreign_key_constraint(None, table.table_ptr, i, values[i]):
+                raise Exception(f"Нарушение целостности внешнего ключа: значение {row[i]} не найдено в таблице {ref_table}")
+        result = lib.insert_row(table.table_ptr, values)
+        if result != 0:
+            raise Exception(f"Ошибка при вставке строки: {result}")
+        return table.table_ptr.contents.next_row_id - 1
+
+
+def is_binary_file(filename):
+    """Проверяет, записан ли файл в двоичном формате базы (binfile.h)"""
+    with open(filename, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def save_table_to_file(table, filename):
+    """Сохраняет таблицу (DBTable) в двоичный файл; запись выполняет C"""
+    if lib.save_table_file(table.table_ptr, os.fsencode(filename)) != 0:
+        raise IOError(f"Не удалось сохранить таблицу в {filename}")
+
+
+def load_table_from_file(filename):
+    """
+    Загружает таблицу из двоичного файла. Возвращает DBTable,
+    таблица в базу данных не добавляется.
+    """
+    table_ptr = lib.load_table_file(os.fsencode(filename))
+    if not table_ptr:
+        raise IOError(f"Не удалось загрузить таблицу из {filename}")
+    return DBTable.wrap(table_ptr)
+
+
 def save_table_to_json(table, filename):
     """Сохраняет таблицу в JSON файл"""
     data = {
@@ -438,18 +1364,16 @@ def save_table_to_json(table, filename):
         }
         data["foreign_keys"].append(fk_data)
     
-    # Сохраняем данные строк
-    for i in range(table.num_rows):
-        row_data = []
-        for j in range(table.num_columns):
-            col_type = table.columns[j].type
-            if col_type == TYPE_INT:
-                row_data.append(table.rows[i].values[j].i)
-            elif col_type == TYPE_FLOAT:
-                row_data.append(table.rows[i].values[j].f)
-            elif col_type == TYPE_STRING:
-                row_data.append(table.rows[i].values[j].s.decode("utf-8"))
-        data["rows"].append(row_data)
+    # Сохраняем данные строк (удалённые строки пропускаются)
+    batch = lib.export_rows(ctypes.pointer(table), 0, table.num_rows - table.num_deleted)
+    if not batch:
+        raise MemoryError("Не удалось выгрузить строки таблицы")
+    try:
+        types = [table.columns[j].type for j in range(table.num_columns)]
+        _, columns = decode_row_batch(batch, types)
+    finally:
+        lib.free_row_batch(batch)
+    data["rows"] = [list(row) for row in zip(*columns)]
     
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
@@ -498,6 +1422,76 @@ def load_table_from_json(filename):
     
     return table
 
+class ReadSnapshot:
+    """
+    Снимок базы для согласованного чтения (mvcc.h): видит данные,
+    зафиксированные до его начала, и не видит изменений незавершённой
+    транзакции, даже если она идёт в этом же процессе. Чтение не ждёт конца
+    транзакций, поэтому снимки можно читать из других потоков параллельно с
+    долгой пишущей транзакцией. Снимок нужно закрыть (close или with):
+    до этого сохраняются нужные ему прежние версии строк.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.handle = lib.mvcc_begin_read()
+        if not self.handle:
+            raise MemoryError("Не удалось открыть снимок для чтения")
+
+    @property
+    def seq(self):
+        """Номер последней фиксации, которую видит снимок"""
+        return lib.mvcc_snapshot_seq(self.handle)
+
+    def fetch_rows(self, table_name, with_ids=False, chunk_size=READ_CHUNK_SIZE):
+        """
+        Возвращает строки таблицы, видимые снимку, как список кортежей
+        (по возрастанию идентификатора). Строки выгружаются пакетами по
+        chunk_size: между пакетами пишущие потоки продолжают работу.
+        """
+        if not self.handle:
+            raise Exception("Снимок уже закрыт")
+        table = self.db.tables.get(table_name)
+        if not table:
+            raise Exception(f"Таблица {table_name} не найдена")
+        types = [col_type for _, col_type in table.columns_info]
+        rows = []
+        after_id = -1
+        while True:
+            batch = lib.mvcc_export_rows(self.handle, table.table_ptr, after_id, chunk_size)
+            if not batch:
+                raise Exception(f"Таблица {table_name} изменена по схеме после начала снимка "
+                                f"или не хватило памяти для выгрузки")
+            try:
+                ids, columns = decode_row_batch(batch, types)
+            finally:
+                lib.free_row_batch(batch)
+            if with_ids:
+                rows.extend(zip(ids, *columns))
+            elif columns:
+                rows.extend(zip(*columns))
+            else:
+                rows.extend(() for _ in ids)
+            if len(ids) < chunk_size:
+                return rows
+            after_id = ids[-1]
+
+    def close(self):
+        """Закрывает снимок; ненужные больше версии освобождает фоновый сборщик"""
+        if self.handle:
+            lib.mvcc_end_read(self.handle)
+            self.handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
 class Database:
     def __init__(self):
         """Инициализация базы данных"""
@@ -505,6 +1499,8 @@ class Database:
             lib.init_database()
             self.tables = {}
             self.current_transaction = None
+            self.statements = OrderedDict()  # кеш подготовленных запросов (query.py)
+            self.inserts = {}                # подготовленные вставки по имени таблицы
         except Exception as e:
             print(f"Ошибка при инициализации базы данных: {e}")
             raise
@@ -518,10 +1514,10 @@ class Database:
         except Exception as e:
             print(f"Ошибка при очистке базы данных: {e}")
 
-    def create_table(self, name, columns):
+    def create_table(self, name, columns, storage=STORAGE_ROW):
         """Создание таблицы с поддержкой транзакций"""
         try:
-            table = DBTable(name, columns)
+            table = DBTable(name, columns, storage)
             if table.table_ptr:
                 self.tables[name] = table
                 return table
@@ -530,6 +1526,17 @@ class Database:
             print(f"Ошибка при создании таблицы {name}: {e}")
             return None
 
+    def drop_table(self, table_name):
+        """Удаляет таблицу из базы данных"""
+        table = self.tables.get(table_name)
+        if not table:
+            raise Exception(f"Таблица {table_name} не найдена")
+        if lib.drop_table(None, table_name.encode('utf-8')) != 0:
+            raise Exception(f"Нельзя удалить таблицу {table_name}: на неё ссылаются внешние ключи или идёт транзакция")
+        table.table_ptr = None
+        del self.tables[table_name]
+        self.inserts.pop(table_name, None)
+
     def insert_row(self, table_name, values):
         """Вставляет новую строку в таблицу"""
         if not self.tables:
@@ -543,60 +1550,50 @@ class Database:
             raise Exception(f"Неверное количество значений. Ожидается {table.num_columns}, получено {len(values)}")
             
         try:
-            # Преобразуем значения в нужные типы
-            c_values = (DataValue * table.num_columns)()
-            for i, value in enumerate(values):
-                if value is None:
-                    c_values[i].i = 0  # NULL значение
-                    continue
-                    
-                if table.columns_info[i][1] == TYPE_INT:
-                    c_values[i].i = int(value)
-                elif table.columns_info[i][1] == TYPE_FLOAT:
-                    c_values[i].f = float(value)
-                elif table.columns_info[i][1] == TYPE_STRING:
-                    if not isinstance(value, str):
-                        value = str(value)
-                    c_values[i].s = value.encode('utf-8')
-                    
-            # Проверяем внешние ключи
-            for i, col in enumerate(table.columns_info):
-                if col[0] in [fk['column'] for fk in table.get_foreign_keys()] and values[i] is not None:
-                    fk = next(fk for fk in table.get_foreign_keys() if fk['column'] == col[0])
-                    ref_table = self.tables.get(fk['referenced_table'])
-                    if not ref_table:
-                        raise Exception(f"Связанная таблица {fk['referenced_table']} не найдена")
-                        
-                    # Находим индекс столбца в связанной таблице
-                    ref_col_index = -1
-                    for j, ref_col in enumerate(ref_table.columns_info):
-                        if ref_col[0] == fk['referenced_column']:
-                            ref_col_index = j
-                            break
-                            
-                    if ref_col_index == -1:
-                        raise Exception(f"Столбец {fk['referenced_column']} не найден в таблице {fk['referenced_table']}")
-                        
-                    # Проверяем существование значения
-                    value_exists = False
-                    for row in range(ref_table.get_num_rows()):
-                        ref_value = ref_table.get_value(row, ref_col_index)
-                        if ref_value == values[i]:
-                            value_exists = True
-                            break
-                            
-                    if not value_exists:
-                        raise Exception(f"Нарушение целостности внешнего ключа: значение {values[i]} не найдено в таблице {fk['referenced_table']}")
-                        
-            result = lib.insert_row(table.table_ptr, c_values)
-            if result != 0:
-                raise Exception(f"Ошибка при вставке строки: {result}")
-                
-            return table.get_num_rows() - 1
+            statement = self.prepare_insert(table_name)
+            for _, ref_table in statement.refresh().foreign_keys:
+                if ref_table not in self.tables:
+                    raise Exception(f"Связанная таблица {ref_table} не найдена")
+            # Идентификатор только что вставленной строки
+            return statement.execute(values)
         except Exception as e:
             print(f"Ошибка при вставке строки в таблицу {table_name}: {e}")
             raise
 
+    def prepare_insert(self, table_name):
+        """Подготовленная вставка в таблицу (кешируется по имени таблицы)"""
+        table = self.tables.get(table_name)
+        if not table:
+            raise Exception(f"Таблица {table_name} не найдена")
+        statement = self.inserts.get(table_name)
+        if statement is None or statement.table is not table:
+            statement = self.inserts[table_name] = PreparedInsert(table)
+        return statement
+
+    def insert_many(self, table_name, rows, chunk_size=INSERT_CHUNK_SIZE):
+        """
+        Пакетная вставка строк из итерируемого объекта или генератора.
+        Внешние и первичные ключи проверяются в C для каждого пакета;
+        пакет с нарушением не вставляется, предыдущие пакеты остаются.
+        Возвращает число вставленных строк.
+        """
+        table = self.tables.get(table_name)
+        if not table:
+            raise Exception(f"Таблица {table_name} не найдена")
+
+        inserted = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return inserted
+            values_array = table.pack_rows(chunk)
+            result = lib.insert_rows(table.table_ptr, values_array, len(chunk))
+            if result < 0:
+                raise Exception(f"Ошибка при пакетной вставке в таблицу {table_name}: "
+                                f"вставлено {inserted} строк, пакет из {len(chunk)} строк отклонён")
+            inserted += result
+
     def update_row(self, table_name, row_index, col_index, new_value):
         """Обновление строки с поддержкой транзакций"""
         if table_name not in self.tables:
@@ -613,6 +1610,103 @@ class Database:
         table = self.tables[table_name]
         return table.delete(row_index)
 
+    def vacuum_table(self, table_name):
+        """Уплотняет таблицу, убирая удалённые строки"""
+        if table_name not in self.tables:
+            raise Exception(f"Таблица {table_name} не найдена")
+        result = lib.vacuum_table(self.tables[table_name].table_ptr)
+        if result < 0:
+            raise Exception("Нельзя уплотнить таблицу во время транзакции")
+        return result
+
+    def group_by(self, table_name, group_column, *aggregates, where=None):
+        """
+        Группирует строки таблицы по столбцу и вычисляет агрегаты
+        (см. DBTable.aggregate); возвращает словарь {ключ: значение}.
+        """
+        if table_name not in self.tables:
+            raise Exception(f"Таблица {table_name} не найдена")
+        return self.tables[table_name].aggregate(*aggregates, group_by=group_column, where=where)
+
+    def join(self, child_name, parent_name, columns=None, where=None, on=None):
+        """
+        Соединяет дочернюю таблицу с родительской по внешнему ключу
+        (хеш-соединение в C). on - столбец внешнего ключа, если их несколько.
+        columns - проекция: имена "Таблица.столбец" или просто "столбец";
+        по умолчанию все столбцы дочерней, затем родительской таблицы.
+        where - условие на строки дочерней таблицы. Возвращает список кортежей.
+        """
+        child = self.tables.get(child_name)
+        parent = self.tables.get(parent_name)
+        if not child or not parent:
+            raise Exception(f"Таблица {child_name if not child else parent_name} не найдена")
+        links = [fk for fk in child.get_foreign_keys()
+                 if fk['referenced_table'] == parent_name and on in (None, fk['column'])]
+        if not links:
+            raise Exception(f"Нет внешнего ключа из {child_name} в {parent_name}")
+        if len(links) > 1:
+            raise Exception(f"Несколько внешних ключей из {child_name} в {parent_name}, укажите on")
+        fk = links[0]
+
+        child_names = [col_name for col_name, _ in child.columns_info]
+        parent_names = [col_name for col_name, _ in parent.columns_info]
+        if columns is None:
+            projection = [(0, j) for j in range(len(child_names))] + [(1, j) for j in range(len(parent_names))]
+        else:
+            projection = []
+            for name in columns:
+                table_name, _, col_name = name.rpartition('.')
+                in_child = table_name in ("", child_name) and col_name in child_names
+                in_parent = table_name in ("", parent_name) and col_name in parent_names
+                if in_child and in_parent:
+                    raise Exception(f"Столбец {name} есть в обеих таблицах, укажите таблицу")
+                if not in_child and not in_parent:
+                    raise Exception(f"Столбец {name} не найден")
+                projection.append((0, child_names.index(col_name)) if in_child else (1, parent_names.index(col_name)))
+
+        mask = None
+        if where is not None:
+            conditions = where if isinstance(where, list) else [where]
+            mask = child.where_mask(ConditionGroup("and", [Condition.of(c) for c in conditions]))
+        result = lib.join_tables(child.table_ptr, child_names.index(fk['column']),
+                                 parent.table_ptr, parent_names.index(fk['referenced_column']), mask)
+        if not result:
+            raise Exception(f"Ошибка соединения таблиц {child_name} и {parent_name}")
+        try:
+            n = result.contents.num_rows
+            id_lists = (result.contents.child_ids[:n], result.contents.parent_ids[:n])
+        finally:
+            lib.free_join_result(result)
+
+        # Выгружаем только те стороны, столбцы которых попали в проекцию
+        sides = [None, None]
+        for side, table in enumerate((child, parent)):
+            if any(s == side for s, _ in projection):
+                sides[side] = list(zip(*table.fetch_by_ids(id_lists[side]))) or [[]] * len(table.columns_info)
+        out = [sides[side][j] for side, j in projection]
+        if not out:
+            return [() for _ in range(n)]
+        return list(zip(*out))
+
+    def query(self, sql, *params):
+        """
+        Выполняет запрос SELECT ... FROM ... [JOIN] [WHERE] [ORDER BY] [LIMIT]
+        или INSERT (см. query.py); params - значения параметров ?.
+        План кешируется по тексту запроса. Возвращает список кортежей.
+        """
+        from query import run_query
+        return run_query(self, sql, *params)
+
+    def prepare(self, sql):
+        """Подготовленный запрос (query.PreparedStatement) из кеша"""
+        from query import prepare
+        return prepare(self, sql)
+
+    def explain(self, sql):
+        """Возвращает текст плана, выбранного для запроса"""
+        from query import explain
+        return explain(self, sql)
+
     def add_foreign_key(self, table_name, column_name, ref_table_name, ref_column_name):
         """Добавление внешнего ключа с поддержкой транзакций"""
         if table_name not in self.tables or ref_table_name not in self.tables:
@@ -621,6 +1715,14 @@ class Database:
         table = self.tables[table_name]
         return table.add_foreign_key(column_name, ref_table_name, ref_column_name)
 
+    def set_primary_key(self, table_name, column_name):
+        """Объявление первичного ключа таблицы"""
+        if table_name not in self.tables:
+            return False
+        
+        table = self.tables[table_name]
+        return table.set_primary_key(column_name)
+
     def remove_foreign_key(self, table_name, column_name):
         """Удаление внешнего ключа с поддержкой транзакций"""
         if table_name not in self.tables:
@@ -629,76 +1731,125 @@ class Database:
         table = self.tables[table_name]
         return table.remove_foreign_key(column_name)
 
-    def save_to_file(self, filename):
-        """Сохраняет базу данных в JSON файл"""
-        data = {
-            "tables": []
-        }
-        
-        for table_name, table in self.tables.items():
-            table_data = {
-                "name": table_name,
-                "columns": [],
-                "rows": [],
-                "foreign_keys": []
-            }
-            
-            # Сохраняем информацию о столбцах
-            for col_name, col_type in table.columns_info:
-                table_data["columns"].append({
-                    "name": col_name,
-                    "type": col_type
-                })
-            
-            # Сохраняем данные строк
-            for row in table.get_all_rows():
-                table_data["rows"].append(list(row))
-            
-            # Сохраняем информацию о внешних ключах
-            for fk in table.get_foreign_keys():
-                table_data["foreign_keys"].append(fk)
-            
-            data["tables"].append(table_data)
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def save_to_file(self, filename, workers=1, compress=None):
+        """
+        Сохраняет базу данных в файл: двоичный формат (binfile.h), запись
+        выполняет C; для имён *.json - прежний JSON, который пишется потоком
+        пакетами строк (json_stream.py).
+        workers > 1 - таблицы двоичного файла записываются параллельно в
+        workers потоков C (GIL на это время освобождён).
+        compress - кодек сжатия ("zlib", "lzma", "bz2", см. compression.py);
+        формат определяется по имени без расширения кодека (base.json.gz - JSON).
+        """
+        if compress:
+            from compression import write_compressed
+            write_compressed(filename, compress,
+                             lambda path, as_json: self._write_file(path, workers, as_json, BINFILE_SAVE_DICT))
+            return
+        self._write_file(filename, workers, filename.lower().endswith('.json'))
 
-    def load_from_file(self, filename):
-        """Загружает базу данных из JSON файла"""
+    def _write_file(self, filename, workers, as_json, options=0):
+        if not as_json:
+            if lib.save_database_file_ex(None, os.fsencode(filename), workers, options) != 0:
+                raise IOError(f"Не удалось сохранить базу данных в {filename}")
+            return
+
+        from json_stream import write_json_database
+        write_json_database(filename, self.tables)
+
+    def load_from_file(self, filename, lazy=False, batch_size=INSERT_CHUNK_SIZE, progress=None):
+        """
+        Загружает базу данных из двоичного или JSON файла.
+        lazy=True (только двоичный формат) отображает файл в память вместо
+        чтения: числовые столбцы читаются прямо из файла, строки - при первом
+        обращении, а данные таблицы копируются в память при её первом изменении.
+        Файл при этом можно перезаписывать новым сохранением.
+        JSON читается потоком: строки вставляются пакетами по batch_size,
+        progress(прочитано_байт, всего_байт) сообщает о ходе чтения.
+        Сжатый файл (compression.py) распаковывается во временный файл.
+        """
+        from compression import decompressed, codec_of_file
+        if lazy and codec_of_file(filename):
+            raise Exception(f"Файл {filename} сжат, отображение невозможно")
+        with decompressed(filename) as path:
+            self._load_file(path, filename, lazy, batch_size, progress)
+
+    def _load_file(self, path, filename, lazy, batch_size, progress):
+        """Загрузка несжатого файла path; filename - имя для сообщений"""
+        binary = is_binary_file(path)
+        if lazy and not binary:
+            raise Exception(f"Файл {filename} не в двоичном формате, отображение невозможно")
         # Полная очистка C-базы и Python-словаря
         lib.cleanup_database()
         lib.init_database()
 
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Память таблиц уже освобождена cleanup_database
+        for table in self.tables.values():
+            table.table_ptr = None
+        self.tables.clear()
+        self.inserts.clear()
+        self.statements.clear()
+
+        if binary:
+            load = lib.open_database_file if lazy else lib.load_database_file
+            if load(None, os.fsencode(path)) < 0:
+                raise IOError(f"Не удалось загрузить базу данных из {filename}")
+            self._wrap_tables()
+            return
+
+        # Строки читаются из файла и вставляются пакетами (json_stream.py)
+        from json_stream import load_json_tables
+        load_json_tables(path, self.create_table, batch_size, progress)
 
-        # Очищаем текущие таблицы
+    def _wrap_tables(self):
+        """Заполняет словарь таблиц по таблицам, уже находящимся в C-базе"""
+        for i in range(lib.get_num_tables(None)):
+            table = DBTable.wrap(lib.get_table_at(None, i))
+            self.tables[table.name.decode('utf-8')] = table
+
+    def restore_backup(self, path):
+        """
+        Восстанавливает базу из резервной копии path (см. backup.py): полной
+        или инкрементной - тогда применяется вся цепочка от полной копии.
+        """
+        from backup import restore_backup
         for table in self.tables.values():
-            table.free()
+            table.table_ptr = None
         self.tables.clear()
+        self.inserts.clear()
+        self.statements.clear()
+        restore_backup(path)
+        self._wrap_tables()
+
+    def enable_wal(self, snapshot_path, wal_path=None, group_commit=1, lazy=False):
+        """
+        Включает журнал упреждающей записи. Загружает снимок snapshot_path
+        (если он есть), применяет к нему журнал (по умолчанию snapshot_path +
+        ".wal") и дальше дописывает в журнал каждую фиксацию и каждое изменение
+        вне транзакции. group_commit фиксаций разделяют один fsync: при сбое
+        питания теряются не больше group_commit - 1 последних фиксаций.
+        Изменения схемы попадают на диск при следующей фиксации (она
+        выполняется как контрольная точка) или при checkpoint().
+        Возвращает число применённых из журнала транзакций.
+        """
+        wal_path = wal_path or snapshot_path + ".wal"
+        if os.path.exists(snapshot_path):
+            self.load_from_file(snapshot_path, lazy=lazy)
+        replayed = lib.wal_open(os.fsencode(wal_path), os.fsencode(snapshot_path), group_commit)
+        if replayed < 0:
+            raise IOError(f"Не удалось применить журнал {wal_path}")
+        return replayed
+
+    def checkpoint(self):
+        """Сохраняет снимок базы и очищает журнал (см. enable_wal)"""
+        if self.current_transaction:
+            raise Exception("Контрольная точка невозможна во время транзакции")
+        if lib.wal_checkpoint() != 0:
+            raise IOError("Не удалось выполнить контрольную точку")
 
-        # Новый вариант: если это просто словарь с таблицами
-        if isinstance(data, dict) and "tables" not in data:
-            for table_name, table_data in data.items():
-                columns = [(col[0], col[1]) for col in table_data["columns_info"]]
-                table = self.create_table(table_name, columns)
-                if table:
-                    for row in table_data["rows"]:
-                        table.insert(row)
-        # Старый вариант: если есть ключ "tables"
-        elif "tables" in data:
-            for table_data in data["tables"]:
-                columns = [(col["name"], col["type"]) for col in table_data["columns"]]
-                table = self.create_table(table_data["name"], columns)
-                if table:
-                    for row in table_data["rows"]:
-                        table.insert(row)
-                    for fk in table_data["foreign_keys"]:
-                        table.add_foreign_key(
-                            fk["column"],
-                            fk["referenced_table"],
-                            fk["referenced_column"]
-                        )
+    def disable_wal(self):
+        """Сбрасывает ожидающие fsync фиксации и закрывает журнал"""
+        lib.wal_close()
 
     def begin_transaction(self):
         """Начало транзакции"""
@@ -740,6 +1891,10 @@ class Database:
             print(f"Ошибка при откате транзакции: {e}")
             self.current_transaction = None
 
+    def read_snapshot(self):
+        """Снимок для согласованного чтения (см. ReadSnapshot)"""
+        return ReadSnapshot(self)
+
     def __enter__(self):
         """Поддержка контекстного менеджера для транзакций"""
         if not self.begin_transaction():
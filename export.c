@@ -0,0 +1,239 @@
+#include "export.h"
+#include "storage.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+/*
+ * Массовое чтение таблицы. Вместо вызова get_cell для каждой ячейки
+ * данные диапазона строк копируются в один блок памяти, который
+ * Python разбирает за один проход по каждому столбцу.
+ */
+
+#define ALIGN8(n) (((n) + 7) & ~(size_t)7)
+
+/*
+ * Выделяет пакет под count строк: string_bytes[j] - размер строковых
+ * данных столбца j. Заполняет указатели на массивы столбцов, смещения
+ * строк и идентификаторы остаются вызывающему.
+ */
+static RowBatch* alloc_batch(Table* table, int count, const size_t* string_bytes) {
+    int ncols = table->num_columns;
+
+    // Раскладка блока: заголовок, массивы указателей, идентификаторы, столбцы
+    size_t size = ALIGN8(sizeof(RowBatch));
+    size += ALIGN8(2 * ncols * sizeof(void*));
+    size += ALIGN8(count * sizeof(int));
+    for (int j = 0; j < ncols; j++) {
+        if (table->columns[j].type == TYPE_STRING) {
+            size += ALIGN8((count + 1) * sizeof(int)) + ALIGN8(string_bytes[j]);
+        } else {
+            size += ALIGN8(count * sizeof(int));  // sizeof(float) == sizeof(int)
+        }
+    }
+
+    char* block = (char*)malloc(size);
+    if (!block) {
+        fprintf(stderr, "Ошибка выделения памяти для выгрузки таблицы %s\n", table->name);
+        return NULL;
+    }
+
+    RowBatch* batch = (RowBatch*)block;
+    char* p = block + ALIGN8(sizeof(RowBatch));
+    batch->num_rows = count;
+    batch->num_columns = ncols;
+    batch->columns = (void**)p;
+    batch->string_offsets = (int**)(p + ncols * sizeof(void*));
+    p += ALIGN8(2 * ncols * sizeof(void*));
+    batch->row_ids = (int*)p;
+    p += ALIGN8(count * sizeof(int));
+
+    for (int j = 0; j < ncols; j++) {
+        if (table->columns[j].type == TYPE_STRING) {
+            batch->string_offsets[j] = (int*)p;
+            p += ALIGN8((count + 1) * sizeof(int));
+            batch->columns[j] = p;
+            p += ALIGN8(string_bytes[j]);
+        } else {
+            batch->string_offsets[j] = NULL;
+            batch->columns[j] = p;
+            p += ALIGN8(count * sizeof(int));
+        }
+    }
+    return batch;
+}
+
+// Дописывает строку s (NULL - пустая) в строковый столбец пакета
+static void put_string(RowBatch* batch, int col, int r, int* pos, const char* s) {
+    size_t len = s ? strlen(s) : 0;
+    batch->string_offsets[col][r] = *pos;
+    memcpy((char*)batch->columns[col] + *pos, s ? s : "", len + 1);
+    *pos += (int)len + 1;
+}
+
+RowBatch* export_slots(Table* table, const int* slots, int count) {
+    int ncols = table->num_columns;
+    if (storage_readable(table, -1) != 0) return NULL;
+
+    // Первый проход: размер строковых данных по каждому столбцу
+    size_t* string_bytes = (size_t*)calloc(ncols, sizeof(size_t));
+    if (!string_bytes) return NULL;
+    for (int j = 0; j < ncols; j++) {
+        if (table->columns[j].type != TYPE_STRING) continue;
+        for (int r = 0; r < count; r++) {
+            const char* s = storage_get(table, slots[r], j).s;
+            string_bytes[j] += (s ? strlen(s) : 0) + 1;
+        }
+    }
+
+    RowBatch* batch = alloc_batch(table, count, string_bytes);
+    free(string_bytes);
+    if (!batch) return NULL;
+
+    for (int r = 0; r < count; r++) {
+        batch->row_ids[r] = table->row_ids[slots[r]];
+    }
+
+    for (int j = 0; j < ncols; j++) {
+        int type = table->columns[j].type;
+        char* p = (char*)batch->columns[j];
+        if (type == TYPE_STRING) {
+            int pos = 0;
+            for (int r = 0; r < count; r++) {
+                put_string(batch, j, r, &pos, storage_get(table, slots[r], j).s);
+            }
+            batch->string_offsets[j][count] = pos;
+        } else if (table->storage == STORAGE_COLUMNAR) {
+            // Непрерывный столбец копируется кусками между пропусками
+            const char* src = (const char*)table->column_data[j];
+            int r = 0;
+            while (r < count) {
+                int run = 1;
+                while (r + run < count && slots[r + run] == slots[r] + run) run++;
+                memcpy(p + r * sizeof(int), src + slots[r] * sizeof(int), run * sizeof(int));
+                r += run;
+            }
+        } else if (type == TYPE_INT) {
+            for (int r = 0; r < count; r++) {
+                ((int*)p)[r] = storage_get(table, slots[r], j).i;
+            }
+        } else {
+            for (int r = 0; r < count; r++) {
+                ((float*)p)[r] = storage_get(table, slots[r], j).f;
+            }
+        }
+    }
+    return batch;
+}
+
+static DataValue source_get(const Table* table, const RowSource* row, int col) {
+    return row->values ? row->values[col] : storage_get(table, row->slot, col);
+}
+
+RowBatch* export_sources(Table* table, const RowSource* rows, int count) {
+    int ncols = table->num_columns;
+    if (storage_readable(table, -1) != 0) return NULL;
+
+    size_t* string_bytes = (size_t*)calloc(ncols, sizeof(size_t));
+    if (!string_bytes) return NULL;
+    for (int j = 0; j < ncols; j++) {
+        if (table->columns[j].type != TYPE_STRING) continue;
+        for (int r = 0; r < count; r++) {
+            const char* s = source_get(table, &rows[r], j).s;
+            string_bytes[j] += (s ? strlen(s) : 0) + 1;
+        }
+    }
+
+    RowBatch* batch = alloc_batch(table, count, string_bytes);
+    free(string_bytes);
+    if (!batch) return NULL;
+
+    for (int r = 0; r < count; r++) {
+        batch->row_ids[r] = rows[r].row_id;
+    }
+    for (int j = 0; j < ncols; j++) {
+        int type = table->columns[j].type;
+        if (type == TYPE_STRING) {
+            int pos = 0;
+            for (int r = 0; r < count; r++) {
+                put_string(batch, j, r, &pos, source_get(table, &rows[r], j).s);
+            }
+            batch->string_offsets[j][count] = pos;
+        } else {
+            // int и float одного размера, копируем биты значения
+            for (int r = 0; r < count; r++) {
+                DataValue value = source_get(table, &rows[r], j);
+                memcpy((char*)batch->columns[j] + r * sizeof(int), &value, sizeof(int));
+            }
+        }
+    }
+    return batch;
+}
+
+API RowBatch* export_rows(Table* table, int start, int stop) {
+    if (!table) return NULL;
+    int live = table->num_rows - table->num_deleted;
+    if (start < 0) start = 0;
+    if (stop > live) stop = live;
+    if (stop < start) stop = start;
+
+    int count = stop - start;
+    int* slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    if (!slots) return NULL;
+
+    if (table->num_deleted == 0) {
+        // Без удалённых строк позиция совпадает со слотом
+        for (int r = 0; r < count; r++) {
+            slots[r] = start + r;
+        }
+    } else {
+        int pos = 0;
+        int n = 0;
+        for (int slot = 0; slot < table->num_rows && n < count; slot++) {
+            if (table->deleted[slot]) continue;
+            if (pos++ >= start) {
+                slots[n++] = slot;
+            }
+        }
+    }
+
+    RowBatch* batch = export_slots(table, slots, count);
+    free(slots);
+    return batch;
+}
+
+API RowBatch* export_row_ids(Table* table, const int* ids, int count) {
+    if (!table || (!ids && count > 0) || count < 0) return NULL;
+    int* slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    if (!slots) return NULL;
+    int n = 0;
+    for (int r = 0; r < count; r++) {
+        int slot = storage_slot(table, ids[r]);
+        if (slot >= 0) {
+            slots[n++] = slot;
+        }
+    }
+    RowBatch* batch = export_slots(table, slots, n);
+    free(slots);
+    return batch;
+}
+
+API int copy_column(Table* table, int col_index, void* out) {
+    if (!table || !out || col_index < 0 || col_index >= table->num_columns ||
+        table->columns[col_index].type == TYPE_STRING) {
+        return -1;
+    }
+    int n = 0;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        if (table->deleted[slot]) continue;
+        // int и float одного размера, копируем биты значения
+        DataValue value = storage_get(table, slot, col_index);
+        memcpy((char*)out + n * sizeof(int), &value, sizeof(int));
+        n++;
+    }
+    return n;
+}
+
+API void free_row_batch(RowBatch* batch) {
+    free(batch);  // пакет занимает один блок памяти
+}
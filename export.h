@@ -0,0 +1,44 @@
+#ifndef EXPORT_H
+#define EXPORT_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+/*
+ * Пакет строк, выгруженный из таблицы одним блоком памяти.
+ * columns[j] для TYPE_INT - int[num_rows], для TYPE_FLOAT - float[num_rows],
+ * для TYPE_STRING - байты всех строк подряд, каждая завершается '\0';
+ * string_offsets[j] тогда содержит num_rows + 1 смещений начала строк
+ * (последнее - общий размер), для числовых столбцов он NULL.
+ * NULL-строка выгружается как пустая.
+ */
+typedef struct {
+    int num_rows;
+    int num_columns;
+    int* row_ids;
+    void** columns;
+    int** string_offsets;
+} RowBatch;
+
+// Выгрузка строк с позициями [start, stop) среди существующих строк таблицы
+API RowBatch* export_rows(Table* table, int start, int stop);
+// Выгрузка строк с заданными идентификаторами (удалённые и неизвестные пропускаются)
+API RowBatch* export_row_ids(Table* table, const int* ids, int count);
+API void free_row_batch(RowBatch* batch);
+
+// Копирует значения числового столбца существующих строк в out; возвращает их число
+API int copy_column(Table* table, int col_index, void* out);
+
+// Выгрузка заданных слотов (внутренняя функция)
+RowBatch* export_slots(Table* table, const int* slots, int count);
+
+// Строка выгрузки: слот таблицы или отдельная копия значений (values != NULL)
+typedef struct {
+    int row_id;
+    int slot;
+    const DataValue* values;
+} RowSource;
+
+// Выгрузка строк из разных источников (внутренняя функция, см. mvcc.h)
+RowBatch* export_sources(Table* table, const RowSource* rows, int count);
+
+#endif // EXPORT_H
@@ -5,13 +5,17 @@
 #endif
 
 #include "db_core.h"
+#include "snapshot.h"
+#include "storage.h"
+#include "index.h"
+#include "wal.h"
+#include "locks.h"
+#include "mvcc.h"
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
 
-#define FLOAT_EPSILON 1e-6
-
 // Глобальная переменная для хранения базы данных
 static Database* global_db = NULL;
 
@@ -21,15 +25,26 @@ static int next_transaction_id = 1;
 // Глобальная переменная для текущей транзакции
 static Transaction* current_transaction = NULL;
 
-// Добавляем структуру для блокировок
-typedef struct {
-    int is_locked;
-    int transaction_id;
-} TableLock;
+// Пишется ли изменение в журнал: внутри транзакции и вне её, но не при откате
+static int wal_logging(void) {
+    return wal_is_open() && (!current_transaction || current_transaction->is_active);
+}
+
+// Изменение вне транзакции фиксируется в журнале сразу
+static void wal_autocommit(void) {
+    if (!current_transaction && wal_commit() != 0) {
+        fprintf(stderr, "Ошибка записи журнала: изменение не сохранено на диске\n");
+    }
+}
 
-// Глобальная переменная для хранения блокировок
-static TableLock* table_locks = NULL;
-static int num_locks = 0;
+int transaction_in_progress(void) {
+    return current_transaction != NULL;
+}
+
+// Сохраняются ли прежние версии строк (mvcc.h): откат возвращает их сам
+static int mvcc_tracking(void) {
+    return !current_transaction || current_transaction->is_active;
+}
 
 // Прототип функции для добавления операции в транзакцию
 static void add_operation(Transaction* t, int op_type, Table* table, 
@@ -52,20 +67,19 @@ API Database* create_database(void) {
     
     db->num_tables = 0;
     db->max_tables = DB_INITIAL_CAPACITY;
+    db->current_transaction = NULL;
+    db->table_map = NULL;
+    db->map_capacity = 0;
+    db->schema_version = 0;
     return db;
 }
 
 API void free_table(Table *table) {
     if (!table) return;
     
-    // Освобождаем память для строк и их значений
-    for (int i = 0; i < table->num_rows; i++){
-         for (int j = 0; j < table->num_columns; j++){
-              if (table->columns[j].type == TYPE_STRING)
-                   free(table->rows[i].values[j].s);
-         }
-         free(table->rows[i].values);
-    }
+    // Освобождаем память для строк, их значений и индексов
+    table_index_free_all(table);
+    storage_free(table);
     
     // Освобождаем память для внешних ключей
     if (table->foreign_keys) {
@@ -75,8 +89,9 @@ API void free_table(Table *table) {
         free(table->foreign_keys);
     }
     
-    free(table->rows);
     free(table->columns);
+    lock_forget_table(table);
+    mvcc_forget_table(table);
     free(table);
 }
 
@@ -87,10 +102,78 @@ API void free_database(Database* db) {
         free_table(db->tables[i]);
     }
     free(db->tables);
+    free(db->table_map);
     free(db);
 }
 
-API int add_table_to_db(Database* db, Table* table) {
+/*
+ * Хеш-таблица имён таблиц: открытая адресация с линейным пробированием.
+ * Хранит указатели на таблицы, ключом служит table->name.
+ * Заполнение не больше 3/4, удаление со сдвигом назад.
+ */
+static unsigned int table_name_hash(const char* name) {
+    DataValue key;
+    key.s = (char*)name;
+    return value_hash(TYPE_STRING, key);
+}
+
+static int table_map_find_pos(const Database* db, const char* name) {
+    if (!db->table_map) return -1;
+    unsigned int mask = (unsigned int)db->map_capacity - 1;
+    for (unsigned int pos = table_name_hash(name) & mask; db->table_map[pos]; pos = (pos + 1) & mask) {
+        if (strcmp(db->table_map[pos]->name, name) == 0) {
+            return (int)pos;
+        }
+    }
+    return -1;
+}
+
+static void table_map_place(Table** map, int capacity, Table* table) {
+    unsigned int mask = (unsigned int)capacity - 1;
+    unsigned int pos = table_name_hash(table->name) & mask;
+    while (map[pos]) {
+        pos = (pos + 1) & mask;
+    }
+    map[pos] = table;
+}
+
+static int table_map_insert(Database* db, Table* table) {
+    if ((db->num_tables + 1) * 4 > db->map_capacity * 3) {
+        int new_capacity = db->map_capacity > 0 ? db->map_capacity * 2 : 16;
+        Table** new_map = (Table**)calloc(new_capacity, sizeof(Table*));
+        if (!new_map) return -1;
+        for (int i = 0; i < db->map_capacity; i++) {
+            if (db->table_map[i]) {
+                table_map_place(new_map, new_capacity, db->table_map[i]);
+            }
+        }
+        free(db->table_map);
+        db->table_map = new_map;
+        db->map_capacity = new_capacity;
+    }
+    table_map_place(db->table_map, db->map_capacity, table);
+    return 0;
+}
+
+static void table_map_remove(Database* db, const char* name) {
+    int found = table_map_find_pos(db, name);
+    if (found < 0) return;
+    unsigned int mask = (unsigned int)db->map_capacity - 1;
+    unsigned int i = (unsigned int)found;
+    unsigned int j = i;
+    for (;;) {
+        j = (j + 1) & mask;
+        if (!db->table_map[j]) break;
+        unsigned int home = table_name_hash(db->table_map[j]->name) & mask;
+        int stays = (i <= j) ? (i < home && home <= j) : (i < home || home <= j);
+        if (stays) continue;
+        db->table_map[i] = db->table_map[j];
+        i = j;
+    }
+    db->table_map[i] = NULL;
+}
+
+static int add_table_to_db_locked(Database* db, Table* table) {
     if (!table) return -1;
     
     // Используем глобальную базу данных, если не указана конкретная
@@ -106,11 +189,9 @@ API int add_table_to_db(Database* db, Table* table) {
     }
     
     // Проверяем, не существует ли уже таблица с таким именем
-    for (int i = 0; i < db->num_tables; i++) {
-        if (strcmp(db->tables[i]->name, table->name) == 0) {
-            fprintf(stderr, "Table with name %s already exists\n", table->name);
-            return -1;
-        }
+    if (table_map_find_pos(db, table->name) >= 0) {
+        fprintf(stderr, "Table with name %s already exists\n", table->name);
+        return -1;
     }
     
     // Увеличиваем размер массива при необходимости
@@ -125,19 +206,219 @@ API int add_table_to_db(Database* db, Table* table) {
         db->max_tables = new_max;
     }
     
+    if (table_map_insert(db, table) != 0) {
+        fprintf(stderr, "Error reallocating memory for table map\n");
+        return -1;
+    }
     db->tables[db->num_tables++] = table;
+    db->schema_version++;
     return 0;
 }
 
+API int add_table_to_db(Database* db, Table* table) {
+    lock_mutations();
+    int result = add_table_to_db_locked(db, table);
+    unlock_mutations();
+    return result;
+}
+
 API Table* get_table_by_name(Database* db, const char* name) {
+    if (!db) db = global_db;
     if (!db || !name) return NULL;
-    
+
+    int pos = table_map_find_pos(db, name);
+    return pos >= 0 ? db->table_map[pos] : NULL;
+}
+
+/*
+ * Удаляет таблицу из базы и освобождает её. Таблицу, на которую
+ * ссылаются внешние ключи других таблиц, удалить нельзя; во время
+ * транзакции удаление запрещено (журнал хранит указатели на таблицы).
+ */
+static int drop_table_locked(Database* db, const char* name) {
+    if (!db) db = global_db;
+    if (!db || !name) return -1;
+
+    Table* table = get_table_by_name(db, name);
+    if (!table) {
+        fprintf(stderr, "Таблица %s не найдена\n", name);
+        return -1;
+    }
+    if (current_transaction) {
+        fprintf(stderr, "Error: cannot drop table %s during a transaction\n", name);
+        return -1;
+    }
+    for (int i = 0; i < db->num_tables; i++) {
+        Table* other = db->tables[i];
+        if (other == table) continue;
+        for (int k = 0; k < other->num_foreign_keys; k++) {
+            if (strcmp(other->foreign_keys[k]->referenced_table, name) == 0) {
+                fprintf(stderr, "Таблица %s используется внешним ключом таблицы %s\n", name, other->name);
+                return -1;
+            }
+        }
+    }
+
+    table_map_remove(db, name);
+    for (int i = 0; i < db->num_tables; i++) {
+        if (db->tables[i] == table) {
+            memmove(&db->tables[i], &db->tables[i + 1], (db->num_tables - i - 1) * sizeof(Table*));
+            db->num_tables--;
+            break;
+        }
+    }
+    db->schema_version++;
+    free_table(table);
+    return 0;
+}
+
+API int drop_table(Database* db, const char* name) {
+    lock_mutations();
+    int result = drop_table_locked(db, name);
+    unlock_mutations();
+    return result;
+}
+
+/*
+ * Заменяет таблицу с тем же именем новой (или добавляет, если такой нет);
+ * старая таблица освобождается. Внешние ключи других таблиц ссылаются по
+ * имени и после смены версии схемы разрешаются заново.
+ */
+static int replace_table_locked(Database* db, Table* table) {
+    if (!db) db = global_db;
+    if (!db || !table) return -1;
+    int pos = table_map_find_pos(db, table->name);
+    if (pos < 0) {
+        return add_table_to_db(db, table);
+    }
+    if (current_transaction) {
+        fprintf(stderr, "Error: cannot replace table %s during a transaction\n", table->name);
+        return -1;
+    }
+    Table* old = db->table_map[pos];
+    if (old == table) return 0;
+    db->table_map[pos] = table;
     for (int i = 0; i < db->num_tables; i++) {
-        if (strcmp(db->tables[i]->name, name) == 0) {
-            return db->tables[i];
+        if (db->tables[i] == old) {
+            db->tables[i] = table;
+            break;
         }
     }
-    return NULL;
+    db->schema_version++;
+    free_table(old);
+    return 0;
+}
+
+API int replace_table(Database* db, Table* table) {
+    lock_mutations();
+    int result = replace_table_locked(db, table);
+    unlock_mutations();
+    return result;
+}
+
+API int get_num_tables(Database* db) {
+    if (!db) db = global_db;
+    return db ? db->num_tables : 0;
+}
+
+API Table* get_table_at(Database* db, int index) {
+    if (!db) db = global_db;
+    if (!db || index < 0 || index >= db->num_tables) return NULL;
+    return db->tables[index];
+}
+
+API int get_schema_version(void) {
+    return global_db ? global_db->schema_version : 0;
+}
+
+void schema_changed(void) {
+    if (global_db) {
+        global_db->schema_version++;
+    }
+}
+
+// Счётчик версий общий для всех таблиц, поэтому пара (таблица, версия) не
+// повторяется даже после удаления таблицы и создания новой по тому же адресу
+static int table_version_counter = 0;
+
+void table_schema_changed(Table* table) {
+    if (table) {
+        table->schema_version = ++table_version_counter;
+        mvcc_schema_changed(table);
+    }
+    schema_changed();
+}
+
+int last_table_schema_version(void) {
+    return table_version_counter;
+}
+
+/*
+ * Разрешает ссылку внешнего ключа в указатель на таблицу и номер столбца.
+ * Для глобальной базы результат кешируется в самом ForeignKey до следующего
+ * изменения схемы, поэтому проверка каждой строки не ищет таблицу по имени.
+ */
+static int resolve_foreign_key(Database* db, ForeignKey* fk, Table** ref_table, int* ref_col_index) {
+    if (db == global_db && fk->ref_table && fk->cache_version == db->schema_version) {
+        *ref_table = fk->ref_table;
+        *ref_col_index = fk->ref_col_index;
+        return 0;
+    }
+
+    Table* table = get_table_by_name(db, fk->referenced_table);
+    if (!table) {
+        fprintf(stderr, "Связанная таблица %s не найдена\n", fk->referenced_table);
+        return -1;
+    }
+    int col_index = -1;
+    for (int i = 0; i < table->num_columns; i++) {
+        if (strcmp(table->columns[i].name, fk->referenced_column) == 0) {
+            col_index = i;
+            break;
+        }
+    }
+    if (col_index == -1) {
+        fprintf(stderr, "Столбец %s не найден в таблице %s\n",
+                fk->referenced_column, fk->referenced_table);
+        return -1;
+    }
+
+    if (db == global_db) {
+        fk->ref_table = table;
+        fk->ref_col_index = col_index;
+        fk->cache_version = db->schema_version;
+    }
+    *ref_table = table;
+    *ref_col_index = col_index;
+    return 0;
+}
+
+/*
+ * Проверяет наличие значения в столбце связанной таблицы.
+ * Использует хеш-индекс по связанному столбцу: он строится при первой
+ * проверке и дальше поддерживается insert_row/update_row/delete_row
+ * связанной таблицы, поэтому вставка дочерней строки стоит O(1).
+ */
+static int referenced_value_exists(Table* table, int col_index,
+                                   Table* ref_table, int ref_col_index, DataValue value) {
+    int type = table->columns[col_index].type;
+    if (type != ref_table->columns[ref_col_index].type) {
+        return 0;
+    }
+
+    HashIndex* index = table_ensure_index(ref_table, ref_col_index);
+    if (index) {
+        return index_find(ref_table, index, value, -1) != -1;
+    }
+
+    // Не удалось построить индекс - проверяем перебором
+    for (int i = 0; i < ref_table->num_rows; i++) {
+        if (ref_table->deleted[i]) continue;
+        if (values_equal(type, storage_get(ref_table, i, ref_col_index), value)) {
+            return 1;
+        }
+    }
+    return 0;
 }
 
 API int check_foreign_key_constraint(Database* db, Table* table, int col_index, DataValue value) {
@@ -160,50 +441,14 @@ API int check_foreign_key_constraint(Database* db, Table* table, int col_index,
     
     ForeignKey* fk = table->columns[col_index].foreign_key;
     Table* ref_table = NULL;
-    
-    // Ищем связанную таблицу
-    for (int i = 0; i < db->num_tables; i++) {
-        if (strcmp(db->tables[i]->name, fk->referenced_table) == 0) {
-            ref_table = db->tables[i];
-            break;
-        }
-    }
-    
-    if (!ref_table) {
-        fprintf(stderr, "Связанная таблица %s не найдена\n", fk->referenced_table);
-        return 0;
-    }
-    
-    // Находим индекс столбца в связанной таблице
     int ref_col_index = -1;
-    for (int i = 0; i < ref_table->num_columns; i++) {
-        if (strcmp(ref_table->columns[i].name, fk->referenced_column) == 0) {
-            ref_col_index = i;
-            break;
-        }
-    }
-    
-    if (ref_col_index == -1) {
-        fprintf(stderr, "Столбец %s не найден в таблице %s\n", 
-                fk->referenced_column, fk->referenced_table);
+    if (resolve_foreign_key(db, fk, &ref_table, &ref_col_index) != 0) {
         return 0;
     }
     
     // Проверяем существование значения в связанной таблице
-    for (int i = 0; i < ref_table->num_rows; i++) {
-        DataValue ref_value = ref_table->rows[i].values[ref_col_index];
-        if (table->columns[col_index].type == TYPE_INT && 
-            ref_table->columns[ref_col_index].type == TYPE_INT) {
-            if (value.i == ref_value.i) return 1;
-        }
-        else if (table->columns[col_index].type == TYPE_FLOAT && 
-                 ref_table->columns[ref_col_index].type == TYPE_FLOAT) {
-            if (fabs(value.f - ref_value.f) < FLOAT_EPSILON) return 1;
-        }
-        else if (table->columns[col_index].type == TYPE_STRING && 
-                 ref_table->columns[ref_col_index].type == TYPE_STRING) {
-            if (value.s && ref_value.s && strcmp(value.s, ref_value.s) == 0) return 1;
-        }
+    if (referenced_value_exists(table, col_index, ref_table, ref_col_index, value)) {
+        return 1;
     }
     
     fprintf(stderr, "Нарушение целостности внешнего ключа: значение не найдено в таблице %s\n", 
@@ -225,52 +470,16 @@ static int check_foreign_key_value(Table* table, int col_index, DataValue value)
         return 0;
     }
 
-    // Находим связанную таблицу
+    // Связанная таблица и столбец берутся из кеша внешнего ключа
     Table* ref_table = NULL;
-    for (int i = 0; i < global_db->num_tables; i++) {
-        if (strcmp(global_db->tables[i]->name, fk->referenced_table) == 0) {
-            ref_table = global_db->tables[i];
-            break;
-        }
-    }
-
-    if (!ref_table) {
-        fprintf(stderr, "Referenced table not found\n");
-        return 0;
-    }
-
-    // Находим индекс столбца в связанной таблице
     int ref_col_index = -1;
-    for (int i = 0; i < ref_table->num_columns; i++) {
-        if (strcmp(ref_table->columns[i].name, fk->referenced_column) == 0) {
-            ref_col_index = i;
-            break;
-        }
-    }
-
-    if (ref_col_index == -1) {
-        fprintf(stderr, "Referenced column not found\n");
+    if (resolve_foreign_key(global_db, fk, &ref_table, &ref_col_index) != 0) {
         return 0;
     }
 
     // Проверяем существование значения в связанной таблице
-    for (int i = 0; i < ref_table->num_rows; i++) {
-        if (table->columns[col_index].type == TYPE_INT && 
-            ref_table->columns[ref_col_index].type == TYPE_INT) {
-            if (value.i == ref_table->rows[i].values[ref_col_index].i) {
-                return 1;
-            }
-        } else if (table->columns[col_index].type == TYPE_FLOAT && 
-                   ref_table->columns[ref_col_index].type == TYPE_FLOAT) {
-            if (fabs(value.f - ref_table->rows[i].values[ref_col_index].f) < FLOAT_EPSILON) {
-                return 1;
-            }
-        } else if (table->columns[col_index].type == TYPE_STRING && 
-                   ref_table->columns[ref_col_index].type == TYPE_STRING) {
-            if (value.s && ref_table->rows[i].values[ref_col_index].s && strcmp(value.s, ref_table->rows[i].values[ref_col_index].s) == 0) {
-                return 1;
-            }
-        }
+    if (referenced_value_exists(table, col_index, ref_table, ref_col_index, value)) {
+        return 1;
     }
 
     fprintf(stderr, "Error: foreign key value %d not found in referenced table\n", value.i);
@@ -278,7 +487,7 @@ static int check_foreign_key_value(Table* table, int col_index, DataValue value)
 }
 
 // Инициализация базы данных при запуске
-API void init_database(void) {
+static void init_database_locked(void) {
     if (global_db == NULL) {
         global_db = (Database*)malloc(sizeof(Database));
         if (!global_db) {
@@ -297,6 +506,9 @@ API void init_database(void) {
         global_db->num_tables = 0;
         global_db->max_tables = DB_INITIAL_CAPACITY;
         global_db->current_transaction = NULL;
+        global_db->table_map = NULL;
+        global_db->map_capacity = 0;
+        global_db->schema_version = 0;
         
         // Инициализируем массив таблиц
         for (int i = 0; i < DB_INITIAL_CAPACITY; i++) {
@@ -305,14 +517,21 @@ API void init_database(void) {
     }
 }
 
+API void init_database(void) {
+    lock_mutations();
+    init_database_locked();
+    unlock_mutations();
+}
+
 // Очистка базы данных при завершении
-API void cleanup_database(void) {
+static void cleanup_database_locked(void) {
     if (!global_db) return;
     
     // Откатываем активную транзакцию, если она есть
     if (global_db->current_transaction) {
         rollback_transaction(global_db->current_transaction);
     }
+    wal_close();
     
     // Освобождаем память таблиц
     for (int i = 0; i < global_db->num_tables; i++) {
@@ -324,108 +543,39 @@ API void cleanup_database(void) {
     
     // Освобождаем память базы данных
     free(global_db->tables);
+    free(global_db->table_map);
     free(global_db);
     global_db = NULL;
 }
 
-API Table* create_table(const char* name, Column* columns, int num_columns) {
-    if (!name || !columns || num_columns <= 0) {
-        fprintf(stderr, "Неверные параметры для create_table\n");
-        return NULL;
-    }
-    
-    Table* table = (Table*)malloc(sizeof(Table));
-    if (!table) {
-        fprintf(stderr, "Ошибка выделения памяти для таблицы\n");
-        return NULL;
-    }
-    
-    // Инициализируем структуру таблицы
-    memset(table, 0, sizeof(Table));
-    
-    // Копируем имя таблицы
-    strncpy(table->name, name, sizeof(table->name) - 1);
-    table->name[sizeof(table->name) - 1] = '\0';
-    
-    // Выделяем память для столбцов
-    table->num_columns = num_columns;
-    table->columns = (Column*)malloc(num_columns * sizeof(Column));
-    if (!table->columns) {
-        fprintf(stderr, "Ошибка выделения памяти для столбцов\n");
-        free(table);
-        return NULL;
-    }
-    
-    // Копируем информацию о столбцах
-    for (int i = 0; i < num_columns; i++) {
-        memset(&table->columns[i], 0, sizeof(Column));
-        strncpy(table->columns[i].name, columns[i].name, sizeof(table->columns[i].name) - 1);
-        table->columns[i].name[sizeof(table->columns[i].name) - 1] = '\0';
-        table->columns[i].type = columns[i].type;
-        table->columns[i].is_primary_key = 0;
-        table->columns[i].is_foreign_key = 0;
-        table->columns[i].foreign_key = NULL;
-    }
-    
-    // Инициализируем массив строк
-    table->num_rows = 0;
-    table->max_rows = TABLE_INITIAL_CAPACITY;
-    table->rows = (Row*)malloc(table->max_rows * sizeof(Row));
-    if (!table->rows) {
-        fprintf(stderr, "Ошибка выделения памяти для строк\n");
-        free(table->columns);
-        free(table);
-        return NULL;
-    }
-    
-    // Инициализируем массив строк
-    for (int i = 0; i < table->max_rows; i++) {
-        table->rows[i].values = NULL;
-    }
-    
-    // Инициализируем внешние ключи
-    table->foreign_keys = NULL;
-    table->num_foreign_keys = 0;
-    
-    return table;
+API void cleanup_database(void) {
+    lock_mutations();
+    cleanup_database_locked();
+    unlock_mutations();
 }
 
-// Функция для получения блокировки таблицы
-static int lock_table(Table* table, int transaction_id) {
-    if (!table) return 0;
-    
-    // Ищем блокировку для таблицы
-    for (int i = 0; i < num_locks; i++) {
-        if (table_locks[i].is_locked && table_locks[i].transaction_id != transaction_id) {
-            return 0; // Таблица уже заблокирована другой транзакцией
-        }
-    }
-    
-    // Создаем новую блокировку
-    TableLock* new_locks = realloc(table_locks, (num_locks + 1) * sizeof(TableLock));
-    if (!new_locks) return 0;
-    
-    table_locks = new_locks;
-    table_locks[num_locks].is_locked = 1;
-    table_locks[num_locks].transaction_id = transaction_id;
-    num_locks++;
-    
-    return 1;
+API Table* create_table(const char* name, Column* columns, int num_columns) {
+    return create_table_ex(name, columns, num_columns, STORAGE_ROW);
 }
 
-// Функция для освобождения блокировки
-static void unlock_table(Table* table, int transaction_id) {
-    if (!table) return;
-    
-    for (int i = 0; i < num_locks; i++) {
-        if (table_locks[i].transaction_id == transaction_id) {
-            table_locks[i].is_locked = 0;
-            break;
-        }
+/*
+ * Блокировка для изменения внутри транзакции (locks.h): вставка берёт
+ * намерение на таблицу, изменение и удаление - строку. Блокировки держатся
+ * до фиксации или отката; повторный захват ничего не стоит. Ожидания нет:
+ * функции выполняются под lock_mutations, и другая транзакция не смогла бы
+ * освободить блокировку, пока мы ждём.
+ */
+static int lock_for_write(Table* table, int row_id) {
+    if (!current_transaction || !current_transaction->is_active) return 1;
+    int mode = row_id == LOCK_WHOLE_TABLE ? LOCK_INTENT_EXCLUSIVE : LOCK_EXCLUSIVE;
+    if (lock_acquire(current_transaction->transaction_id, table, row_id, mode, 0) != LOCK_OK) {
+        fprintf(stderr, "Error: table %s is locked by another transaction\n", table->name);
+        return 0;
     }
+    return 1;
 }
 
-API void* begin_transaction() {
+static void* begin_transaction_locked() {
     if (!global_db) {
         fprintf(stderr, "Database not initialized\n");
         return NULL;
@@ -460,6 +610,13 @@ API void* begin_transaction() {
     return current_transaction;
 }
 
+API void* begin_transaction(void) {
+    lock_mutations();
+    void* result = begin_transaction_locked();
+    unlock_mutations();
+    return result;
+}
+
 // Функция для добавления операции в транзакцию
 static void add_operation(Transaction* t, int op_type, Table* table, 
                          int row_index, int col_index, 
@@ -489,9 +646,13 @@ static void add_operation(Transaction* t, int op_type, Table* table,
     t->num_operations++;
 }
 
-API void rollback_transaction(void* transaction) {
+static void rollback_transaction_locked(void* transaction) {
     if (!transaction || !current_transaction) return;
 
+    // Операции отката не должны записываться в журнал транзакции
+    current_transaction->is_active = 0;
+    wal_discard();
+
     // Отменяем операции в обратном порядке
     for (int i = current_transaction->num_operations - 1; i >= 0; i--) {
         TransactionOperation* op = &current_transaction->operations[i];
@@ -503,20 +664,29 @@ API void rollback_transaction(void* transaction) {
             case OP_UPDATE:
                 // Восстанавливаем старое значение
                 update_row(op->table, op->row_index, op->col_index, op->old_value);
+                if (op->table->columns[op->col_index].type == TYPE_STRING) {
+                    free(op->old_value.s);
+                }
                 break;
-            case OP_DELETE:
-                // Восстанавливаем удаленную строку
-                insert_row(op->table, op->table->rows[op->row_index].values);
+            case OP_DELETE: {
+                // Снимаем пометку удаления: данные строки хранятся до конца транзакции
+                int slot = storage_slot_any(op->table, op->row_index);
+                if (slot >= 0 && op->table->deleted[slot]) {
+                    op->table->deleted[slot] = 0;
+                    op->table->num_deleted--;
+                    storage_touch(op->table, slot);
+                    table_index_add_row(op->table, slot);
+                }
                 break;
+            }
         }
     }
 
+    // Прежние версии строк снова в таблице
+    mvcc_rollback();
+
     // Освобождаем все блокировки транзакции
-    for (int i = 0; i < num_locks; i++) {
-        if (table_locks[i].transaction_id == current_transaction->transaction_id) {
-            table_locks[i].is_locked = 0;
-        }
-    }
+    lock_release_all(current_transaction->transaction_id);
 
     // Освобождаем память транзакции
     free(current_transaction->operations);
@@ -524,16 +694,24 @@ API void rollback_transaction(void* transaction) {
     current_transaction = NULL;
 }
 
-API int commit_transaction(void* transaction) {
+API void rollback_transaction(void* transaction) {
+    lock_mutations();
+    rollback_transaction_locked(transaction);
+    unlock_mutations();
+}
+
+static int commit_transaction_locked(void* transaction) {
     if (!transaction || !current_transaction) return 0;
 
     // Проверяем целостность данных
     for (int i = 0; i < current_transaction->num_operations; i++) {
         TransactionOperation* op = &current_transaction->operations[i];
         if (op->operation == OP_INSERT || op->operation == OP_UPDATE) {
+            int slot = storage_slot(op->table, op->row_index);
+            if (slot < 0) continue;  // строка удалена позже в этой же транзакции
             for (int j = 0; j < op->table->num_columns; j++) {
                 if (op->table->columns[j].is_foreign_key) {
-                    DataValue value = op->table->rows[op->row_index].values[j];
+                    DataValue value = storage_get(op->table, slot, j);
                     if (!check_foreign_key_value(op->table, j, value)) {
                         rollback_transaction(transaction);
                         return 0;
@@ -543,13 +721,30 @@ API int commit_transaction(void* transaction) {
         }
     }
 
-    // Снимаем все блокировки, связанные с этой транзакцией
-    for (int i = 0; i < num_locks; i++) {
-        if (table_locks[i].transaction_id == current_transaction->transaction_id) {
-            table_locks[i].is_locked = 0;
+    // Запись в журнал до освобождения данных отката: при ошибке записи
+    // транзакция ещё может быть откатана
+    if (wal_commit() != 0) {
+        rollback_transaction(transaction);
+        return 0;
+    }
+    mvcc_commit();
+
+    // Старые значения и данные удалённых строк больше не нужны для отката
+    for (int i = 0; i < current_transaction->num_operations; i++) {
+        TransactionOperation* op = &current_transaction->operations[i];
+        if (op->operation == OP_UPDATE && op->table->columns[op->col_index].type == TYPE_STRING) {
+            free(op->old_value.s);
+        } else if (op->operation == OP_DELETE) {
+            int slot = storage_slot_any(op->table, op->row_index);
+            if (slot >= 0 && op->table->deleted[slot]) {
+                storage_clear_row(op->table, slot);
+            }
         }
     }
 
+    // Снимаем все блокировки, связанные с этой транзакцией
+    lock_release_all(current_transaction->transaction_id);
+
     // Освобождаем память транзакции
     free(current_transaction->operations);
     free(current_transaction);
@@ -557,147 +752,211 @@ API int commit_transaction(void* transaction) {
     return 1;
 }
 
+API int commit_transaction(void* transaction) {
+    lock_mutations();
+    int result = commit_transaction_locked(transaction);
+    unlock_mutations();
+    return result;
+}
+
 void set_value(Table* table, int row_idx, int col_idx, DataValue value) {
-    if (!table || !table->rows || row_idx < 0 || row_idx >= table->num_rows ||
+    if (!table || row_idx < 0 || row_idx >= table->num_rows ||
         col_idx < 0 || col_idx >= table->num_columns) {
         return;
     }
+    if (storage_writable(table) != 0) {
+        return;
+    }
 
-    Row* row = &table->rows[row_idx];
-    if (!row->values) {
-        row->values = (DataValue*)calloc(table->num_columns, sizeof(DataValue));
-        if (!row->values) {
+    if (table->storage == STORAGE_ROW && !table->rows[row_idx].values) {
+        if (storage_init_row(table, row_idx) != 0) {
             return;
         }
     }
 
     // Очищаем предыдущее значение
-    if (row->values[col_idx].s) {
-        free(row->values[col_idx].s);
-        row->values[col_idx].s = NULL;
+    if (table->columns[col_idx].type == TYPE_STRING) {
+        free(storage_get(table, row_idx, col_idx).s);
     }
 
     // Копируем новое значение
     if (table->columns[col_idx].type == TYPE_STRING && value.s) {
-        size_t len = strlen(value.s);
-        row->values[col_idx].s = (char*)malloc(len + 1);
-        if (row->values[col_idx].s) {
-            strncpy(row->values[col_idx].s, value.s, len);
-            row->values[col_idx].s[len] = '\0';
-        }
-    } else {
-        row->values[col_idx] = value;
+        value.s = strdup(value.s);
+    }
+    storage_set(table, row_idx, col_idx, value);
+}
+
+// Убирает строки, добавленные в слоты начиная с first_slot (откат неудачного пакета)
+static void insert_rows_undo(Table* table, int first_slot) {
+    while (table->num_rows > first_slot) {
+        int slot = table->num_rows - 1;
+        table_index_remove_row(table, slot);
+        storage_pop_slot(table);
     }
 }
 
+static int insert_row_locked(Table* table, DataValue* values) {
+    return insert_rows(table, values, 1) == 1 ? 0 : -1;
+}
+
 API int insert_row(Table* table, DataValue* values) {
-    if (!table || !values) {
+    lock_mutations();
+    int result = insert_row_locked(table, values);
+    unlock_mutations();
+    return result;
+}
+
+/*
+ * Пакетная вставка nrows строк; values - массив nrows * num_columns значений
+ * (строка за строкой). Блокировка берётся один раз, ёмкость таблицы
+ * увеличивается один раз, внешние ключи проверяются до вставки.
+ * Вставка атомарна: при нарушении первичного ключа (в том числе между
+ * строками пакета) уже добавленные строки пакета убираются.
+ * Возвращает количество вставленных строк или -1.
+ */
+static int insert_rows_locked(Table* table, DataValue* values, int nrows) {
+    if (!table || !values || nrows < 0) {
         fprintf(stderr, "Invalid parameters for insert_row\n");
         return -1;
     }
+    if (nrows == 0) {
+        return 0;
+    }
 
-    // Получаем блокировку таблицы
-    if (current_transaction && !lock_table(table, current_transaction->transaction_id)) {
-        fprintf(stderr, "Error: table is locked by another transaction\n");
+    // Блокировка таблицы для вставки (до конца транзакции)
+    if (!lock_for_write(table, LOCK_WHOLE_TABLE)) {
         return -1;
     }
 
-    // Проверяем внешние ключи
+    // Проверяем внешние ключи всего пакета
     for (int i = 0; i < table->num_columns; i++) {
-        if (table->columns[i].is_foreign_key) {
-            if (!check_foreign_key_value(table, i, values[i])) {
-                if (current_transaction) unlock_table(table, current_transaction->transaction_id);
+        if (!table->columns[i].is_foreign_key) continue;
+        for (int r = 0; r < nrows; r++) {
+            if (!check_foreign_key_value(table, i, values[r * table->num_columns + i])) {
                 return -1;
             }
         }
     }
 
-    // Проверяем уникальность первичного ключа
-    for (int i = 0; i < table->num_columns; i++) {
-        if (table->columns[i].is_primary_key) {
-            for (int j = 0; j < table->num_rows; j++) {
-                int is_duplicate = 0;
-                if (table->columns[i].type == TYPE_INT) {
-                    if (table->rows[j].values[i].i == values[i].i) {
-                        is_duplicate = 1;
-                    }
-                } else if (table->columns[i].type == TYPE_FLOAT) {
-                    if (table->rows[j].values[i].f == values[i].f) {
-                        is_duplicate = 1;
-                    }
-                } else if (table->columns[i].type == TYPE_STRING) {
-                    if (values[i].s && table->rows[j].values[i].s && strcmp(table->rows[j].values[i].s, values[i].s) == 0) {
-                        is_duplicate = 1;
-                    }
-                }
-                if (is_duplicate) {
-                    if (current_transaction) unlock_table(table, current_transaction->transaction_id);
-                    fprintf(stderr, "Error: primary key violation for column %s\n", table->columns[i].name);
-                    return -1;
-                }
+    if (storage_reserve(table, table->num_rows + nrows) != 0) {
+        fprintf(stderr, "Failed to reallocate memory for rows\n");
+        return -1;
+    }
+
+    int first_slot = table->num_rows;
+    int first_id = table->next_row_id;
+    for (int r = 0; r < nrows; r++) {
+        DataValue* row = values + r * table->num_columns;
+
+        // Проверяем уникальность первичного ключа по хеш-индексу
+        for (int i = 0; i < table->num_columns; i++) {
+            if (table->columns[i].is_primary_key && table_index_conflict(table, i, row[i], -1)) {
+                fprintf(stderr, "Error: primary key violation for column %s\n", table->columns[i].name);
+                insert_rows_undo(table, first_slot);
+                return -1;
             }
         }
-    }
 
-    // Выполняем вставку
-    if (table->num_rows >= table->max_rows) {
-        int new_max = table->max_rows * 2;
-        Row* temp = realloc(table->rows, new_max * sizeof(Row));
-        if (!temp) {
-            if (current_transaction) unlock_table(table, current_transaction->transaction_id);
-            fprintf(stderr, "Failed to reallocate memory for rows\n");
+        // Выполняем вставку в новый слот; строка получает следующий идентификатор
+        int slot = storage_append_slot(table);
+        if (slot < 0) {
+            fprintf(stderr, "Error allocating memory for new row\n");
+            insert_rows_undo(table, first_slot);
             return -1;
         }
-        table->rows = temp;
-        table->max_rows = new_max;
-    }
 
-    Row new_row;
-    new_row.values = (DataValue*)calloc(table->num_columns, sizeof(DataValue));
-    if (!new_row.values) {
-        if (current_transaction) unlock_table(table, current_transaction->transaction_id);
-        fprintf(stderr, "Error allocating memory for new row\n");
+        // Копируем значения
+        for (int i = 0; i < table->num_columns; i++) {
+            DataValue value = row[i];
+            if (table->columns[i].type == TYPE_STRING && row[i].s) {
+                value.s = strdup(row[i].s);
+            }
+            storage_set(table, slot, i, value);
+        }
+        table_index_add_row(table, slot);
+    }
+    if (mvcc_tracking() && mvcc_rows_inserted(table, first_id, current_transaction != NULL) != 0) {
+        insert_rows_undo(table, first_slot);
         return -1;
     }
 
-    // Копируем значения
-    for (int i = 0; i < table->num_columns; i++) {
-        if (table->columns[i].type == TYPE_STRING) {
-            if (values[i].s) {
-                size_t len = strlen(values[i].s);
-                new_row.values[i].s = (char*)malloc(len + 1);
-                if (new_row.values[i].s) {
-                    strncpy(new_row.values[i].s, values[i].s, len);
-                    new_row.values[i].s[len] = '\0';
-                }
-            } else {
-                new_row.values[i].s = NULL;
-            }
-        } else {
-            new_row.values[i] = values[i];
+    // Если есть активная транзакция, добавляем операции
+    if (current_transaction && current_transaction->is_active) {
+        DataValue empty_value = {0};
+        for (int slot = first_slot; slot < table->num_rows; slot++) {
+            add_operation(current_transaction, OP_INSERT, table, table->row_ids[slot], -1, 
+                         empty_value, empty_value);
+        }
+    }
+    if (wal_logging()) {
+        for (int slot = first_slot; slot < table->num_rows; slot++) {
+            wal_log_insert(table, slot);
         }
+        wal_autocommit();
     }
+    return nrows;
+}
 
-    // Добавляем строку
-    table->rows[table->num_rows] = new_row;
-    int row_index = table->num_rows;
-    table->num_rows++;
+API int insert_rows(Table* table, DataValue* values, int nrows) {
+    lock_mutations();
+    int result = insert_rows_locked(table, values, nrows);
+    unlock_mutations();
+    return result;
+}
 
-    // Если есть активная транзакция, добавляем операцию
-    if (current_transaction && current_transaction->is_active) {
-        DataValue empty_value = {0};
-        add_operation(current_transaction, OP_INSERT, table, row_index, -1, 
-                     empty_value, empty_value);
+/*
+ * Вставка из массивов по столбцам: columns[j] указывает на int[nrows],
+ * float[nrows] или char*[nrows] в зависимости от типа столбца.
+ * Строки переставляются в порядок insert_rows, поэтому проверки
+ * ключей и атомарность те же.
+ */
+static int insert_columns_locked(Table* table, void** columns, int nrows) {
+    if (!table || !columns || nrows < 0) {
+        fprintf(stderr, "Invalid parameters for insert_columns\n");
+        return -1;
+    }
+    if (nrows == 0) {
+        return 0;
     }
 
-    // Освобождаем блокировку
-    if (current_transaction) unlock_table(table, current_transaction->transaction_id);
-    return 0;
+    int ncols = table->num_columns;
+    DataValue* values = (DataValue*)malloc((size_t)nrows * ncols * sizeof(DataValue));
+    if (!values) {
+        fprintf(stderr, "Error allocating memory for insert_columns\n");
+        return -1;
+    }
+    for (int j = 0; j < ncols; j++) {
+        for (int r = 0; r < nrows; r++) {
+            DataValue* value = &values[(size_t)r * ncols + j];
+            switch (table->columns[j].type) {
+                case TYPE_INT:   value->i = ((int*)columns[j])[r]; break;
+                case TYPE_FLOAT: value->f = ((float*)columns[j])[r]; break;
+                default:         value->s = ((char**)columns[j])[r]; break;
+            }
+        }
+    }
+    int result = insert_rows(table, values, nrows);
+    free(values);
+    return result;
+}
+
+API int insert_columns(Table* table, void** columns, int nrows) {
+    lock_mutations();
+    int result = insert_columns_locked(table, columns, nrows);
+    unlock_mutations();
+    return result;
 }
 
-API int update_row(Table* table, int row_index, int col_index, DataValue new_value) {
-    if (!table || row_index < 0 || row_index >= table->num_rows || 
-        col_index < 0 || col_index >= table->num_columns) {
+static int update_row_locked(Table* table, int row_id, int col_index, DataValue new_value) {
+    if (!table || col_index < 0 || col_index >= table->num_columns) {
+        return -1;
+    }
+    int slot = storage_slot(table, row_id);
+    if (slot < 0 || !lock_for_write(table, row_id)) {
+        return -1;
+    }
+    // Данные отображённой таблицы копируются до изменения индексов
+    if (storage_writable(table) != 0) {
         return -1;
     }
 
@@ -710,79 +969,148 @@ API int update_row(Table* table, int row_index, int col_index, DataValue new_val
         }
     }
 
-    // Проверяем уникальность первичного ключа
-    if (table->columns[col_index].is_primary_key) {
-        for (int i = 0; i < table->num_rows; i++) {
-            if (i != row_index && table->columns[col_index].type == TYPE_INT && 
-                table->rows[i].values[col_index].i == new_value.i) {
-                fprintf(stderr, "Error: primary key violation for column %s\n", 
-                        table->columns[col_index].name);
-                return -1;
-            }
-        }
+    // Проверяем уникальность первичного ключа по хеш-индексу
+    if (table->columns[col_index].is_primary_key &&
+        table_index_conflict(table, col_index, new_value, slot)) {
+        fprintf(stderr, "Error: primary key violation for column %s\n", 
+                table->columns[col_index].name);
+        return -1;
+    }
+
+    // Прежняя версия строки для открытых снимков
+    if (mvcc_tracking() && mvcc_save_row(table, slot, current_transaction != NULL) != 0) {
+        return -1;
     }
 
     // Сохраняем старое значение
-    DataValue old_value = table->rows[row_index].values[col_index];
+    DataValue old_value = storage_get(table, slot, col_index);
+    table_index_remove_cell(table, slot, col_index);
 
     // Обновляем значение
     if (table->columns[col_index].type == TYPE_STRING) {
-        if (table->rows[row_index].values[col_index].s) {
-            free(table->rows[row_index].values[col_index].s);
+        DataValue stored = {0};
+        // Внутри транзакции старая строка остаётся в журнале для отката
+        if (old_value.s && !(current_transaction && current_transaction->is_active)) {
+            free(old_value.s);
         }
         if (new_value.s) {
             size_t len = strlen(new_value.s);
-            table->rows[row_index].values[col_index].s = (char*)malloc(len + 1);
-            if (table->rows[row_index].values[col_index].s) {
-                strncpy(table->rows[row_index].values[col_index].s, new_value.s, len);
-                table->rows[row_index].values[col_index].s[len] = '\0';
+            stored.s = (char*)malloc(len + 1);
+            if (stored.s) {
+                strncpy(stored.s, new_value.s, len);
+                stored.s[len] = '\0';
             }
-        } else {
-            table->rows[row_index].values[col_index].s = NULL;
         }
+        storage_set(table, slot, col_index, stored);
     } else {
-        table->rows[row_index].values[col_index] = new_value;
+        storage_set(table, slot, col_index, new_value);
     }
+    table_index_add_cell(table, slot, col_index);
 
     // Если есть активная транзакция, добавляем операцию
     if (current_transaction && current_transaction->is_active) {
-        add_operation(current_transaction, OP_UPDATE, table, row_index, col_index, 
+        add_operation(current_transaction, OP_UPDATE, table, row_id, col_index, 
                      old_value, new_value);
     }
+    if (wal_logging()) {
+        wal_log_update(table, slot, col_index);
+        wal_autocommit();
+    }
 
     return 0;
 }
 
-API int delete_row(Table* table, int row_index) {
-    if (!table || row_index < 0 || row_index >= table->num_rows) {
+API int update_row(Table* table, int row_id, int col_index, DataValue new_value) {
+    lock_mutations();
+    int result = update_row_locked(table, row_id, col_index, new_value);
+    unlock_mutations();
+    return result;
+}
+
+/*
+ * Удаление строки по идентификатору за O(1): строка только помечается
+ * удалённой, остальные строки не сдвигаются и сохраняют свои идентификаторы.
+ * Вне транзакции данные строки освобождаются сразу, внутри - при фиксации
+ * (до неё они нужны для отката). Слоты освобождаются при уплотнении.
+ */
+static int delete_row_locked(Table* table, int row_id) {
+    if (!table) {
+        return -1;
+    }
+    int slot = storage_slot(table, row_id);
+    if (slot < 0 || !lock_for_write(table, row_id)) {
         return -1;
     }
 
-    // Если есть активная транзакция, сохраняем данные строки
-    if (current_transaction && current_transaction->is_active) {
+    int in_transaction = current_transaction && current_transaction->is_active;
+    // Вне транзакции данные строки освобождаются сразу: отображённую таблицу
+    // нужно скопировать до изменения индексов (надгробие копии не требует)
+    if (!in_transaction && storage_writable(table) != 0) {
+        return -1;
+    }
+    if (mvcc_tracking() && mvcc_save_row(table, slot, in_transaction) != 0) {
+        return -1;
+    }
+    if (in_transaction) {
         DataValue empty_value = {0};
-        add_operation(current_transaction, OP_DELETE, table, row_index, -1, 
+        add_operation(current_transaction, OP_DELETE, table, row_id, -1, 
                      empty_value, empty_value);
     }
 
-    // Освобождаем память строки
-    for (int i = 0; i < table->num_columns; i++) {
-        if (table->columns[i].type == TYPE_STRING && 
-            table->rows[row_index].values[i].s) {
-            free(table->rows[row_index].values[i].s);
-        }
+    table_index_remove_row(table, slot);
+    table->deleted[slot] = 1;
+    table->num_deleted++;
+    storage_touch(table, slot);
+    if (!in_transaction) {
+        storage_clear_row(table, slot);
     }
-    free(table->rows[row_index].values);
-
-    // Сдвигаем оставшиеся строки
-    for (int i = row_index; i < table->num_rows - 1; i++) {
-        table->rows[i] = table->rows[i + 1];
+    if (wal_logging()) {
+        wal_log_delete(table, row_id);
+        wal_autocommit();
     }
 
-    table->num_rows--;
+    // Уплотняем таблицу, когда надгробия занимают больше половины слотов
+    if (!current_transaction && table->num_deleted >= VACUUM_MIN_DELETED &&
+        table->num_deleted * 2 > table->num_rows) {
+        vacuum_table(table);
+    }
     return 0;
 }
 
+API int delete_row(Table* table, int row_id) {
+    lock_mutations();
+    int result = delete_row_locked(table, row_id);
+    unlock_mutations();
+    return result;
+}
+
+static int vacuum_table_locked(Table* table) {
+    if (!table) {
+        return -1;
+    }
+    // Журнал транзакции ссылается на удалённые строки, уплотнять нельзя
+    if (current_transaction) {
+        fprintf(stderr, "Error: cannot vacuum table %s during a transaction\n", table->name);
+        return -1;
+    }
+    // Надгробия нужны открытым снимкам: уплотнение откладывается до сборки их версий
+    if (table->num_deleted == 0 || mvcc_holds_rows(table)) {
+        return 0;
+    }
+    int removed = storage_compact(table);
+    if (table_index_rebuild_all(table) != 0) {
+        fprintf(stderr, "Ошибка перестроения индексов таблицы %s\n", table->name);
+    }
+    return removed;
+}
+
+API int vacuum_table(Table* table) {
+    lock_mutations();
+    int result = vacuum_table_locked(table);
+    unlock_mutations();
+    return result;
+}
+
 API void print_table(Table *table) {
     if (!table) return;
     printf("Таблица: %s\n", table->name);
@@ -795,14 +1123,16 @@ API void print_table(Table *table) {
     }
     printf("\n");
     for (int i = 0; i < table->num_rows; i++){
+         if (table->deleted[i]) continue;
          for (int j = 0; j < table->num_columns; j++){
               int col_type = table->columns[j].type;
+              DataValue value = storage_get(table, i, j);
               if (col_type == TYPE_INT)
-                  printf("%-15d", table->rows[i].values[j].i);
+                  printf("%-15d", value.i);
               else if (col_type == TYPE_FLOAT)
-                  printf("%-15f", table->rows[i].values[j].f);
+                  printf("%-15f", value.f);
               else if (col_type == TYPE_STRING)
-                  printf("%-15s", table->rows[i].values[j].s);
+                  printf("%-15s", value.s);
          }
          printf("\n");
     }
@@ -822,12 +1152,23 @@ API void print_table(Table *table) {
  *   — Иначе устанавливается значение по умолчанию (0, 0.0 или пустая строка).
  */
 API Table* transform_table(Table* old_table, Column* new_columns, int new_num_columns) {
-    Table* new_table = create_table(old_table->name, new_columns, new_num_columns);
+    Table* new_table = create_table_ex(old_table->name, new_columns, new_num_columns, old_table->storage);
     if (!new_table) {
          fprintf(stderr, "Ошибка создания новой таблицы\n");
          return NULL;
     }
+    // Переносим первичные ключи для столбцов с тем же именем и типом
+    for (int j = 0; j < new_num_columns; j++) {
+         for (int k = 0; k < old_table->num_columns; k++) {
+             if (old_table->columns[k].is_primary_key &&
+                 old_table->columns[k].type == new_columns[j].type &&
+                 strcmp(old_table->columns[k].name, new_columns[j].name) == 0) {
+                 set_primary_key(new_table, new_columns[j].name);
+             }
+         }
+    }
     for (int i = 0; i < old_table->num_rows; i++) {
+         if (old_table->deleted[i]) continue;
          DataValue* new_values = (DataValue*)malloc(new_num_columns * sizeof(DataValue));
          if (!new_values) {
              fprintf(stderr, "Ошибка выделения памяти для новой строки\n");
@@ -839,10 +1180,11 @@ API Table* transform_table(Table* old_table, Column* new_columns, int new_num_co
                  if (strcmp(old_table->columns[k].name, new_columns[j].name) == 0) {
                      found = 1;
                      if (old_table->columns[k].type == new_columns[j].type) {
+                         DataValue old_value = storage_get(old_table, i, k);
                          if (new_columns[j].type == TYPE_STRING) {
-                              new_values[j].s = strdup(old_table->rows[i].values[k].s);
+                              new_values[j].s = old_value.s ? strdup(old_value.s) : NULL;
                          } else {
-                              new_values[j] = old_table->rows[i].values[k];
+                              new_values[j] = old_value;
                          }
                      } else {
                          if (new_columns[j].type == TYPE_INT) {
@@ -874,7 +1216,7 @@ API Table* transform_table(Table* old_table, Column* new_columns, int new_num_co
     return new_table;
 }
 
-API int add_foreign_key(Table* table, const char* column_name, 
+static int add_foreign_key_locked(Table* table, const char* column_name, 
                        const char* ref_table_name, const char* ref_column_name) {
     if (!table || !column_name || !ref_table_name || !ref_column_name) {
         return -1;
@@ -901,9 +1243,11 @@ API int add_foreign_key(Table* table, const char* column_name,
         return -1;
     }
 
+    memset(new_fk, 0, sizeof(ForeignKey));
     strncpy(new_fk->referenced_table, ref_table_name, sizeof(new_fk->referenced_table) - 1);
     strncpy(new_fk->referenced_column, ref_column_name, sizeof(new_fk->referenced_column) - 1);
     new_fk->column_index = col_index;
+    new_fk->ref_table = NULL;  // разрешается при первой проверке
 
     // Увеличиваем массив внешних ключей
     ForeignKey** new_fks = (ForeignKey**)realloc(table->foreign_keys, 
@@ -921,11 +1265,19 @@ API int add_foreign_key(Table* table, const char* column_name,
     // Обновляем информацию о столбце
     table->columns[col_index].is_foreign_key = 1;
     table->columns[col_index].foreign_key = new_fk;
+    table_schema_changed(table);
 
     return 0;
 }
 
-API int remove_foreign_key(Table* table, const char* column_name) {
+API int add_foreign_key(Table* table, const char* column_name, const char* ref_table_name, const char* ref_column_name) {
+    lock_mutations();
+    int result = add_foreign_key_locked(table, column_name, ref_table_name, ref_column_name);
+    unlock_mutations();
+    return result;
+}
+
+static int remove_foreign_key_locked(Table* table, const char* column_name) {
     if (!table || !column_name) {
         return -1;
     }
@@ -967,10 +1319,18 @@ API int remove_foreign_key(Table* table, const char* column_name) {
         free(table->foreign_keys);
         table->foreign_keys = NULL;
     }
+    table_schema_changed(table);
 
     return 0;
 }
 
+API int remove_foreign_key(Table* table, const char* column_name) {
+    lock_mutations();
+    int result = remove_foreign_key_locked(table, column_name);
+    unlock_mutations();
+    return result;
+}
+
 API int validate_foreign_keys(Table* table) {
     if (!table) {
         return -1;
@@ -982,7 +1342,8 @@ API int validate_foreign_keys(Table* table) {
 
         // Проверяем каждое значение в столбце
         for (int j = 0; j < table->num_rows; j++) {
-            DataValue value = table->rows[j].values[col_index];
+            if (table->deleted[j]) continue;
+            DataValue value = storage_get(table, j, col_index);
             // Здесь должна быть проверка существования значения в referenced_table
             // Для этого нужен доступ к другим таблицам, что требует дополнительной инфраструктуры
         }
@@ -1,7 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
-from db_interface import DBTable, TYPE_INT, TYPE_STRING, TYPE_FLOAT, load_table_from_json, save_table_to_json
-import json
+from db_interface import (DBTable, Condition, ConditionGroup, TYPE_INT, TYPE_STRING, TYPE_FLOAT, lib,
+                          load_table_from_json, save_table_to_json, is_binary_file,
+                          save_table_to_file, load_table_from_file, SAVE_WORKERS, BINFILE_SAVE_DICT)
+from backup import BackupChain, restore_backup
+from compression import codec_of_name, decompressed, write_compressed
+from json_stream import load_json_tables, write_json_database, LAYOUT_BACKUP
 import os
 import zipfile
 import shutil
@@ -16,6 +20,11 @@ except ImportError:
 
 MIN_NUM_WIDTH = 40  # Минимальная ширина для столбца "№"
 
+# Двоичный формат (см. binfile.h) - основной, JSON остаётся для старых файлов;
+# расширение кодека (compression.py) - файл сжимается
+DB_FILETYPES = [("Database files", "*.mydb"), ("JSON files", "*.json"),
+                ("Compressed files", "*.gz *.xz *.bz2"), ("All files", "*.*")]
+
 class TableManager:
     def __init__(self):
         if _USE_THEMED:
@@ -34,6 +43,7 @@ class TableManager:
         file_menu.add_command(label="Загрузить базу данных", command=self.load_database)
         file_menu.add_separator()
         file_menu.add_command(label="Сделать резервную копию", command=self.make_backup)
+        file_menu.add_command(label="Восстановить из резервной копии", command=self.restore_from_backup)
         menubar.add_cascade(label="Файл", menu=file_menu)
         # Меню настроек
         settings_menu = tk.Menu(menubar, tearoff=0)
@@ -78,6 +88,9 @@ class TableManager:
         self.notebook.add(self.manage_tab, text="Управление таблицами")
         self.create_manage_tab(self.manage_tab)
         self.backup_interval = 5 * 60
+        # Полная копия и за ней инкрементные, только с изменёнными строками;
+        # сжимаются в фоновом потоке
+        self.backups = BackupChain(os.path.join(os.getcwd(), 'backups'), compress="zlib")
         self.backup_thread = threading.Thread(target=self._auto_backup_loop, daemon=True)
         self.backup_thread.start()
     
@@ -195,7 +208,7 @@ class TableManager:
             self.notebook.select(self.table_tabs[table_name])
             # Обновляем данные при переключении на существующую вкладку
             tab = self.table_tabs[table_name]
-            tab.rows_data = tab.dbtable.get_all_rows()
+            tab.rows_data = tab.dbtable.get_all_rows(with_ids=True)
             tab.original_rows_data = list(tab.rows_data)
             self.refresh_table_tab(tab)
         else:
@@ -205,14 +218,14 @@ class TableManager:
             self.notebook.add(new_tab, text=table_name)
             self.create_table_tab(new_tab, table)
             # Обновляем данные при создании новой вкладки
-            new_tab.rows_data = table.get_all_rows()
+            new_tab.rows_data = table.get_all_rows(with_ids=True)
             new_tab.original_rows_data = list(new_tab.rows_data)
             self.refresh_table_tab(new_tab)
             self.notebook.select(new_tab)
     
     def create_table_tab(self, parent, table):
         parent.dbtable = table
-        parent.rows_data = table.get_all_rows()
+        parent.rows_data = table.get_all_rows(with_ids=True)
         parent.original_rows_data = list(parent.rows_data)
         parent.sort_state = {}
         parent.search_active = False
@@ -279,7 +292,7 @@ class TableManager:
                             col_idx = i
                             break
                     if col_idx is not None:
-                        values = [str(ref_table.get_value(row, col_idx)) for row in range(ref_table.get_num_rows())]
+                        values = [str(ref_table.get_value(row, col_idx)) for row in ref_table.get_row_ids()]
                 ent = ttk.Combobox(input_frame, textvariable=var, values=values, width=10, state="readonly")
             else:
                 ent = tk.Entry(input_frame, textvariable=var, width=10)
@@ -346,22 +359,17 @@ class TableManager:
                     parent.tree.heading(c, text=c)
             # Определить текущее состояние сортировки
             state = parent.sort_state.get(col_name, None)
+            # Сама сортировка выполняется в apply_active_sort при обновлении вкладки
             if state is None:
-                # Сортируем текущие данные (результаты поиска или основные данные)
-                current_data = parent.search_results if parent.search_active and parent.search_results else parent.rows_data
-                current_data.sort(key=lambda row: row[col_index-1])
                 parent.sort_state[col_name] = 'asc'
                 parent.tree.heading(col_name, text=f"{col_name} ▼")
             elif state == 'asc':
-                # Сортируем текущие данные в обратном порядке
-                current_data = parent.search_results if parent.search_active and parent.search_results else parent.rows_data
-                current_data.sort(key=lambda row: row[col_index-1], reverse=True)
                 parent.sort_state[col_name] = 'desc'
                 parent.tree.heading(col_name, text=f"{col_name} ▲")
             else:
                 # Сбрасываем сортировку, возвращаясь к исходным данным
                 if parent.search_active and parent.search_results:
-                    parent.search_results = list(parent.dbtable.get_all_rows())
+                    parent.search_results = list(parent.dbtable.get_all_rows(with_ids=True))
                 else:
                     parent.rows_data = list(parent.original_rows_data)
                 parent.sort_state[col_name] = None
@@ -417,7 +425,7 @@ class TableManager:
                 messagebox.showerror("Ошибка", f"Неверное значение для столбца {col_name}")
                 return
         table.insert(values)
-        tab.rows_data = table.get_all_rows()
+        tab.rows_data = table.get_all_rows(with_ids=True)
         tab.original_rows_data = list(tab.rows_data)
         self.apply_active_sort(tab)
         self.refresh_table_tab(tab)
@@ -429,13 +437,11 @@ class TableManager:
         if not selected:
             messagebox.showwarning("Внимание", "Выберите строку для удаления.")
             return
-        index = tab.tree.index(selected[0])
-        if index < 0 or index >= len(tab.rows_data):
-            messagebox.showerror("Ошибка", f"Неверный индекс строки: {index}. Всего строк: {len(tab.rows_data)}")
-            return
+        # iid элемента дерева - идентификатор строки в таблице
+        row_id = int(selected[0])
         old_count = len(tab.rows_data)
-        table.delete(index)
-        tab.rows_data = table.get_all_rows()
+        table.delete(row_id)
+        tab.rows_data = table.get_all_rows(with_ids=True)
         tab.original_rows_data = list(tab.rows_data)
         self.apply_active_sort(tab)
         self.refresh_table_tab(tab)
@@ -451,17 +457,19 @@ class TableManager:
                     active_sort = True
                     break
 
+        # Без сортировки показываем строки в порядке хранения
+        if not (tab.search_active and tab.search_results) and not active_sort:
+            tab.rows_data = tab.dbtable.get_all_rows(with_ids=True)
+            if not hasattr(tab, 'original_rows_data') or len(tab.original_rows_data) != len(tab.rows_data):
+                tab.original_rows_data = list(tab.rows_data)
+
+        self.apply_active_sort(tab)
+
         # Определяем, какие данные показывать
         if tab.search_active and tab.search_results:
             display_data = tab.search_results
         else:
-            if not active_sort:
-                tab.rows_data = tab.dbtable.get_all_rows()
-                if not hasattr(tab, 'original_rows_data') or len(tab.original_rows_data) != len(tab.rows_data):
-                    tab.original_rows_data = list(tab.rows_data)
             display_data = tab.rows_data
-
-        self.apply_active_sort(tab)
         table_columns = ["№"] + [col_def[0] for col_def in tab.dbtable.columns_info]
         current_columns = list(tab.tree['columns'])
         if current_columns != table_columns:
@@ -472,7 +480,7 @@ class TableManager:
             tab.tree.delete(item)
 
         for idx, row in enumerate(display_data, 1):
-            tab.tree.insert("", tk.END, values=(idx,) + row)
+            tab.tree.insert("", tk.END, iid=str(row[0]), values=(idx,) + row[1:])
 
         # Динамическая ширина для столбца "№" с stretch=False
         max_num = max(1, len(display_data))
@@ -497,7 +505,7 @@ class TableManager:
                             col_idx = i
                             break
                     if col_idx is not None:
-                        values = [str(ref_table.get_value(row, col_idx)) for row in range(ref_table.get_num_rows())]
+                        values = [str(ref_table.get_value(row, col_idx)) for row in ref_table.get_row_ids()]
                 ent['values'] = values
     
     def add_column_in_table(self, table, tab):
@@ -539,7 +547,7 @@ class TableManager:
             if ret != 0:
                 messagebox.showerror("Ошибка", "Не удалось добавить столбец в таблицу.")
                 return
-            tab.rows_data = table.get_all_rows()
+            tab.rows_data = table.get_all_rows(with_ids=True)
             tab.original_rows_data = list(tab.rows_data)
             self.apply_active_sort(tab)
             self.recreate_table_tab(tab, table)
@@ -564,7 +572,7 @@ class TableManager:
                 return
             old_count = len(table.columns_info)
             table.drop_column(selected)
-            tab.rows_data = table.get_all_rows()
+            tab.rows_data = table.get_all_rows(with_ids=True)
             tab.original_rows_data = list(tab.rows_data)
             self.apply_active_sort(tab)
             self.recreate_table_tab(tab, table)
@@ -597,7 +605,7 @@ class TableManager:
         if col_index == 0:
             # Клик по столбцу '№' — ничего не делаем
             return
-        row_id = tab.tree.index(row)
+        row_id = int(row)
         x, y, width, height = tab.tree.bbox(row, col)
         edit = tk.Entry(tab.tree)
         current_value = tab.tree.item(row, "values")[col_index]
@@ -607,11 +615,11 @@ class TableManager:
         
         def on_return(event):
             new_value = edit.get()
-            old_rows = tab.dbtable.get_all_rows()
+            old_value = tab.dbtable.get_value(row_id, col_index - 1)
             table.update(row_id, col_index - 1, new_value)
-            tab.rows_data = tab.dbtable.get_all_rows()
+            tab.rows_data = tab.dbtable.get_all_rows(with_ids=True)
             self.refresh_table_tab(tab)
-            if tab.rows_data[row_id][col_index - 1] == old_rows[row_id][col_index - 1]:
+            if tab.dbtable.get_value(row_id, col_index - 1) == old_value:
                 messagebox.showerror("Ошибка", f"Не удалось обновить ячейку ({row_id}, {col_index - 1}).")
             edit.destroy()
         
@@ -648,11 +656,14 @@ class TableManager:
                     columns = ["№"] + [col_def[0] for col_def in tab.dbtable.columns_info]
                     if col_name not in columns:
                         continue
-                    col_index = columns.index(col_name)
                     reverse = (state == 'desc')
-                    # Сортируем текущие данные
-                    current_data = tab.search_results if tab.search_active and tab.search_results else tab.rows_data
-                    current_data.sort(key=lambda row: row[col_index-1], reverse=reverse)
+                    # Сортировка в C по идентификаторам строк, затем одна выгрузка строк
+                    table = tab.dbtable
+                    if tab.search_active and tab.search_results:
+                        row_ids = table.order_by((col_name, reverse), row_ids=[row[0] for row in tab.search_results])
+                        tab.search_results = table.fetch_by_ids(row_ids, with_ids=True)
+                    else:
+                        tab.rows_data = table.fetch_by_ids(table.order_by((col_name, reverse)), with_ids=True)
                     # Обновить стрелку
                     arrow = "▼" if state == 'asc' else "▲"
                     for c in columns:
@@ -670,8 +681,10 @@ class TableManager:
         index = selection[0]
         table_name = self.table_listbox.get(index)
         if messagebox.askyesno("Подтверждение", f"Удалить таблицу '{table_name}'?"):
-            # Удалить из self.tables
+            # Удалить таблицу из базы и из self.tables
             if table_name in self.tables:
+                if self.tables[table_name].drop() != 0:
+                    return
                 del self.tables[table_name]
             # Удалить вкладку, если открыта
             if table_name in self.table_tabs:
@@ -686,22 +699,22 @@ class TableManager:
         if not query:
             return
         col_name = tab.search_column.get()
-        all_rows = tab.dbtable.get_all_rows()
-        filtered = []
-        if col_name == "Вся таблица":
-            for row in all_rows:
-                if any(query.lower() in str(cell).lower() for cell in row):
-                    filtered.append(row)
-        else:
-            # Определяем индекс столбца в данных (без учёта '№')
-            col_names = [col_def[0] for col_def in tab.dbtable.columns_info]
-            try:
-                col_index = col_names.index(col_name)
-            except ValueError:
-                pass
-            for row in all_rows:
-                if query.lower() in str(row[col_index]).lower():
-                    filtered.append(row)
+        columns = tab.dbtable.columns_info
+        if col_name != "Вся таблица":
+            columns = [col_def for col_def in columns if col_def[0] == col_name]
+
+        # Строки - подстрока без учёта регистра, числа - подстрока записи
+        # значения, как в таблице ("3" находит 3.5); всё проверяется в C
+        conditions = []
+        for name, col_type in columns:
+            if col_type == TYPE_STRING:
+                conditions.append(Condition(name, "contains", query, ignore_case=True))
+            elif col_type == TYPE_INT:
+                conditions.append(Condition(name, "contains", query))
+            else:
+                conditions.append(Condition(name, "contains", query.lower()))  # запись вида 1e+20
+        row_ids = tab.dbtable.where(ConditionGroup("or", conditions)) if conditions else []
+        filtered = tab.dbtable.fetch_by_ids(row_ids, with_ids=True) if row_ids else []
         
         if not filtered:
             messagebox.showinfo("Результаты поиска", "По вашему запросу ничего не найдено")
@@ -719,14 +732,14 @@ class TableManager:
         self.refresh_table_tab(tab)
 
     def save_database(self):
-        """Сохранение всей базы данных в JSON файл"""
+        """Сохранение всей базы данных в файл (двоичный формат или JSON)"""
         if not self.tables:
             messagebox.showwarning("Внимание", "Нет таблиц для сохранения.")
             return
             
         file_path = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            defaultextension=".mydb",
+            filetypes=DB_FILETYPES,
             title="Сохранить базу данных"
         )
         
@@ -734,36 +747,36 @@ class TableManager:
             return
             
         try:
-            db_data = {}
-            for table_name, table in self.tables.items():
-                table_data = {
-                    'columns_info': table.columns_info,
-                    'rows': table.get_all_rows(),
-                    'foreign_keys': []  # Добавляем информацию о внешних ключах
-                }
-                
-                # Сохраняем информацию о внешних ключах
-                for fk in table.get_foreign_keys():
-                    table_data['foreign_keys'].append({
-                        'column': fk['column'],
-                        'referenced_table': fk['referenced_table'],
-                        'referenced_column': fk['referenced_column']
-                    })
-                
-                db_data[table_name] = table_data
-                
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(db_data, f, ensure_ascii=False, indent=2)
-                
+            self._write_database(file_path)
             messagebox.showinfo("Успех", "База данных успешно сохранена!")
             
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить базу данных: {str(e)}")
 
+    def _write_database(self, file_path):
+        """
+        Записывает все таблицы: двоичный формат, для имён *.json - JSON;
+        с расширением кодека (*.gz, *.xz, *.bz2) файл сжимается
+        """
+        codec = codec_of_name(file_path)
+        if codec:
+            write_compressed(file_path, codec,
+                             lambda path, as_json: self._write_plain(path, as_json, BINFILE_SAVE_DICT))
+        else:
+            self._write_plain(file_path, file_path.lower().endswith('.json'))
+
+    def _write_plain(self, file_path, as_json, options=0):
+        if not as_json:
+            if lib.save_database_file_ex(None, os.fsencode(file_path), SAVE_WORKERS, options) != 0:
+                raise IOError(f"Ошибка записи файла {file_path}")
+            return
+
+        write_json_database(file_path, self.tables, LAYOUT_BACKUP)
+
     def load_database(self):
-        """Загрузка базы данных из JSON файла"""
+        """Загрузка базы данных из двоичного или JSON файла"""
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=DB_FILETYPES,
             title="Загрузить базу данных"
         )
         if not file_path:
@@ -779,34 +792,44 @@ class TableManager:
             for tab in list(self.table_tabs.values()):
                 self.notebook.forget(tab)
             self.table_tabs.clear()
-            with open(file_path, 'r', encoding='utf-8') as f:
-                db_data = json.load(f)
-            # Загружаем новые данные
-            for table_name, table_data in db_data.items():
-                columns_info = table_data['columns_info']
-                rows = table_data['rows']
-                table = DBTable(table_name, columns_info)
-                if not table.table_ptr:
-                    messagebox.showerror("Ошибка", f"Не удалось создать таблицу {table_name} при загрузке базы данных.")
-                    continue
-                self.tables[table_name] = table
-                self.table_listbox.insert(tk.END, table_name)
-                for row in rows:
-                    table.insert(row)
-                if 'foreign_keys' in table_data:
-                    for fk_data in table_data['foreign_keys']:
-                        ret = table.add_foreign_key(
-                            fk_data['column'],
-                            fk_data['referenced_table'],
-                            fk_data['referenced_column']
-                        )
-                        if ret != 0:
-                            messagebox.showwarning("Предупреждение", 
-                                f"Не удалось восстановить внешний ключ для столбца {fk_data['column']} в таблице {table_name}")
+            # Копии прежней базы не продолжают цепочку
+            self.backups.reset()
+            # Сжатый файл распаковывается во временный
+            with decompressed(file_path) as plain_path:
+                if is_binary_file(plain_path):
+                    if lib.load_database_file(None, os.fsencode(plain_path)) < 0:
+                        raise IOError("файл повреждён или имеет неизвестный формат")
+                    self._wrap_loaded_tables()
+                    messagebox.showinfo("Успех", "База данных успешно загружена!")
+                    return
+                # JSON читается потоком, строки вставляются пакетами
+                title = self.root.title()
+                try:
+                    _, failed = load_json_tables(plain_path, self._create_loaded_table,
+                                                 progress=self._show_load_progress)
+                finally:
+                    self.root.title(title)
+            for table_name, fk_data in failed:
+                messagebox.showwarning("Предупреждение",
+                    f"Не удалось восстановить внешний ключ для столбца {fk_data['column']} в таблице {table_name}")
             messagebox.showinfo("Успех", "База данных успешно загружена!")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось загрузить базу данных: {str(e)}")
 
+    def _create_loaded_table(self, table_name, columns_info):
+        table = DBTable(table_name, columns_info)
+        if not table.table_ptr:
+            messagebox.showerror("Ошибка", f"Не удалось создать таблицу {table_name} при загрузке базы данных.")
+            return None
+        self.tables[table_name] = table
+        self.table_listbox.insert(tk.END, table_name)
+        return table
+
+    def _show_load_progress(self, done, total):
+        """Ход загрузки в заголовке окна"""
+        self.root.title(f"Загрузка базы данных: {done * 100 // max(total, 1)}%")
+        self.root.update_idletasks()
+
     def close_tab_by_index(self, index):
         """Закрытие вкладки по индексу"""
         # Получаем текст вкладки
@@ -988,39 +1011,45 @@ class TableManager:
         text.configure(state='disabled')  # Делаем текст только для чтения
 
     def save_table(self, table_name):
-        """Сохраняет таблицу в JSON файл"""
+        """Сохраняет таблицу в файл (двоичный формат или JSON)"""
         table = self.tables.get(table_name)
         if not table:
             messagebox.showerror("Ошибка", f"Таблица {table_name} не найдена")
             return
         
         filename = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            defaultextension=".mydb",
+            filetypes=DB_FILETYPES,
             title=f"Сохранить таблицу {table_name}"
         )
         
         if filename:
             try:
-                save_table_to_json(table, filename)
+                if filename.lower().endswith('.json'):
+                    save_table_to_json(table.table_ptr.contents, filename)
+                else:
+                    save_table_to_file(table, filename)
                 messagebox.showinfo("Успех", f"Таблица {table_name} успешно сохранена")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Ошибка при сохранении таблицы: {str(e)}")
 
     def load_table(self):
-        """Загружает таблицу из JSON файла"""
+        """Загружает таблицу из двоичного или JSON файла"""
         filename = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            filetypes=DB_FILETYPES,
             title="Загрузить таблицу"
         )
         
         if filename:
             try:
-                table = load_table_from_json(filename)
+                if is_binary_file(filename):
+                    table = load_table_from_file(filename)
+                else:
+                    table = DBTable.wrap(load_table_from_json(filename))
                 table_name = table.name.decode("utf-8")
                 
                 # Добавляем таблицу в базу данных
-                if lib.add_table_to_db(None, table) != 0:
+                if lib.add_table_to_db(None, table.table_ptr) != 0:
                     messagebox.showwarning("Предупреждение", 
                         f"Не удалось добавить таблицу {table_name} в базу данных")
                 
@@ -1033,35 +1062,17 @@ class TableManager:
                 messagebox.showerror("Ошибка", f"Ошибка при загрузке таблицы: {str(e)}")
 
     def make_backup(self, silent=False):
-        """Создать резервную копию базы данных (JSON-файл) в папке backups"""
+        """
+        Создать резервную копию базы данных в папке backups: полную или
+        инкрементную - только с таблицами и строками, изменёнными после
+        предыдущей копии (см. backup.py)
+        """
         try:
             if not self.tables:
                 if not silent:
                     messagebox.showwarning("Внимание", "Нет таблиц для резервного копирования.")
                 return
-            backup_dir = os.path.join(os.getcwd(), 'backups')
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
-            timestamp = time.strftime('%Y%m%d_%H%M%S')
-            backup_name = f'backup_{timestamp}.json'
-            backup_path = os.path.join(backup_dir, backup_name)
-            db_data = {}
-            for table_name, table in self.tables.items():
-                table_data = {
-                    'columns_info': table.columns_info,
-                    'rows': table.get_all_rows(),
-                    'foreign_keys': []
-                }
-                for fk in table.get_foreign_keys():
-                    table_data['foreign_keys'].append({
-                        'column': fk['column'],
-                        'referenced_table': fk['referenced_table'],
-                        'referenced_column': fk['referenced_column']
-                    })
-                db_data[table_name] = table_data
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(db_data, f, ensure_ascii=False, indent=2)
-            self._cleanup_old_backups(backup_dir)
+            backup_name = os.path.basename(self.backups.make())
             if not silent:
                 messagebox.showinfo("Резервное копирование", f"Резервная копия базы данных создана: {backup_name}")
         except Exception as e:
@@ -1076,15 +1087,40 @@ class TableManager:
             except Exception:
                 pass  # Не показываем messagebox из потока, чтобы не мешать GUI
 
-    def _cleanup_old_backups(self, backup_dir):
-        backups = [f for f in os.listdir(backup_dir) if f.startswith('backup_') and f.endswith('.json')]
-        backups.sort()
-        if len(backups) > 10:
-            for old in backups[:-10]:
-                try:
-                    os.remove(os.path.join(backup_dir, old))
-                except Exception:
-                    pass
+    def restore_from_backup(self):
+        """Восстановление базы из резервной копии (инкрементной - вместе со всей цепочкой)"""
+        file_path = filedialog.askopenfilename(
+            initialdir=self.backups.backup_dir,
+            filetypes=[("Backups", "backup_*_full.mydb* backup_*_incr.zip"), ("All files", "*.*")],
+            title="Восстановить из резервной копии"
+        )
+        if not file_path:
+            return
+        try:
+            # Копии, ещё сжимаемые в фоне, должны быть дописаны
+            self.backups.wait()
+        except Exception as e:
+            messagebox.showwarning("Предупреждение", f"Последняя резервная копия не записана: {str(e)}")
+        try:
+            self.tables.clear()
+            self.table_listbox.delete(0, tk.END)
+            for tab in list(self.table_tabs.values()):
+                self.notebook.forget(tab)
+            self.table_tabs.clear()
+            restore_backup(file_path)
+            self.backups.reset()
+            self._wrap_loaded_tables()
+            messagebox.showinfo("Успех", f"База данных восстановлена из {os.path.basename(file_path)}")
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось восстановить базу данных: {str(e)}")
+
+    def _wrap_loaded_tables(self):
+        """Показывает таблицы, уже загруженные в C-базу"""
+        for i in range(lib.get_num_tables(None)):
+            table = DBTable.wrap(lib.get_table_at(None, i))
+            table_name = table.name.decode('utf-8')
+            self.tables[table_name] = table
+            self.table_listbox.insert(tk.END, table_name)
 
     def run(self):
         self.root.mainloop()
@@ -1116,8 +1152,12 @@ class TableTab(tk.Frame):
         self.delete_row_gui(user_index)
     
     def delete_row_gui(self, user_index):
-        index = user_index - 1
-        ret = self.table.delete(index)
+        # Номер строки на экране переводим в идентификатор строки
+        row_ids = self.table.get_row_ids()
+        if user_index > len(row_ids):
+            messagebox.showerror("Ошибка", f"Строки {user_index} нет в таблице.")
+            return
+        ret = self.table.delete(row_ids[user_index - 1])
         if ret != 0:
             messagebox.showerror("Ошибка", "Ошибка при удалении строки.")
         else:
@@ -0,0 +1,388 @@
+#include "index.h"
+#include "snapshot.h"
+#include "storage.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+#define INDEX_INITIAL_CAPACITY 16
+
+unsigned int value_hash(int type, DataValue value) {
+    unsigned int h;
+    if (type == TYPE_STRING) {
+        // FNV-1a
+        h = 2166136261u;
+        for (const unsigned char* p = (const unsigned char*)value.s; p && *p; p++) {
+            h ^= *p;
+            h *= 16777619u;
+        }
+        return h;
+    }
+    if (type == TYPE_FLOAT) {
+        float f = value.f == 0.0f ? 0.0f : value.f;  // -0.0 и 0.0 равны
+        memcpy(&h, &f, sizeof(h));
+    } else {
+        h = (unsigned int)value.i;
+    }
+    // Перемешивание битов (финализатор murmur3)
+    h ^= h >> 16;
+    h *= 0x85ebca6bu;
+    h ^= h >> 13;
+    h *= 0xc2b2ae35u;
+    h ^= h >> 16;
+    return h;
+}
+
+int values_equal(int type, DataValue a, DataValue b) {
+    switch (type) {
+        case TYPE_INT:   return a.i == b.i;
+        case TYPE_FLOAT: return a.f == b.f;
+        default:         return a.s && b.s && strcmp(a.s, b.s) == 0;
+    }
+}
+
+static int index_alloc(HashIndex* index, int capacity) {
+    index->row_ids = (int*)malloc(capacity * sizeof(int));
+    index->hashes = (unsigned int*)malloc(capacity * sizeof(unsigned int));
+    if (!index->row_ids || !index->hashes) {
+        free(index->row_ids);
+        free(index->hashes);
+        return -1;
+    }
+    for (int i = 0; i < capacity; i++) {
+        index->row_ids[i] = INDEX_EMPTY;
+    }
+    index->capacity = capacity;
+    return 0;
+}
+
+static void index_place(HashIndex* index, int row, unsigned int hash) {
+    unsigned int mask = (unsigned int)index->capacity - 1;
+    unsigned int pos = hash & mask;
+    while (index->row_ids[pos] != INDEX_EMPTY) {
+        pos = (pos + 1) & mask;
+    }
+    index->row_ids[pos] = row;
+    index->hashes[pos] = hash;
+    index->count++;
+}
+
+static int index_grow(HashIndex* index) {
+    int* old_rows = index->row_ids;
+    unsigned int* old_hashes = index->hashes;
+    int old_capacity = index->capacity;
+
+    if (index_alloc(index, old_capacity * 2) != 0) {
+        index->row_ids = old_rows;
+        index->hashes = old_hashes;
+        return -1;
+    }
+    index->count = 0;
+    for (int i = 0; i < old_capacity; i++) {
+        if (old_rows[i] != INDEX_EMPTY) {
+            index_place(index, old_rows[i], old_hashes[i]);
+        }
+    }
+    free(old_rows);
+    free(old_hashes);
+    return 0;
+}
+
+HashIndex* index_build(Table* table, int col_index, int unique) {
+    if (storage_readable(table, col_index) != 0) {
+        return NULL;
+    }
+    HashIndex* index = (HashIndex*)calloc(1, sizeof(HashIndex));
+    if (!index) {
+        fprintf(stderr, "Ошибка выделения памяти для индекса\n");
+        return NULL;
+    }
+    index->col_index = col_index;
+    index->unique = unique;
+
+    int capacity = INDEX_INITIAL_CAPACITY;
+    while (capacity * 3 < table->num_rows * 4) {
+        capacity *= 2;
+    }
+    if (index_alloc(index, capacity) != 0) {
+        fprintf(stderr, "Ошибка выделения памяти для индекса\n");
+        free(index);
+        return NULL;
+    }
+
+    for (int i = 0; i < table->num_rows; i++) {
+        if (table->deleted[i]) continue;
+        if (unique && index_find(table, index, storage_get(table, i, col_index), -1) != -1) {
+            fprintf(stderr, "Error: duplicate value in column %s\n", table->columns[col_index].name);
+            index_free(index);
+            return NULL;
+        }
+        if (index_insert(table, index, i) != 0) {
+            index_free(index);
+            return NULL;
+        }
+    }
+    return index;
+}
+
+void index_free(HashIndex* index) {
+    if (!index) return;
+    free(index->row_ids);
+    free(index->hashes);
+    free(index);
+}
+
+// Возвращает номер строки с ключом key (кроме exclude_row) или -1
+int index_find(const Table* table, const HashIndex* index, DataValue key, int exclude_row) {
+    int type = table->columns[index->col_index].type;
+    if (type == TYPE_STRING && !key.s) return -1;
+
+    unsigned int hash = value_hash(type, key);
+    unsigned int mask = (unsigned int)index->capacity - 1;
+    for (unsigned int pos = hash & mask; index->row_ids[pos] != INDEX_EMPTY; pos = (pos + 1) & mask) {
+        int row = index->row_ids[pos];
+        if (index->hashes[pos] == hash && row != exclude_row &&
+            values_equal(type, storage_get(table, row, index->col_index), key)) {
+            return row;
+        }
+    }
+    return -1;
+}
+
+// Добавляет строку row в индекс; ключ берётся из таблицы
+int index_insert(Table* table, HashIndex* index, int row) {
+    int type = table->columns[index->col_index].type;
+    DataValue key = storage_get(table, row, index->col_index);
+    if (type == TYPE_STRING && !key.s) return 0;  // NULL не индексируется
+
+    if ((index->count + 1) * 4 > index->capacity * 3 && index_grow(index) != 0) {
+        fprintf(stderr, "Ошибка выделения памяти для индекса\n");
+        return -1;
+    }
+    index_place(index, row, value_hash(type, key));
+    return 0;
+}
+
+// Удаляет строку row из индекса; вызывается до изменения значения в таблице
+void index_remove(Table* table, HashIndex* index, int row) {
+    int type = table->columns[index->col_index].type;
+    DataValue key = storage_get(table, row, index->col_index);
+    if (type == TYPE_STRING && !key.s) return;
+
+    unsigned int mask = (unsigned int)index->capacity - 1;
+    unsigned int pos = value_hash(type, key) & mask;
+    while (index->row_ids[pos] != row) {
+        if (index->row_ids[pos] == INDEX_EMPTY) return;
+        pos = (pos + 1) & mask;
+    }
+
+    // Удаление со сдвигом назад, чтобы не оставлять "дыр" в цепочке
+    unsigned int i = pos;
+    unsigned int j = pos;
+    for (;;) {
+        j = (j + 1) & mask;
+        if (index->row_ids[j] == INDEX_EMPTY) break;
+        unsigned int home = index->hashes[j] & mask;
+        int stays = (i <= j) ? (i < home && home <= j) : (i < home || home <= j);
+        if (stays) continue;
+        index->row_ids[i] = index->row_ids[j];
+        index->hashes[i] = index->hashes[j];
+        i = j;
+    }
+    index->row_ids[i] = INDEX_EMPTY;
+    index->count--;
+}
+
+int table_index_conflict(Table* table, int col_index, DataValue key, int exclude_row) {
+    if (!table->indexes || !table->indexes[col_index] || !table->indexes[col_index]->unique) {
+        return 0;
+    }
+    return index_find(table, table->indexes[col_index], key, exclude_row) != -1;
+}
+
+void table_index_add_row(Table* table, int row) {
+    for (int j = 0; table->indexes && j < table->num_columns; j++) {
+        table_index_add_cell(table, row, j);
+    }
+}
+
+void table_index_remove_row(Table* table, int row) {
+    for (int j = 0; table->indexes && j < table->num_columns; j++) {
+        table_index_remove_cell(table, row, j);
+    }
+}
+
+void table_index_add_cell(Table* table, int row, int col_index) {
+    if (table->indexes && table->indexes[col_index]) {
+        index_insert(table, table->indexes[col_index], row);
+    }
+}
+
+void table_index_remove_cell(Table* table, int row, int col_index) {
+    if (table->indexes && table->indexes[col_index]) {
+        index_remove(table, table->indexes[col_index], row);
+    }
+}
+
+// Перестраивает все индексы таблицы после перемещения строк по слотам
+int table_index_rebuild_all(Table* table) {
+    int result = 0;
+    for (int j = 0; table->indexes && j < table->num_columns; j++) {
+        HashIndex* old = table->indexes[j];
+        if (!old) continue;
+        HashIndex* rebuilt = index_build(table, j, old->unique);
+        if (!rebuilt) {
+            result = -1;
+            continue;
+        }
+        index_free(old);
+        table->indexes[j] = rebuilt;
+    }
+    return result;
+}
+
+// Вызывается после добавления нового последнего столбца
+int table_index_add_column(Table* table) {
+    if (!table->indexes) return 0;
+    HashIndex** temp = (HashIndex**)realloc(table->indexes, table->num_columns * sizeof(HashIndex*));
+    if (!temp) return -1;
+    temp[table->num_columns - 1] = NULL;
+    table->indexes = temp;
+    return 0;
+}
+
+// Вызывается до удаления столбца из table->columns
+void table_index_drop_column(Table* table, int col_index) {
+    if (!table->indexes) return;
+    index_free(table->indexes[col_index]);
+    for (int j = col_index; j < table->num_columns - 1; j++) {
+        table->indexes[j] = table->indexes[j + 1];
+        if (table->indexes[j]) {
+            table->indexes[j]->col_index = j;
+        }
+    }
+    table->indexes[table->num_columns - 1] = NULL;
+}
+
+void table_index_free_all(Table* table) {
+    if (!table->indexes) return;
+    for (int j = 0; j < table->num_columns; j++) {
+        index_free(table->indexes[j]);
+    }
+    free(table->indexes);
+    table->indexes = NULL;
+}
+
+// Возвращает индекс по столбцу, при необходимости строя неуникальный
+HashIndex* table_ensure_index(Table* table, int col_index) {
+    if (!table->indexes) {
+        table->indexes = (HashIndex**)calloc(table->num_columns, sizeof(HashIndex*));
+        if (!table->indexes) return NULL;
+    }
+    if (!table->indexes[col_index]) {
+        table->indexes[col_index] = index_build(table, col_index, 0);
+    }
+    return table->indexes[col_index];
+}
+
+static int find_column(Table* table, const char* col_name) {
+    for (int i = 0; i < table->num_columns; i++) {
+        if (strcmp(table->columns[i].name, col_name) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+static int set_primary_key_locked(Table* table, const char* col_name) {
+    if (!table || !col_name) return -1;
+
+    int col_index = find_column(table, col_name);
+    if (col_index == -1) {
+        fprintf(stderr, "Столбец '%s' не найден\n", col_name);
+        return -1;
+    }
+    if (table->columns[col_index].is_primary_key) {
+        return 0;
+    }
+
+    if (!table->indexes) {
+        table->indexes = (HashIndex**)calloc(table->num_columns, sizeof(HashIndex*));
+        if (!table->indexes) {
+            fprintf(stderr, "Ошибка выделения памяти для индексов\n");
+            return -1;
+        }
+    }
+
+    // Строим уникальный индекс (он же заменяет неуникальный, если был); при наличии дубликатов ключ не объявляется
+    HashIndex* index = index_build(table, col_index, 1);
+    if (!index) {
+        fprintf(stderr, "Error: cannot declare primary key on column %s\n", col_name);
+        return -1;
+    }
+    index_free(table->indexes[col_index]);
+    table->indexes[col_index] = index;
+    table->columns[col_index].is_primary_key = 1;
+    table_schema_changed(table);
+    return 0;
+}
+
+API int set_primary_key(Table* table, const char* col_name) {
+    lock_mutations();
+    int result = set_primary_key_locked(table, col_name);
+    unlock_mutations();
+    return result;
+}
+
+static int drop_primary_key_locked(Table* table, const char* col_name) {
+    if (!table || !col_name) return -1;
+
+    int col_index = find_column(table, col_name);
+    if (col_index == -1 || !table->columns[col_index].is_primary_key) {
+        fprintf(stderr, "Первичный ключ для столбца '%s' не найден\n", col_name);
+        return -1;
+    }
+    if (table->indexes) {
+        index_free(table->indexes[col_index]);
+        table->indexes[col_index] = NULL;
+    }
+    table->columns[col_index].is_primary_key = 0;
+    table_schema_changed(table);
+    return 0;
+}
+
+API int drop_primary_key(Table* table, const char* col_name) {
+    lock_mutations();
+    int result = drop_primary_key_locked(table, col_name);
+    unlock_mutations();
+    return result;
+}
+
+API int get_index_kind(Table* table, int col_index) {
+    if (!table || col_index < 0 || col_index >= table->num_columns ||
+        !table->indexes || !table->indexes[col_index]) {
+        return 0;
+    }
+    return table->indexes[col_index]->unique ? 2 : 1;
+}
+
+API int index_lookup(Table* table, int col_index, DataValue key, int* out_ids, int max_ids) {
+    if (!get_index_kind(table, col_index)) return -1;
+    const HashIndex* index = table->indexes[col_index];
+    int type = table->columns[col_index].type;
+    if (type == TYPE_STRING && !key.s) return 0;
+
+    int found = 0;
+    unsigned int hash = value_hash(type, key);
+    unsigned int mask = (unsigned int)index->capacity - 1;
+    for (unsigned int pos = hash & mask; index->row_ids[pos] != INDEX_EMPTY; pos = (pos + 1) & mask) {
+        int row = index->row_ids[pos];
+        if (index->hashes[pos] == hash && values_equal(type, storage_get(table, row, col_index), key)) {
+            if (found < max_ids && out_ids) {
+                out_ids[found] = table->row_ids[row];
+            }
+            found++;
+        }
+    }
+    return found;
+}
@@ -0,0 +1,51 @@
+#ifndef INDEX_H
+#define INDEX_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+#define INDEX_EMPTY -1
+
+// Хеш-индекс по одному столбцу: открытая адресация с линейным пробированием.
+// Хранит только номера слотов строк, ключи читаются из самой таблицы.
+struct HashIndex {
+    int col_index;
+    int unique;
+    int capacity;            // всегда степень двойки
+    int count;
+    int* row_ids;            // слот строки или INDEX_EMPTY
+    unsigned int* hashes;    // кешированные хеши ключей
+};
+
+// Функции для работы с первичным ключом
+API int set_primary_key(Table* table, const char* col_name);
+API int drop_primary_key(Table* table, const char* col_name);
+// Наличие индекса по столбцу: 0 - нет, 1 - неуникальный, 2 - уникальный
+API int get_index_kind(Table* table, int col_index);
+// Поиск строк со значением key по индексу столбца; в out_ids пишется не более
+// max_ids идентификаторов, возвращается общее число совпадений или -1 без индекса
+API int index_lookup(Table* table, int col_index, DataValue key, int* out_ids, int max_ids);
+
+// Хеширование и сравнение значений (используются также вне индексов)
+unsigned int value_hash(int type, DataValue value);
+int values_equal(int type, DataValue a, DataValue b);
+
+// Внутренние функции индексов (не экспортируются)
+HashIndex* index_build(Table* table, int col_index, int unique);
+void index_free(HashIndex* index);
+int index_find(const Table* table, const HashIndex* index, DataValue key, int exclude_row);
+int index_insert(Table* table, HashIndex* index, int row);
+void index_remove(Table* table, HashIndex* index, int row);
+
+// Поддержка всех индексов таблицы в актуальном состоянии
+int table_index_conflict(Table* table, int col_index, DataValue key, int exclude_row);
+void table_index_add_row(Table* table, int row);
+void table_index_remove_row(Table* table, int row);
+void table_index_remove_cell(Table* table, int row, int col_index);
+void table_index_add_cell(Table* table, int row, int col_index);
+int table_index_rebuild_all(Table* table);
+int table_index_add_column(Table* table);
+void table_index_drop_column(Table* table, int col_index);
+void table_index_free_all(Table* table);
+HashIndex* table_ensure_index(Table* table, int col_index);
+
+#endif // INDEX_H
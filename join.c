@@ -0,0 +1,81 @@
+#include "join.h"
+#include "storage.h"
+#include "index.h"
+#include <stdlib.h>
+#include <stdio.h>
+
+static int join_append(JoinResult* r, int* capacity, int child_id, int parent_id) {
+    if (r->num_rows >= *capacity) {
+        int cap = *capacity * 2;
+        int* child_ids = (int*)realloc(r->child_ids, cap * sizeof(int));
+        if (child_ids) r->child_ids = child_ids;
+        int* parent_ids = (int*)realloc(r->parent_ids, cap * sizeof(int));
+        if (parent_ids) r->parent_ids = parent_ids;
+        if (!child_ids || !parent_ids) return -1;
+        *capacity = cap;
+    }
+    r->child_ids[r->num_rows] = child_id;
+    r->parent_ids[r->num_rows] = parent_id;
+    r->num_rows++;
+    return 0;
+}
+
+API void free_join_result(JoinResult* result) {
+    if (!result) return;
+    free(result->child_ids);
+    free(result->parent_ids);
+    free(result);
+}
+
+API JoinResult* join_tables(Table* child, int child_col, Table* parent, int parent_col,
+                            const unsigned char* child_mask) {
+    if (!child || !parent || child_col < 0 || child_col >= child->num_columns ||
+        parent_col < 0 || parent_col >= parent->num_columns) {
+        return NULL;
+    }
+    int type = child->columns[child_col].type;
+    if (parent->columns[parent_col].type != type) {
+        fprintf(stderr, "join_tables: типы столбцов %s и %s не совпадают\n",
+                child->columns[child_col].name, parent->columns[parent_col].name);
+        return NULL;
+    }
+    if (storage_readable(child, child_col) != 0 || storage_readable(parent, parent_col) != 0) {
+        return NULL;
+    }
+
+    // Сторона построения: индекс связанного столбца (он же используется проверкой внешних ключей)
+    HashIndex* index = table_ensure_index(parent, parent_col);
+    JoinResult* r = (JoinResult*)calloc(1, sizeof(JoinResult));
+    int capacity = child->num_rows > 16 ? child->num_rows : 16;
+    if (!index || !r) {
+        free(r);
+        fprintf(stderr, "Ошибка выделения памяти для соединения\n");
+        return NULL;
+    }
+    r->child_ids = (int*)malloc(capacity * sizeof(int));
+    r->parent_ids = (int*)malloc(capacity * sizeof(int));
+    if (!r->child_ids || !r->parent_ids) goto fail;
+
+    // Сторона проверки: один проход по дочерней таблице
+    unsigned int bits = (unsigned int)index->capacity - 1;
+    for (int slot = 0; slot < child->num_rows; slot++) {
+        if (child->deleted[slot] || (child_mask && !child_mask[slot])) continue;
+        DataValue key = storage_get(child, slot, child_col);
+        if (type == TYPE_STRING && !key.s) continue;  // NULL ни с чем не соединяется
+
+        unsigned int hash = value_hash(type, key);
+        for (unsigned int pos = hash & bits; index->row_ids[pos] != INDEX_EMPTY; pos = (pos + 1) & bits) {
+            int match = index->row_ids[pos];
+            if (index->hashes[pos] == hash && values_equal(type, storage_get(parent, match, parent_col), key) &&
+                join_append(r, &capacity, child->row_ids[slot], parent->row_ids[match]) != 0) {
+                goto fail;
+            }
+        }
+    }
+    return r;
+
+fail:
+    fprintf(stderr, "Ошибка выделения памяти для соединения\n");
+    free_join_result(r);
+    return NULL;
+}
@@ -0,0 +1,24 @@
+#ifndef JOIN_H
+#define JOIN_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+/*
+ * Результат соединения: num_rows пар идентификаторов строк
+ * (child_ids[i], parent_ids[i]) в порядке строк дочерней таблицы.
+ */
+typedef struct {
+    int num_rows;
+    int* child_ids;
+    int* parent_ids;
+} JoinResult;
+
+// Хеш-соединение child.child_col = parent.parent_col. Сторона построения -
+// хеш-индекс parent_col (создаётся при необходимости и остаётся у таблицы),
+// дочерняя таблица просматривается один раз. child_mask - необязательная
+// маска строк дочерней таблицы (NULL - все строки).
+API JoinResult* join_tables(Table* child, int child_col, Table* parent, int parent_col,
+                            const unsigned char* child_mask);
+API void free_join_result(JoinResult* result);
+
+#endif // JOIN_H
@@ -0,0 +1,296 @@
+"""
+Потоковые чтение и запись JSON-файлов базы.
+
+Файл читается блоками по READ_SIZE байт. Описание таблицы разбирается
+целиком, а массив "rows" - по одной строке: строки сразу уходят в
+DBTable.insert_many пакетами, поэтому в памяти одновременно находится только
+пакет, а не весь файл. Поддерживаются оба формата:
+
+    {"tables": [{"name", "columns": [{"name", "type", "is_primary_key"}],
+                 "rows", "foreign_keys"}, ...]}        - Database.save_to_file
+    {таблица: {"columns_info": [[имя, тип], ...], "rows", "foreign_keys"}}
+                                                       - резервные копии GUI
+
+Если "rows" в объекте таблицы идёт раньше описания столбцов, строки этой
+таблицы приходится прочитать целиком.
+
+Запись (write_json_database) идёт в обратном порядке: строки выгружаются из
+C пакетами по EXPORT_CHUNK_SIZE (DBTable.fetch_rows) и сразу пишутся в файл
+без отступов. Файл собирается во временном файле и заменяет прежний только
+после успешной записи.
+"""
+import codecs
+import json
+import os
+
+from db_interface import INSERT_CHUNK_SIZE
+
+READ_SIZE = 1 << 20
+# Сколько строк выгружается из C за раз при записи
+EXPORT_CHUNK_SIZE = 10000
+
+# Форматы файла: {"tables": [...]} и {таблица: {"columns_info", ...}}
+LAYOUT_TABLES = "tables"
+LAYOUT_BACKUP = "backup"
+
+_WHITESPACE = ' \t\r\n'
+_decoder = json.JSONDecoder()
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+class _JsonStream:
+    """Разбор JSON по мере чтения файла"""
+
+    def __init__(self, file, progress=None):
+        self.file = file
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self.total = os.fstat(file.fileno()).st_size
+        self.progress = progress
+
+    def _fill(self):
+        chunk = self.file.read(READ_SIZE)
+        self.bytes_read += len(chunk)
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=not chunk)
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        elif self.progress:
+            self.progress(self.bytes_read, self.total)
+        return bool(chunk)
+
+    def peek(self):
+        """Следующий значащий символ ('' в конце файла)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Ошибка JSON: ожидался '{char}', найдено '{found}' "
+                             f"(около байта {self.bytes_read})")
+        self.pos += 1
+
+    def value(self):
+        """Читает одно значение целиком"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # Число в конце буфера может продолжаться в следующем блоке
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def keys(self):
+        """Ключи объекта; значение каждого ключа читает вызывающий"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Ошибка JSON: ключ объекта должен быть строкой")
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def elements(self):
+        """Элементы массива; каждый элемент читает вызывающий"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def skip(self):
+        """Пропускает значение, не собирая вложенные массивы и объекты"""
+        char = self.peek()
+        if char == '{':
+            for _ in self.keys():
+                self.skip()
+        elif char == '[':
+            for _ in self.elements():
+                self.skip()
+        else:
+            self.value()
+
+
+class JsonTable:
+    """
+    Таблица из JSON-файла. rows - итератор строк, читаемых из файла;
+    foreign_keys известны после перехода к следующей таблице.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.columns = None
+        self.primary_key = None
+        self.rows = iter(())
+        self.foreign_keys = []
+
+
+def _rows(stream):
+    for _ in stream.elements():
+        yield stream.value()
+
+
+def _read_table(stream, name=None):
+    table = JsonTable(name)
+    started = False
+    for key in stream.keys():
+        if key == "rows":
+            if table.columns is not None and table.name is not None:
+                table.rows = _rows(stream)
+                started = True
+                yield table
+                for _ in table.rows:  # дочитываем строки, которые не понадобились
+                    pass
+            else:
+                table.rows = iter(stream.value())
+        elif key == "name":
+            table.name = stream.value()
+        elif key == "columns":
+            columns = stream.value()
+            table.columns = [(col["name"], col["type"]) for col in columns]
+            for col in columns:
+                if col.get("is_primary_key"):
+                    table.primary_key = col["name"]
+        elif key == "columns_info":
+            table.columns = [(col[0], col[1]) for col in stream.value()]
+        elif key == "foreign_keys":
+            table.foreign_keys = stream.value()
+        else:
+            stream.skip()
+    if table.columns is None:
+        raise ValueError(f"В файле нет описания столбцов таблицы {table.name}")
+    if not started:
+        yield table
+
+
+def iter_json_tables(filename, progress=None):
+    """
+    Перебирает таблицы JSON-файла базы (оба формата). Строки каждой таблицы
+    нужно прочитать до перехода к следующей - иначе они пропускаются.
+    progress(прочитано_байт, всего_байт) вызывается после каждого блока.
+    """
+    with open(filename, 'rb') as f:
+        stream = _JsonStream(f, progress)
+        for key in stream.keys():
+            char = stream.peek()
+            if key == "tables" and char == '[':
+                for _ in stream.elements():
+                    yield from _read_table(stream)
+            elif char == '{':
+                yield from _read_table(stream, key)
+            else:
+                stream.skip()
+
+
+def load_json_tables(filename, create_table, batch_size=INSERT_CHUNK_SIZE, progress=None):
+    """
+    Загружает таблицы JSON-файла: create_table(имя, столбцы) возвращает
+    новую DBTable (или None - таблица пропускается), строки вставляются
+    пакетами по batch_size. Первичные и внешние ключи восстанавливаются
+    после загрузки всех таблиц. Возвращает словарь загруженных таблиц и
+    список (таблица, внешний ключ), которые восстановить не удалось.
+    """
+    loaded = []
+    for source in iter_json_tables(filename, progress):
+        table = create_table(source.name, source.columns)
+        if table:
+            table.insert_many(source.rows, chunk_size=batch_size)
+            loaded.append((table, source))
+
+    failed = []
+    for table, source in loaded:
+        if source.primary_key:
+            table.set_primary_key(source.primary_key)
+    for table, source in loaded:
+        for fk in source.foreign_keys:
+            if table.add_foreign_key(fk["column"], fk["referenced_table"], fk["referenced_column"]) != 0:
+                failed.append((source.name, fk))
+    return {source.name: table for table, source in loaded}, failed
+
+
+def _row_chunks(table, chunk_size):
+    """Строки таблицы в виде текста "[...],[...]" по chunk_size строк"""
+    total = table.get_num_rows()
+    for start in range(0, total, chunk_size):
+        rows = table.fetch_rows(start, min(start + chunk_size, total))
+        if rows:
+            yield _encoder.encode(rows)[1:-1]
+
+
+def _table_chunks(header, table, chunk_size):
+    """Объект таблицы: заголовок, затем "rows" и "foreign_keys" """
+    yield _encoder.encode(header)[:-1] + ',"rows":['
+    separator = ''
+    for chunk in _row_chunks(table, chunk_size):
+        yield separator + chunk
+        separator = ','
+    yield '],"foreign_keys":' + _encoder.encode(table.get_foreign_keys()) + '}'
+
+
+def iter_json_database(tables, layout=LAYOUT_TABLES, chunk_size=EXPORT_CHUNK_SIZE):
+    """Текст JSON-файла базы по частям; tables - словарь имя -> DBTable"""
+    yield '{"tables":[' if layout == LAYOUT_TABLES else '{'
+    for i, (table_name, table) in enumerate(tables.items()):
+        if i:
+            yield ','
+        if layout == LAYOUT_TABLES:
+            primary_key = table.get_primary_key()
+            columns = []
+            for col_name, col_type in table.columns_info:
+                col_data = {"name": col_name, "type": col_type}
+                if col_name == primary_key:
+                    col_data["is_primary_key"] = 1
+                columns.append(col_data)
+            header = {"name": table_name, "columns": columns}
+        else:
+            yield _encoder.encode(table_name) + ':'
+            header = {"columns_info": table.columns_info}
+        yield from _table_chunks(header, table, chunk_size)
+    yield ']}' if layout == LAYOUT_TABLES else '}'
+
+
+def write_json_database(filename, tables, layout=LAYOUT_TABLES, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Записывает таблицы в JSON-файл потоком: в памяти находится только
+    текущий пакет строк. Прежний файл заменяется после успешной записи.
+    """
+    temp_path = filename + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for piece in iter_json_database(tables, layout, chunk_size):
+                f.write(piece)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, filename)
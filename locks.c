@@ -0,0 +1,478 @@
+#include "locks.h"
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#include <time.h>
+#endif
+
+#define LOCK_MODES      4
+#define INITIAL_BUCKETS 64
+// Сколько строк одной таблицы транзакция блокирует по отдельности, прежде
+// чем попытаться заменить их блокировкой всей таблицы
+#define LOCK_ESCALATE_ROWS 1000
+
+// compatible[держит][запрошен]
+static const int compatible[LOCK_MODES][LOCK_MODES] = {
+    {1, 1, 1, 0},
+    {1, 1, 0, 0},
+    {1, 0, 1, 0},
+    {0, 0, 0, 0},
+};
+
+// Наименьший режим, покрывающий оба (S и IX вместе дают X: отдельного SIX нет)
+static const int combined[LOCK_MODES][LOCK_MODES] = {
+    {LOCK_INTENT_SHARED, LOCK_INTENT_EXCLUSIVE, LOCK_SHARED, LOCK_EXCLUSIVE},
+    {LOCK_INTENT_EXCLUSIVE, LOCK_INTENT_EXCLUSIVE, LOCK_EXCLUSIVE, LOCK_EXCLUSIVE},
+    {LOCK_SHARED, LOCK_EXCLUSIVE, LOCK_SHARED, LOCK_EXCLUSIVE},
+    {LOCK_EXCLUSIVE, LOCK_EXCLUSIVE, LOCK_EXCLUSIVE, LOCK_EXCLUSIVE},
+};
+
+typedef struct LockEntry LockEntry;
+typedef struct TxnLocks TxnLocks;
+
+// Взятая блокировка: входит в список держателей объекта и в список транзакции
+typedef struct LockHolder {
+    LockEntry* entry;
+    TxnLocks* owner;
+    int mode;
+    int rows;                      // у блокировки таблицы: заблокировано строк по отдельности
+    struct LockHolder* prev_in_entry;
+    struct LockHolder* next_in_entry;
+    struct LockHolder* prev_in_txn;
+    struct LockHolder* next_in_txn;
+} LockHolder;
+
+// Блокируемый объект: таблица или строка
+struct LockEntry {
+    Table* table;
+    int row_id;
+    int granted[LOCK_MODES];       // держателей в каждом режиме
+    LockHolder* holders;
+    int waiters;
+    LockEntry* next;               // цепочка корзины
+};
+
+struct TxnLocks {
+    int txn;
+    LockHolder* held;
+    LockEntry* waiting_for;        // для поиска циклов ожидания
+    int waiting_mode;
+    unsigned visit;                // отметка обхода графа ожиданий
+    TxnLocks* next;
+};
+
+static LockEntry** entry_buckets = NULL;
+static int num_entry_buckets = 0;
+static int num_entries = 0;
+static TxnLocks** txn_buckets = NULL;
+static int num_txn_buckets = 0;
+static int num_txns = 0;
+static unsigned visit_mark = 0;
+
+/* ---------- Блокировка самого менеджера ---------- */
+
+#ifdef _WIN32
+static CRITICAL_SECTION manager_mutex;
+static CONDITION_VARIABLE lock_released = CONDITION_VARIABLE_INIT;
+static INIT_ONCE manager_once = INIT_ONCE_STATIC_INIT;
+
+static BOOL CALLBACK init_manager_mutex(PINIT_ONCE once, PVOID param, PVOID* context) {
+    InitializeCriticalSection(&manager_mutex);
+    return TRUE;
+}
+
+static void enter(void) {
+    InitOnceExecuteOnce(&manager_once, init_manager_mutex, NULL, NULL);
+    EnterCriticalSection(&manager_mutex);
+}
+
+static void leave(void) {
+    LeaveCriticalSection(&manager_mutex);
+}
+
+static long long now_ms(void) {
+    return (long long)GetTickCount64();
+}
+
+// Ждёт освобождения блокировок не дольше timeout_ms (< 0 - без ограничения)
+static void wait_released(long long timeout_ms) {
+    SleepConditionVariableCS(&lock_released, &manager_mutex, timeout_ms < 0 ? INFINITE : (DWORD)timeout_ms);
+}
+
+static void wake_waiters(void) {
+    WakeAllConditionVariable(&lock_released);
+}
+#else
+static pthread_mutex_t manager_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t lock_released = PTHREAD_COND_INITIALIZER;
+
+static void enter(void) {
+    pthread_mutex_lock(&manager_mutex);
+}
+
+static void leave(void) {
+    pthread_mutex_unlock(&manager_mutex);
+}
+
+static long long now_ms(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+static void wait_released(long long timeout_ms) {
+    if (timeout_ms < 0) {
+        pthread_cond_wait(&lock_released, &manager_mutex);
+        return;
+    }
+    // Условная переменная по умолчанию ждёт по часам реального времени
+    struct timespec deadline;
+    clock_gettime(CLOCK_REALTIME, &deadline);
+    deadline.tv_sec += (time_t)(timeout_ms / 1000);
+    deadline.tv_nsec += (long)(timeout_ms % 1000) * 1000000;
+    if (deadline.tv_nsec >= 1000000000) {
+        deadline.tv_sec++;
+        deadline.tv_nsec -= 1000000000;
+    }
+    pthread_cond_timedwait(&lock_released, &manager_mutex, &deadline);
+}
+
+static void wake_waiters(void) {
+    pthread_cond_broadcast(&lock_released);
+}
+#endif
+
+/* ---------- Хеш-таблицы объектов и транзакций ---------- */
+
+static uint32_t mix(uint64_t h) {
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    return (uint32_t)h;
+}
+
+static uint32_t entry_hash(const Table* table, int row_id) {
+    return mix((uint64_t)(uintptr_t)table * 0x9E3779B97F4A7C15ULL + (uint32_t)row_id);
+}
+
+// Вдвое больше корзин, когда записей больше, чем корзин
+static int grow_entries(void) {
+    int count = num_entry_buckets ? num_entry_buckets * 2 : INITIAL_BUCKETS;
+    LockEntry** buckets = (LockEntry**)calloc(count, sizeof(LockEntry*));
+    if (!buckets) return -1;
+    for (int b = 0; b < num_entry_buckets; b++) {
+        LockEntry* e = entry_buckets[b];
+        while (e) {
+            LockEntry* next = e->next;
+            uint32_t pos = entry_hash(e->table, e->row_id) & (uint32_t)(count - 1);
+            e->next = buckets[pos];
+            buckets[pos] = e;
+            e = next;
+        }
+    }
+    free(entry_buckets);
+    entry_buckets = buckets;
+    num_entry_buckets = count;
+    return 0;
+}
+
+static LockEntry* find_entry(Table* table, int row_id, int create) {
+    if (num_entry_buckets > 0) {
+        uint32_t pos = entry_hash(table, row_id) & (uint32_t)(num_entry_buckets - 1);
+        for (LockEntry* e = entry_buckets[pos]; e; e = e->next) {
+            if (e->table == table && e->row_id == row_id) return e;
+        }
+    }
+    if (!create) return NULL;
+    if (num_entries >= num_entry_buckets && grow_entries() != 0) return NULL;
+    LockEntry* e = (LockEntry*)calloc(1, sizeof(LockEntry));
+    if (!e) return NULL;
+    e->table = table;
+    e->row_id = row_id;
+    uint32_t pos = entry_hash(table, row_id) & (uint32_t)(num_entry_buckets - 1);
+    e->next = entry_buckets[pos];
+    entry_buckets[pos] = e;
+    num_entries++;
+    return e;
+}
+
+static void drop_entry_if_unused(LockEntry* entry) {
+    if (entry->holders || entry->waiters) return;
+    LockEntry** link = &entry_buckets[entry_hash(entry->table, entry->row_id) & (uint32_t)(num_entry_buckets - 1)];
+    while (*link != entry) link = &(*link)->next;
+    *link = entry->next;
+    free(entry);
+    num_entries--;
+}
+
+static int grow_txns(void) {
+    int count = num_txn_buckets ? num_txn_buckets * 2 : INITIAL_BUCKETS;
+    TxnLocks** buckets = (TxnLocks**)calloc(count, sizeof(TxnLocks*));
+    if (!buckets) return -1;
+    for (int b = 0; b < num_txn_buckets; b++) {
+        TxnLocks* t = txn_buckets[b];
+        while (t) {
+            TxnLocks* next = t->next;
+            uint32_t pos = mix((uint32_t)t->txn) & (uint32_t)(count - 1);
+            t->next = buckets[pos];
+            buckets[pos] = t;
+            t = next;
+        }
+    }
+    free(txn_buckets);
+    txn_buckets = buckets;
+    num_txn_buckets = count;
+    return 0;
+}
+
+static TxnLocks* find_txn(int txn, int create) {
+    if (num_txn_buckets > 0) {
+        for (TxnLocks* t = txn_buckets[mix((uint32_t)txn) & (uint32_t)(num_txn_buckets - 1)]; t; t = t->next) {
+            if (t->txn == txn) return t;
+        }
+    }
+    if (!create) return NULL;
+    if (num_txns >= num_txn_buckets && grow_txns() != 0) return NULL;
+    TxnLocks* t = (TxnLocks*)calloc(1, sizeof(TxnLocks));
+    if (!t) return NULL;
+    t->txn = txn;
+    uint32_t pos = mix((uint32_t)txn) & (uint32_t)(num_txn_buckets - 1);
+    t->next = txn_buckets[pos];
+    txn_buckets[pos] = t;
+    num_txns++;
+    return t;
+}
+
+static void drop_txn_if_unused(TxnLocks* owner) {
+    if (owner->held || owner->waiting_for) return;
+    TxnLocks** link = &txn_buckets[mix((uint32_t)owner->txn) & (uint32_t)(num_txn_buckets - 1)];
+    while (*link != owner) link = &(*link)->next;
+    *link = owner->next;
+    free(owner);
+    num_txns--;
+}
+
+/* ---------- Держатели ---------- */
+
+static LockHolder* find_holder(const LockEntry* entry, const TxnLocks* owner) {
+    for (LockHolder* h = entry->holders; h; h = h->next_in_entry) {
+        if (h->owner == owner) return h;
+    }
+    return NULL;
+}
+
+static LockHolder* add_holder(LockEntry* entry, TxnLocks* owner, int mode) {
+    LockHolder* h = (LockHolder*)calloc(1, sizeof(LockHolder));
+    if (!h) return NULL;
+    h->entry = entry;
+    h->owner = owner;
+    h->mode = mode;
+    h->next_in_entry = entry->holders;
+    if (entry->holders) entry->holders->prev_in_entry = h;
+    entry->holders = h;
+    h->next_in_txn = owner->held;
+    if (owner->held) owner->held->prev_in_txn = h;
+    owner->held = h;
+    entry->granted[mode]++;
+    return h;
+}
+
+// Снимает блокировку; объект без держателей и ожидающих удаляется
+static void release_holder(LockHolder* h) {
+    LockEntry* entry = h->entry;
+    TxnLocks* owner = h->owner;
+    entry->granted[h->mode]--;
+    if (h->prev_in_entry) h->prev_in_entry->next_in_entry = h->next_in_entry;
+    else entry->holders = h->next_in_entry;
+    if (h->next_in_entry) h->next_in_entry->prev_in_entry = h->prev_in_entry;
+    if (h->prev_in_txn) h->prev_in_txn->next_in_txn = h->next_in_txn;
+    else owner->held = h->next_in_txn;
+    if (h->next_in_txn) h->next_in_txn->prev_in_txn = h->prev_in_txn;
+    free(h);
+    drop_entry_if_unused(entry);
+}
+
+/* ---------- Захват ---------- */
+
+// Мешают ли режиму mode блокировки других транзакций (own - своя блокировка объекта)
+static int conflicts(const LockEntry* entry, const LockHolder* own, int mode) {
+    for (int m = 0; m < LOCK_MODES; m++) {
+        int others = entry->granted[m] - (own && own->mode == m ? 1 : 0);
+        if (others > 0 && !compatible[m][mode]) return 1;
+    }
+    return 0;
+}
+
+// Ведёт ли цепочка ожиданий от from к target
+static int waits_for(TxnLocks* from, const TxnLocks* target) {
+    LockEntry* entry = from->waiting_for;
+    if (!entry) return 0;
+    for (LockHolder* h = entry->holders; h; h = h->next_in_entry) {
+        TxnLocks* other = h->owner;
+        if (other == from || compatible[h->mode][from->waiting_mode]) continue;
+        if (other == target) return 1;
+        if (other->visit == visit_mark) continue;
+        other->visit = visit_mark;
+        if (waits_for(other, target)) return 1;
+    }
+    return 0;
+}
+
+static int closes_cycle(TxnLocks* owner) {
+    visit_mark++;
+    owner->visit = visit_mark;
+    return waits_for(owner, owner);
+}
+
+// Захват одного объекта; deadline < 0 - ждать без ограничения
+static int acquire(TxnLocks* owner, Table* table, int row_id, int mode, long long deadline) {
+    LockEntry* entry = find_entry(table, row_id, 1);
+    if (!entry) return LOCK_FAILED;
+    LockHolder* own = find_holder(entry, owner);
+    int wanted = own ? combined[own->mode][mode] : mode;
+    if (own && wanted == own->mode) return LOCK_OK;  // уже взята в достаточном режиме
+
+    int result = LOCK_OK;
+    if (conflicts(entry, own, wanted)) {
+        owner->waiting_for = entry;
+        owner->waiting_mode = wanted;
+        entry->waiters++;
+        while (conflicts(entry, own, wanted)) {
+            if (closes_cycle(owner)) {
+                result = LOCK_DEADLOCK;
+                break;
+            }
+            long long left = deadline < 0 ? -1 : deadline - now_ms();
+            if (deadline >= 0 && left <= 0) {
+                result = LOCK_TIMEOUT;
+                break;
+            }
+            wait_released(left);
+        }
+        entry->waiters--;
+        owner->waiting_for = NULL;
+    }
+    if (result == LOCK_OK) {
+        if (own) {
+            entry->granted[own->mode]--;
+            own->mode = wanted;
+            entry->granted[wanted]++;
+        } else if (!add_holder(entry, owner, wanted)) {
+            result = LOCK_FAILED;
+        }
+    }
+    if (result != LOCK_OK) drop_entry_if_unused(entry);
+    return result;
+}
+
+/*
+ * Транзакция заблокировала много строк таблицы: если таблицу удаётся
+ * заблокировать целиком без ожидания, блокировки строк больше не нужны.
+ */
+static void escalate(TxnLocks* owner, LockHolder* table_lock, int mode) {
+    int wanted = combined[table_lock->mode][mode];
+    if (conflicts(table_lock->entry, table_lock, wanted)) return;
+    LockEntry* entry = table_lock->entry;
+    entry->granted[table_lock->mode]--;
+    table_lock->mode = wanted;
+    entry->granted[wanted]++;
+    LockHolder* h = owner->held;
+    while (h) {
+        LockHolder* next = h->next_in_txn;
+        if (h->entry->table == entry->table && h->entry->row_id != LOCK_WHOLE_TABLE) release_holder(h);
+        h = next;
+    }
+    table_lock->rows = 0;
+    wake_waiters();
+}
+
+API int lock_acquire(int txn, Table* table, int row_id, int mode, int timeout_ms) {
+    if (!table || mode < 0 || mode >= LOCK_MODES || row_id < LOCK_WHOLE_TABLE) return LOCK_FAILED;
+    if (row_id != LOCK_WHOLE_TABLE && mode != LOCK_SHARED && mode != LOCK_EXCLUSIVE) return LOCK_FAILED;
+
+    enter();
+    long long deadline = timeout_ms < 0 ? -1 : now_ms() + timeout_ms;
+    int result = LOCK_FAILED;
+    TxnLocks* owner = find_txn(txn, 1);
+    if (owner && row_id == LOCK_WHOLE_TABLE) {
+        result = acquire(owner, table, LOCK_WHOLE_TABLE, mode, deadline);
+    } else if (owner) {
+        int intent = mode == LOCK_SHARED ? LOCK_INTENT_SHARED : LOCK_INTENT_EXCLUSIVE;
+        result = acquire(owner, table, LOCK_WHOLE_TABLE, intent, deadline);
+        LockEntry* entry = result == LOCK_OK ? find_entry(table, LOCK_WHOLE_TABLE, 0) : NULL;
+        LockHolder* table_lock = entry ? find_holder(entry, owner) : NULL;
+        // Блокировка всей таблицы уже покрывает строку
+        int covered = table_lock && (table_lock->mode == LOCK_EXCLUSIVE ||
+                                     (table_lock->mode == LOCK_SHARED && mode == LOCK_SHARED));
+        if (table_lock && !covered) {
+            LockEntry* row = find_entry(table, row_id, 0);
+            int is_new = !row || !find_holder(row, owner);
+            result = acquire(owner, table, row_id, mode, deadline);
+            if (result == LOCK_OK && is_new && ++table_lock->rows >= LOCK_ESCALATE_ROWS) {
+                escalate(owner, table_lock, mode);
+            }
+        }
+    }
+    if (owner) drop_txn_if_unused(owner);
+    leave();
+    return result;
+}
+
+API void lock_release_all(int txn) {
+    enter();
+    TxnLocks* owner = find_txn(txn, 0);
+    if (owner) {
+        while (owner->held) {
+            release_holder(owner->held);
+        }
+        drop_txn_if_unused(owner);
+        wake_waiters();
+    }
+    leave();
+}
+
+API int lock_held_mode(int txn, Table* table, int row_id) {
+    enter();
+    TxnLocks* owner = find_txn(txn, 0);
+    LockEntry* entry = owner ? find_entry(table, row_id, 0) : NULL;
+    LockHolder* h = entry ? find_holder(entry, owner) : NULL;
+    int mode = h ? h->mode : -1;
+    leave();
+    return mode;
+}
+
+API int lock_count(void) {
+    enter();
+    int count = num_entries;
+    leave();
+    return count;
+}
+
+void lock_forget_table(Table* table) {
+    enter();
+    for (int b = 0; num_entries > 0 && b < num_entry_buckets; b++) {
+        LockEntry* e = entry_buckets[b];
+        while (e) {
+            LockEntry* next = e->next;
+            if (e->table == table) {
+                // Последний снятый держатель удаляет и сам объект, если его никто не ждёт
+                int waiters = e->waiters;
+                LockHolder* h = e->holders;
+                while (h) {
+                    LockHolder* next_holder = h->next_in_entry;
+                    TxnLocks* owner = h->owner;
+                    release_holder(h);
+                    drop_txn_if_unused(owner);
+                    h = next_holder;
+                }
+                if (waiters) wake_waiters();
+            }
+            e = next;
+        }
+    }
+    leave();
+}
@@ -0,0 +1,59 @@
+#ifndef LOCKS_H
+#define LOCKS_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Менеджер блокировок транзакций.
+ *
+ * Блокировка задаётся таблицей (Table*) и идентификатором строки (или
+ * LOCK_WHOLE_TABLE - вся таблица). Записи блокировок лежат в хеш-таблице,
+ * поэтому захват и освобождение стоят O(1) независимо от числа уже
+ * взятых блокировок; повторный захват уже взятой блокировки ничего не
+ * добавляет, а более сильный режим повышает имеющуюся. Блокировка строки
+ * сначала берёт намерение (IS/IX) на всю таблицу, так что блокировка всей
+ * таблицы и блокировки её строк конфликтуют как положено:
+ *
+ *            IS  IX  S   X
+ *       IS   +   +   +   -
+ *       IX   +   +   -   -
+ *       S    +   -   +   -
+ *       X    -   -   -   -
+ *
+ * Блокировки держатся до lock_release_all (фиксация или откат). Конфликтующий
+ * запрос ждёт до timeout_ms; если ожидание замкнуло бы цикл в графе
+ * ожиданий, запрос сразу получает LOCK_DEADLOCK - откатываться должна
+ * запросившая транзакция. У менеджера своя блокировка, отдельная от
+ * lock_mutations: функции func.c вызывают его под lock_mutations только без
+ * ожидания (timeout_ms = 0).
+ */
+
+// Режимы
+#define LOCK_INTENT_SHARED    0  // IS
+#define LOCK_INTENT_EXCLUSIVE 1  // IX
+#define LOCK_SHARED           2  // S
+#define LOCK_EXCLUSIVE        3  // X
+
+// row_id блокировки всей таблицы
+#define LOCK_WHOLE_TABLE -1
+
+// Результаты lock_acquire
+#define LOCK_OK        0
+#define LOCK_TIMEOUT   1   // не дождались за timeout_ms (0 - без ожидания)
+#define LOCK_DEADLOCK  2   // ожидание замкнуло бы цикл
+#define LOCK_FAILED   -1   // неверные параметры или нет памяти
+
+// Захватывает блокировку для транзакции txn; timeout_ms < 0 - ждать без ограничения.
+// Строки блокируются только в режимах LOCK_SHARED и LOCK_EXCLUSIVE
+API int lock_acquire(int txn, Table* table, int row_id, int mode, int timeout_ms);
+// Освобождает все блокировки транзакции и будит ожидающих
+API void lock_release_all(int txn);
+// Режим, в котором транзакция держит блокировку, или -1
+API int lock_held_mode(int txn, Table* table, int row_id);
+// Число блокируемых объектов (таблиц и строк) с держателями или ожидающими
+API int lock_count(void);
+
+// Удаляет блокировки освобождаемой таблицы (free_table): адрес может достаться другой
+void lock_forget_table(Table* table);
+
+#endif // LOCKS_H
@@ -0,0 +1,608 @@
+#include "mmapfile.h"
+#include "snapshot.h"
+#include "binfile.h"
+#include "storage.h"
+#include "index.h"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+#define MAX_NAME_LEN 4096
+
+// Отображение файла, общее для всех его таблиц
+typedef struct MappedFile {
+    const unsigned char* base;
+    uint64_t size;
+    int refs;
+} MappedFile;
+
+static MappedFile* map_file(const char* path) {
+    MappedFile* file = (MappedFile*)calloc(1, sizeof(MappedFile));
+    if (!file) return NULL;
+#ifdef _WIN32
+    HANDLE handle = CreateFileA(path, GENERIC_READ, FILE_SHARE_READ, NULL,
+                                OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+    LARGE_INTEGER size;
+    if (handle == INVALID_HANDLE_VALUE) {
+        free(file);
+        return NULL;
+    }
+    if (!GetFileSizeEx(handle, &size) || size.QuadPart == 0) {
+        CloseHandle(handle);
+        free(file);
+        return NULL;
+    }
+    HANDLE mapping = CreateFileMappingA(handle, NULL, PAGE_READONLY, 0, 0, NULL);
+    void* base = mapping ? MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0) : NULL;
+    if (mapping) CloseHandle(mapping);
+    CloseHandle(handle);
+    if (!base) {
+        free(file);
+        return NULL;
+    }
+    file->size = (uint64_t)size.QuadPart;
+#else
+    int fd = open(path, O_RDONLY);
+    struct stat st;
+    if (fd < 0) {
+        free(file);
+        return NULL;
+    }
+    if (fstat(fd, &st) != 0 || st.st_size == 0) {
+        close(fd);
+        free(file);
+        return NULL;
+    }
+    // MAP_PRIVATE: последующая перезапись файла через rename не меняет отображение
+    void* base = mmap(NULL, (size_t)st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (base == MAP_FAILED) {
+        free(file);
+        return NULL;
+    }
+    file->size = (uint64_t)st.st_size;
+#endif
+    file->base = (const unsigned char*)base;
+    return file;
+}
+
+static void unmap_file(MappedFile* file) {
+    if (!file || --file->refs > 0) return;
+#ifdef _WIN32
+    UnmapViewOfFile((void*)file->base);
+#else
+    munmap((void*)file->base, (size_t)file->size);
+#endif
+    free(file);
+}
+
+/* ---------- Разбор заголовков с проверкой границ ---------- */
+
+typedef struct {
+    const unsigned char* base;
+    uint64_t end;
+    uint64_t pos;
+    int error;
+} Cursor;
+
+static const unsigned char* cursor_take(Cursor* c, uint64_t len) {
+    if (c->error || len > c->end - c->pos) {
+        c->error = 1;
+        return NULL;
+    }
+    const unsigned char* p = c->base + c->pos;
+    c->pos += len;
+    return p;
+}
+
+static uint32_t cursor_u32(Cursor* c) {
+    uint32_t v = 0;
+    const unsigned char* p = cursor_take(c, sizeof(v));
+    if (p) memcpy(&v, p, sizeof(v));
+    return v;
+}
+
+static uint64_t cursor_u64(Cursor* c) {
+    uint64_t v = 0;
+    const unsigned char* p = cursor_take(c, sizeof(v));
+    if (p) memcpy(&v, p, sizeof(v));
+    return v;
+}
+
+// Копирует строку "u32 длина + байты" в dst (обрезая до size - 1 символов)
+static void cursor_str(Cursor* c, char* dst, size_t size) {
+    uint32_t len = cursor_u32(c);
+    if (len > MAX_NAME_LEN) c->error = 1;
+    const unsigned char* p = cursor_take(c, len);
+    if (!p) {
+        dst[0] = '\0';
+        return;
+    }
+    size_t n = len < size - 1 ? len : size - 1;
+    memcpy(dst, p, n);
+    dst[n] = '\0';
+}
+
+static void cursor_pad(Cursor* c) {
+    cursor_take(c, ((c->pos + 7) & ~(uint64_t)7) - c->pos);
+}
+
+/* ---------- Доступ к данным отображённой таблицы ---------- */
+
+static char* copy_string(const unsigned char* bytes, uint64_t len) {
+    char* s = (char*)malloc((size_t)len + 1);
+    if (!s) return NULL;
+    memcpy(s, bytes, (size_t)len);
+    s[len] = '\0';
+    return s;
+}
+
+// Отмечает повреждённый сегмент: столбец больше не подкачивается
+static void mark_corrupt(Table* table, int col) {
+    fprintf(stderr, "Повреждён строковый столбец %s.%s\n", table->name, table->columns[col].name);
+    table->mapped->corrupt[col] = 1;
+}
+
+// Строки словарного сегмента: границы словаря проверены при открытии
+static int page_in_dict(Table* table, int col, char** values) {
+    const unsigned char* segment = table->mapped->strings[col];
+    int n = table->num_rows;
+    uint32_t count;
+    memcpy(&count, segment, 4);
+    const unsigned char* codes = segment + 8;
+    const unsigned char* offsets = codes + (((uint64_t)n * 4 + 7) & ~(uint64_t)7);
+    const unsigned char* bytes = offsets + ((uint64_t)count + 1) * 8;
+    uint64_t blob_size;
+    memcpy(&blob_size, offsets + (uint64_t)count * 8, 8);
+
+    for (int i = 0; i < n; i++) {
+        int32_t code;
+        memcpy(&code, codes + (uint64_t)i * 4, 4);
+        if (code == -1) continue;
+        uint64_t start = 0, end = 0;
+        if (code >= 0 && (uint32_t)code < count) {
+            memcpy(&start, offsets + (uint64_t)code * 8, 8);
+            memcpy(&end, offsets + ((uint64_t)code + 1) * 8, 8);
+        }
+        if (code < 0 || (uint32_t)code >= count || end < start || end > blob_size) {
+            mark_corrupt(table, col);
+            return -1;
+        }
+        values[i] = copy_string(bytes + start, end - start);
+        if (!values[i]) return -1;
+    }
+    return 0;
+}
+
+/*
+ * Копирует строки столбца из файла в char**. Смещения проверяются здесь, а не
+ * при открытии; NULL - сегмент повреждён (значения столбца не выдаются) или
+ * не хватило памяти.
+ */
+static char** page_in_strings(Table* table, int col) {
+    MappedTable* m = table->mapped;
+    int n = table->num_rows;
+    if (m->corrupt[col]) return NULL;
+    char** values = (char**)calloc(n > 0 ? n : 1, sizeof(char*));
+    if (!values) return NULL;
+
+    if (m->dict[col]) {
+        if (page_in_dict(table, col, values) != 0) {
+            for (int k = 0; k < n; k++) free(values[k]);
+            free(values);
+            return NULL;
+        }
+    } else {
+        const unsigned char* nulls = m->strings[col];
+        uint64_t offsets_pos = ((uint64_t)n + 7) & ~(uint64_t)7;
+        const unsigned char* offsets = nulls + offsets_pos;
+        const unsigned char* bytes = offsets + ((uint64_t)n + 1) * 8;
+        uint64_t blob_size;
+        memcpy(&blob_size, offsets + (uint64_t)n * 8, 8);  // граница проверена при открытии
+
+        uint64_t prev = 0;
+        for (int i = 0; i < n; i++) {
+            uint64_t next;
+            memcpy(&next, offsets + ((uint64_t)i + 1) * 8, 8);
+            if (next < prev || next > blob_size || (nulls[i] && next != prev)) {
+                mark_corrupt(table, col);
+            } else if (!nulls[i]) {
+                values[i] = copy_string(bytes + prev, next - prev);
+            }
+            if (m->corrupt[col] || (!nulls[i] && !values[i])) {
+                for (int k = 0; k < i; k++) free(values[k]);
+                free(values);
+                return NULL;
+            }
+            prev = next;
+        }
+    }
+    m->data[col] = values;
+    if (table->storage == STORAGE_COLUMNAR) {
+        table->column_data[col] = values;
+    }
+    return values;
+}
+
+int mapped_page_in(Table* table, int col) {
+    if (table->columns[col].type != TYPE_STRING || table->mapped->data[col]) return 0;
+    return page_in_strings(table, col) ? 0 : -1;
+}
+
+DataValue mapped_get(const Table* table, int row, int col) {
+    MappedTable* m = table->mapped;
+    DataValue value = {0};
+    switch (table->columns[col].type) {
+        case TYPE_INT:
+            value.i = ((const int*)m->data[col])[row];
+            break;
+        case TYPE_FLOAT:
+            value.f = ((const float*)m->data[col])[row];
+            break;
+        default: {
+            // Чтение не меняет содержимого таблицы, поэтому подкачка допустима для const
+            char** values = (char**)m->data[col];
+            if (!values) values = page_in_strings((Table*)table, col);
+            if (values) value.s = values[row];
+            break;
+        }
+    }
+    return value;
+}
+
+// Строит отображение идентификатор -> слот; идентификаторы в файле возрастают
+int mapped_build_ids(Table* table) {
+    int count = table->next_row_id;
+    int* id_slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    if (!id_slots) return -1;
+    for (int id = 0; id < count; id++) {
+        id_slots[id] = -1;
+    }
+    for (int i = 0; i < table->num_rows; i++) {
+        int id = table->row_ids[i];
+        if (id < 0 || id >= count || (i > 0 && id <= table->row_ids[i - 1])) {
+            fprintf(stderr, "Повреждены идентификаторы строк таблицы %s\n", table->name);
+            free(id_slots);
+            return -1;
+        }
+        id_slots[id] = i;
+    }
+    table->id_slots = id_slots;
+    table->id_capacity = count;
+    return 0;
+}
+
+static void free_mapped(MappedTable* m, int num_columns) {
+    for (int j = 0; m->strings && j < num_columns; j++) {
+        if (m->strings[j]) free(m->data[j]);  // строки уже переданы или освобождены
+    }
+    free(m->data);
+    free(m->strings);
+    free(m->dict);
+    free(m->corrupt);
+    unmap_file(m->file);
+    free(m);
+}
+
+/*
+ * Копирует данные в обычный формат хранения таблицы (копирование при
+ * записи): вызывается перед первым изменением. Строки, уже подкачанные
+ * в память, передаются таблице без повторного копирования.
+ */
+int mapped_materialize(Table* table) {
+    MappedTable* m = table->mapped;
+    int n = table->num_rows;
+    int capacity = n > 0 ? n : 1;
+    int ncols = table->num_columns;
+
+    if (!table->id_slots && mapped_build_ids(table) != 0) return -1;
+    for (int j = 0; j < ncols; j++) {
+        if (mapped_page_in(table, j) != 0) {
+            return -1;
+        }
+    }
+    int* ids = (int*)malloc(capacity * sizeof(int));
+    int* versions = (int*)calloc(capacity, sizeof(int));
+    if (!ids || !versions) {
+        free(ids);
+        free(versions);
+        return -1;
+    }
+
+    if (table->storage == STORAGE_ROW) {
+        Row* rows = (Row*)calloc(capacity, sizeof(Row));
+        if (!rows) {
+            free(ids);
+            free(versions);
+            return -1;
+        }
+        for (int i = 0; i < n; i++) {
+            rows[i].values = (DataValue*)malloc(ncols * sizeof(DataValue));
+            if (!rows[i].values) {
+                for (int k = 0; k < i; k++) free(rows[k].values);
+                free(rows);
+                free(ids);
+                free(versions);
+                return -1;
+            }
+        }
+        for (int i = 0; i < n; i++) {
+            for (int j = 0; j < ncols; j++) {
+                rows[i].values[j] = mapped_get(table, i, j);
+            }
+        }
+        table->rows = rows;
+    } else {
+        // column_data совпадает с m->data: числовые столбцы заменяются копиями
+        void** data = m->data;
+        void** copies = (void**)calloc(ncols, sizeof(void*));
+        if (!copies) {
+            free(ids);
+            free(versions);
+            return -1;
+        }
+        for (int j = 0; j < ncols; j++) {
+            if (table->columns[j].type == TYPE_STRING) continue;
+            copies[j] = malloc((size_t)capacity * 4);
+            if (!copies[j]) {
+                for (int k = 0; k < j; k++) free(copies[k]);
+                free(copies);
+                free(ids);
+                free(versions);
+                return -1;
+            }
+            memcpy(copies[j], data[j], (size_t)n * 4);
+        }
+        for (int j = 0; j < ncols; j++) {
+            if (copies[j]) data[j] = copies[j];
+        }
+        free(copies);
+        // Массив столбцов и строки переходят таблице
+        m->data = NULL;
+        free(m->strings);
+        m->strings = NULL;
+    }
+
+    memcpy(ids, table->row_ids, (size_t)n * sizeof(int));
+    table->row_ids = ids;
+    table->row_versions = versions;
+    table->max_rows = capacity;
+    table->mapped = NULL;
+    free_mapped(m, ncols);  // строки переданы таблице: освобождаются только массивы указателей
+    return 0;
+}
+
+// Освобождает данные отображённой таблицы (вместо обычного storage_free)
+void mapped_free(Table* table) {
+    MappedTable* m = table->mapped;
+    for (int j = 0; j < table->num_columns; j++) {
+        char** values = table->columns[j].type == TYPE_STRING ? (char**)m->data[j] : NULL;
+        for (int i = 0; values && i < table->num_rows; i++) {
+            free(values[i]);
+        }
+    }
+    free_mapped(m, table->num_columns);
+    table->mapped = NULL;
+    table->column_data = NULL;
+    table->rows = NULL;
+    table->row_ids = NULL;
+    free(table->id_slots);
+    free(table->deleted);
+    table->id_slots = NULL;
+    table->deleted = NULL;
+    table->num_rows = 0;
+    table->max_rows = 0;
+    table->num_deleted = 0;
+}
+
+/* ---------- Открытие файла ---------- */
+
+// Разбирает секцию таблицы и создаёт таблицу поверх отображения
+static Table* open_table(MappedFile* file, Cursor* c) {
+    uint64_t section = cursor_u64(c);
+    if (c->error || section > c->end - c->pos) {
+        c->error = 1;
+        return NULL;
+    }
+    Cursor s = { c->base, c->pos + section, c->pos, 0 };
+    c->pos += section;
+
+    char name[50];
+    cursor_str(&s, name, sizeof(name));
+    uint32_t storage = cursor_u32(&s);
+    uint32_t num_columns = cursor_u32(&s);
+    uint32_t n = cursor_u32(&s);
+    uint32_t next_row_id = cursor_u32(&s);
+    uint32_t num_fks = cursor_u32(&s);
+    if (s.error || num_columns == 0 || num_columns > 65535 || n > next_row_id ||
+        next_row_id > (uint32_t)INT32_MAX || num_fks > num_columns) {
+        c->error = 1;
+        return NULL;
+    }
+
+    Column* columns = (Column*)calloc(num_columns, sizeof(Column));
+    uint32_t* flags = (uint32_t*)calloc(num_columns, sizeof(uint32_t));
+    char (*fk_names)[50] = (char (*)[50])calloc((size_t)num_fks * 3 + 1, 50);
+    MappedTable* m = (MappedTable*)calloc(1, sizeof(MappedTable));
+    Table* table = NULL;
+    if (!columns || !flags || !fk_names || !m) {
+        c->error = 1;
+        goto done;
+    }
+    for (uint32_t j = 0; j < num_columns && !s.error; j++) {
+        cursor_str(&s, columns[j].name, sizeof(columns[j].name));
+        columns[j].type = (ColumnType)cursor_u32(&s);
+        flags[j] = cursor_u32(&s);
+        if (columns[j].type != TYPE_INT && columns[j].type != TYPE_FLOAT && columns[j].type != TYPE_STRING) {
+            s.error = 1;
+        }
+    }
+    for (uint32_t k = 0; k < num_fks * 3; k++) {
+        cursor_str(&s, fk_names[k], 50);
+    }
+    cursor_pad(&s);
+
+    // Находим сегменты, не читая их содержимого
+    m->data = (void**)calloc(num_columns, sizeof(void*));
+    m->strings = (const unsigned char**)calloc(num_columns, sizeof(unsigned char*));
+    m->dict = (unsigned char*)calloc(num_columns, 1);
+    m->corrupt = (unsigned char*)calloc(num_columns, 1);
+    if (!m->data || !m->strings || !m->dict || !m->corrupt) s.error = 1;
+    m->ids = (const int*)cursor_take(&s, (uint64_t)n * 4);
+    cursor_pad(&s);
+    for (uint32_t j = 0; j < num_columns && !s.error; j++) {
+        if (flags[j] & BINFILE_COL_DICT) {
+            if (columns[j].type != TYPE_STRING) s.error = 1;
+            m->dict[j] = 1;
+            m->strings[j] = cursor_take(&s, 8);
+            uint32_t count = 0;
+            if (m->strings[j]) memcpy(&count, m->strings[j], 4);
+            if (count > n) s.error = 1;
+            cursor_take(&s, (uint64_t)n * 4);
+            cursor_pad(&s);
+            const unsigned char* offsets = cursor_take(&s, ((uint64_t)count + 1) * 8);
+            uint64_t blob_size = 0;
+            if (offsets) memcpy(&blob_size, offsets + (uint64_t)count * 8, 8);
+            cursor_take(&s, blob_size);
+        } else if (columns[j].type != TYPE_STRING) {
+            m->data[j] = (void*)cursor_take(&s, (uint64_t)n * 4);
+        } else {
+            m->strings[j] = cursor_take(&s, n);
+            cursor_pad(&s);
+            const unsigned char* offsets = cursor_take(&s, ((uint64_t)n + 1) * 8);
+            uint64_t blob_size = 0;
+            if (offsets) memcpy(&blob_size, offsets + (uint64_t)n * 8, 8);
+            cursor_take(&s, blob_size);
+        }
+        cursor_pad(&s);
+    }
+    if (s.error) {
+        c->error = 1;
+        goto done;
+    }
+
+    table = create_table_ex(name, columns, (int)num_columns, (int)storage);
+    if (!table) {
+        c->error = 1;
+        goto done;
+    }
+    storage_free(table);  // пустые массивы начальной ёмкости не нужны
+    table->deleted = (unsigned char*)calloc(n > 0 ? n : 1, 1);
+    if (!table->deleted) {
+        c->error = 1;
+        free_table(table);
+        table = NULL;
+        goto done;
+    }
+    if (table->storage == STORAGE_COLUMNAR) {
+        table->column_data = m->data;
+    }
+    m->file = file;
+    file->refs++;
+    table->mapped = m;
+    table->row_ids = (int*)m->ids;
+    table->num_rows = (int)n;
+    table->max_rows = (int)n;
+    table->next_row_id = (int)next_row_id;
+    m = NULL;
+
+    // Индекс первичного ключа строится сразу: от него зависит проверка вставок
+    for (uint32_t j = 0; j < num_columns; j++) {
+        if ((flags[j] & BINFILE_COL_PRIMARY_KEY) && set_primary_key(table, columns[j].name) != 0) {
+            fprintf(stderr, "Предупреждение: первичный ключ %s.%s не восстановлен\n", name, columns[j].name);
+        }
+    }
+    for (uint32_t k = 0; k < num_fks; k++) {
+        if (add_foreign_key(table, fk_names[3 * k], fk_names[3 * k + 1], fk_names[3 * k + 2]) != 0) {
+            fprintf(stderr, "Предупреждение: внешний ключ %s.%s не восстановлен\n", name, fk_names[3 * k]);
+        }
+    }
+
+done:
+    if (m) {
+        free(m->data);
+        free(m->strings);
+        free(m->dict);
+        free(m->corrupt);
+        free(m);
+    }
+    free(columns);
+    free(flags);
+    free(fk_names);
+    return table;
+}
+
+static int open_database_file_locked(Database* db, const char* path) {
+    if (!path) return -1;
+    MappedFile* file = map_file(path);
+    if (!file) {
+        fprintf(stderr, "Не удалось отобразить файл %s\n", path);
+        return -1;
+    }
+    file->refs = 1;  // ссылка на время открытия
+
+    // Окончание (CRC-32) не относится ни к одной секции
+    Cursor c = { file->base, file->size >= 4 ? file->size - 4 : 0, 0, 0 };
+    const unsigned char* magic = cursor_take(&c, 4);
+    uint32_t version = cursor_u32(&c);
+    uint32_t order = cursor_u32(&c);
+    uint32_t count = cursor_u32(&c);
+    cursor_u32(&c);  // флаги
+    cursor_u32(&c);  // отметка журнала
+    if (c.error || memcmp(magic, BINFILE_MAGIC, 4) != 0 ||
+        version > BINFILE_VERSION || order != BINFILE_BYTE_ORDER || count > 1000000) {
+        fprintf(stderr, "Файл %s не является файлом базы данных поддерживаемой версии\n", path);
+        unmap_file(file);
+        return -1;
+    }
+
+    Table** tables = (Table**)calloc(count > 0 ? count : 1, sizeof(Table*));
+    int opened = 0;
+    if (!tables) c.error = 1;
+    for (uint32_t i = 0; i < count && !c.error; i++) {
+        tables[i] = open_table(file, &c);
+        if (!tables[i]) break;
+        opened++;
+        if (get_table_by_name(db, tables[i]->name)) {
+            fprintf(stderr, "Таблица %s уже существует\n", tables[i]->name);
+            c.error = 1;
+        }
+    }
+    if (c.error || opened != (int)count) {
+        fprintf(stderr, "Ошибка открытия файла %s\n", path);
+        for (int i = 0; i < opened; i++) {
+            free_table(tables[i]);
+        }
+        free(tables);
+        unmap_file(file);
+        return -1;
+    }
+
+    int added = 0;
+    for (int i = 0; i < opened; i++) {
+        if (add_table_to_db(db, tables[i]) == 0) {
+            added++;
+        } else {
+            free_table(tables[i]);
+        }
+    }
+    free(tables);
+    unmap_file(file);  // дальше файл удерживают только таблицы
+    return added;
+}
+
+API int open_database_file(Database* db, const char* path) {
+    lock_mutations();
+    int result = open_database_file_locked(db, path);
+    unlock_mutations();
+    return result;
+}
@@ -0,0 +1,41 @@
+#ifndef MMAPFILE_H
+#define MMAPFILE_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Открытие двоичного файла базы (binfile.h) без загрузки данных.
+ *
+ * Файл отображается в память только для чтения. Сегменты INT/FLOAT читаются
+ * прямо из отображения (у колоночной таблицы column_data указывает в файл),
+ * строки столбца копируются в память при первом обращении к столбцу,
+ * идентификаторы -> слоты строятся при первом поиске строки по идентификатору.
+ * Повреждённый строковый сегмент не подменяется NULL-значениями: чтение
+ * столбца (storage_readable) и копирование таблицы завершаются ошибкой.
+ * Первое изменение таблицы (вставка, обновление, удаление, изменение схемы)
+ * копирует её данные в обычный формат хранения, после чего отображение
+ * таблице больше не нужно. Файл освобождается вместе с последней таблицей.
+ */
+struct MappedTable {
+    struct MappedFile* file;
+    const int* ids;   // сегмент идентификаторов строк
+    void** data;      // по столбцу: INT/FLOAT - массив в файле, STRING - char** или NULL
+    const unsigned char** strings;  // по столбцу: начало сегмента STRING в файле
+    unsigned char* dict;            // по столбцу: 1 - сегмент записан словарём (BINFILE_COL_DICT)
+    unsigned char* corrupt;         // по столбцу: 1 - строковый сегмент повреждён
+};
+
+// Открывает все таблицы файла в базе (NULL - глобальная); возвращает число
+// таблиц или -1. Контрольная сумма не проверяется - это потребовало бы
+// прочитать весь файл; границы сегментов и смещения строк проверяются
+API int open_database_file(Database* db, const char* path);
+
+// Внутренние функции для storage.c
+DataValue mapped_get(const Table* table, int row, int col);
+// Подкачивает строки столбца; -1 - сегмент повреждён или не хватило памяти
+int mapped_page_in(Table* table, int col);
+int mapped_build_ids(Table* table);
+int mapped_materialize(Table* table);
+void mapped_free(Table* table);
+
+#endif // MMAPFILE_H
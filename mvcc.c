@@ -0,0 +1,714 @@
+#include "mvcc.h"
+#include "snapshot.h"
+#include "storage.h"
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+#define INITIAL_BUCKETS 64
+#define INITIAL_MARKS   8
+
+// Сохранённая копия строки. Значения и байты строковых значений лежат
+// одним блоком сразу за заголовком, поэтому копия освобождается одним free
+// и не зависит от того, как с тех пор изменились столбцы таблицы
+typedef struct RowVersion {
+    int row_id;
+    int num_columns;
+    long long superseded;             // номер фиксации, заменившей копию, или MVCC_PENDING
+    struct RowVersion* older;         // предыдущая копия той же строки
+    struct RowVersion* next_row;      // следующая строка корзины (только у новейших копий)
+    struct RowVersion* next_pending;  // следующая копия текущей транзакции
+    DataValue values[];
+} RowVersion;
+
+// До фиксации seq снимкам были видны идентификаторы меньше next_row_id
+typedef struct {
+    long long seq;
+    int next_row_id;
+} IdMark;
+
+typedef struct VersionStore {
+    Table* table;
+    RowVersion** buckets;             // новейшая копия каждой строки по row_id
+    int num_buckets;
+    int num_rows;                     // строк с копиями
+    int num_versions;
+    int visible_next_id;              // граница идентификаторов после последней фиксации
+    IdMark* marks;                    // по возрастанию seq
+    int num_marks;
+    int max_marks;
+    RowVersion* pending;              // копии текущей транзакции
+    int in_transaction;               // таблица изменена текущей транзакцией
+    struct VersionStore* next;        // цепочка корзины
+    struct VersionStore* next_pending;
+} VersionStore;
+
+struct ReadSnapshot {
+    long long seq;
+    int schema_version;               // таблицы с большей версией схемы снимку не видны
+    ReadSnapshot* prev;
+    ReadSnapshot* next;
+};
+
+static VersionStore** store_buckets = NULL;
+static int num_store_buckets = 0;
+static int num_stores = 0;
+static VersionStore* pending_stores = NULL;
+static long long commit_seq = 0;
+static int total_versions = 0;
+// Открытые снимки в порядке начала (и неубывания seq)
+static ReadSnapshot* oldest = NULL;
+static ReadSnapshot* newest = NULL;
+
+static void request_collect(void);
+static void start_collector(void);
+
+/* ---------- Хранилища версий таблиц ---------- */
+
+static unsigned table_hash(const Table* table) {
+    return (unsigned)(((uintptr_t)table >> 4) * 2654435761u);
+}
+
+static unsigned row_hash(int row_id) {
+    return (unsigned)row_id * 2654435761u;
+}
+
+static VersionStore* find_store(const Table* table) {
+    if (!store_buckets) return NULL;
+    VersionStore* store = store_buckets[table_hash(table) & (num_store_buckets - 1)];
+    while (store && store->table != table) {
+        store = store->next;
+    }
+    return store;
+}
+
+static int grow_stores(void) {
+    int capacity = num_store_buckets ? num_store_buckets * 2 : INITIAL_BUCKETS;
+    VersionStore** buckets = (VersionStore**)calloc(capacity, sizeof(VersionStore*));
+    if (!buckets) return -1;
+    for (int b = 0; b < num_store_buckets; b++) {
+        VersionStore* store = store_buckets[b];
+        while (store) {
+            VersionStore* next = store->next;
+            unsigned pos = table_hash(store->table) & (capacity - 1);
+            store->next = buckets[pos];
+            buckets[pos] = store;
+            store = next;
+        }
+    }
+    free(store_buckets);
+    store_buckets = buckets;
+    num_store_buckets = capacity;
+    return 0;
+}
+
+// Хранилище таблицы; новое получает границу visible_next_id
+static VersionStore* get_store(Table* table, int visible_next_id) {
+    VersionStore* store = find_store(table);
+    if (store) return store;
+    if (num_stores >= num_store_buckets && grow_stores() != 0) {
+        fprintf(stderr, "Ошибка выделения памяти для версий таблицы %s\n", table->name);
+        return NULL;
+    }
+    store = (VersionStore*)calloc(1, sizeof(VersionStore));
+    if (store) {
+        store->buckets = (RowVersion**)calloc(INITIAL_BUCKETS, sizeof(RowVersion*));
+    }
+    if (!store || !store->buckets) {
+        free(store);
+        fprintf(stderr, "Ошибка выделения памяти для версий таблицы %s\n", table->name);
+        return NULL;
+    }
+    store->table = table;
+    store->num_buckets = INITIAL_BUCKETS;
+    store->visible_next_id = visible_next_id;
+    unsigned pos = table_hash(table) & (num_store_buckets - 1);
+    store->next = store_buckets[pos];
+    store_buckets[pos] = store;
+    num_stores++;
+    return store;
+}
+
+static void free_store(VersionStore* store) {
+    VersionStore** link = &store_buckets[table_hash(store->table) & (num_store_buckets - 1)];
+    while (*link != store) {
+        link = &(*link)->next;
+    }
+    *link = store->next;
+    num_stores--;
+
+    if (store->in_transaction) {
+        VersionStore** pending = &pending_stores;
+        while (*pending != store) {
+            pending = &(*pending)->next_pending;
+        }
+        *pending = store->next_pending;
+    }
+    for (int b = 0; b < store->num_buckets; b++) {
+        RowVersion* head = store->buckets[b];
+        while (head) {
+            RowVersion* next_row = head->next_row;
+            while (head) {
+                RowVersion* older = head->older;
+                free(head);
+                head = older;
+            }
+            head = next_row;
+        }
+    }
+    total_versions -= store->num_versions;
+    free(store->buckets);
+    free(store->marks);
+    free(store);
+}
+
+// Хранилище больше ничего не хранит для снимков и не участвует в транзакции
+static int store_unused(const VersionStore* store) {
+    return store->num_versions == 0 && store->num_marks == 0 && !store->in_transaction;
+}
+
+// Ячейка, в которой лежит (или будет лежать) новейшая копия строки
+static RowVersion** row_link(VersionStore* store, int row_id) {
+    RowVersion** link = &store->buckets[row_hash(row_id) & (store->num_buckets - 1)];
+    while (*link && (*link)->row_id != row_id) {
+        link = &(*link)->next_row;
+    }
+    return link;
+}
+
+static int grow_rows(VersionStore* store) {
+    int capacity = store->num_buckets * 2;
+    RowVersion** buckets = (RowVersion**)calloc(capacity, sizeof(RowVersion*));
+    if (!buckets) return -1;
+    for (int b = 0; b < store->num_buckets; b++) {
+        RowVersion* head = store->buckets[b];
+        while (head) {
+            RowVersion* next = head->next_row;
+            unsigned pos = row_hash(head->row_id) & (capacity - 1);
+            head->next_row = buckets[pos];
+            buckets[pos] = head;
+            head = next;
+        }
+    }
+    free(store->buckets);
+    store->buckets = buckets;
+    store->num_buckets = capacity;
+    return 0;
+}
+
+// Место под ещё одну отметку границы: сама фиксация уже не может не удаться
+static int reserve_mark(VersionStore* store) {
+    if (store->num_marks < store->max_marks) return 0;
+    int capacity = store->max_marks ? store->max_marks * 2 : INITIAL_MARKS;
+    IdMark* marks = (IdMark*)realloc(store->marks, capacity * sizeof(IdMark));
+    if (!marks) {
+        fprintf(stderr, "Ошибка выделения памяти для версий таблицы %s\n", store->table->name);
+        return -1;
+    }
+    store->marks = marks;
+    store->max_marks = capacity;
+    return 0;
+}
+
+// Таблица участвует в транзакции; отметка её фиксации резервируется заранее
+static int join_transaction(VersionStore* store) {
+    if (store->in_transaction) return 0;
+    if (reserve_mark(store) != 0) return -1;
+    store->in_transaction = 1;
+    store->next_pending = pending_stores;
+    pending_stores = store;
+    return 0;
+}
+
+static void add_mark(VersionStore* store, long long seq) {
+    IdMark mark = { seq, store->visible_next_id };
+    store->marks[store->num_marks++] = mark;
+}
+
+// Убирает копии текущей транзакции: они всегда новейшие в своих цепочках
+static void discard_pending(VersionStore* store) {
+    RowVersion* version = store->pending;
+    while (version) {
+        RowVersion* next = version->next_pending;
+        RowVersion** link = row_link(store, version->row_id);
+        if (version->older) {
+            version->older->next_row = version->next_row;
+            *link = version->older;
+        } else {
+            *link = version->next_row;
+            store->num_rows--;
+        }
+        free(version);
+        store->num_versions--;
+        total_versions--;
+        version = next;
+    }
+    store->pending = NULL;
+}
+
+// Освобождает копии, заменённые не позже horizon, и ненужные отметки
+static int collect_store(VersionStore* store, long long horizon) {
+    int freed = 0;
+    for (int b = 0; b < store->num_buckets; b++) {
+        RowVersion** link = &store->buckets[b];
+        while (*link) {
+            RowVersion* head = *link;
+            RowVersion* kept = NULL;
+            RowVersion* version = head;
+            while (version && version->superseded > horizon) {
+                kept = version;
+                version = version->older;
+            }
+            // Копия, заменённая не позже самого старого снимка, и все более
+            // старые уже никому не видны
+            if (version) {
+                if (kept) {
+                    kept->older = NULL;
+                } else {
+                    *link = head->next_row;
+                    store->num_rows--;
+                }
+                while (version) {
+                    RowVersion* older = version->older;
+                    free(version);
+                    freed++;
+                    version = older;
+                }
+            }
+            if (kept) {
+                link = &head->next_row;
+            }
+        }
+    }
+    store->num_versions -= freed;
+    total_versions -= freed;
+
+    int drop = 0;
+    while (drop < store->num_marks && store->marks[drop].seq <= horizon) {
+        drop++;
+    }
+    memmove(store->marks, store->marks + drop, (store->num_marks - drop) * sizeof(IdMark));
+    store->num_marks -= drop;
+    return freed;
+}
+
+/* ---------- Изменения (func.c, под lock_mutations) ---------- */
+
+int mvcc_save_row(Table* table, int slot, int in_transaction) {
+    if (!in_transaction && !oldest) return 0;  // прежнюю версию некому читать
+    int row_id = table->row_ids[slot];
+    VersionStore* store = find_store(table);
+    // Строку вставила эта же транзакция: снимки её не видят
+    if (in_transaction && store && row_id >= store->visible_next_id) return 0;
+    if (!store && !(store = get_store(table, table->next_row_id))) return -1;
+    if (store->num_rows >= store->num_buckets && grow_rows(store) != 0) {
+        fprintf(stderr, "Ошибка выделения памяти для версий таблицы %s\n", table->name);
+        return -1;
+    }
+
+    RowVersion** link = row_link(store, row_id);
+    RowVersion* head = *link;
+    if (in_transaction && head && head->superseded == MVCC_PENDING) return 0;  // уже сохранена
+    if (in_transaction && join_transaction(store) != 0) return -1;
+
+    // Копия строки вместе с байтами строковых значений
+    int ncols = table->num_columns;
+    size_t bytes = 0;
+    for (int j = 0; j < ncols; j++) {
+        if (table->columns[j].type != TYPE_STRING) continue;
+        const char* s = storage_get(table, slot, j).s;
+        bytes += s ? strlen(s) + 1 : 0;
+    }
+    RowVersion* version = (RowVersion*)malloc(sizeof(RowVersion) + ncols * sizeof(DataValue) + bytes);
+    if (!version) {
+        fprintf(stderr, "Ошибка выделения памяти для версии строки таблицы %s\n", table->name);
+        return -1;
+    }
+    char* p = (char*)(version->values + ncols);
+    for (int j = 0; j < ncols; j++) {
+        DataValue value = storage_get(table, slot, j);
+        if (table->columns[j].type == TYPE_STRING && value.s) {
+            size_t len = strlen(value.s) + 1;
+            memcpy(p, value.s, len);
+            value.s = p;
+            p += len;
+        }
+        version->values[j] = value;
+    }
+    version->row_id = row_id;
+    version->num_columns = ncols;
+
+    if (head) {
+        version->next_row = head->next_row;
+        head->next_row = NULL;
+    } else {
+        version->next_row = NULL;
+        store->num_rows++;
+    }
+    version->older = head;
+    *link = version;
+    store->num_versions++;
+    total_versions++;
+
+    if (in_transaction) {
+        version->superseded = MVCC_PENDING;
+        version->next_pending = store->pending;
+        store->pending = version;
+    } else {
+        version->superseded = ++commit_seq;
+        version->next_pending = NULL;
+    }
+    return 0;
+}
+
+int mvcc_rows_inserted(Table* table, int first_id, int in_transaction) {
+    VersionStore* store = find_store(table);
+    if (in_transaction) {
+        // Граница видимых идентификаторов сдвинется при фиксации
+        if (!store && !(store = get_store(table, first_id))) return -1;
+        return join_transaction(store);
+    }
+    if (!oldest) {
+        if (store) store->visible_next_id = table->next_row_id;
+        return 0;
+    }
+    if (!store && !(store = get_store(table, first_id))) return -1;
+    if (reserve_mark(store) != 0) return -1;
+    add_mark(store, ++commit_seq);
+    store->visible_next_id = table->next_row_id;
+    return 0;
+}
+
+void mvcc_commit(void) {
+    long long seq = oldest ? ++commit_seq : 0;
+    while (pending_stores) {
+        VersionStore* store = pending_stores;
+        pending_stores = store->next_pending;
+        store->next_pending = NULL;
+        store->in_transaction = 0;
+        if (oldest) {
+            for (RowVersion* version = store->pending; version; version = version->next_pending) {
+                version->superseded = seq;
+            }
+            store->pending = NULL;
+            if (store->table->next_row_id != store->visible_next_id) {
+                add_mark(store, seq);
+            }
+        } else {
+            discard_pending(store);  // прежние версии некому читать
+        }
+        store->visible_next_id = store->table->next_row_id;
+        if (store_unused(store)) {
+            free_store(store);
+        }
+    }
+}
+
+void mvcc_rollback(void) {
+    while (pending_stores) {
+        VersionStore* store = pending_stores;
+        pending_stores = store->next_pending;
+        store->next_pending = NULL;
+        store->in_transaction = 0;
+        discard_pending(store);
+        if (store_unused(store)) {
+            free_store(store);
+        }
+    }
+}
+
+// Самая старая фиксация, копии до которой ещё могут понадобиться снимкам
+static long long collect_horizon(void) {
+    return oldest ? oldest->seq : MVCC_PENDING - 1;
+}
+
+int mvcc_holds_rows(Table* table) {
+    VersionStore* store = find_store(table);
+    if (!store) return 0;
+    // Фоновый сборщик мог ещё не дойти до таблицы
+    collect_store(store, collect_horizon());
+    int holds = store->num_versions > 0;
+    if (store_unused(store)) {
+        free_store(store);
+    }
+    return holds;
+}
+
+void mvcc_schema_changed(Table* table) {
+    VersionStore* store = find_store(table);
+    if (!store) return;
+    // Снимки, начатые до изменения, таблицу не читают; более новые не видят
+    // зафиксированных копий. Копии текущей транзакции нужны до её конца
+    collect_store(store, MVCC_PENDING - 1);
+    if (!store->in_transaction) {
+        store->visible_next_id = table->next_row_id;
+    }
+    if (store_unused(store)) {
+        free_store(store);
+    }
+}
+
+void mvcc_forget_table(Table* table) {
+    VersionStore* store = find_store(table);
+    if (store) {
+        free_store(store);
+    }
+}
+
+/* ---------- Снимки ---------- */
+
+API ReadSnapshot* mvcc_begin_read(void) {
+    ReadSnapshot* snapshot = (ReadSnapshot*)malloc(sizeof(ReadSnapshot));
+    if (!snapshot) {
+        fprintf(stderr, "Ошибка выделения памяти для снимка\n");
+        return NULL;
+    }
+    lock_mutations();
+    snapshot->seq = commit_seq;
+    snapshot->schema_version = last_table_schema_version();
+    snapshot->prev = newest;
+    snapshot->next = NULL;
+    if (newest) {
+        newest->next = snapshot;
+    } else {
+        oldest = snapshot;
+    }
+    newest = snapshot;
+    start_collector();
+    unlock_mutations();
+    return snapshot;
+}
+
+API void mvcc_end_read(ReadSnapshot* snapshot) {
+    if (!snapshot) return;
+    lock_mutations();
+    int was_oldest = snapshot == oldest;
+    if (snapshot->prev) {
+        snapshot->prev->next = snapshot->next;
+    } else {
+        oldest = snapshot->next;
+    }
+    if (snapshot->next) {
+        snapshot->next->prev = snapshot->prev;
+    } else {
+        newest = snapshot->prev;
+    }
+    unlock_mutations();
+    free(snapshot);
+    // Граница сборки сдвинулась, только если закрылся самый старый снимок
+    if (was_oldest) {
+        request_collect();
+    }
+}
+
+API long long mvcc_snapshot_seq(ReadSnapshot* snapshot) {
+    return snapshot ? snapshot->seq : -1;
+}
+
+// Граница идентификаторов строк, видимых снимку seq
+static int visible_bound(const VersionStore* store, long long seq) {
+    int lo = 0, hi = store->num_marks;
+    while (lo < hi) {
+        int mid = (lo + hi) / 2;
+        if (store->marks[mid].seq <= seq) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo < store->num_marks ? store->marks[lo].next_row_id : store->visible_next_id;
+}
+
+// Копия строки, видимая снимку seq, или NULL - видна версия в таблице
+static const RowVersion* visible_version(const RowVersion* head, long long seq) {
+    const RowVersion* newer = NULL;
+    for (const RowVersion* version = head; version; version = version->older) {
+        if (version->superseded <= seq) break;  // заменена до снимка: видна следующая за ней
+        newer = version;
+    }
+    return newer;
+}
+
+// Первый слот с идентификатором больше after_id (слоты идут по возрастанию id)
+static int first_slot_after(const Table* table, int after_id) {
+    int lo = 0, hi = table->num_rows;
+    while (lo < hi) {
+        int mid = (lo + hi) / 2;
+        if (table->row_ids[mid] <= after_id) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+
+static RowBatch* export_visible(ReadSnapshot* snapshot, Table* table, int after_id, int max_rows) {
+    if (table->schema_version > snapshot->schema_version) {
+        fprintf(stderr, "Таблица %s создана или изменена после начала снимка\n", table->name);
+        return NULL;
+    }
+    VersionStore* store = find_store(table);
+    int bound = store ? visible_bound(store, snapshot->seq) : table->next_row_id;
+
+    RowSource* rows = (RowSource*)malloc((max_rows > 0 ? max_rows : 1) * sizeof(RowSource));
+    if (!rows) return NULL;
+    int n = 0;
+    for (int slot = first_slot_after(table, after_id); slot < table->num_rows && n < max_rows; slot++) {
+        int row_id = table->row_ids[slot];
+        if (row_id >= bound) break;  // вставлена после начала снимка
+        const RowVersion* version = NULL;
+        if (store && store->num_versions > 0) {
+            version = visible_version(*row_link(store, row_id), snapshot->seq);
+        }
+        if (!version) {
+            if (table->deleted[slot]) continue;
+            rows[n].values = NULL;
+        } else if (version->num_columns != table->num_columns) {
+            // Копию сохранила транзакция, которая затем изменила столбцы
+            fprintf(stderr, "Таблица %s изменена по схеме незавершённой транзакцией\n", table->name);
+            free(rows);
+            return NULL;
+        } else {
+            rows[n].values = version->values;
+        }
+        rows[n].row_id = row_id;
+        rows[n].slot = slot;
+        n++;
+    }
+    RowBatch* batch = export_sources(table, rows, n);
+    free(rows);
+    return batch;
+}
+
+API RowBatch* mvcc_export_rows(ReadSnapshot* snapshot, Table* table, int after_id, int max_rows) {
+    if (!snapshot || !table || max_rows < 0) return NULL;
+    lock_mutations();
+    RowBatch* batch = export_visible(snapshot, table, after_id, max_rows);
+    unlock_mutations();
+    return batch;
+}
+
+/* ---------- Сборка ненужных копий ---------- */
+
+API int mvcc_collect(void) {
+    lock_mutations();
+    // Без открытых снимков не нужна ни одна зафиксированная копия
+    long long horizon = collect_horizon();
+    int freed = 0;
+    for (int b = 0; b < num_store_buckets; b++) {
+        VersionStore* store = store_buckets[b];
+        while (store) {
+            VersionStore* next = store->next;
+            freed += collect_store(store, horizon);
+            if (store_unused(store)) {
+                free_store(store);
+            }
+            store = next;
+        }
+    }
+    unlock_mutations();
+    return freed;
+}
+
+API int mvcc_version_count(void) {
+    lock_mutations();
+    int count = total_versions;
+    unlock_mutations();
+    return count;
+}
+
+/*
+ * Фоновый сборщик: поток запускается вместе с первым снимком и ждёт
+ * запроса от mvcc_end_read. Если поток создать не удалось, сборка
+ * выполняется прямо в mvcc_end_read.
+ */
+static int collector_started = 0;
+static int collect_requested = 0;
+
+#ifdef _WIN32
+static CRITICAL_SECTION collector_mutex;
+static CONDITION_VARIABLE collector_wakeup = CONDITION_VARIABLE_INIT;
+static INIT_ONCE collector_once = INIT_ONCE_STATIC_INIT;
+
+static BOOL CALLBACK init_collector_mutex(PINIT_ONCE once, PVOID param, PVOID* context) {
+    InitializeCriticalSection(&collector_mutex);
+    return TRUE;
+}
+
+static DWORD WINAPI collector_main(LPVOID arg) {
+    for (;;) {
+        EnterCriticalSection(&collector_mutex);
+        while (!collect_requested) {
+            SleepConditionVariableCS(&collector_wakeup, &collector_mutex, INFINITE);
+        }
+        collect_requested = 0;
+        LeaveCriticalSection(&collector_mutex);
+        mvcc_collect();
+    }
+    return 0;
+}
+
+static void start_collector(void) {
+    if (collector_started) return;
+    InitOnceExecuteOnce(&collector_once, init_collector_mutex, NULL, NULL);
+    HANDLE thread = CreateThread(NULL, 0, collector_main, NULL, 0, NULL);
+    if (thread) {
+        CloseHandle(thread);
+        collector_started = 1;
+    }
+}
+
+static void request_collect(void) {
+    if (!collector_started) {
+        mvcc_collect();
+        return;
+    }
+    EnterCriticalSection(&collector_mutex);
+    collect_requested = 1;
+    WakeConditionVariable(&collector_wakeup);
+    LeaveCriticalSection(&collector_mutex);
+}
+#else
+static pthread_mutex_t collector_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t collector_wakeup = PTHREAD_COND_INITIALIZER;
+
+static void* collector_main(void* arg) {
+    for (;;) {
+        pthread_mutex_lock(&collector_mutex);
+        while (!collect_requested) {
+            pthread_cond_wait(&collector_wakeup, &collector_mutex);
+        }
+        collect_requested = 0;
+        pthread_mutex_unlock(&collector_mutex);
+        mvcc_collect();
+    }
+    return NULL;
+}
+
+static void start_collector(void) {
+    if (collector_started) return;
+    pthread_t thread;
+    if (pthread_create(&thread, NULL, collector_main, NULL) == 0) {
+        pthread_detach(thread);
+        collector_started = 1;
+    }
+}
+
+static void request_collect(void) {
+    if (!collector_started) {
+        mvcc_collect();
+        return;
+    }
+    pthread_mutex_lock(&collector_mutex);
+    collect_requested = 1;
+    pthread_cond_signal(&collector_wakeup);
+    pthread_mutex_unlock(&collector_mutex);
+}
+#endif
@@ -0,0 +1,72 @@
+#ifndef MVCC_H
+#define MVCC_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+#include "export.h"   // RowBatch
+
+/*
+ * Многоверсионное чтение (MVCC): снимок видит базу такой, какой она была
+ * на момент его начала, и не ждёт ни конца чужой транзакции, ни её отката.
+ *
+ * Таблица по-прежнему хранит одну, последнюю версию каждой строки - её
+ * видит и меняет пишущая транзакция (изменения на месте, откат по журналу
+ * транзакции). Прежние версии хранятся отдельно, в хранилище версий
+ * таблицы: перед первым изменением строки в транзакции (или перед
+ * изменением вне транзакции, пока открыт хотя бы один снимок) сохраняется
+ * копия строки. Копия отмечается номером фиксации, которая её заменила:
+ * до фиксации это MVCC_PENDING, при фиксации - очередной номер, при откате
+ * копия просто удаляется. Вставленные строки отдельных копий не требуют:
+ * транзакция одна на всю базу, поэтому идентификаторы выдаются в порядке
+ * фиксаций, и снимку видны строки с идентификатором меньше границы на
+ * момент его начала (история границ хранится отметками IdMark).
+ *
+ * Снимок - номер последней фиксации на момент начала. Для строки он видит
+ * последнюю версию таблицы, если все сохранённые копии заменены не позже
+ * снимка, иначе самую новую копию, заменённую после него. Копии, которые
+ * не нужны ни одному открытому снимку, освобождает сборщик: фоновый поток
+ * запускается с первым снимком и просыпается, когда закрывается самый
+ * старый снимок. Без открытых снимков копии транзакции освобождаются
+ * сразу при фиксации.
+ *
+ * Чтение идёт пакетами под lock_mutations: пишущий поток ждёт только
+ * выгрузки пакета, читающий - только одной операции изменения. Пока у
+ * таблицы есть сохранённые копии, уплотнение (vacuum) откладывается:
+ * надгробия удалённых строк нужны снимкам. Снимок не читает таблицы,
+ * созданные или изменённые по схеме (столбцы, ключи) после его начала.
+ */
+
+#define MVCC_PENDING 0x7fffffffffffffffLL  // копия заменена незафиксированной транзакцией
+
+typedef struct ReadSnapshot ReadSnapshot;
+
+// Открывает снимок для чтения; NULL при нехватке памяти
+API ReadSnapshot* mvcc_begin_read(void);
+API void mvcc_end_read(ReadSnapshot* snapshot);
+// Номер фиксации, которую видит снимок
+API long long mvcc_snapshot_seq(ReadSnapshot* snapshot);
+/*
+ * Выгружает до max_rows строк таблицы, видимых снимку, с идентификаторами
+ * больше after_id, по возрастанию идентификатора. Меньше max_rows строк -
+ * таблица прочитана до конца. NULL - таблица изменена по схеме после
+ * начала снимка или не хватило памяти.
+ */
+API RowBatch* mvcc_export_rows(ReadSnapshot* snapshot, Table* table, int after_id, int max_rows);
+// Освобождает копии, не нужные открытым снимкам; возвращает их число
+API int mvcc_collect(void);
+// Число сохранённых копий строк во всех таблицах
+API int mvcc_version_count(void);
+
+// Вызываются из func.c под lock_mutations; откат транзакции их не вызывает.
+// in_transaction - изменение внутри транзакции, иначе оно фиксируется сразу
+int mvcc_save_row(Table* table, int slot, int in_transaction);
+int mvcc_rows_inserted(Table* table, int first_id, int in_transaction);
+void mvcc_commit(void);
+void mvcc_rollback(void);
+// Есть ли у таблицы сохранённые копии (уплотнение откладывается)
+int mvcc_holds_rows(Table* table);
+// Изменилась схема таблицы: зафиксированные копии больше никому не нужны
+void mvcc_schema_changed(Table* table);
+// Удаляет хранилище версий освобождаемой таблицы
+void mvcc_forget_table(Table* table);
+
+#endif // MVCC_H
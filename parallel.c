@@ -0,0 +1,84 @@
+#include "parallel.h"
+#include <stdlib.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+typedef struct {
+    ParallelFn fn;
+    void* arg;
+    int worker;
+} WorkerStart;
+
+#ifdef _WIN32
+static DWORD WINAPI worker_main(LPVOID param) {
+    WorkerStart* start = (WorkerStart*)param;
+    start->fn(start->arg, start->worker);
+    return 0;
+}
+#else
+static void* worker_main(void* param) {
+    WorkerStart* start = (WorkerStart*)param;
+    start->fn(start->arg, start->worker);
+    return NULL;
+}
+#endif
+
+void parallel_run(int workers, ParallelFn fn, void* arg) {
+    if (workers <= 1) {
+        fn(arg, 0);
+        return;
+    }
+    WorkerStart* starts = (WorkerStart*)malloc(workers * sizeof(WorkerStart));
+#ifdef _WIN32
+    HANDLE* threads = (HANDLE*)calloc(workers, sizeof(HANDLE));
+#else
+    pthread_t* threads = (pthread_t*)malloc(workers * sizeof(pthread_t));
+    int* started = (int*)calloc(workers, sizeof(int));
+    if (!started) {
+        free(threads);
+        threads = NULL;
+    }
+#endif
+    if (!starts || !threads) {
+        free(starts);
+        free(threads);
+        for (int k = 0; k < workers; k++) fn(arg, k);
+        return;
+    }
+
+    for (int k = 1; k < workers; k++) {
+        starts[k].fn = fn;
+        starts[k].arg = arg;
+        starts[k].worker = k;
+#ifdef _WIN32
+        threads[k] = CreateThread(NULL, 0, worker_main, &starts[k], 0, NULL);
+#else
+        started[k] = pthread_create(&threads[k], NULL, worker_main, &starts[k]) == 0;
+#endif
+    }
+    fn(arg, 0);
+    for (int k = 1; k < workers; k++) {
+#ifdef _WIN32
+        if (threads[k]) {
+            WaitForSingleObject(threads[k], INFINITE);
+            CloseHandle(threads[k]);
+        } else {
+            fn(arg, k);
+        }
+#else
+        if (started[k]) {
+            pthread_join(threads[k], NULL);
+        } else {
+            fn(arg, k);
+        }
+#endif
+    }
+#ifndef _WIN32
+    free(started);
+#endif
+    free(threads);
+    free(starts);
+}
@@ -0,0 +1,17 @@
+#ifndef PARALLEL_H
+#define PARALLEL_H
+
+/*
+ * Запуск работы в нескольких потоках (сохранение таблиц, binfile.c).
+ * Потоки не делят данные без синхронизации: каждый получает свой номер и
+ * сам выбирает по нему свою часть работы.
+ */
+
+typedef void (*ParallelFn)(void* arg, int worker);
+
+// Вызывает fn(arg, k) для k = 0 .. workers - 1 (k = 0 - в текущем потоке) и
+// ждёт завершения всех. Если поток создать не удалось, его часть выполняется
+// в текущем потоке после остальных
+void parallel_run(int workers, ParallelFn fn, void* arg);
+
+#endif // PARALLEL_H
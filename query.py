@@ -0,0 +1,649 @@
+"""
+Небольшой язык запросов поверх Database:
+
+    SELECT * | столбец, ... FROM таблица [JOIN таблица [ON a.x = b.y]]
+    [WHERE условие] [ORDER BY столбец [ASC | DESC], ...] [LIMIT n [OFFSET m]]
+
+Условие - сравнения (=, !=, <>, <, <=, >, >=), BETWEEN a AND b,
+LIKE / ILIKE с шаблонами 'abc', 'abc%' и '%abc%', объединённые AND, OR
+и скобками. Столбец можно указывать как "столбец" или "Таблица.столбец".
+
+Планировщик выбирает поиск по хеш-индексу, сканирование столбцов в C или
+полный просмотр, а для ORDER BY с LIMIT - отбор первых строк кучей вместо
+полной сортировки. Database.explain() показывает выбранный план.
+
+Вместо значений можно писать параметры ?, а также вставлять строки:
+
+    INSERT INTO таблица [(столбец, ...)] VALUES (значение | ?, ...)
+
+PreparedStatement разбирает текст один раз и хранит план, пока не
+изменилась версия схемы (столбцы, ключи) участвующих таблиц.
+"""
+import re
+import weakref
+from ctypes import c_float
+
+from db_interface import Condition, ConditionGroup, PreparedInsert, TYPE_INT, TYPE_FLOAT, TYPE_STRING, int_literal
+
+# Отбор первых строк кучей, если нужно меньше этой доли строк
+TOP_N_FRACTION = 4
+# Сколько подготовленных запросов хранит Database
+STATEMENT_CACHE_SIZE = 128
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<num>\d+\.\d*|\.\d+|\d+)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<name>[^\W\d][\w.]*)
+  | (?P<op><=|>=|<>|!=|[=<>(),*?-])
+)""", re.VERBOSE)
+
+_KEYWORDS = {"SELECT", "FROM", "JOIN", "ON", "WHERE", "AND", "OR", "BETWEEN", "LIKE", "ILIKE",
+             "ORDER", "BY", "ASC", "DESC", "LIMIT", "OFFSET", "INNER", "INSERT", "INTO", "VALUES"}
+
+
+class QueryError(Exception):
+    """Ошибка разбора или выполнения запроса"""
+
+
+def tokenize(sql):
+    """Разбивает текст запроса на лексемы (вид, значение)"""
+    tokens = []
+    pos = 0
+    sql = sql.rstrip().rstrip(';')
+    while pos < len(sql):
+        match = _TOKEN_RE.match(sql, pos)
+        if not match or match.end() == pos:
+            if sql[pos:].strip():
+                raise QueryError(f"Непонятный текст в запросе: {sql[pos:pos + 20]!r}")
+            break
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "num":
+            value = float(value) if "." in value else int(value)
+        elif kind == "str":
+            value = value[1:-1].replace("''", "'")
+        elif kind == "name" and value.upper() in _KEYWORDS:
+            kind, value = "kw", value.upper()
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class Param:
+    """Параметр ? запроса; index - номер по порядку"""
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f"?{self.index + 1}"
+
+
+class Insert:
+    """Разобранный запрос INSERT"""
+    def __init__(self):
+        self.table = None
+        self.columns = None        # None - все столбцы по порядку
+        self.values = []
+        self.num_params = 0
+
+
+class Select:
+    """Разобранный запрос SELECT"""
+    def __init__(self):
+        self.num_params = 0
+        self.columns = None        # None - все столбцы
+        self.table = None
+        self.join = None
+        self.join_on = None        # (столбец, столбец) из ON или None
+        self.where = None          # Condition / ConditionGroup
+        self.order = []            # [(столбец, по_убыванию)]
+        self.limit = None
+        self.offset = 0
+
+
+class Parser:
+    def __init__(self, sql):
+        self.tokens = tokenize(sql)
+        self.pos = 0
+        self.num_params = 0
+
+    def peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return False
+        tok_kind, tok_value = self.tokens[self.pos]
+        return (kind is None or tok_kind == kind) and (value is None or tok_value == value)
+
+    def take(self, kind=None, value=None):
+        if not self.peek(kind, value):
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else "конец запроса"
+            raise QueryError(f"Ожидалось {value or kind}, получено {found!r}")
+        self.pos += 1
+        return self.tokens[self.pos - 1][1]
+
+    def accept(self, kind=None, value=None):
+        if self.peek(kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        if self.peek("kw", "INSERT"):
+            query = self.parse_insert()
+        else:
+            query = self.parse_select()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"Лишний текст в запросе: {self.tokens[self.pos][1]!r}")
+        query.num_params = self.num_params
+        return query
+
+    def parse_insert(self):
+        query = Insert()
+        self.take("kw", "INSERT")
+        self.take("kw", "INTO")
+        query.table = self.take("name")
+        if self.accept("op", "("):
+            query.columns = [self.take("name")]
+            while self.accept("op", ","):
+                query.columns.append(self.take("name"))
+            self.take("op", ")")
+        self.take("kw", "VALUES")
+        self.take("op", "(")
+        query.values = [self.parse_value()]
+        while self.accept("op", ","):
+            query.values.append(self.parse_value())
+        self.take("op", ")")
+        return query
+
+    def parse_select(self):
+        query = Select()
+        self.take("kw", "SELECT")
+        if not self.accept("op", "*"):
+            query.columns = [self.take("name")]
+            while self.accept("op", ","):
+                query.columns.append(self.take("name"))
+        self.take("kw", "FROM")
+        query.table = self.take("name")
+        self.accept("kw", "INNER")
+        if self.accept("kw", "JOIN"):
+            query.join = self.take("name")
+            if self.accept("kw", "ON"):
+                left = self.take("name")
+                self.take("op", "=")
+                query.join_on = (left, self.take("name"))
+        if self.accept("kw", "WHERE"):
+            query.where = self.parse_or()
+        if self.accept("kw", "ORDER"):
+            self.take("kw", "BY")
+            while True:
+                column = self.take("name")
+                descending = self.accept("kw", "DESC")
+                if not descending:
+                    self.accept("kw", "ASC")
+                query.order.append((column, descending))
+                if not self.accept("op", ","):
+                    break
+        if self.accept("kw", "LIMIT"):
+            query.limit = self.take("num")
+            if self.accept("kw", "OFFSET"):
+                query.offset = self.take("num")
+        return query
+
+    def parse_or(self):
+        parts = [self.parse_and()]
+        while self.accept("kw", "OR"):
+            parts.append(self.parse_and())
+        return parts[0] if len(parts) == 1 else ConditionGroup("or", parts)
+
+    def parse_and(self):
+        parts = [self.parse_atom()]
+        while self.accept("kw", "AND"):
+            parts.append(self.parse_atom())
+        return parts[0] if len(parts) == 1 else ConditionGroup("and", parts)
+
+    def parse_atom(self):
+        if self.accept("op", "("):
+            node = self.parse_or()
+            self.take("op", ")")
+            return node
+        column = self.take("name")
+        if self.accept("kw", "BETWEEN"):
+            low = self.parse_value()
+            self.take("kw", "AND")
+            return Condition(column, "between", low, self.parse_value())
+        for keyword in ("LIKE", "ILIKE"):
+            if self.accept("kw", keyword):
+                return like_condition(column, self.take("str"), keyword == "ILIKE")
+        op = self.take("op")
+        if op not in ("=", "!=", "<>", "<", "<=", ">", ">="):
+            raise QueryError(f"Неизвестная операция {op!r}")
+        return Condition(column, "!=" if op == "<>" else op, self.parse_value())
+
+    def parse_value(self):
+        if self.peek("str"):
+            return self.take("str")
+        if self.accept("op", "?"):
+            self.num_params += 1
+            return Param(self.num_params - 1)
+        negative = self.accept("op", "-")
+        value = self.take("num")
+        return -value if negative else value
+
+
+def like_condition(column, pattern, ignore_case):
+    """Переводит шаблон LIKE в условие prefix / contains / ="""
+    body = pattern.strip("%")
+    if "%" in body or "_" in body:
+        raise QueryError(f"Шаблон {pattern!r} не поддерживается")
+    if pattern.startswith("%") and pattern.endswith("%") and len(pattern) > 1:
+        op = "contains"
+    elif pattern.endswith("%"):
+        op = "prefix"
+    elif pattern.startswith("%"):
+        raise QueryError(f"Шаблон {pattern!r} не поддерживается")
+    else:
+        op = "="
+    return Condition(column, op, body, ignore_case=ignore_case)
+
+
+def parse(sql):
+    return Parser(sql).parse()
+
+
+def _conjuncts(node):
+    """Раскладывает условие на части, объединённые через AND"""
+    if node is None:
+        return []
+    if isinstance(node, ConditionGroup) and node.mode == "and":
+        return [part for child in node.conditions for part in _conjuncts(child)]
+    return [node]
+
+
+def _and(parts):
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else ConditionGroup("and", parts)
+
+
+def _columns_of(node):
+    if isinstance(node, ConditionGroup):
+        return [col for child in node.conditions for col in _columns_of(child)]
+    return [node.column]
+
+
+def _bind(node, params):
+    """Копия условия с подставленными значениями параметров"""
+    if not params:
+        return node
+    if isinstance(node, ConditionGroup):
+        return ConditionGroup(node.mode, [_bind(c, params) for c in node.conditions])
+    value = params[node.value.index] if isinstance(node.value, Param) else node.value
+    value2 = params[node.value2.index] if isinstance(node.value2, Param) else node.value2
+    return Condition(node.column, node.op, value, value2, node.ignore_case)
+
+
+def _describe(node):
+    if isinstance(node, ConditionGroup):
+        return "(" + f" {node.mode.upper()} ".join(_describe(c) for c in node.conditions) + ")"
+    value = f"{node.value!r} AND {node.value2!r}" if node.op == "between" else repr(node.value)
+    return f"{node.column} {node.op}{' icase' if node.ignore_case else ''} {value}"
+
+
+def _coerce(value, col_type, column):
+    """
+    Приводит литерал к типу столбца так же, как это делает C. Дробный литерал
+    для целочисленного столбца остаётся дробным (см. int_literal).
+    """
+    try:
+        if col_type == TYPE_INT:
+            return int_literal(value)
+        if col_type == TYPE_FLOAT:
+            return c_float(float(value) if value is not None else 0.0).value
+    except (TypeError, ValueError):
+        raise QueryError(f"Значение {value!r} не подходит для столбца {column}") from None
+    return value if isinstance(value, str) else str(value)
+
+
+def _check_values(node, positions, types):
+    """Проверяет литералы условия до выполнения (QueryError вместо ошибки при сканировании)"""
+    if isinstance(node, ConditionGroup):
+        for child in node.conditions:
+            _check_values(child, positions, types)
+    elif node.op not in ("prefix", "contains"):
+        col_type = types[positions[node.column]]
+        _coerce(node.value, col_type, node.column)
+        if node.op == "between":
+            _coerce(node.value2, col_type, node.column)
+
+
+def _matches(node, row, positions, types):
+    """Проверка условия на строке Python (для остатка после поиска по индексу)"""
+    if isinstance(node, ConditionGroup):
+        results = (_matches(c, row, positions, types) for c in node.conditions)
+        return all(results) if node.mode == "and" else any(results)
+    j = positions[node.column]
+    value = row[j]
+    if node.op in ("prefix", "contains"):
+        text, needle = str(value), str(node.value)
+        if node.ignore_case:
+            text, needle = text.lower(), needle.lower()
+        return text.startswith(needle) if node.op == "prefix" else needle in text
+    target = _coerce(node.value, types[j], node.column)
+    if node.ignore_case and types[j] == TYPE_STRING:
+        value, target = value.lower(), target.lower()
+    if node.op == "between":
+        return target <= value <= _coerce(node.value2, types[j], node.column)
+    return {
+        "=": value == target, "==": value == target, "!=": value != target,
+        "<": value < target, "<=": value <= target, ">": value > target, ">=": value >= target,
+    }[node.op]
+
+
+def _sort_rows(rows, order, positions):
+    # Устойчивые сортировки от последнего ключа к первому
+    for column, descending in reversed(order):
+        j = positions[column]
+        rows.sort(key=lambda row: row[j], reverse=descending)
+    return rows
+
+
+class Plan:
+    """
+    План запроса: список шагов для explain() и функция выполнения.
+    База передаётся при выполнении: план хранится в кеше самой базы,
+    и ссылка на неё из плана образовала бы цикл.
+    """
+    def __init__(self, steps, run):
+        self.steps = steps
+        self.run = run
+
+    def execute(self, db, params=()):
+        return self.run(db, params)
+
+    def __str__(self):
+        return "\n".join(f"{i}. {step}" for i, step in enumerate(self.steps, 1))
+
+
+class _Scope:
+    """Разрешение имён столбцов для одной или двух таблиц"""
+    def __init__(self, tables):
+        self.tables = tables     # [(имя таблицы, DBTable)]
+        self.qualified = []      # полные имена "Таблица.столбец" по порядку
+        self.types = []
+        for name, table in tables:
+            for col_name, col_type in table.columns_info:
+                self.qualified.append(f"{name}.{col_name}")
+                self.types.append(col_type)
+
+    def resolve(self, column):
+        if "." in column:
+            if column not in self.qualified:
+                raise QueryError(f"Столбец {column} не найден")
+            return column
+        found = [q for q in self.qualified if q.split(".", 1)[1] == column]
+        if not found:
+            raise QueryError(f"Столбец {column} не найден")
+        if len(found) > 1:
+            raise QueryError(f"Столбец {column} есть в нескольких таблицах, укажите таблицу")
+        return found[0]
+
+    def qualify(self, node):
+        """Копия условия с полными именами столбцов"""
+        if isinstance(node, ConditionGroup):
+            return ConditionGroup(node.mode, [self.qualify(c) for c in node.conditions])
+        return Condition(self.resolve(node.column), node.op, node.value, node.value2, node.ignore_case)
+
+    def positions(self):
+        return {q: j for j, q in enumerate(self.qualified)}
+
+
+def _local(node):
+    """Условие с именами столбцов без префикса таблицы"""
+    if isinstance(node, ConditionGroup):
+        return ConditionGroup(node.mode, [_local(c) for c in node.conditions])
+    return Condition(node.column.split(".", 1)[1], node.op, node.value, node.value2, node.ignore_case)
+
+
+def _limit_steps(query, steps):
+    if query.limit is not None or query.offset:
+        limit = "все" if query.limit is None else query.limit
+        steps.append(f"limit {limit} offset {query.offset}")
+
+
+def plan_query(db, sql):
+    """Разбирает запрос и строит план его выполнения"""
+    query = parse(sql) if isinstance(sql, str) else sql
+    if query.table not in db.tables:
+        raise QueryError(f"Таблица {query.table} не найдена")
+    if isinstance(query, Insert):
+        return _plan_insert(db, query)
+    if query.join is not None:
+        if query.join not in db.tables:
+            raise QueryError(f"Таблица {query.join} не найдена")
+        return _plan_join(db, query)
+    return _plan_single(db, query)
+
+
+def _plan_single(db, query):
+    table = db.tables[query.table]
+    scope = _Scope([(query.table, table)])
+    positions = scope.positions()
+    conditions = [scope.qualify(c) for c in _conjuncts(query.where)]
+    order = [(scope.resolve(c), d) for c, d in query.order]
+    output = [positions[scope.resolve(c)] for c in query.columns] if query.columns else None
+    num_rows = table.get_num_rows()
+    steps = []
+
+    # Доступ к строкам: индекс по условию равенства, иначе сканирование в C
+    lookup = None
+    for cond in conditions:
+        if isinstance(cond, Condition) and cond.op in ("=", "==") and not cond.ignore_case:
+            kind = table.index_kind(cond.column.split(".", 1)[1])
+            if kind and (lookup is None or kind == "unique"):
+                lookup = (cond, kind)
+    if lookup:
+        cond, kind = lookup
+        residual = _and([c for c in conditions if c is not cond])
+        estimate = 1 if kind == "unique" else num_rows
+        steps.append(f"index lookup {query.table} ({kind}) {_describe(cond)}")
+        if residual is not None:
+            steps.append(f"filter {_describe(residual)}")
+    elif conditions:
+        residual = None
+        estimate = num_rows
+        steps.append(f"native scan {query.table} ({num_rows} rows) {_describe(_and(conditions))}")
+    else:
+        residual = None
+        estimate = num_rows
+        steps.append(f"full scan {query.table} ({num_rows} rows)")
+
+    # Выбор сортировки повторяется при выполнении по фактическому числу строк
+    wanted = None if query.limit is None else query.limit + query.offset
+    top_n = bool(order) and wanted is not None and wanted * TOP_N_FRACTION < estimate
+    if order:
+        keys = ", ".join(f"{c}{' DESC' if d else ''}" for c, d in order)
+        steps.append(f"top-{wanted} heap select by {keys}" if top_n else f"merge sort by {keys}")
+    _limit_steps(query, steps)
+
+    local_keys = [(c.split(".", 1)[1], d) for c, d in order]
+    local_conditions = [_local(c) for c in conditions]
+
+    def run(db, params):
+        for cond in conditions:
+            _check_values(_bind(cond, params), positions, scope.types)
+        if lookup:
+            cond = _bind(lookup[0], params)
+            ids = table.lookup(cond.column.split(".", 1)[1],
+                               _coerce(cond.value, scope.types[positions[cond.column]], cond.column))
+            if residual is not None:
+                bound = _bind(residual, params)
+                rows = table.fetch_by_ids(ids, with_ids=True)
+                ids = [row[0] for row in rows if _matches(bound, row[1:], positions, scope.types)]
+        elif conditions:
+            ids = table.where(*[_bind(c, params) for c in local_conditions])
+        else:
+            ids = table.get_row_ids()
+        if order:
+            use_heap = wanted is not None and wanted * TOP_N_FRACTION < len(ids)
+            ids = table.order_by(*local_keys, row_ids=ids, limit=wanted if use_heap else None)
+        stop = None if query.limit is None else query.offset + query.limit
+        ids = ids[query.offset:stop]
+        rows = table.fetch_by_ids(ids)
+        if output is None:
+            return rows
+        return [tuple(row[j] for j in output) for row in rows]
+
+    return Plan(steps, run)
+
+
+def _plan_join(db, query):
+    first, second = db.tables[query.table], db.tables[query.join]
+    scope = _Scope([(query.table, first), (query.join, second)])
+    positions = scope.positions()
+
+    # Направление связи: дочерняя таблица - та, в которой объявлен внешний ключ
+    on = None
+    if query.join_on:
+        left, right = (scope.resolve(c) for c in query.join_on)
+        on = (left, right)
+    candidates = []
+    for child, parent in ((query.table, query.join), (query.join, query.table)):
+        for fk in db.tables[child].get_foreign_keys():
+            pair = (f"{child}.{fk['column']}", f"{parent}.{fk['referenced_column']}")
+            if fk['referenced_table'] == parent and (on is None or set(on) == set(pair)):
+                candidates.append((child, parent, fk['column'], pair))
+    if not candidates:
+        raise QueryError(f"Нет внешнего ключа между {query.table} и {query.join}")
+    if len(candidates) > 1:
+        raise QueryError(f"Несколько внешних ключей между {query.table} и {query.join}, укажите ON")
+    child, parent, fk_column, pair = candidates[0]
+
+    # Условия только на дочернюю таблицу выполняются сканированием до соединения
+    conditions = [scope.qualify(c) for c in _conjuncts(query.where)]
+    pushed = [c for c in conditions if all(col.startswith(child + ".") for col in _columns_of(c))]
+    residual = _and([c for c in conditions if not any(c is p for p in pushed)])
+    order = [(scope.resolve(c), d) for c, d in query.order]
+    output = [positions[scope.resolve(c)] for c in query.columns] if query.columns else None
+
+    steps = []
+    if pushed:
+        steps.append(f"native scan {child} {_describe(_and(pushed))}")
+    else:
+        steps.append(f"full scan {child} ({db.tables[child].get_num_rows()} rows)")
+    steps.append(f"hash join {pair[0]} = {pair[1]} (build: index {pair[1]})")
+    if residual is not None:
+        steps.append(f"filter {_describe(residual)}")
+    if order:
+        steps.append("sort by " + ", ".join(f"{c}{' DESC' if d else ''}" for c, d in order))
+    _limit_steps(query, steps)
+
+    local_pushed = [_local(c) for c in pushed]
+
+    def run(db, params):
+        for cond in conditions:
+            _check_values(_bind(cond, params), positions, scope.types)
+        where = [_bind(c, params) for c in local_pushed] or None
+        rows = db.join(child, parent, columns=scope.qualified, where=where, on=fk_column)
+        if residual is not None:
+            bound = _bind(residual, params)
+            rows = [row for row in rows if _matches(bound, row, positions, scope.types)]
+        if order:
+            rows = _sort_rows(rows, order, positions)
+        stop = None if query.limit is None else query.offset + query.limit
+        rows = rows[query.offset:stop]
+        if output is None:
+            return rows
+        return [tuple(row[j] for j in output) for row in rows]
+
+    return Plan(steps, run)
+
+
+def _plan_insert(db, query):
+    table = db.tables[query.table]
+    names = [col_name for col_name, _ in table.columns_info]
+    columns = query.columns or names
+    if len(columns) != len(query.values):
+        raise QueryError(f"Ожидается {len(columns)} значений, получено {len(query.values)}")
+    for name in columns:
+        if name not in names:
+            raise QueryError(f"Столбец {name} не найден")
+    # Шаблон строки: номер столбца -> литерал или параметр, остальные столбцы - NULL
+    template = [None] * len(names)
+    for name, value in zip(columns, query.values):
+        template[names.index(name)] = value
+    statement = PreparedInsert(table)
+
+    def run(db, params):
+        row = [params[v.index] if isinstance(v, Param) else v for v in template]
+        return statement.execute(row)
+
+    return Plan([f"insert into {query.table} ({len(names)} columns, prepared layout)"], run)
+
+
+def _table_versions(db, query):
+    # Версия схемы каждой таблицы запроса; None - таблицы нет
+    names = [query.table] + ([query.join] if getattr(query, "join", None) else [])
+    versions = []
+    for name in names:
+        table = db.tables.get(name)
+        versions.append((name, id(table), table.get_schema_version()) if table and table.table_ptr else None)
+    return versions
+
+
+class PreparedStatement:
+    """
+    Подготовленный запрос: текст разбирается один раз, план строится
+    при первом выполнении и перестраивается, только если изменилась
+    версия схемы какой-либо из его таблиц.
+    """
+    def __init__(self, db, sql):
+        self.db = weakref.ref(db)  # запрос хранится в кеше самой базы
+        self.sql = sql
+        self.query = parse(sql)
+        self.plan = None
+        self.versions = None
+
+    @property
+    def num_params(self):
+        return self.query.num_params
+
+    def compiled(self):
+        """Возвращает действующий план, перестраивая его при изменении схемы"""
+        versions = _table_versions(self.db(), self.query)
+        if self.plan is None or versions != self.versions:
+            self.plan = plan_query(self.db(), self.query)
+            self.versions = versions
+        return self.plan
+
+    def execute(self, *params):
+        if len(params) != self.query.num_params:
+            raise QueryError(f"Ожидается {self.query.num_params} параметров, получено {len(params)}")
+        return self.compiled().execute(self.db(), params)
+
+    def explain(self):
+        return str(self.compiled())
+
+
+def prepare(db, sql):
+    """
+    Подготовленный запрос из кеша базы (ключ - текст запроса); при
+    переполнении вытесняется давно не использовавшийся.
+    """
+    cache = db.statements
+    statement = cache.get(sql)
+    if statement is None:
+        statement = cache[sql] = PreparedStatement(db, sql)
+        if len(cache) > STATEMENT_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(sql)
+    return statement
+
+
+def run_query(db, sql, *params):
+    """Выполняет запрос и возвращает список кортежей (для INSERT - id строки)"""
+    return prepare(db, sql).execute(*params)
+
+
+def explain(db, sql):
+    """Текст плана запроса"""
+    return prepare(db, sql).explain()
@@ -0,0 +1,273 @@
+#include "scan.h"
+#include "storage.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+#include <math.h>
+
+/*
+ * Сканирование столбца с условием. Результат - байтовая маска по слотам
+ * таблицы, которую можно объединять с результатами других условий (AND/OR)
+ * и переводить в список идентификаторов строк.
+ */
+
+#define MAX_NEEDLE 256
+
+// Читает следующий символ UTF-8 и приводит его к нижнему регистру
+// (латиница, Latin-1 и кириллица). Некорректный байт возвращается как есть.
+static int next_folded(const unsigned char** p) {
+    const unsigned char* s = *p;
+    int c = s[0];
+    int len = 1;
+    if (c >= 0xC0 && c < 0xE0 && (s[1] & 0xC0) == 0x80) {
+        c = ((c & 0x1F) << 6) | (s[1] & 0x3F);
+        len = 2;
+    } else if (c >= 0xE0 && c < 0xF0 && (s[1] & 0xC0) == 0x80 && (s[2] & 0xC0) == 0x80) {
+        c = ((c & 0x0F) << 12) | ((s[1] & 0x3F) << 6) | (s[2] & 0x3F);
+        len = 3;
+    } else if (c >= 0xF0 && (s[1] & 0xC0) == 0x80 && (s[2] & 0xC0) == 0x80 && (s[3] & 0xC0) == 0x80) {
+        c = ((c & 0x07) << 18) | ((s[1] & 0x3F) << 12) | ((s[2] & 0x3F) << 6) | (s[3] & 0x3F);
+        len = 4;
+    }
+    *p = s + len;
+
+    if (c >= 'A' && c <= 'Z') return c + 32;
+    if (c >= 0xC0 && c <= 0xDE && c != 0xD7) return c + 32;
+    if (c >= 0x410 && c <= 0x42F) return c + 32;   // А-Я
+    if (c >= 0x400 && c <= 0x40F) return c + 80;   // Ѐ-Џ (в том числе Ё)
+    return c;
+}
+
+// Раскладывает строку в массив приведённых символов; возвращает длину или -1
+static int fold_string(const char* s, int* out, int max) {
+    const unsigned char* p = (const unsigned char*)(s ? s : "");
+    int n = 0;
+    while (*p) {
+        if (n >= max) return -1;
+        out[n++] = next_folded(&p);
+    }
+    return n;
+}
+
+// Совпадение приведённой иглы в позиции p (без учёта регистра)
+static int folded_match_at(const unsigned char* p, const int* needle, int n) {
+    for (int k = 0; k < n; k++) {
+        if (!*p || next_folded(&p) != needle[k]) return 0;
+    }
+    return 1;
+}
+
+static int icase_compare(const char* a, const char* b) {
+    const unsigned char* p = (const unsigned char*)(a ? a : "");
+    const unsigned char* q = (const unsigned char*)(b ? b : "");
+    while (*p && *q) {
+        int x = next_folded(&p);
+        int y = next_folded(&q);
+        if (x != y) return x < y ? -1 : 1;
+    }
+    return (*p != 0) - (*q != 0);
+}
+
+static int string_matches(const char* s, int op, int icase, const char* needle,
+                          const char* needle2, const int* folded, int folded_len) {
+    if (!s) s = "";
+    if (op == SCAN_PREFIX) {
+        if (!icase) return strncmp(s, needle, strlen(needle)) == 0;
+        return folded_match_at((const unsigned char*)s, folded, folded_len);
+    }
+    if (op == SCAN_CONTAINS) {
+        if (!icase) return strstr(s, needle) != NULL;
+        for (const unsigned char* p = (const unsigned char*)s; ; ) {
+            if (folded_match_at(p, folded, folded_len)) return 1;
+            if (!*p) return 0;
+            next_folded(&p);
+        }
+    }
+    int cmp = icase ? icase_compare(s, needle) : strcmp(s, needle);
+    switch (op) {
+        case SCAN_EQ: return cmp == 0;
+        case SCAN_NE: return cmp != 0;
+        case SCAN_LT: return cmp < 0;
+        case SCAN_LE: return cmp <= 0;
+        case SCAN_GT: return cmp > 0;
+        case SCAN_GE: return cmp >= 0;
+        case SCAN_BETWEEN:
+            return cmp >= 0 && (icase ? icase_compare(s, needle2) : strcmp(s, needle2)) <= 0;
+    }
+    return 0;
+}
+
+#define COMPARE(x, a, b, op) \
+    ((op) == SCAN_EQ ? (x) == (a) : \
+     (op) == SCAN_NE ? (x) != (a) : \
+     (op) == SCAN_LT ? (x) < (a) : \
+     (op) == SCAN_LE ? (x) <= (a) : \
+     (op) == SCAN_GT ? (x) > (a) : \
+     (op) == SCAN_GE ? (x) >= (a) : \
+     (op) == SCAN_BETWEEN ? ((x) >= (a) && (x) <= (b)) : 0)
+
+static int int_contains(int x, const char* needle) {
+    char buf[16];
+    snprintf(buf, sizeof(buf), "%d", x);
+    return strstr(buf, needle) != NULL;
+}
+
+/*
+ * Запись значения, совпадающая с repr(float) в Python (так значения
+ * показывает интерфейс): кратчайшие цифры, которые читаются обратно в то же
+ * число, с фиксированной точкой при порядке от -4 до 15, иначе экспонента.
+ */
+static void float_text(float f, char* out, size_t size) {
+    double x = f;
+    if (isnan(x)) {
+        snprintf(out, size, "nan");
+        return;
+    }
+    if (isinf(x)) {
+        snprintf(out, size, x < 0 ? "-inf" : "inf");
+        return;
+    }
+    char sci[40];
+    for (int p = 0; p < 17; p++) {
+        snprintf(sci, sizeof(sci), "%.*e", p, x);
+        if (strtod(sci, NULL) == x) break;
+    }
+    // sci: [-]d[.ddd]e[+-]XX
+    const char* s = sci;
+    int negative = *s == '-';
+    if (negative) s++;
+    char digits[24];
+    int nd = 0;
+    for (; *s && *s != 'e'; s++) {
+        if (*s != '.') digits[nd++] = *s;
+    }
+    int exp = atoi(s + 1);
+    while (nd > 1 && digits[nd - 1] == '0') nd--;
+    digits[nd] = '\0';
+
+    // Собираем запись: знак, цифры с точкой, при необходимости экспонента
+    size_t len = 0;
+    char text[48];
+    if (negative) text[len++] = '-';
+    if (exp < -4 || exp >= 16) {
+        text[len++] = digits[0];
+        if (nd > 1) {
+            text[len++] = '.';
+            memcpy(text + len, digits + 1, nd - 1);
+            len += nd - 1;
+        }
+        snprintf(text + len, sizeof(text) - len, "e%c%02d", exp < 0 ? '-' : '+', exp < 0 ? -exp : exp);
+    } else if (exp < 0) {
+        text[len++] = '0';
+        text[len++] = '.';
+        for (int k = 1; k < -exp; k++) text[len++] = '0';
+        memcpy(text + len, digits, nd);
+        text[len + nd] = '\0';
+    } else {
+        for (int k = 0; k <= exp; k++) text[len++] = k < nd ? digits[k] : '0';
+        text[len++] = '.';
+        if (nd > exp + 1) {
+            memcpy(text + len, digits + exp + 1, nd - exp - 1);
+            len += nd - exp - 1;
+        } else {
+            text[len++] = '0';
+        }
+        text[len] = '\0';
+    }
+    snprintf(out, size, "%s", text);
+}
+
+static int float_contains(float x, const char* needle) {
+    char buf[48];
+    float_text(x, buf, sizeof(buf));
+    return strstr(buf, needle) != NULL;
+}
+
+API int scan_column(Table* table, int col_index, int op, DataValue value, DataValue value2,
+                    unsigned char* mask, int mode) {
+    if (!table || !mask || col_index < 0 || col_index >= table->num_columns) {
+        return -1;
+    }
+    int icase = (op & SCAN_ICASE) != 0;
+    op &= ~SCAN_ICASE;
+    int type = table->columns[col_index].type;
+    if (op < SCAN_EQ || op > SCAN_CONTAINS ||
+        (type != TYPE_STRING && op == SCAN_PREFIX)) {
+        fprintf(stderr, "scan_column: операция %d не поддерживается для столбца %s\n",
+                op, table->columns[col_index].name);
+        return -1;
+    }
+    if (storage_readable(table, col_index) != 0) {
+        return -1;
+    }
+
+    const char* needle = "";
+    const char* needle2 = "";
+    int folded[MAX_NEEDLE];
+    int folded_len = 0;
+    if (type == TYPE_STRING || op == SCAN_CONTAINS) {
+        needle = value.s ? value.s : "";
+        needle2 = value2.s ? value2.s : "";
+        if (icase && type == TYPE_STRING) {
+            folded_len = fold_string(needle, folded, MAX_NEEDLE);
+            if (folded_len < 0) {
+                fprintf(stderr, "scan_column: слишком длинный образец\n");
+                return -1;
+            }
+        }
+    }
+
+    int n = table->num_rows;
+    int count = 0;
+    int columnar = table->storage == STORAGE_COLUMNAR;
+    for (int slot = 0; slot < n; slot++) {
+        if (table->deleted[slot]) {
+            mask[slot] = 0;
+            continue;
+        }
+        // При AND проверяем только отмеченные строки, при OR - только неотмеченные
+        if (mode == MASK_AND && !mask[slot]) continue;
+        if (mode == MASK_OR && mask[slot]) {
+            count++;
+            continue;
+        }
+
+        int match;
+        if (type == TYPE_INT) {
+            int x = columnar ? ((int*)table->column_data[col_index])[slot] : storage_get(table, slot, col_index).i;
+            match = op == SCAN_CONTAINS ? int_contains(x, needle) : COMPARE(x, value.i, value2.i, op);
+        } else if (type == TYPE_FLOAT) {
+            float x = columnar ? ((float*)table->column_data[col_index])[slot] : storage_get(table, slot, col_index).f;
+            match = op == SCAN_CONTAINS ? float_contains(x, needle) : COMPARE(x, value.f, value2.f, op);
+        } else {
+            match = string_matches(storage_get(table, slot, col_index).s, op, icase,
+                                   needle, needle2, folded, folded_len);
+        }
+        mask[slot] = (unsigned char)match;
+        count += match;
+    }
+    return count;
+}
+
+API int combine_masks(unsigned char* dst, const unsigned char* src, int n, int mode) {
+    if (!dst || !src) return -1;
+    int count = 0;
+    for (int i = 0; i < n; i++) {
+        if (mode == MASK_AND) dst[i] = dst[i] & src[i];
+        else if (mode == MASK_OR) dst[i] = dst[i] | src[i];
+        else dst[i] = src[i];
+        count += dst[i];
+    }
+    return count;
+}
+
+API int mask_to_row_ids(Table* table, const unsigned char* mask, int* out_ids) {
+    if (!table || !mask || !out_ids) return -1;
+    int count = 0;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        if (mask[slot] && !table->deleted[slot]) {
+            out_ids[count++] = table->row_ids[slot];
+        }
+    }
+    return count;
+}
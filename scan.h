@@ -0,0 +1,39 @@
+#ifndef SCAN_H
+#define SCAN_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+// Операции сравнения для scan_column
+typedef enum {
+    SCAN_EQ,
+    SCAN_NE,
+    SCAN_LT,
+    SCAN_LE,
+    SCAN_GT,
+    SCAN_GE,
+    SCAN_BETWEEN,   // value <= x <= value2
+    SCAN_PREFIX,    // только строки
+    SCAN_CONTAINS   // строки; для TYPE_INT - подстрока десятичной записи, для TYPE_FLOAT -
+                    // подстрока записи, как её показывает Python (repr: 2.5, 3.0, 1e+20)
+} ScanOp;
+
+// Флаг к операции: сравнение строк без учёта регистра
+#define SCAN_ICASE 0x100
+
+// Как результат сравнения объединяется с уже записанной маской
+typedef enum {
+    MASK_SET,   // mask = результат
+    MASK_AND,   // mask = mask && результат (проверяются только отмеченные строки)
+    MASK_OR     // mask = mask || результат (проверяются только неотмеченные строки)
+} MaskMode;
+
+/*
+ * Маска - массив из num_rows байт (по одному на слот таблицы),
+ * 1 - строка подходит. Удалённые строки всегда 0.
+ */
+API int scan_column(Table* table, int col_index, int op, DataValue value, DataValue value2,
+                    unsigned char* mask, int mode);
+API int combine_masks(unsigned char* dst, const unsigned char* src, int n, int mode);
+API int mask_to_row_ids(Table* table, const unsigned char* mask, int* out_ids);
+
+#endif // SCAN_H
@@ -0,0 +1,153 @@
+#include "snapshot.h"
+#include "backup.h"
+#include "binfile.h"
+#include "parallel.h"
+#include <errno.h>
+#include <stdio.h>
+#include <stdlib.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <pthread.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+#endif
+
+#ifdef _WIN32
+static CRITICAL_SECTION mutation_mutex;  // рекурсивна по умолчанию
+static INIT_ONCE mutation_once = INIT_ONCE_STATIC_INIT;
+
+static BOOL CALLBACK init_mutation_mutex(PINIT_ONCE once, PVOID param, PVOID* context) {
+    InitializeCriticalSection(&mutation_mutex);
+    return TRUE;
+}
+
+API void lock_mutations(void) {
+    InitOnceExecuteOnce(&mutation_once, init_mutation_mutex, NULL, NULL);
+    EnterCriticalSection(&mutation_mutex);
+}
+
+API void unlock_mutations(void) {
+    LeaveCriticalSection(&mutation_mutex);
+}
+#else
+static pthread_mutex_t mutation_mutex;
+static pthread_once_t mutation_once = PTHREAD_ONCE_INIT;
+
+static void init_mutation_mutex(void) {
+    pthread_mutexattr_t attr;
+    pthread_mutexattr_init(&attr);
+    pthread_mutexattr_settype(&attr, PTHREAD_MUTEX_RECURSIVE);
+    pthread_mutex_init(&mutation_mutex, &attr);
+    pthread_mutexattr_destroy(&attr);
+}
+
+API void lock_mutations(void) {
+    pthread_once(&mutation_once, init_mutation_mutex);
+    pthread_mutex_lock(&mutation_mutex);
+}
+
+API void unlock_mutations(void) {
+    pthread_mutex_unlock(&mutation_mutex);
+}
+#endif
+
+static int write_runs(Table* table, const char* path) {
+    int* runs = (int*)malloc((table->num_rows > 0 ? 2 * table->num_rows : 2) * sizeof(int));
+    if (!runs) return -1;
+    int num_runs = get_row_id_runs(table, runs);
+    FILE* file = fopen(path, "wb");
+    int ok = file && fwrite(runs, 2 * sizeof(int), num_runs, file) == (size_t)num_runs;
+    if (file && fclose(file) != 0) ok = 0;
+    free(runs);
+    return ok ? 0 : -1;
+}
+
+static int write_job(const SnapshotJob* job, int options) {
+    Table* table = job->table;
+    if (job->since == SNAPSHOT_WHOLE) {
+        return binfile_save_rows(table, NULL, -1, job->path, options);
+    }
+    int* ids = (int*)malloc((table->num_rows > 0 ? table->num_rows : 1) * sizeof(int));
+    if (!ids) return -1;
+    int count = get_changed_row_ids(table, job->since, ids);
+    int result = binfile_save_rows(table, ids, count, job->path, options);
+    free(ids);
+    if (result != 0) return -1;
+    return write_runs(table, job->ids_path);
+}
+
+typedef struct {
+    const SnapshotJob* jobs;
+    int count;
+    int workers;
+    int options;
+    int* errors;  // по заданию
+} SnapshotWrite;
+
+static void write_jobs_worker(void* arg, int worker) {
+    SnapshotWrite* write = (SnapshotWrite*)arg;
+    for (int i = worker; i < write->count; i += write->workers) {
+        write->errors[i] = write_job(&write->jobs[i], write->options) != 0;
+    }
+}
+
+static int write_snapshot(Database* db, const char* db_path, const SnapshotJob* jobs, int count,
+                          int workers, int options) {
+    if (db_path && save_database_file_ex(db, db_path, workers, options) != 0) return -1;
+    if (count == 0) return 0;
+    binfile_crc32(0, NULL, 0);  // таблица CRC строится до запуска потоков
+    int* errors = (int*)calloc(count, sizeof(int));
+    if (!errors) return -1;
+    SnapshotWrite write = { jobs, count, workers < count ? workers : count, options, errors };
+    parallel_run(write.workers, write_jobs_worker, &write);
+    int result = 0;
+    for (int i = 0; i < count; i++) {
+        if (errors[i]) {
+            fprintf(stderr, "Не удалось записать снимок таблицы %s\n", jobs[i].table->name);
+            result = -1;
+        }
+    }
+    free(errors);
+    return result;
+}
+
+API int snapshot_start(Database* db, const char* db_path, const SnapshotJob* jobs, int count, int workers,
+                       int options) {
+    if ((count > 0 && !jobs) || count < 0) return -1;
+#ifdef _WIN32
+    lock_mutations();
+    int result = write_snapshot(db, db_path, jobs, count, workers, options);
+    unlock_mutations();
+    return result;
+#else
+    lock_mutations();
+    pid_t pid = fork();
+    unlock_mutations();
+    if (pid < 0) {
+        perror("fork");
+        return -1;
+    }
+    if (pid == 0) {
+        // Дочерний процесс: единственный поток, блокировку никто не ждёт.
+        // _exit не вызывает обработчики выхода и не сбрасывает буферы родителя
+        _exit(write_snapshot(db, db_path, jobs, count, workers, options) == 0 ? 0 : 1);
+    }
+    return (int)pid;
+#endif
+}
+
+API int snapshot_wait(int handle) {
+    if (handle < 0) return -1;
+    if (handle == 0) return 0;
+#ifdef _WIN32
+    return -1;
+#else
+    int status;
+    while (waitpid((pid_t)handle, &status, 0) < 0) {
+        if (errno != EINTR) return -1;
+    }
+    return WIFEXITED(status) && WEXITSTATUS(status) == 0 ? 0 : -1;
+#endif
+}
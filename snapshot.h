@@ -0,0 +1,43 @@
+#ifndef SNAPSHOT_H
+#define SNAPSHOT_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Согласованные снимки базы для резервного копирования (backup.py).
+ *
+ * Все изменяющие функции библиотеки выполняются под блокировкой изменений
+ * (рекурсивной, её можно брать повторно в том же потоке). snapshot_start
+ * нужна она лишь на время fork(): дочерний процесс получает образ памяти
+ * на момент вызова (страницы копируются при записи) и пишет файлы из него,
+ * а родитель тем временем продолжает изменять таблицы. Ленивые структуры
+ * чтения (строки и идентификаторы отображённых таблиц, mmapfile.h)
+ * публикуются присваиванием указателя после построения, поэтому снимок,
+ * сделанный во время чтения, их не разрывает.
+ *
+ * Без fork() (Windows) файлы пишутся в том же процессе под блокировкой.
+ */
+
+// Таблица целиком (save_table_file)
+#define SNAPSHOT_WHOLE -1
+
+typedef struct {
+    Table* table;
+    int since;             // SNAPSHOT_WHOLE или эпоха: строки, изменённые после неё (backup.h)
+    const char* path;      // файл таблицы (binfile.h)
+    const char* ids_path;  // для since >= 0 - отрезки существующих идентификаторов (get_row_id_runs)
+} SnapshotJob;
+
+API void lock_mutations(void);
+API void unlock_mutations(void);
+
+// Начинает запись снимка: вся база в db_path (если не NULL) и таблицы jobs,
+// в workers потоков с параметрами записи options (BINFILE_SAVE_*). Вызывать под
+// lock_mutations, если jobs составлены по текущему состоянию базы.
+// Возвращает дескриптор для snapshot_wait (0 - запись уже завершена) или -1
+API int snapshot_start(Database* db, const char* db_path, const SnapshotJob* jobs, int count, int workers,
+                       int options);
+// Ожидает окончания записи; 0 - все файлы записаны
+API int snapshot_wait(int handle);
+
+#endif // SNAPSHOT_H
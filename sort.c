@@ -0,0 +1,223 @@
+#include "sort.h"
+#include "storage.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+/*
+ * Сортировка слиянием по массиву слотов: устойчива, поэтому строки с
+ * равными ключами остаются в порядке хранения (или в порядке входного
+ * списка идентификаторов), а сортировка по нескольким ключам однозначна.
+ */
+
+typedef struct {
+    const Table* table;
+    const int* cols;
+    const int* desc;
+    int num_keys;
+} SortKeys;
+
+static int compare_slots(const SortKeys* keys, int a, int b) {
+    for (int k = 0; k < keys->num_keys; k++) {
+        int col = keys->cols[k];
+        DataValue x = storage_get(keys->table, a, col);
+        DataValue y = storage_get(keys->table, b, col);
+        int cmp;
+        switch (keys->table->columns[col].type) {
+            case TYPE_INT:
+                cmp = (x.i > y.i) - (x.i < y.i);
+                break;
+            case TYPE_FLOAT:
+                cmp = (x.f > y.f) - (x.f < y.f);
+                break;
+            default:
+                cmp = strcmp(x.s ? x.s : "", y.s ? y.s : "");
+                break;
+        }
+        if (cmp != 0) {
+            return keys->desc[k] ? -cmp : cmp;
+        }
+    }
+    return 0;
+}
+
+static void merge_sort(const SortKeys* keys, int* slots, int* tmp, int n) {
+    // Восходящее слияние; короткие отрезки упорядочиваются вставками
+    const int run = 16;
+    for (int start = 0; start < n; start += run) {
+        int end = start + run < n ? start + run : n;
+        for (int i = start + 1; i < end; i++) {
+            int v = slots[i];
+            int j = i - 1;
+            while (j >= start && compare_slots(keys, slots[j], v) > 0) {
+                slots[j + 1] = slots[j];
+                j--;
+            }
+            slots[j + 1] = v;
+        }
+    }
+    for (int width = run; width < n; width *= 2) {
+        for (int left = 0; left < n; left += 2 * width) {
+            int mid = left + width < n ? left + width : n;
+            int right = left + 2 * width < n ? left + 2 * width : n;
+            int i = left, j = mid, k = left;
+            while (i < mid && j < right) {
+                // <= сохраняет порядок равных элементов
+                tmp[k++] = compare_slots(keys, slots[i], slots[j]) <= 0 ? slots[i++] : slots[j++];
+            }
+            while (i < mid) tmp[k++] = slots[i++];
+            while (j < right) tmp[k++] = slots[j++];
+        }
+        memcpy(slots, tmp, n * sizeof(int));
+    }
+}
+
+static int check_keys(Table* table, const int* cols, int num_keys) {
+    for (int k = 0; k < num_keys; k++) {
+        if (cols[k] < 0 || cols[k] >= table->num_columns) {
+            fprintf(stderr, "sort_row_ids: неверный номер столбца %d\n", cols[k]);
+            return -1;
+        }
+        if (storage_readable(table, cols[k]) != 0) {
+            return -1;
+        }
+    }
+    return 0;
+}
+
+API int sort_row_ids(Table* table, int* ids, int count, const int* cols, const int* desc, int num_keys) {
+    if (!table || (!ids && count > 0) || count < 0 || num_keys < 0 || (num_keys > 0 && (!cols || !desc))) {
+        return -1;
+    }
+    if (check_keys(table, cols, num_keys) != 0) {
+        return -1;
+    }
+
+    int* slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    int* tmp = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    if (!slots || !tmp) {
+        free(slots);
+        free(tmp);
+        fprintf(stderr, "Ошибка выделения памяти для сортировки\n");
+        return -1;
+    }
+    int n = 0;
+    for (int i = 0; i < count; i++) {
+        int slot = storage_slot(table, ids[i]);
+        if (slot >= 0) {
+            slots[n++] = slot;
+        }
+    }
+
+    SortKeys keys = { table, cols, desc, num_keys };
+    merge_sort(&keys, slots, tmp, n);
+
+    for (int i = 0; i < n; i++) {
+        ids[i] = table->row_ids[slots[i]];
+    }
+    free(slots);
+    free(tmp);
+    return n;
+}
+
+/*
+ * Отбор первых limit строк: max-куча по (ключи, позиция во входном списке).
+ * Позиция делает порядок строгим, поэтому результат совпадает с первыми
+ * limit элементами устойчивой сортировки.
+ */
+typedef struct {
+    const SortKeys* keys;
+    const int* slots;
+} TopHeap;
+
+static int heap_after(const TopHeap* h, int a, int b) {
+    int cmp = compare_slots(h->keys, h->slots[a], h->slots[b]);
+    return cmp > 0 || (cmp == 0 && a > b);
+}
+
+static void heap_sift_down(const TopHeap* h, int* heap, int size, int i) {
+    for (;;) {
+        int largest = i;
+        int left = 2 * i + 1;
+        int right = left + 1;
+        if (left < size && heap_after(h, heap[left], heap[largest])) largest = left;
+        if (right < size && heap_after(h, heap[right], heap[largest])) largest = right;
+        if (largest == i) return;
+        int t = heap[i];
+        heap[i] = heap[largest];
+        heap[largest] = t;
+        i = largest;
+    }
+}
+
+static int compare_ints(const void* a, const void* b) {
+    int x = *(const int*)a;
+    int y = *(const int*)b;
+    return (x > y) - (x < y);
+}
+
+API int top_row_ids(Table* table, int* ids, int count, const int* cols, const int* desc, int num_keys, int limit) {
+    if (!table || (!ids && count > 0) || count < 0 || limit < 0 || num_keys < 0 ||
+        (num_keys > 0 && (!cols || !desc))) {
+        return -1;
+    }
+    if (check_keys(table, cols, num_keys) != 0) {
+        return -1;
+    }
+
+    int* slots = (int*)malloc((count > 0 ? count : 1) * sizeof(int));
+    int* heap = (int*)malloc((limit > 0 ? limit : 1) * sizeof(int));
+    if (!slots || !heap) {
+        free(slots);
+        free(heap);
+        fprintf(stderr, "Ошибка выделения памяти для сортировки\n");
+        return -1;
+    }
+    int n = 0;
+    for (int i = 0; i < count; i++) {
+        int slot = storage_slot(table, ids[i]);
+        if (slot >= 0) {
+            slots[n++] = slot;
+        }
+    }
+
+    SortKeys keys = { table, cols, desc, num_keys };
+    TopHeap h = { &keys, slots };
+    int size = 0;
+    for (int pos = 0; pos < n && limit > 0; pos++) {
+        if (size < limit) {
+            // Просеивание вверх
+            int i = size++;
+            heap[i] = pos;
+            while (i > 0 && heap_after(&h, heap[i], heap[(i - 1) / 2])) {
+                int parent = (i - 1) / 2;
+                int t = heap[i];
+                heap[i] = heap[parent];
+                heap[parent] = t;
+                i = parent;
+            }
+        } else if (heap_after(&h, heap[0], pos)) {
+            heap[0] = pos;
+            heap_sift_down(&h, heap, size, 0);
+        }
+    }
+
+    // Отобранные позиции по порядку входа, затем устойчивая сортировка по ключам
+    qsort(heap, size, sizeof(int), compare_ints);
+    for (int i = 0; i < size; i++) {
+        heap[i] = slots[heap[i]];
+    }
+    merge_sort(&keys, heap, slots, size);
+    for (int i = 0; i < size; i++) {
+        ids[i] = table->row_ids[heap[i]];
+    }
+    free(slots);
+    free(heap);
+    return size;
+}
+
+API int sort_table_index(Table* table, int col, int desc, int* out_ids) {
+    if (!table || !out_ids) return -1;
+    int count = get_row_ids(table, out_ids);
+    return sort_row_ids(table, out_ids, count, &col, &desc, 1);
+}
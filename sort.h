@@ -0,0 +1,18 @@
+#ifndef SORT_H
+#define SORT_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table
+
+// Устойчивая сортировка строк таблицы по одному или нескольким столбцам.
+// Строки сравниваются побайтно (для UTF-8 это порядок кодовых точек), NULL как "".
+
+// Все существующие строки, отсортированные по столбцу col; out_ids - идентификаторы
+API int sort_table_index(Table* table, int col, int desc, int* out_ids);
+// Сортирует на месте массив идентификаторов строк по ключам cols/desc;
+// удалённые строки отбрасываются, возвращается новая длина
+API int sort_row_ids(Table* table, int* ids, int count, const int* cols, const int* desc, int num_keys);
+// Первые limit строк в порядке sort_row_ids без полной сортировки (куча на limit
+// элементов); результат в начале ids, возвращается его длина
+API int top_row_ids(Table* table, int* ids, int count, const int* cols, const int* desc, int num_keys, int limit);
+
+#endif // SORT_H
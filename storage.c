@@ -0,0 +1,583 @@
+#include "storage.h"
+#include "mmapfile.h"
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+/*
+ * Слой хранения данных таблицы.
+ *
+ * STORAGE_ROW      - каждая строка это отдельно выделенный массив DataValue
+ *                    (table->rows[i].values).
+ * STORAGE_COLUMNAR - каждый столбец хранится непрерывным типизированным
+ *                    массивом в table->column_data[j]: int* для TYPE_INT,
+ *                    float* для TYPE_FLOAT и char** для TYPE_STRING.
+ *
+ * Остальной код обращается к ячейкам только через storage_get/storage_set,
+ * поэтому формат хранения прозрачен для insert_row/update_row/delete_row.
+ *
+ * Строки адресуются двумя способами:
+ *   слот          - физическая позиция строки (0 .. num_rows-1);
+ *   идентификатор - стабильный номер строки, который не меняется при
+ *                   удалении других строк и при уплотнении (vacuum).
+ * row_ids переводит слот в идентификатор, id_slots - обратно.
+ * Удалённая строка помечается в deleted (надгробие) и физически
+ * убирается только при уплотнении таблицы.
+ *
+ * Таблица, открытая из файла (mmapfile.h), читает данные из отображения
+ * (table->mapped); любая изменяющая функция этого файла сначала вызывает
+ * storage_writable, который копирует данные в обычный формат хранения.
+ *
+ * Каждая запись в слот отмечает его текущей эпохой storage_epoch
+ * (row_versions), а таблицу - в data_version; по ним резервное
+ * копирование находит строки, изменённые после предыдущей копии.
+ */
+
+int storage_epoch = 1;
+
+static size_t column_elem_size(int type) {
+    switch (type) {
+        case TYPE_INT:    return sizeof(int);
+        case TYPE_FLOAT:  return sizeof(float);
+        default:          return sizeof(char*);
+    }
+}
+
+API Table* create_table_ex(const char* name, Column* columns, int num_columns, int storage) {
+    if (!name || !columns || num_columns <= 0) {
+        fprintf(stderr, "Неверные параметры для create_table\n");
+        return NULL;
+    }
+    if (storage != STORAGE_ROW && storage != STORAGE_COLUMNAR) {
+        fprintf(stderr, "Неизвестный формат хранения таблицы: %d\n", storage);
+        return NULL;
+    }
+
+    Table* table = (Table*)malloc(sizeof(Table));
+    if (!table) {
+        fprintf(stderr, "Ошибка выделения памяти для таблицы\n");
+        return NULL;
+    }
+
+    // Инициализируем структуру таблицы
+    memset(table, 0, sizeof(Table));
+
+    // Копируем имя таблицы
+    strncpy(table->name, name, sizeof(table->name) - 1);
+    table->name[sizeof(table->name) - 1] = '\0';
+
+    // Выделяем память для столбцов
+    table->num_columns = num_columns;
+    table->columns = (Column*)malloc(num_columns * sizeof(Column));
+    if (!table->columns) {
+        fprintf(stderr, "Ошибка выделения памяти для столбцов\n");
+        free(table);
+        return NULL;
+    }
+
+    // Копируем информацию о столбцах
+    for (int i = 0; i < num_columns; i++) {
+        memset(&table->columns[i], 0, sizeof(Column));
+        strncpy(table->columns[i].name, columns[i].name, sizeof(table->columns[i].name) - 1);
+        table->columns[i].name[sizeof(table->columns[i].name) - 1] = '\0';
+        table->columns[i].type = columns[i].type;
+        table->columns[i].is_primary_key = 0;
+        table->columns[i].is_foreign_key = 0;
+        table->columns[i].foreign_key = NULL;
+    }
+
+    table->storage = storage;
+    table->num_rows = 0;
+    table->max_rows = 0;
+    table_schema_changed(table);
+
+    if (storage == STORAGE_COLUMNAR) {
+        table->column_data = (void**)calloc(num_columns, sizeof(void*));
+        if (!table->column_data) {
+            fprintf(stderr, "Ошибка выделения памяти для столбцов\n");
+            free(table->columns);
+            free(table);
+            return NULL;
+        }
+    }
+
+    if (storage_reserve(table, TABLE_INITIAL_CAPACITY) != 0) {
+        fprintf(stderr, "Ошибка выделения памяти для строк\n");
+        storage_free(table);
+        free(table->columns);
+        free(table);
+        return NULL;
+    }
+
+    // Инициализируем внешние ключи
+    table->foreign_keys = NULL;
+    table->num_foreign_keys = 0;
+
+    return table;
+}
+
+API DataValue get_cell(Table* table, int row_id, int col_index) {
+    DataValue empty = {0};
+    if (!table || col_index < 0 || col_index >= table->num_columns) {
+        return empty;
+    }
+    int slot = storage_slot(table, row_id);
+    if (slot < 0) {
+        return empty;
+    }
+    return storage_get(table, slot, col_index);
+}
+
+API int check_column_readable(Table* table, int col_index) {
+    if (!table || col_index < 0 || col_index >= table->num_columns) return -1;
+    return storage_readable(table, col_index);
+}
+
+API int get_row_ids(Table* table, int* out_ids) {
+    if (!table || !out_ids) return -1;
+    int count = 0;
+    for (int i = 0; i < table->num_rows; i++) {
+        if (!table->deleted[i]) {
+            out_ids[count++] = table->row_ids[i];
+        }
+    }
+    return count;
+}
+
+// Переводит идентификатор строки в слот; -1 для несуществующей или удалённой строки
+int storage_slot(const Table* table, int row_id) {
+    if (row_id < 0 || row_id >= table->next_row_id) return -1;
+    if (!table->id_slots && (!table->mapped || mapped_build_ids((Table*)table) != 0)) return -1;
+    int slot = table->id_slots[row_id];
+    if (slot < 0 || table->deleted[slot]) return -1;
+    return slot;
+}
+
+// Как storage_slot, но находит и строки, помеченные удалёнными
+int storage_slot_any(const Table* table, int row_id) {
+    if (row_id < 0 || row_id >= table->next_row_id) return -1;
+    if (!table->id_slots && (!table->mapped || mapped_build_ids((Table*)table) != 0)) return -1;
+    return table->id_slots[row_id];
+}
+
+API int get_table_storage(Table* table) {
+    if (!table) return -1;
+    return table->storage;
+}
+
+DataValue storage_get(const Table* table, int row, int col) {
+    DataValue value = {0};
+    if (table->mapped) {
+        return mapped_get(table, row, col);
+    }
+    if (table->storage == STORAGE_ROW) {
+        if (table->rows[row].values) {
+            value = table->rows[row].values[col];
+        }
+        return value;
+    }
+    switch (table->columns[col].type) {
+        case TYPE_INT:
+            value.i = ((int*)table->column_data[col])[row];
+            break;
+        case TYPE_FLOAT:
+            value.f = ((float*)table->column_data[col])[row];
+            break;
+        default:
+            value.s = ((char**)table->column_data[col])[row];
+            break;
+    }
+    return value;
+}
+
+// Копирует данные отображённой таблицы в память перед первым изменением
+int storage_writable(Table* table) {
+    if (!table->mapped) return 0;
+    if (mapped_materialize(table) != 0) {
+        fprintf(stderr, "Не удалось скопировать в память данные таблицы %s\n", table->name);
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Подкачивает строки отображённой таблицы до чтения: storage_get не
+ * сообщает об ошибках, поэтому функции чтения проверяют столбцы заранее.
+ */
+int storage_readable(Table* table, int col) {
+    if (!table->mapped) return 0;
+    int first = col < 0 ? 0 : col;
+    int last = col < 0 ? table->num_columns : col + 1;
+    for (int j = first; j < last; j++) {
+        if (mapped_page_in(table, j) != 0) {
+            fprintf(stderr, "Не удалось прочитать столбец %s.%s\n", table->name, table->columns[j].name);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+// Отмечает изменение строки (или только таблицы, если row < 0)
+void storage_touch(Table* table, int row) {
+    if (row >= 0 && table->row_versions) {
+        table->row_versions[row] = storage_epoch;
+    }
+    table->data_version = storage_epoch;
+}
+
+/*
+ * Записывает значение без копирования: строка переходит во владение таблицы.
+ * -1, если данные отображённой таблицы не удалось скопировать в память
+ * (значение при этом не записано и остаётся у вызывающего).
+ */
+int storage_set(Table* table, int row, int col, DataValue value) {
+    if (storage_writable(table) != 0) return -1;
+    storage_touch(table, row);
+    if (table->storage == STORAGE_ROW) {
+        table->rows[row].values[col] = value;
+        return 0;
+    }
+    switch (table->columns[col].type) {
+        case TYPE_INT:
+            ((int*)table->column_data[col])[row] = value.i;
+            break;
+        case TYPE_FLOAT:
+            ((float*)table->column_data[col])[row] = value.f;
+            break;
+        default:
+            ((char**)table->column_data[col])[row] = value.s;
+            break;
+    }
+    return 0;
+}
+
+// Меняет ёмкость таблицы (в слотах); capacity не меньше num_rows
+static int storage_resize(Table* table, int capacity) {
+    int old = table->max_rows;
+    int grow = capacity > old ? capacity - old : 0;
+
+    if (table->storage == STORAGE_ROW) {
+        Row* temp = (Row*)realloc(table->rows, capacity * sizeof(Row));
+        if (!temp) return -1;
+        for (int i = old; i < capacity; i++) {
+            temp[i].values = NULL;
+        }
+        table->rows = temp;
+    } else {
+        for (int j = 0; j < table->num_columns; j++) {
+            size_t elem = column_elem_size(table->columns[j].type);
+            char* temp = (char*)realloc(table->column_data[j], capacity * elem);
+            if (!temp) return -1;
+            memset(temp + old * elem, 0, grow * elem);
+            table->column_data[j] = temp;
+        }
+    }
+
+    int* ids = (int*)realloc(table->row_ids, capacity * sizeof(int));
+    if (!ids) return -1;
+    table->row_ids = ids;
+
+    int* versions = (int*)realloc(table->row_versions, capacity * sizeof(int));
+    if (!versions) return -1;
+    memset(versions + (capacity > old ? old : capacity), 0, grow * sizeof(int));
+    table->row_versions = versions;
+
+    unsigned char* deleted = (unsigned char*)realloc(table->deleted, capacity);
+    if (!deleted) return -1;
+    memset(deleted + (capacity > old ? old : capacity), 0, grow);
+    table->deleted = deleted;
+
+    table->max_rows = capacity;
+    return 0;
+}
+
+// Гарантирует место как минимум под capacity строк
+int storage_reserve(Table* table, int capacity) {
+    if (storage_writable(table) != 0) return -1;
+    if (capacity <= table->max_rows) return 0;
+    return storage_resize(table, capacity);
+}
+
+// Выделяет новый слот в конце таблицы и присваивает ему новый идентификатор
+int storage_append_slot(Table* table) {
+    if (storage_writable(table) != 0) return -1;
+    if (table->num_rows >= table->max_rows &&
+        storage_reserve(table, table->max_rows > 0 ? table->max_rows * 2 : TABLE_INITIAL_CAPACITY) != 0) {
+        return -1;
+    }
+    if (table->next_row_id >= table->id_capacity) {
+        int new_capacity = table->id_capacity > 0 ? table->id_capacity * 2 : TABLE_INITIAL_CAPACITY;
+        int* temp = (int*)realloc(table->id_slots, new_capacity * sizeof(int));
+        if (!temp) return -1;
+        table->id_slots = temp;
+        table->id_capacity = new_capacity;
+    }
+
+    int slot = table->num_rows;
+    if (storage_init_row(table, slot) != 0) {
+        return -1;
+    }
+    int row_id = table->next_row_id++;
+    table->row_ids[slot] = row_id;
+    table->id_slots[row_id] = slot;
+    table->deleted[slot] = 0;
+    table->num_rows++;
+    return slot;
+}
+
+/*
+ * Заполняет пустую таблицу count пустыми строками с заданными идентификаторами
+ * (строго возрастающими, меньше next_row_id) - для загрузки из файла.
+ */
+int storage_load_slots(Table* table, const int* ids, int count, int next_row_id) {
+    if (storage_writable(table) != 0) return -1;
+    if (table->num_rows != 0 || count < 0 || next_row_id < count) return -1;
+    for (int i = 0; i < count; i++) {
+        if (ids[i] < 0 || ids[i] >= next_row_id || (i > 0 && ids[i] <= ids[i - 1])) return -1;
+    }
+    if (storage_reserve(table, count) != 0) return -1;
+    if (next_row_id > table->id_capacity) {
+        int* temp = (int*)realloc(table->id_slots, next_row_id * sizeof(int));
+        if (!temp) return -1;
+        table->id_slots = temp;
+        table->id_capacity = next_row_id;
+    }
+    for (int id = 0; id < next_row_id; id++) {
+        table->id_slots[id] = -1;
+    }
+    for (int i = 0; i < count; i++) {
+        if (storage_init_row(table, i) != 0) {
+            table->num_rows = i;
+            return -1;
+        }
+        table->row_ids[i] = ids[i];
+        table->id_slots[ids[i]] = i;
+        table->deleted[i] = 0;
+        table->num_rows = i + 1;
+    }
+    table->next_row_id = next_row_id;
+    return 0;
+}
+
+/*
+ * Пропускает идентификаторы до next_row_id (не включая): следующая строка
+ * получит идентификатор next_row_id. Нужно при повторении журнала, где
+ * идентификаторы откатанных вставок уже израсходованы.
+ */
+int storage_skip_ids(Table* table, int next_row_id) {
+    if (next_row_id <= table->next_row_id) return next_row_id == table->next_row_id ? 0 : -1;
+    if (storage_writable(table) != 0) return -1;
+    if (table->next_row_id > 0 && !table->id_slots) return -1;
+    if (next_row_id > table->id_capacity) {
+        int* temp = (int*)realloc(table->id_slots, next_row_id * sizeof(int));
+        if (!temp) return -1;
+        table->id_slots = temp;
+        table->id_capacity = next_row_id;
+    }
+    for (int id = table->next_row_id; id < next_row_id; id++) {
+        table->id_slots[id] = -1;
+    }
+    table->next_row_id = next_row_id;
+    return 0;
+}
+
+// Освобождает последний слот, возвращая его идентификатор (отмена storage_append_slot)
+void storage_pop_slot(Table* table) {
+    int slot = table->num_rows - 1;
+    storage_clear_row(table, slot);
+    table->id_slots[table->row_ids[slot]] = -1;
+    table->next_row_id--;
+    table->num_rows--;
+}
+
+/*
+ * Уплотнение: физически убирает строки-надгробия, сохраняя порядок и
+ * идентификаторы остальных строк, и уменьшает ёмкость таблицы.
+ * Возвращает количество убранных строк. Индексы нужно перестроить.
+ */
+int storage_compact(Table* table) {
+    if (table->mapped && table->num_deleted == 0) return 0;  // надгробий нет - копия не нужна
+    if (storage_writable(table) != 0) return 0;
+    int removed = table->num_deleted;
+    int dst = 0;
+    for (int slot = 0; slot < table->num_rows; slot++) {
+        int row_id = table->row_ids[slot];
+        if (table->deleted[slot]) {
+            storage_clear_row(table, slot);
+            table->id_slots[row_id] = -1;
+            table->deleted[slot] = 0;
+            continue;
+        }
+        if (dst != slot) {
+            storage_move_row(table, dst, slot);
+            table->row_ids[dst] = row_id;
+            table->id_slots[row_id] = dst;
+        }
+        dst++;
+    }
+    table->num_rows = dst;
+    table->num_deleted = 0;
+
+    int capacity = TABLE_INITIAL_CAPACITY;
+    while (capacity < dst) {
+        capacity *= 2;
+    }
+    if (capacity < table->max_rows) {
+        storage_resize(table, capacity);
+    }
+    return removed;
+}
+
+// Подготавливает пустую (обнулённую) строку в слоте row
+int storage_init_row(Table* table, int row) {
+    if (storage_writable(table) != 0) return -1;
+    if (table->storage == STORAGE_ROW) {
+        table->rows[row].values = (DataValue*)calloc(table->num_columns, sizeof(DataValue));
+        return table->rows[row].values ? 0 : -1;
+    }
+    DataValue empty = {0};
+    for (int j = 0; j < table->num_columns; j++) {
+        storage_set(table, row, j, empty);
+    }
+    return 0;
+}
+
+// Освобождает строковые значения строки и саму строку
+void storage_clear_row(Table* table, int row) {
+    if (storage_writable(table) != 0) return;
+    storage_touch(table, row);
+    for (int j = 0; j < table->num_columns; j++) {
+        if (table->columns[j].type == TYPE_STRING) {
+            DataValue value = storage_get(table, row, j);
+            free(value.s);
+        }
+    }
+    if (table->storage == STORAGE_ROW) {
+        free(table->rows[row].values);
+        table->rows[row].values = NULL;
+    } else {
+        storage_init_row(table, row);
+    }
+}
+
+// Переносит строку src в позицию dst (владение строками переходит к dst)
+void storage_move_row(Table* table, int dst, int src) {
+    if (dst == src || storage_writable(table) != 0) return;
+    if (table->storage == STORAGE_ROW) {
+        table->rows[dst] = table->rows[src];
+        table->rows[src].values = NULL;
+        table->row_versions[dst] = table->row_versions[src];
+        return;
+    }
+    for (int j = 0; j < table->num_columns; j++) {
+        storage_set(table, dst, j, storage_get(table, src, j));
+    }
+    storage_init_row(table, src);
+    table->row_versions[dst] = table->row_versions[src];  // перенос - не изменение данных
+}
+
+// Освобождает все данные таблицы (но не столбцы и внешние ключи)
+void storage_free(Table* table) {
+    if (table->mapped) {
+        mapped_free(table);
+        return;
+    }
+    for (int i = 0; i < table->num_rows; i++) {
+        storage_clear_row(table, i);
+    }
+    if (table->storage == STORAGE_ROW) {
+        free(table->rows);
+        table->rows = NULL;
+    } else if (table->column_data) {
+        for (int j = 0; j < table->num_columns; j++) {
+            free(table->column_data[j]);
+        }
+        free(table->column_data);
+        table->column_data = NULL;
+    }
+    free(table->row_ids);
+    free(table->id_slots);
+    free(table->deleted);
+    free(table->row_versions);
+    table->row_versions = NULL;
+    table->row_ids = NULL;
+    table->id_slots = NULL;
+    table->deleted = NULL;
+    table->num_rows = 0;
+    table->max_rows = 0;
+    table->num_deleted = 0;
+}
+
+/*
+ * Добавляет данные для нового последнего столбца.
+ * Вызывается после того, как столбец уже добавлен в table->columns.
+ */
+int storage_add_column(Table* table, int type, DataValue default_value) {
+    if (table->mapped) return -1;  // add_column вызывает storage_writable до изменения столбцов
+    int new_cols = table->num_columns;
+    int idx = new_cols - 1;
+
+    if (table->storage == STORAGE_ROW) {
+        for (int i = 0; i < table->num_rows; i++) {
+            if (!table->rows[i].values) continue;  // данные удалённой строки уже освобождены
+            DataValue* new_values = (DataValue*)realloc(table->rows[i].values, new_cols * sizeof(DataValue));
+            if (!new_values) {
+                fprintf(stderr, "add_column: Ошибка выделения памяти для значений строки %d\n", i);
+                return -1;
+            }
+            table->rows[i].values = new_values;
+        }
+    } else {
+        void** new_data = (void**)realloc(table->column_data, new_cols * sizeof(void*));
+        if (!new_data) {
+            fprintf(stderr, "add_column: Ошибка выделения памяти для массива столбцов\n");
+            return -1;
+        }
+        table->column_data = new_data;
+        table->column_data[idx] = calloc(table->max_rows > 0 ? table->max_rows : 1, column_elem_size(type));
+        if (!table->column_data[idx]) {
+            fprintf(stderr, "add_column: Ошибка выделения памяти для данных столбца\n");
+            return -1;
+        }
+    }
+
+    // Устанавливаем значение по умолчанию для нового столбца
+    for (int i = 0; i < table->num_rows; i++) {
+        if (table->storage == STORAGE_ROW && !table->rows[i].values) continue;
+        DataValue value = default_value;
+        if (type == TYPE_STRING) {
+            value.s = default_value.s ? strdup(default_value.s) : NULL;
+        }
+        storage_set(table, i, idx, value);
+    }
+    return 0;
+}
+
+/*
+ * Удаляет данные столбца col_index; -1, если данные не удалось сделать
+ * изменяемыми. Вызывается до того, как столбец будет удалён из table->columns.
+ */
+int storage_drop_column(Table* table, int col_index) {
+    if (storage_writable(table) != 0) return -1;
+    int old_cols = table->num_columns;
+
+    if (table->columns[col_index].type == TYPE_STRING) {
+        for (int i = 0; i < table->num_rows; i++) {
+            free(storage_get(table, i, col_index).s);
+        }
+    }
+
+    if (table->storage == STORAGE_ROW) {
+        for (int i = 0; i < table->num_rows; i++) {
+            DataValue* values = table->rows[i].values;
+            if (!values) continue;
+            memmove(&values[col_index], &values[col_index + 1],
+                    (old_cols - col_index - 1) * sizeof(DataValue));
+        }
+    } else {
+        free(table->column_data[col_index]);
+        memmove(&table->column_data[col_index], &table->column_data[col_index + 1],
+                (old_cols - col_index - 1) * sizeof(void*));
+    }
+    return 0;
+}
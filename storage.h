@@ -0,0 +1,43 @@
+#ifndef STORAGE_H
+#define STORAGE_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Row, Table
+
+// Создание таблицы с выбором формата хранения (STORAGE_ROW / STORAGE_COLUMNAR)
+API Table* create_table_ex(const char* name, Column* columns, int num_columns, int storage);
+// Чтение значения ячейки независимо от формата хранения
+API DataValue get_cell(Table* table, int row_id, int col_index);
+// 0, если значения столбца можно читать; -1 - повреждён сегмент отображённого файла
+API int check_column_readable(Table* table, int col_index);
+API int get_table_storage(Table* table);
+// Список идентификаторов существующих строк; возвращает их количество
+API int get_row_ids(Table* table, int* out_ids);
+
+// Эпоха изменений: каждое изменение строки отмечается текущей эпохой
+// (table->row_versions, table->data_version), см. backup.h
+extern int storage_epoch;
+void storage_touch(Table* table, int row);
+
+// Внутренние функции доступа к данным таблицы (не экспортируются)
+DataValue storage_get(const Table* table, int row, int col);
+int storage_writable(Table* table);
+// Готовность столбца col (col < 0 - всех столбцов) к чтению через storage_get;
+// -1 - повреждены или не загружены строки отображённой таблицы
+int storage_readable(Table* table, int col);
+int storage_set(Table* table, int row, int col, DataValue value);
+int storage_slot(const Table* table, int row_id);
+int storage_slot_any(const Table* table, int row_id);
+int storage_reserve(Table* table, int capacity);
+int storage_append_slot(Table* table);
+int storage_load_slots(Table* table, const int* ids, int count, int next_row_id);
+int storage_skip_ids(Table* table, int next_row_id);
+void storage_pop_slot(Table* table);
+int storage_compact(Table* table);
+int storage_init_row(Table* table, int row);
+void storage_clear_row(Table* table, int row);
+void storage_move_row(Table* table, int dst, int src);
+void storage_free(Table* table);
+int storage_add_column(Table* table, int type, DataValue default_value);
+int storage_drop_column(Table* table, int col_index);
+
+#endif // STORAGE_H
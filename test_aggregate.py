@@ -0,0 +1,58 @@
+import pytest
+from db_interface import Database, Condition, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_aggregate_matches_python(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Sales", [("id", TYPE_INT), ("region", TYPE_STRING), ("amount", TYPE_FLOAT)], storage)
+    rows = [(i, f"r{i % 7}", float(i % 13)) for i in range(1000)]
+    db.insert_many("Sales", rows)
+    for row_id in range(0, 1000, 10):
+        table.delete(row_id)
+    rows = [row for row in rows if row[0] % 10]
+
+    assert table.aggregate("count") == len(rows)
+    assert table.aggregate(("sum", "id")) == sum(r[0] for r in rows)
+    count, low, high, avg = table.aggregate("count", ("min", "amount"), ("max", "id"), ("avg", "amount"))
+    assert (count, low, high) == (len(rows), 0.0, 999)
+    assert avg == pytest.approx(sum(r[2] for r in rows) / len(rows))
+
+    groups = db.group_by("Sales", "region", "count", ("sum", "amount"))
+    expected = {}
+    for _, region, amount in rows:
+        n, total = expected.get(region, (0, 0.0))
+        expected[region] = (n + 1, total + amount)
+    assert list(groups) == [f"r{i}" for i in range(1, 7)] + ["r0"]
+    assert groups == pytest.approx(expected)
+
+    big = table.aggregate(("max", "amount"), group_by="region", where=Condition("id", ">=", 990))
+    assert big == {f"r{i % 7}": float(i % 13) for i in range(991, 1000)}
+
+
+def test_aggregate_empty_and_invalid():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Empty", [("name", TYPE_STRING), ("value", TYPE_INT)])
+    assert table.aggregate("count", ("sum", "value"), ("min", "value"), ("avg", "value")) == (0, 0, None, None)
+    assert table.aggregate("count", group_by="name") == {}
+    with pytest.raises(ValueError):
+        table.aggregate(("sum", "name"))
+    with pytest.raises(KeyError):
+        db.group_by("Empty", "missing", "count")
+
+
+@pytest.mark.parametrize("values", [[float("nan"), 1.0, 3.0], [1.0, float("nan"), 3.0], [1.0, 3.0, float("nan")]])
+def test_nan_values_are_skipped(values):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Readings", [("sensor", TYPE_STRING), ("value", TYPE_FLOAT)])
+    db.insert_many("Readings", [("a", v) for v in values] + [("b", float("nan"))])
+    aggs = ("count", ("sum", "value"), ("min", "value"), ("max", "value"), ("avg", "value"))
+    # Результат не зависит от порядка строк
+    assert table.aggregate(*aggs, where=Condition("sensor", "=", "a")) == (3, 4.0, 1.0, 3.0, 2.0)
+    assert table.aggregate(*aggs, group_by="sensor")["b"] == (1, 0.0, None, None, None)
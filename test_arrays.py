@@ -0,0 +1,62 @@
+import array
+
+import pytest
+from db_interface import DBTable, Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_column_as_array(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Numbers", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT)], storage)
+    db.insert_many("Numbers", ((i, str(i), i / 2) for i in range(100)))
+
+    ids = table.column_as_array("id")
+    scores = table.column_as_array("score")
+    assert list(ids) == list(range(100))
+    assert sum(scores) == sum(i / 2 for i in range(100))
+    with pytest.raises(TypeError):
+        table.column_as_array("name")
+
+    # Удалённые строки в массив не попадают
+    table.delete(0)
+    assert list(table.column_as_array("id"))[:2] == [1, 2]
+
+
+def test_columnar_array_is_a_view():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("View", [("id", TYPE_INT)], STORAGE_COLUMNAR)
+    db.insert_many("View", ([i] for i in range(10)))
+    ids = table.column_as_array("id")
+    table.update(3, 0, 42)
+    assert ids[3] == 42
+
+
+def test_from_arrays_roundtrip():
+    lib.cleanup_database()
+    lib.init_database()
+    table = DBTable.from_arrays("Arrays", {
+        "id": array.array('i', range(1000)),
+        "score": [i * 0.25 for i in range(1000)],
+        "name": [f"n{i}" if i % 2 else None for i in range(1000)],
+    })
+    assert table.columns_info == [("id", TYPE_INT), ("score", TYPE_FLOAT), ("name", TYPE_STRING)]
+    assert table.get_num_rows() == 1000
+    assert table.fetch_rows(0, 2) == [(0, 0.0, ""), (1, 0.25, "n1")]
+    assert table.insert_arrays({"id": [1], "score": [1.0], "name": ["x"]}) == 1
+    with pytest.raises(ValueError):
+        table.insert_arrays({"id": [1, 2], "score": [1.0], "name": ["x"]})
+
+
+def test_numpy_arrays():
+    np = pytest.importorskip("numpy")
+    lib.cleanup_database()
+    lib.init_database()
+    table = DBTable.from_arrays("NumPy", {"id": np.arange(50), "value": np.linspace(0, 1, 50)})
+    assert table.columns_info == [("id", TYPE_INT), ("value", TYPE_FLOAT)]
+    ids = table.column_as_array("id")
+    assert ids.dtype == np.int32 and ids.sum() == sum(range(50))
+    assert not ids.flags.writeable
@@ -0,0 +1,135 @@
+import os
+import zipfile
+import json
+import threading
+from db_interface import TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_COLUMNAR, lib
+from backup import BackupChain, MANIFEST
+from conftest import new_database, snapshot_state
+
+
+def make_db():
+    db = new_database()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    db.create_table("People", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT)],
+                    STORAGE_COLUMNAR)
+    db.set_primary_key("Departments", "id")
+    db.insert_many("Departments", [(1, "IT"), (2, "HR")])
+    db.insert_many("People", [(i, f"name{i}", i * 0.5) for i in range(1000)])
+    return db
+
+
+def read_manifest(path):
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read(MANIFEST))
+
+
+def test_incremental_chain_restore(tmp_path):
+    db = make_db()
+    chain = BackupChain(str(tmp_path))
+    base = chain.make()
+    assert base.endswith("_full.mydb")
+
+    # Без изменений инкремент не содержит таблиц
+    empty = chain.make()
+    manifest = read_manifest(empty)
+    assert manifest["full"] == {} and manifest["delta"] == {}
+    assert manifest["tables"] == ["Departments", "People"]
+
+    db.update_row("People", 10, 1, "changed")
+    db.delete_row("People", 20)
+    db.insert_row("People", [1000, "new", 1.0])
+    db.create_table("Projects", [("title", TYPE_STRING)])
+    db.insert_row("Projects", ["db"])
+    first = chain.make()
+    manifest = read_manifest(first)
+    assert list(manifest["full"]) == ["Projects"]
+    assert list(manifest["delta"]) == ["People"]
+    with zipfile.ZipFile(first) as archive:
+        rows = archive.getinfo(manifest["delta"]["People"]["rows"]).file_size
+    assert rows < os.path.getsize(base) / 4  # две строки, а не вся таблица
+
+    db.tables["Departments"].add_column("budget", TYPE_FLOAT, 0.0)
+    db.update_row("Departments", 0, 2, 10.5)
+    for row_id in range(100, 200):
+        db.delete_row("People", row_id)
+    db.drop_table("Projects")
+    second = chain.make()
+    assert list(read_manifest(second)["full"]) == ["Departments"]
+
+    expected = snapshot_state(db)
+    db.insert_row("People", [2000, "after", 0.0])
+    db.restore_backup(second)
+    assert snapshot_state(db) == expected
+    assert db.tables["People"].get_num_rows() == 1000 - 1 + 1 - 100
+    # Идентификаторы продолжаются с того же места
+    assert db.insert_row("People", [3000, "next", 0.0]) is not False
+    assert db.tables["People"].get_row_ids()[-1] == 1001
+
+    db.restore_backup(first)
+    state = snapshot_state(db)
+    assert "Projects" in state and state["Projects"] == [(0, "db")]
+    assert len(state["People"]) == 1000
+
+
+def test_full_every_and_retention(tmp_path):
+    db = make_db()
+    chain = BackupChain(str(tmp_path), full_every=2, keep_chains=2)
+    for i in range(7):
+        db.insert_row("People", [5000 + i, "x", 0.0])
+        chain.make()
+    names = sorted(os.listdir(tmp_path))
+    # Цепочки: full incr incr | full incr incr | full - хранятся две последние
+    assert [n.rsplit("_", 1)[1] for n in names] == ["full.mydb", "incr.zip", "incr.zip", "full.mydb"]
+    expected = snapshot_state(db)
+    db.restore_backup(os.path.join(tmp_path, names[2]))
+    assert len(db.tables["People"].get_all_rows()) == 1000 + 6
+    db.restore_backup(os.path.join(tmp_path, names[3]))
+    assert snapshot_state(db) == expected
+
+
+def test_snapshot_is_point_in_time(tmp_path):
+    db = make_db()
+    expected = snapshot_state(db)
+    path = str(tmp_path / "snap.mydb")
+    handle = lib.snapshot_start(None, os.fsencode(path), None, 0, 2, 0)
+    assert handle >= 0
+    # Изменения после снимка в файл не попадают
+    for row_id in range(500):
+        db.delete_row("People", row_id)
+    db.update_row("Departments", 0, 1, "changed")
+    assert lib.snapshot_wait(handle) == 0
+    db.load_from_file(path)
+    assert snapshot_state(db) == expected
+
+
+def test_backup_while_writing(tmp_path):
+    db = make_db()
+    chain = BackupChain(str(tmp_path))
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        row_id = 10000
+        while not stop.is_set():
+            db.insert_row("People", [row_id, "w", 0.0])
+            written.append(row_id)
+            row_id += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        paths = [chain.make() for _ in range(5)]
+    finally:
+        stop.set()
+        thread.join()
+    expected = snapshot_state(db)
+    last = chain.make()
+
+    # Каждая копия цепочки - целая таблица без разрывов в идентификаторах
+    for path in paths:
+        db.restore_backup(path)
+        ids = db.tables["People"].get_row_ids()
+        assert ids == list(range(len(ids)))
+    db.restore_backup(last)
+    assert snapshot_state(db) == expected
+    assert len(written) > 0
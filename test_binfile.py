@@ -0,0 +1,192 @@
+import struct
+import pytest
+from db_interface import (Database, DataValue, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR,
+                          lib, is_binary_file, save_table_to_file, load_table_from_file, BINFILE_SAVE_DICT)
+
+
+def make_db(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)], storage)
+    people = db.create_table("People", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT),
+                                        ("department_id", TYPE_INT)], storage)
+    db.insert_many("Departments", [(1, "Отдел"), (2, None)])
+    db.set_primary_key("Departments", "id")
+    db.add_foreign_key("People", "department_id", "Departments", "id")
+    db.insert_many("People", [(i, f"имя {i}" if i % 7 else "", i / 4, 1 + i % 2) for i in range(300)])
+    for row_id in range(0, 300, 3):
+        people.delete(row_id)
+    return db
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_binary_roundtrip(tmp_path, storage):
+    db = make_db(storage)
+    expected = {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()}
+    path = str(tmp_path / "db.mydb")
+    db.save_to_file(path)
+    assert is_binary_file(path)
+
+    db.load_from_file(path)
+    assert {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()} == expected
+    people = db.tables["People"]
+    assert people.storage == storage
+    assert db.tables["Departments"].get_primary_key() == "id"
+    assert people.get_foreign_keys()[0]["referenced_table"] == "Departments"
+    # Идентификаторы строк сохранены, новые продолжают нумерацию
+    assert db.insert_row("People", [1000, "new", 0.0, 2]) == 300
+    with pytest.raises(Exception):
+        db.insert_row("People", [1001, "bad", 0.0, 3])
+    with pytest.raises(Exception):
+        db.insert_row("Departments", [1, "dup"])
+
+
+def test_corrupted_file_is_rejected(tmp_path):
+    db = make_db(STORAGE_ROW)
+    path = tmp_path / "db.mydb"
+    db.save_to_file(str(path))
+    data = bytearray(path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(IOError):
+        db.load_from_file(str(path))
+    assert lib.get_num_tables(None) == 0
+
+
+def test_single_table_file(tmp_path):
+    db = make_db(STORAGE_COLUMNAR)
+    path = str(tmp_path / "people.mydb")
+    save_table_to_file(db.tables["People"], path)
+    table = load_table_from_file(path)
+    try:
+        assert table.columns_info == db.tables["People"].columns_info
+        assert table.get_all_rows() == db.tables["People"].get_all_rows()
+    finally:
+        table.free()
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_lazy_open_reads_from_mapping(tmp_path, storage):
+    db = make_db(storage)
+    expected = {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()}
+    path = str(tmp_path / "db.mydb")
+    db.save_to_file(path)
+
+    db.load_from_file(path, lazy=True)
+    people = db.tables["People"]
+    assert people.is_mapped()
+    assert {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()} == expected
+    assert people.where(("score", ">=", 70.0)) == [i for i in range(280, 300) if i % 3]
+    assert db.query("SELECT name FROM People WHERE id = 4") == [("имя 4",)]
+    assert db.group_by("People", "department_id", "count") == {1: 100, 2: 100}
+    assert list(people.column_as_array("id"))[:3] == [1, 2, 4]
+    # Чтение не копирует таблицу, откатанная транзакция тоже
+    db.begin_transaction()
+    people.delete(1)
+    db.rollback_transaction()
+    assert people.is_mapped()
+
+    # Перезапись файла не затрагивает открытые таблицы
+    db.save_to_file(path)
+    assert people.get_all_rows(with_ids=True) == expected["People"]
+
+    # Первое изменение переносит данные в память
+    assert people.update(2, 1, "изменено") == 0
+    assert not people.is_mapped()
+    assert db.tables["Departments"].is_mapped()
+    people.delete(4)
+    assert db.insert_row("People", [1000, "new", 0.5, 2]) == 300
+    rows = {row[0]: row[1:] for row in people.get_all_rows(with_ids=True)}
+    assert rows[2][1] == "изменено" and 4 not in rows and rows[300] == (1000, "new", 0.5, 2)
+    with pytest.raises(Exception):
+        db.insert_row("Departments", [2, "dup"])
+
+    db.tables["Departments"].add_column("floor", TYPE_INT, 3)
+    assert db.tables["Departments"].get_all_rows() == [(1, "Отдел", 3), (2, "", 3)]
+
+
+def test_lazy_open_requires_binary_file(tmp_path):
+    db = make_db(STORAGE_ROW)
+    path = str(tmp_path / "db.json")
+    db.save_to_file(path)
+    with pytest.raises(Exception):
+        db.load_from_file(path, lazy=True)
+    garbage = tmp_path / "bad.mydb"
+    garbage.write_bytes(b"MYDB" + bytes(40))
+    with pytest.raises(IOError):
+        db.load_from_file(str(garbage), lazy=True)
+
+
+def test_parallel_save_matches_sequential(tmp_path):
+    db = make_db(STORAGE_COLUMNAR)
+    for i in range(6):
+        table = db.create_table(f"Extra{i}", [("s", TYPE_STRING), ("v", TYPE_FLOAT)],
+                                STORAGE_ROW if i % 2 else STORAGE_COLUMNAR)
+        table.insert_many([(f"строка {k}" if k % 5 else None, k * 0.5) for k in range(i * 500)])
+    sequential = tmp_path / "seq.mydb"
+    parallel = tmp_path / "par.mydb"
+    db.save_to_file(str(sequential))
+    db.save_to_file(str(parallel), workers=4)
+    # Тот же формат байт в байт, включая контрольную сумму
+    assert parallel.read_bytes() == sequential.read_bytes()
+
+    expected = {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()}
+    db.load_from_file(str(parallel))
+    assert {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()} == expected
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_dictionary_strings(tmp_path, storage):
+    db = make_db(storage)
+    db.create_table("Events", [("kind", TYPE_STRING), ("note", TYPE_STRING)], storage)
+    kinds = ["вход", "выход", None, "ошибка"]
+    db.insert_many("Events", [(kinds[i % 4], f"запись {i}") for i in range(2000)])
+    db.tables["Events"].delete(7)
+    expected = {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()}
+    plain = tmp_path / "plain.mydb"
+    encoded = tmp_path / "dict.mydb"
+    db.save_to_file(str(plain))
+    assert lib.save_database_file_ex(None, str(encoded).encode(), 2, BINFILE_SAVE_DICT) == 0
+    # Повторяющиеся строки записаны один раз, уникальные - как обычно
+    assert encoded.stat().st_size < plain.stat().st_size - 2000 * 3
+
+    for lazy in (False, True):
+        db.load_from_file(str(encoded), lazy=lazy)
+        assert {name: table.get_all_rows(with_ids=True) for name, table in db.tables.items()} == expected
+    db.update_row("Events", 0, 0, "изменено")
+    assert db.tables["Events"].get_all_rows()[0] == ("изменено", "запись 0")
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_lazy_corrupt_strings_are_not_served(tmp_path, storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Notes", [("id", TYPE_INT), ("text", TYPE_STRING)], storage)
+    db.insert_many("Notes", [(i, f"s{i:04d}") for i in range(100)])
+    path = tmp_path / "db.mydb"
+    db.save_to_file(str(path))
+    # Смещение конца третьей строки выходит за сегмент (контрольная сумма при отображении не проверяется)
+    data = bytearray(path.read_bytes())
+    pos = data.index(struct.pack("<QQQ", 5, 10, 15))
+    data[pos + 8:pos + 16] = struct.pack("<Q", 1 << 40)
+    path.write_bytes(bytes(data))
+
+    db.load_from_file(str(path), lazy=True)
+    notes = db.tables["Notes"]
+    assert notes.get_value(0, 0) == 0
+    with pytest.raises(Exception):
+        notes.get_all_rows()
+    with pytest.raises(IOError):
+        notes.get_value(5, 1)
+    with pytest.raises(Exception):
+        notes.where(("text", "=", "s0001"))
+    # Изменения отказываются, а не сохраняют NULL вместо строк
+    value = DataValue()
+    value.i = 7
+    assert lib.update_row(notes.table_ptr, 1, 0, value) == -1
+    assert lib.delete_row(notes.table_ptr, 1) == -1
+    assert lib.drop_column(notes.table_ptr, b"id") == -1
+    assert notes.is_mapped() and notes.get_num_rows() == 100
+    assert lib.save_database_file(None, str(tmp_path / "copy.mydb").encode()) == -1
@@ -0,0 +1,88 @@
+import os
+import zipfile
+import pytest
+import backup
+from db_interface import TYPE_INT, TYPE_STRING, TYPE_FLOAT
+from backup import BackupChain, MANIFEST
+from compression import CODECS, codec_of_file, codec_suffix
+from conftest import new_database, snapshot_state
+
+
+def make_db():
+    db = new_database()
+    db.create_table("Orders", [("id", TYPE_INT), ("status", TYPE_STRING), ("total", TYPE_FLOAT)])
+    db.set_primary_key("Orders", "id")
+    statuses = ["новый", "оплачен", "отправлен", None]
+    db.insert_many("Orders", [(i, statuses[i % 4], i * 1.5) for i in range(3000)])
+    return db
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_compressed_save_and_load(tmp_path, codec):
+    db = make_db()
+    expected = snapshot_state(db)
+    plain = tmp_path / "db.mydb"
+    packed = tmp_path / ("db.mydb" + codec_suffix(codec))
+    db.save_to_file(str(plain))
+    db.save_to_file(str(packed), compress=codec)
+    assert codec_of_file(str(packed)) == codec
+    assert packed.stat().st_size < plain.stat().st_size / 4
+    assert sorted(os.listdir(tmp_path)) == sorted([plain.name, packed.name])
+
+    db.load_from_file(str(packed))
+    assert snapshot_state(db) == expected
+    assert db.tables["Orders"].get_primary_key() == "id"
+    with pytest.raises(Exception):
+        db.load_from_file(str(packed), lazy=True)
+
+
+def test_compressed_json(tmp_path):
+    db = make_db()
+    expected = snapshot_state(db)
+    path = str(tmp_path / "db.json.gz")
+    db.save_to_file(path, compress="zlib")
+    db.load_from_file(path)
+    assert snapshot_state(db) == expected
+
+
+def test_compressed_backup_chain(tmp_path):
+    db = make_db()
+    chain = BackupChain(str(tmp_path), compress="lzma")
+    base = chain.make()
+    db.update_row("Orders", 5, 1, "возврат")
+    db.insert_row("Orders", [5000, "новый", 1.0])
+    incr = chain.make()
+    chain.wait()
+    assert base.endswith("_full.mydb.xz") and codec_of_file(base) == "lzma"
+    with zipfile.ZipFile(incr) as archive:
+        assert all(info.compress_type == zipfile.ZIP_LZMA
+                   for info in archive.infolist() if info.filename != MANIFEST)
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(base), os.path.basename(incr)])
+
+    expected = snapshot_state(db)
+    db.delete_row("Orders", 1)
+    db.restore_backup(incr)
+    assert snapshot_state(db) == expected
+    db.restore_backup(base)
+    assert len(db.tables["Orders"].get_all_rows()) == 3000
+
+
+def test_failed_background_write_restarts_chain(tmp_path, monkeypatch):
+    db = make_db()
+    chain = BackupChain(str(tmp_path), compress="zlib")
+
+    def broken(src, dst, codec, level=None):
+        raise IOError("нет места")
+
+    monkeypatch.setattr(backup, "compress_file", broken)
+    chain.make()
+    db.insert_row("Orders", [5000, "новый", 1.0])
+    chain.make()  # инкремент прерванной цепочки тоже не записывается
+    with pytest.raises(IOError):
+        chain.wait()
+    assert chain.base is None and os.listdir(tmp_path) == []
+
+    monkeypatch.undo()
+    path = chain.make()
+    chain.wait()
+    assert path.endswith("_full.mydb.gz")
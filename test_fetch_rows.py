@@ -0,0 +1,30 @@
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_fetch_rows_matches_cell_reads(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Read", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT)], storage)
+    db.insert_many("Read", ((i, f"имя{i}" if i % 7 else None, i / 4) for i in range(300)))
+    for row_id in (0, 10, 11, 150):
+        table.delete(row_id)
+
+    expected = [tuple(table.get_value(row_id, j) for j in range(3)) for row_id in table.get_row_ids()]
+    assert table.get_all_rows() == expected
+    assert table.fetch_rows(20, 25) == expected[20:25]
+    assert table.fetch_rows(290, 1000) == expected[290:]
+    assert table.fetch_rows(5, 2) == []
+    assert table.fetch_rows(0, 2, with_ids=True) == [(1,) + expected[0], (2,) + expected[1]]
+    assert expected[6][1] == ""  # NULL-строка читается как пустая
+
+
+def test_fetch_rows_empty_table():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Empty", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    assert table.get_all_rows() == []
+    assert table.get_all_rows(with_ids=True) == []
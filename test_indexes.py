@@ -0,0 +1,129 @@
+import pytest
+from db_interface import Database, DataValue, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_primary_key_index(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Keys", [("id", TYPE_INT), ("code", TYPE_STRING), ("rate", TYPE_FLOAT)], storage)
+    for i in range(100):
+        db.insert_row("Keys", [i, f"c{i}", i / 2])
+    assert db.set_primary_key("Keys", "id") == 0
+    assert table.get_primary_key() == "id"
+
+    with pytest.raises(Exception):
+        db.insert_row("Keys", [42, "dup", 0.0])
+
+    # Обновление ключа на занятое значение запрещено, на свободное - разрешено
+    dv = DataValue()
+    dv.i = 7
+    assert lib.update_row(table.table_ptr, 3, 0, dv) != 0
+    dv.i = 1000
+    assert lib.update_row(table.table_ptr, 3, 0, dv) == 0
+    db.insert_row("Keys", [3, "reused", 0.0])
+
+    # Удаление освобождает значение ключа, индекс переживает сдвиг строк
+    table.delete(0)
+    db.insert_row("Keys", [0, "again", 0.0])
+    with pytest.raises(Exception):
+        db.insert_row("Keys", [99, "dup", 0.0])
+
+    # Откат вставки освобождает ключ
+    db.begin_transaction()
+    db.insert_row("Keys", [500, "tx", 0.0])
+    db.rollback_transaction()
+    db.insert_row("Keys", [500, "after", 0.0])
+    assert len(table.get_all_rows()) == 102
+
+
+def test_primary_key_rejects_duplicates():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Names", [("name", TYPE_STRING)])
+    db.insert_row("Names", ["a"])
+    db.insert_row("Names", ["a"])
+    assert lib.set_primary_key(table.table_ptr, b"name") != 0
+    assert table.get_primary_key() is None
+    table.delete(1)
+    assert lib.set_primary_key(table.table_ptr, b"name") == 0
+    with pytest.raises(Exception):
+        db.insert_row("Names", ["a"])
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_foreign_key_lookup_follows_parent_changes(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    parent = db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)], storage)
+    db.create_table("Employees", [("id", TYPE_INT), ("department_id", TYPE_INT)])
+    db.add_foreign_key("Employees", "department_id", "Departments", "id")
+    for i in range(50):
+        db.insert_row("Departments", [i, f"d{i}"])
+
+    db.insert_row("Employees", [1, 10])
+    with pytest.raises(Exception):
+        db.insert_row("Employees", [2, 77])
+
+    # Индекс связанного столбца уже построен и должен отслеживать изменения
+    db.insert_row("Departments", [77, "new"])
+    db.insert_row("Employees", [2, 77])
+    dv = DataValue()
+    dv.i = 78
+    assert lib.update_row(parent.table_ptr, 50, 0, dv) == 0
+    with pytest.raises(Exception):
+        db.insert_row("Employees", [3, 77])
+    parent.delete(5)
+    with pytest.raises(Exception):
+        db.insert_row("Employees", [3, 5])
+    db.insert_row("Employees", [3, 49])
+
+
+def test_table_lookup_and_drop():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    for i in range(200):
+        db.create_table(f"T{i}", [("id", TYPE_INT)])
+    assert lib.get_table_by_name(None, b"T150").contents.name == b"T150"
+    assert not lib.get_table_by_name(None, b"missing")
+    assert db.create_table("T10", [("id", TYPE_INT)]) is None
+
+    db.create_table("Child", [("t_id", TYPE_INT)])
+    db.add_foreign_key("Child", "t_id", "T7", "id")
+    db.insert_row("T7", [1])
+    db.insert_row("Child", [1])
+    with pytest.raises(Exception):
+        db.drop_table("T7")
+
+    # Удаление и повторное создание таблицы сбрасывает кеш ссылки внешнего ключа
+    for i in range(0, 200, 2):
+        db.drop_table(f"T{i}")
+    assert not lib.get_table_by_name(None, b"T0")
+    assert lib.get_table_by_name(None, b"T199")
+    db.create_table("T0", [("id", TYPE_INT)])
+    db.insert_row("Child", [1])
+    with pytest.raises(Exception):
+        db.insert_row("Child", [2])
+
+
+def test_foreign_key_cache_follows_column_changes():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    parent = db.create_table("Parent", [("extra", TYPE_INT), ("id", TYPE_INT)])
+    db.create_table("Kid", [("parent_id", TYPE_INT)])
+    db.add_foreign_key("Kid", "parent_id", "Parent", "id")
+    db.insert_row("Parent", [100, 1])
+    db.insert_row("Kid", [1])
+    with pytest.raises(Exception):
+        db.insert_row("Kid", [100])
+
+    # После удаления столбца "id" сдвигается на место 0
+    parent.drop_column("extra")
+    db.insert_row("Kid", [1])
+    with pytest.raises(Exception):
+        db.insert_row("Kid", [100])
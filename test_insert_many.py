@@ -0,0 +1,52 @@
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_insert_many_from_generator(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Bulk", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT)], storage)
+    rows = ((i, f"n{i}", i * 0.5) for i in range(2500))
+    assert db.insert_many("Bulk", rows, chunk_size=1000) == 2500
+    assert table.get_num_rows() == 2500
+    assert table.get_all_rows()[1234] == (1234, "n1234", 617.0)
+    assert table.insert_many([(2500, None, 1.0)]) == 1
+    assert table.get_value(2500, 1) == ""
+
+
+def test_insert_many_checks_keys_per_chunk():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    parent = db.create_table("Parents", [("id", TYPE_INT)])
+    child = db.create_table("Children", [("id", TYPE_INT), ("parent_id", TYPE_INT)])
+    db.set_primary_key("Children", "id")
+    db.add_foreign_key("Children", "parent_id", "Parents", "id")
+    db.insert_many("Parents", ([i] for i in range(10)))
+
+    # Дубликат ключа внутри пакета отклоняет весь пакет
+    with pytest.raises(Exception):
+        db.insert_many("Children", [(1, 1), (2, 2), (1, 3)])
+    assert child.get_num_rows() == 0
+    db.insert_many("Children", [(1, 1), (2, 2)])
+
+    # Первый пакет принят, второй нарушает внешний ключ
+    with pytest.raises(Exception):
+        db.insert_many("Children", [(3, 3), (4, 4), (5, 99)], chunk_size=2)
+    assert [row[0] for row in child.get_all_rows()] == [1, 2, 3, 4]
+
+    # Отклонённые строки не занимают идентификаторы
+    assert db.insert_row("Children", [6, 6]) == 4
+
+
+def test_insert_many_in_transaction_rolls_back():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("TxBulk", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    db.begin_transaction()
+    db.insert_many("TxBulk", [(i, str(i)) for i in range(100)])
+    db.rollback_transaction()
+    assert table.get_num_rows() == 0
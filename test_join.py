@@ -0,0 +1,31 @@
+import pytest
+from db_interface import Database, Condition, TYPE_INT, TYPE_STRING, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_join_by_foreign_key(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)], storage)
+    employees = db.create_table("Employees", [("id", TYPE_INT), ("name", TYPE_STRING), ("department_id", TYPE_INT)], storage)
+    db.add_foreign_key("Employees", "department_id", "Departments", "id")
+    db.insert_many("Departments", [(d, f"dep{d}") for d in range(10)])
+    db.insert_many("Employees", [(e, f"emp{e}", e % 10) for e in range(200)])
+    employees.delete(5)
+
+    rows = db.join("Employees", "Departments")
+    assert len(rows) == 199
+    assert rows[:2] == [(0, "emp0", 0, 0, "dep0"), (1, "emp1", 1, 1, "dep1")]
+    assert all(row[2] == row[3] for row in rows)
+
+    names = db.join("Employees", "Departments", columns=["Employees.name", "Departments.name"],
+                    where=Condition("id", "<", 3))
+    assert names == [("emp0", "dep0"), ("emp1", "dep1"), ("emp2", "dep2")]
+    assert db.join("Employees", "Departments", columns=["department_id"],
+                   where=Condition("id", ">", 1000)) == []
+
+    with pytest.raises(Exception):
+        db.join("Employees", "Departments", columns=["name"])
+    with pytest.raises(Exception):
+        db.join("Departments", "Employees")
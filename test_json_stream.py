@@ -0,0 +1,101 @@
+import json
+import pytest
+import json_stream
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, lib
+from json_stream import iter_json_tables
+
+
+def fresh_db():
+    lib.cleanup_database()
+    lib.init_database()
+    return Database()
+
+
+def test_tables_layout_roundtrip(tmp_path, monkeypatch):
+    # Маленький блок чтения: значения и числа разрываются границами блоков
+    monkeypatch.setattr(json_stream, "READ_SIZE", 7)
+    db = fresh_db()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    db.create_table("People", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT),
+                               ("department_id", TYPE_INT)])
+    db.set_primary_key("Departments", "id")
+    db.add_foreign_key("People", "department_id", "Departments", "id")
+    db.insert_many("Departments", [(1, "IT"), (2, "Отдел \"кадров\"")])
+    db.insert_many("People", [(i, f"имя{i}", i * 0.25, 1 + i % 2) for i in range(250)])
+    path = str(tmp_path / "db.json")
+    db.save_to_file(path)
+    expected = {name: t.get_all_rows() for name, t in db.tables.items()}
+
+    calls = []
+    db.load_from_file(path, batch_size=16, progress=lambda done, total: calls.append((done, total)))
+    assert {name: t.get_all_rows() for name, t in db.tables.items()} == expected
+    assert db.tables["Departments"].get_primary_key() == "id"
+    assert db.tables["People"].get_foreign_keys()[0]["referenced_table"] == "Departments"
+    assert calls[-1][0] == calls[-1][1] and len(calls) > 10
+
+
+def test_backup_layout_and_key_order(tmp_path):
+    data = {
+        "A": {"rows": [[1, "x"], [2, None]], "columns_info": [["id", TYPE_INT], ["s", TYPE_STRING]]},
+        "B": {"columns_info": [["v", TYPE_FLOAT]], "rows": [[1.5], [2e3]], "extra": {"k": [1, {"z": []}]},
+              "foreign_keys": []},
+        "Empty": {"columns_info": [["id", TYPE_INT]]},
+    }
+    path = tmp_path / "backup.json"
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    names = [(t.name, list(t.rows)) for t in iter_json_tables(str(path))]
+    assert names == [("A", [[1, "x"], [2, None]]), ("B", [[1.5], [2000.0]]), ("Empty", [])]
+
+    db = fresh_db()
+    db.load_from_file(str(path))
+    assert db.tables["B"].get_all_rows() == [(1.5,), (2000.0,)]
+    assert db.tables["A"].get_num_rows() == 2
+
+
+def test_unconsumed_rows_are_skipped(tmp_path):
+    path = tmp_path / "db.json"
+    path.write_text(json.dumps({"tables": [
+        {"name": "T1", "columns": [{"name": "a", "type": TYPE_INT}], "rows": [[i] for i in range(100)]},
+        {"name": "T2", "columns": [{"name": "b", "type": TYPE_INT}], "rows": [[7]]},
+    ]}), encoding="utf-8")
+    tables = iter_json_tables(str(path))
+    first = next(tables)
+    assert next(first.rows) == [0]
+    second = next(tables)
+    assert (second.name, list(second.rows)) == ("T2", [[7]])
+
+
+def test_truncated_file_raises(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text('{"tables": [{"name": "T", "columns": [{"name": "a", "type": 0}], "rows": [[1], [2',
+                    encoding="utf-8")
+    with pytest.raises(ValueError):
+        for table in iter_json_tables(str(path)):
+            list(table.rows)
+
+
+def test_writer_streams_compact_and_atomic(tmp_path, monkeypatch):
+    db = fresh_db()
+    db.create_table("T", [("id", TYPE_INT), ("s", TYPE_STRING)])
+    db.create_table("Empty", [("x", TYPE_FLOAT)])
+    db.insert_many("T", [(i, f"ё{i}") for i in range(25)])
+    db.delete_row("T", 3)
+    path = tmp_path / "db.json"
+    json_stream.write_json_database(str(path), db.tables, json_stream.LAYOUT_BACKUP, chunk_size=4)
+    text = path.read_text(encoding="utf-8")
+    assert "\n" not in text and ", " not in text and "ё1" in text
+    data = json.loads(text)
+    assert data["T"]["columns_info"] == [["id", TYPE_INT], ["s", TYPE_STRING]]
+    assert data["T"]["rows"] == [list(row) for row in db.tables["T"].get_all_rows()]
+    assert data["Empty"]["rows"] == []
+
+    # Ошибка посреди записи оставляет прежний файл нетронутым
+    def broken(*args):
+        yield "{"
+        raise RuntimeError("сбой")
+    monkeypatch.setattr(json_stream, "iter_json_database", broken)
+    with pytest.raises(RuntimeError):
+        json_stream.write_json_database(str(path), db.tables)
+    assert path.read_text(encoding="utf-8") == text
+    assert not (tmp_path / "db.json.tmp").exists()
@@ -0,0 +1,99 @@
+import threading
+import time
+from db_interface import (Database, TYPE_INT, TYPE_STRING, lib, LOCK_SHARED, LOCK_EXCLUSIVE, LOCK_INTENT_EXCLUSIVE,
+                          LOCK_WHOLE_TABLE, LOCK_OK, LOCK_TIMEOUT, LOCK_DEADLOCK, LOCK_FAILED)
+
+# Номера транзакций для прямых вызовов менеджера - далеко от номеров begin_transaction
+A, B = 100001, 100002
+
+
+def make_db():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Accounts", [("id", TYPE_INT), ("owner", TYPE_STRING)])
+    db.create_table("Audit", [("note", TYPE_STRING)])
+    db.insert_many("Accounts", [(i, f"owner{i}") for i in range(3000)])
+    return db
+
+
+def test_transaction_reuses_locks():
+    db = make_db()
+    table = db.tables["Accounts"].table_ptr
+    db.begin_transaction()
+    for i in range(2000):
+        db.insert_row("Audit", [f"n{i}"])
+    # Все вставки - одна блокировка таблицы
+    assert lib.lock_count() == 1
+    for _ in range(3):
+        db.update_row("Accounts", 5, 1, "x")
+    db.delete_row("Accounts", 6)
+    assert lib.lock_count() == 1 + 1 + 2
+    # Много строк одной таблицы заменяются блокировкой всей таблицы
+    for row_id in range(10, 1500):
+        db.update_row("Accounts", row_id, 1, "y")
+    assert lib.lock_count() == 2
+    db.commit_transaction()
+    assert lib.lock_count() == 0
+    assert lib.lock_held_mode(A, table, LOCK_WHOLE_TABLE) == -1
+
+
+def test_modes_and_timeout():
+    db = make_db()
+    table = db.tables["Accounts"].table_ptr
+    try:
+        assert lib.lock_acquire(A, table, 1, LOCK_SHARED, 0) == LOCK_OK
+        assert lib.lock_acquire(B, table, 1, LOCK_SHARED, 0) == LOCK_OK
+        assert lib.lock_acquire(B, table, 2, LOCK_EXCLUSIVE, 0) == LOCK_OK
+        # Строки под намерениями: таблицу целиком не взять ни в S, ни в X
+        assert lib.lock_acquire(A, table, LOCK_WHOLE_TABLE, LOCK_SHARED, 0) == LOCK_TIMEOUT
+        assert lib.lock_held_mode(A, table, LOCK_WHOLE_TABLE) != LOCK_SHARED
+        start = time.monotonic()
+        assert lib.lock_acquire(A, table, 1, LOCK_EXCLUSIVE, 50) == LOCK_TIMEOUT
+        assert time.monotonic() - start >= 0.04
+        assert lib.lock_acquire(A, table, 3, LOCK_INTENT_EXCLUSIVE, 0) == LOCK_FAILED
+
+        lib.lock_release_all(B)
+        assert lib.lock_acquire(A, table, 1, LOCK_EXCLUSIVE, 0) == LOCK_OK
+        assert lib.lock_held_mode(A, table, 1) == LOCK_EXCLUSIVE
+        assert lib.lock_held_mode(A, table, LOCK_WHOLE_TABLE) == LOCK_INTENT_EXCLUSIVE
+    finally:
+        lib.lock_release_all(A)
+        lib.lock_release_all(B)
+    assert lib.lock_count() == 0
+
+
+def test_waiter_is_woken_and_deadlock_detected():
+    db = make_db()
+    accounts = db.tables["Accounts"].table_ptr
+    audit = db.tables["Audit"].table_ptr
+    assert lib.lock_acquire(A, accounts, LOCK_WHOLE_TABLE, LOCK_EXCLUSIVE, 0) == LOCK_OK
+    assert lib.lock_acquire(B, audit, LOCK_WHOLE_TABLE, LOCK_EXCLUSIVE, 0) == LOCK_OK
+    results = {}
+
+    def wait_for_audit():
+        results["A"] = lib.lock_acquire(A, audit, LOCK_WHOLE_TABLE, LOCK_EXCLUSIVE, 5000)
+
+    waiter = threading.Thread(target=wait_for_audit)
+    waiter.start()
+    try:
+        time.sleep(0.1)
+        # A ждёт B; ожидание B на таблице A замкнуло бы цикл
+        assert lib.lock_acquire(B, accounts, 7, LOCK_EXCLUSIVE, 5000) == LOCK_DEADLOCK
+        lib.lock_release_all(B)
+        waiter.join(5)
+        assert results["A"] == LOCK_OK
+    finally:
+        waiter.join()
+        lib.lock_release_all(A)
+        lib.lock_release_all(B)
+    assert lib.lock_count() == 0
+
+
+def test_dropped_table_forgets_locks():
+    db = make_db()
+    table = db.tables["Audit"].table_ptr
+    assert lib.lock_acquire(A, table, 0, LOCK_EXCLUSIVE, 0) == LOCK_OK
+    db.drop_table("Audit")
+    assert lib.lock_count() == 0
+    lib.lock_release_all(A)
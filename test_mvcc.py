@@ -0,0 +1,133 @@
+import threading
+import time
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, lib
+
+
+def make_db(rows=100):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Accounts", [("id", TYPE_INT), ("owner", TYPE_STRING), ("balance", TYPE_INT)])
+    db.insert_many("Accounts", [(i, f"owner{i}", 100) for i in range(rows)])
+    return db
+
+
+def wait_collected(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while lib.mvcc_version_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return lib.mvcc_version_count()
+
+
+def test_snapshot_ignores_running_transaction():
+    db = make_db()
+    before = db.tables["Accounts"].get_all_rows(with_ids=True)
+    db.begin_transaction()
+    db.update_row("Accounts", 1, 1, "changed")
+    db.update_row("Accounts", 1, 2, 0)
+    db.delete_row("Accounts", 2)
+    db.insert_row("Accounts", [500, "new", 1])
+    db.update_row("Accounts", 100, 2, 7)  # строка самой транзакции: копия не нужна
+
+    with db.read_snapshot() as snapshot:
+        # Транзакция видит свои изменения, снимок - нет
+        assert len(db.tables["Accounts"].get_all_rows()) == 100
+        assert snapshot.fetch_rows("Accounts", with_ids=True, chunk_size=7) == before
+        assert lib.mvcc_version_count() == 2
+        db.commit_transaction()
+        # Начатый до фиксации снимок по-прежнему видит старые данные
+        assert snapshot.fetch_rows("Accounts", with_ids=True) == before
+        with db.read_snapshot() as later:
+            rows = later.fetch_rows("Accounts", with_ids=True)
+            assert rows == db.tables["Accounts"].get_all_rows(with_ids=True)
+            assert rows[1] == (1, 1, "changed", 0) and rows[-1] == (100, 500, "new", 7)
+    assert wait_collected() == 0
+
+
+def test_rollback_and_commit_without_readers_keep_no_versions():
+    db = make_db()
+    db.begin_transaction()
+    for row_id in range(50):
+        db.update_row("Accounts", row_id, 2, 0)
+    assert lib.mvcc_version_count() == 50
+    db.rollback_transaction()
+    assert lib.mvcc_version_count() == 0
+
+    db.begin_transaction()
+    db.delete_row("Accounts", 3)
+    db.commit_transaction()
+    assert lib.mvcc_version_count() == 0
+    with db.read_snapshot() as snapshot:
+        assert len(snapshot.fetch_rows("Accounts")) == 99
+
+
+def test_changes_outside_transaction_and_vacuum():
+    db = make_db(2000)
+    snapshot = db.read_snapshot()
+    db.update_row("Accounts", 0, 2, 1)
+    db.update_row("Accounts", 0, 2, 2)
+    for row_id in range(1, 1500):
+        db.delete_row("Accounts", row_id)
+    db.insert_row("Accounts", [9000, "late", 1])
+    # Надгробия нужны снимку: уплотнение отложено
+    assert db.vacuum_table("Accounts") == 0
+    assert db.tables["Accounts"].get_num_rows() == 502
+
+    rows = snapshot.fetch_rows("Accounts", chunk_size=300)
+    assert len(rows) == 2000 and rows[0] == (0, "owner0", 100)
+    snapshot.close()
+    assert wait_collected() == 0
+    assert db.vacuum_table("Accounts") == 1499
+    with db.read_snapshot() as snapshot:
+        rows = snapshot.fetch_rows("Accounts", with_ids=True)
+        assert rows[0] == (0, 0, "owner0", 2) and rows[-1] == (2000, 9000, "late", 1)
+
+
+def test_schema_change_hides_table_from_older_snapshot():
+    db = make_db()
+    snapshot = db.read_snapshot()
+    try:
+        db.tables["Accounts"].add_column("note", TYPE_STRING, "")
+        with pytest.raises(Exception):
+            snapshot.fetch_rows("Accounts")
+    finally:
+        snapshot.close()
+
+
+def test_readers_run_alongside_long_writer():
+    db = make_db(1000)
+    total = 100 * 1000
+    errors = []
+    reads = [0]
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            with db.read_snapshot() as snapshot:
+                balances = [row[2] for row in snapshot.fetch_rows("Accounts", chunk_size=128)]
+            if sum(balances) != total or len(balances) != 1000:
+                errors.append((len(balances), sum(balances)))
+            reads[0] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    try:
+        table = db.tables["Accounts"]
+        for _ in range(3):
+            # Переводы внутри транзакции: сумма меняется до её конца
+            db.begin_transaction()
+            for row_id in range(0, 1000, 2):
+                table.update(row_id, 2, table.get_value(row_id, 2) - 10)
+                time.sleep(0)
+            for row_id in range(1, 1000, 2):
+                table.update(row_id, 2, table.get_value(row_id, 2) + 10)
+            db.commit_transaction()
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    assert not errors
+    assert reads[0] > 0
+    assert wait_collected() == 0
@@ -0,0 +1,35 @@
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_order_by_matches_python_sort(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Sorted", [("id", TYPE_INT), ("group", TYPE_STRING), ("score", TYPE_FLOAT)], storage)
+    db.insert_many("Sorted", ((i, ["б", "a", "Б", None][i % 4], (i * 37 % 11) / 2) for i in range(500)))
+    table.delete(17)
+
+    rows = table.get_all_rows(with_ids=True)
+    expected = [r[0] for r in sorted(rows, key=lambda r: r[3])]
+    assert table.order_by("score") == expected
+
+    # Устойчивость и несколько ключей: группа по возрастанию, балл по убыванию
+    expected = [r[0] for r in sorted(sorted(rows, key=lambda r: r[3], reverse=True), key=lambda r: r[2])]
+    assert table.order_by("group", ("score", True)) == expected
+
+    ids = table.where(("id", "<", 40))
+    assert table.order_by(("id", True), row_ids=ids) == sorted(ids, reverse=True)
+
+
+def test_sort_table_index():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Small", [("v", TYPE_INT)])
+    db.insert_many("Small", ([v] for v in (3, 1, 2, 1)))
+    from ctypes import c_int
+    out = (c_int * 4)()
+    assert lib.sort_table_index(table.table_ptr, 0, 1, out) == 4
+    assert list(out) == [0, 2, 1, 3]
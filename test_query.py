@@ -0,0 +1,132 @@
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, lib
+from query import QueryError
+
+
+def make_db():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    db.create_table("Employees", [("id", TYPE_INT), ("name", TYPE_STRING),
+                                  ("salary", TYPE_FLOAT), ("department_id", TYPE_INT)])
+    db.add_foreign_key("Employees", "department_id", "Departments", "id")
+    db.insert_many("Departments", [(d, f"Dep {d}") for d in range(5)])
+    db.insert_many("Employees", [(e, f"Emp {e}", 30000.0 + (e * 37) % 20000, e % 5) for e in range(1000)])
+    return db
+
+
+def test_select_where_order_limit():
+    db = make_db()
+    rows = [(e, f"Emp {e}", 30000.0 + (e * 37) % 20000, e % 5) for e in range(1000)]
+    expected = sorted((r for r in rows if r[2] > 40000), key=lambda r: r[2])[:50]
+    sql = "SELECT name, salary FROM Employees WHERE salary > 40000 ORDER BY salary LIMIT 50"
+    assert db.query(sql) == [(r[1], r[2]) for r in expected]
+    assert "top-50 heap select" in db.explain(sql)
+    assert "native scan" in db.explain(sql)
+
+    sql = "SELECT id FROM Employees WHERE (department_id = 1 OR name LIKE 'Emp 99%') AND id BETWEEN 90 AND 1000 " \
+          "ORDER BY department_id DESC, id LIMIT 5 OFFSET 2"
+    matching = [r for r in rows if (r[3] == 1 or r[1].startswith("Emp 99")) and 90 <= r[0] <= 1000]
+    matching.sort(key=lambda r: (-r[3], r[0]))
+    assert db.query(sql) == [(r[0],) for r in matching[2:7]]
+    assert db.query("SELECT * FROM Departments WHERE name ILIKE '%DEP 3%'") == [(3, "Dep 3")]
+
+
+def test_index_lookup_plan():
+    db = make_db()
+    sql = "SELECT name FROM Employees WHERE id = 42 AND salary < 100000"
+    assert "native scan" in db.explain(sql)
+    db.set_primary_key("Employees", "id")
+    plan = db.explain(sql)
+    assert "index lookup Employees (unique)" in plan and "filter" in plan
+    assert db.query(sql) == [("Emp 42",)]
+    assert db.query("SELECT name FROM Employees WHERE id = 42 AND salary > 100000") == []
+
+
+def test_join_query():
+    db = make_db()
+    sql = ("SELECT Employees.name, Departments.name FROM Employees JOIN Departments "
+           "WHERE Employees.id < 3 AND Departments.name != 'Dep 1' ORDER BY Employees.id DESC")
+    assert db.query(sql) == [("Emp 2", "Dep 2"), ("Emp 0", "Dep 0")]
+    plan = db.explain(sql)
+    assert "hash join Employees.department_id = Departments.id" in plan
+    assert "native scan Employees" in plan
+    reverse = db.query("SELECT Departments.id, Employees.id FROM Departments JOIN Employees "
+                       "ON Departments.id = Employees.department_id WHERE Employees.id = 7")
+    assert reverse == [(2, 7)]
+
+
+def test_fractional_literal_on_int_column():
+    db = make_db()
+    assert db.query("SELECT id FROM Employees WHERE id < 2.5") == [(0,), (1,), (2,)]
+    assert db.query("SELECT id FROM Employees WHERE id > 997.5") == [(998,), (999,)]
+    assert db.query("SELECT id FROM Employees WHERE id = ?", 3.7) == []
+    # Индекс и проверка остатка условий тоже не отбрасывают дробную часть
+    db.set_primary_key("Employees", "id")
+    assert db.query("SELECT id FROM Employees WHERE id = 3.7") == []
+    assert db.query("SELECT id FROM Employees WHERE id = 3 AND department_id < 3.5") == [(3,)]
+    assert db.query("SELECT id FROM Employees WHERE id = 4 AND department_id < 3.5") == []
+    assert len(db.query("SELECT id FROM Employees WHERE id < 3000000000")) == 1000
+    assert db.query("SELECT id FROM Employees WHERE id > ?", 3_000_000_000) == []
+    assert db.query("SELECT id FROM Employees WHERE id = ?", 2 ** 32 + 3) == []
+    assert db.query("SELECT id FROM Employees WHERE id = 3 AND department_id > -3000000000") == [(3,)]
+
+
+def test_bad_literal_names_column():
+    db = make_db()
+    for sql, params in [("SELECT id FROM Employees WHERE id = 'x'", ()),
+                        ("SELECT id FROM Employees WHERE salary > ?", ("много",)),
+                        ("SELECT id FROM Employees WHERE id BETWEEN 1 AND 'x'", ()),
+                        ("SELECT Employees.id FROM Employees JOIN Departments WHERE Departments.id = 'x'", ())]:
+        with pytest.raises(QueryError, match="id|salary"):
+            db.query(sql, *params)
+    db.set_primary_key("Employees", "id")
+    with pytest.raises(QueryError, match="Employees.id"):
+        db.query("SELECT id FROM Employees WHERE id = ?", "x")
+
+
+def test_query_errors():
+    db = make_db()
+    with pytest.raises(QueryError):
+        db.query("SELECT name FROM Missing")
+    with pytest.raises(QueryError):
+        db.query("SELECT missing FROM Employees")
+    with pytest.raises(QueryError):
+        db.query("SELECT name FROM Employees JOIN Departments WHERE name = 'x'")
+    with pytest.raises(QueryError):
+        db.query("SELECT name FROM Employees WHERE name LIKE '%x'")
+    with pytest.raises(QueryError):
+        db.query("SELECT name FROM Employees LIMIT")
+
+
+def test_prepared_statements_follow_schema_changes():
+    db = make_db()
+    statement = db.prepare("SELECT name FROM Employees WHERE id = ? AND salary > ?")
+    assert db.prepare("SELECT name FROM Employees WHERE id = ? AND salary > ?") is statement
+    assert statement.execute(7, 0) == [("Emp 7",)]
+    plan = statement.plan
+    assert statement.execute(8, 0) == [("Emp 8",)] and statement.plan is plan
+    assert "native scan" in statement.explain()
+
+    # Новый индекс и новые столбцы меняют версию схемы - план перестраивается
+    db.set_primary_key("Employees", "id")
+    assert statement.execute(9, 100000) == []
+    assert statement.plan is not plan and "index lookup" in statement.explain()
+    db.tables["Employees"].add_column("bonus", TYPE_INT, 0)
+    assert db.query("SELECT bonus FROM Employees WHERE id = ?", 3) == [(0,)]
+    with pytest.raises(QueryError):
+        statement.execute(1)
+
+    insert = db.prepare("INSERT INTO Employees (id, name, department_id) VALUES (?, ?, 2)")
+    row_id = insert.execute(5000, "New")
+    assert db.query("SELECT name, salary, department_id, bonus FROM Employees WHERE id = 5000") == \
+        [("New", 0.0, 2, 0)]
+    assert db.tables["Employees"].get_value(row_id, 1) == "New"
+    db.tables["Employees"].drop_column("bonus")
+    insert.execute(5001, "Other")
+    with pytest.raises(Exception):
+        insert.execute(5001, "Duplicate")
+    with pytest.raises(Exception):
+        db.insert_row("Employees", [5002, "Bad", 0.0, 99])
+    assert db.query("SELECT id FROM Employees WHERE name = ?", "Other") == [(5001,)]
@@ -0,0 +1,118 @@
+import pytest
+from db_interface import Database, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+def _fill(db, name, storage):
+    table = db.create_table(name, [("id", TYPE_INT), ("name", TYPE_STRING), ("salary", TYPE_FLOAT)], storage)
+    for i in range(25):
+        db.insert_row(name, [i, f"emp{i}", 1000.0 + i])
+    return table
+
+
+def test_columnar_storage_matches_row_storage():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    row_table = _fill(db, "RowLayout", STORAGE_ROW)
+    col_table = _fill(db, "ColumnLayout", STORAGE_COLUMNAR)
+
+    for table in (row_table, col_table):
+        table.update(3, 1, "renamed")
+        table.update(4, 2, 5.5)
+        table.delete(0)
+        table.add_column("bonus", TYPE_INT, 7)
+        table.drop_column("salary")
+
+    assert col_table.get_all_rows() == row_table.get_all_rows()
+    rows = col_table.get_all_rows()
+    assert len(rows) == 24
+    assert rows[0] == (1, "emp1", 7)
+    assert rows[2] == (3, "renamed", 7)
+
+
+def test_columnar_transaction_rollback():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = _fill(db, "ColumnTx", STORAGE_COLUMNAR)
+
+    db.begin_transaction()
+    db.insert_row("ColumnTx", [100, "temp", 1.0])
+    db.update_row("ColumnTx", 1, 1, "changed")
+    db.rollback_transaction()
+
+    rows = table.get_all_rows()
+    assert len(rows) == 25
+    assert rows[1] == (1, "emp1", 1001.0)
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_delete_keeps_row_ids_stable(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = _fill(db, "Tombstones", storage)
+    db.set_primary_key("Tombstones", "id")
+
+    for row_id in (0, 5, 6, 24):
+        assert table.delete(row_id) == 0
+    assert lib.delete_row(table.table_ptr, 5) != 0  # повторное удаление
+    assert table.get_num_rows() == 21
+    assert table.get_value(7, 1) == "emp7"
+    assert 5 not in table.get_row_ids()
+
+    # Значение ключа удалённой строки снова свободно
+    assert db.insert_row("Tombstones", [5, "again", 0.0]) == 25
+
+    # Уплотнение не меняет идентификаторы и сохраняет индексы
+    assert db.vacuum_table("Tombstones") == 4
+    assert table.table_ptr.contents.num_deleted == 0
+    assert table.get_all_rows(with_ids=True)[:2] == [(1, 1, "emp1", 1001.0), (2, 2, "emp2", 1002.0)]
+    assert table.get_value(25, 1) == "again"
+    table.update(7, 1, "seven")
+    assert table.get_value(7, 1) == "seven"
+    with pytest.raises(Exception):
+        db.insert_row("Tombstones", [7, "dup", 0.0])
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_delete_rollback_restores_row(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = _fill(db, "DeleteTx", storage)
+    db.set_primary_key("DeleteTx", "id")
+
+    db.begin_transaction()
+    db.delete_row("DeleteTx", 3)
+    db.update_row("DeleteTx", 4, 1, "changed")
+    with pytest.raises(Exception):
+        db.vacuum_table("DeleteTx")
+    db.rollback_transaction()
+
+    assert table.get_num_rows() == 25
+    assert table.get_all_rows(with_ids=True)[3] == (3, 3, "emp3", 1003.0)
+    assert table.get_value(4, 1) == "emp4"
+    with pytest.raises(Exception):
+        db.insert_row("DeleteTx", [3, "dup", 0.0])
+
+    db.begin_transaction()
+    db.delete_row("DeleteTx", 3)
+    db.commit_transaction()
+    assert table.get_num_rows() == 24
+    assert db.vacuum_table("DeleteTx") == 1
+
+
+def test_mass_delete_vacuums_automatically():
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("Mass", [("id", TYPE_INT)])
+    for i in range(3000):
+        db.insert_row("Mass", [i])
+    for row_id in range(2000):
+        table.delete(row_id)
+    t = table.table_ptr.contents
+    assert t.num_deleted < 1024
+    assert table.get_num_rows() == 1000
+    assert table.get_all_rows()[0] == (2000,)
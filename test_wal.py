@@ -0,0 +1,112 @@
+import os
+import shutil
+import pytest
+from db_interface import TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_COLUMNAR, lib
+from conftest import new_database, snapshot_state
+
+
+def reopen(db, path, **kwargs):
+    # Как после перезапуска: загрузка снимка заменяет всё содержимое базы
+    replayed = db.enable_wal(path, **kwargs)
+    return db, replayed
+
+
+def make_db(path):
+    db = new_database()
+    db.create_table("Departments", [("id", TYPE_INT), ("name", TYPE_STRING)])
+    db.create_table("People", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT),
+                               ("department_id", TYPE_INT)], STORAGE_COLUMNAR)
+    db.set_primary_key("Departments", "id")
+    db.add_foreign_key("People", "department_id", "Departments", "id")
+    db.insert_many("Departments", [(1, "IT"), (2, "HR")])
+    assert db.enable_wal(path) == 0
+    assert os.path.exists(path)
+    return db
+
+
+def test_commits_are_replayed(tmp_path):
+    path = str(tmp_path / "db.mydb")
+    db = make_db(path)
+    wal_size = os.path.getsize(path + ".wal")
+
+    with db:
+        db.insert_row("People", [1, "Анна", 1.5, 1])
+        db.insert_row("People", [2, None, 2.5, 2])
+    # Фиксация одной строки - одна небольшая запись в журнале
+    assert 0 < os.path.getsize(path + ".wal") - wal_size < 200
+
+    db.begin_transaction()
+    db.insert_row("People", [3, "отменено", 0.0, 1])
+    db.rollback_transaction()
+    db.insert_row("People", [4, "после отката", 4.0, 2])
+    db.update_row("People", 0, 1, "Анна Б.")
+    db.delete_row("People", 1)
+    db.update_row("Departments", 1, 1, None)
+    expected = snapshot_state(db)
+
+    db, replayed = reopen(db, path)
+    assert replayed == 5
+    assert snapshot_state(db) == expected
+    assert db.insert_row("People", [5, "дальше", 5.0, 1]) == 4
+    with pytest.raises(Exception):
+        db.insert_row("Departments", [1, "dup"])
+
+    # Журнал продолжает дописываться после повторения
+    expected = snapshot_state(db)
+    db, replayed = reopen(db, path, lazy=True)
+    assert replayed == 6
+    assert snapshot_state(db) == expected
+    db.disable_wal()
+
+
+def test_torn_tail_and_checkpoint(tmp_path):
+    path = str(tmp_path / "db.mydb")
+    db = make_db(path)
+    for i in range(10):
+        db.insert_row("People", [i, f"p{i}", i / 2, 1 + i % 2])
+    expected = snapshot_state(db)
+    lib.wal_close()
+
+    # Оборванная при сбое запись отбрасывается
+    with open(path + ".wal", "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x01\x02")
+    db, replayed = reopen(db, path, group_commit=4)
+    assert replayed == 10
+    assert snapshot_state(db) == expected
+    db.insert_row("People", [10, "p10", 5.0, 1])
+    expected = snapshot_state(db)
+
+    stale = str(tmp_path / "stale.wal")
+    shutil.copy(path + ".wal", stale)
+    db.checkpoint()
+    assert os.path.getsize(path + ".wal") == 16
+
+    # Сбой между сохранением снимка и очисткой журнала: старый журнал уже в снимке
+    lib.wal_close()
+    shutil.copy(stale, path + ".wal")
+    db, replayed = reopen(db, path)
+    assert replayed == 0
+    assert snapshot_state(db) == expected
+    db.disable_wal()
+
+
+def test_schema_change_forces_checkpoint(tmp_path):
+    path = str(tmp_path / "db.mydb")
+    db = make_db(path)
+    db.insert_row("Departments", [3, "Ops"])
+    db.create_table("Projects", [("id", TYPE_INT)])
+    db.tables["Departments"].add_column("floor", TYPE_INT, 7)
+    with db:
+        db.insert_row("Projects", [42])
+    assert os.path.getsize(path + ".wal") == 16
+    db.update_row("Departments", 2, 2, 9)
+    expected = snapshot_state(db)
+
+    db, replayed = reopen(db, path)
+    assert replayed == 1
+    assert snapshot_state(db) == expected
+    db.begin_transaction()
+    with pytest.raises(Exception):
+        db.checkpoint()
+    db.rollback_transaction()
+    db.disable_wal()
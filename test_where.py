@@ -0,0 +1,103 @@
+import pytest
+from db_interface import Database, Condition, TYPE_INT, TYPE_STRING, TYPE_FLOAT, STORAGE_ROW, STORAGE_COLUMNAR, lib
+
+
+def _people(storage):
+    lib.cleanup_database()
+    lib.init_database()
+    db = Database()
+    table = db.create_table("People", [("id", TYPE_INT), ("name", TYPE_STRING), ("score", TYPE_FLOAT)], storage)
+    names = ["Анна", "Андрей", "Boris", "bob", "Ёлка", None]
+    db.insert_many("People", ((i, names[i % 6], i * 1.5) for i in range(60)))
+    return db, table
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_numeric_predicates(storage):
+    db, table = _people(storage)
+    assert table.where(("id", "=", 7)) == [7]
+    assert table.where(("id", "<", 3)) == [0, 1, 2]
+    assert table.where(("id", "between", 10, 12)) == [10, 11, 12]
+    assert table.where(("score", ">=", 85.5)) == [57, 58, 59]
+    assert table.where(("id", "contains", "5")) == [5, 15, 25, 35, 45, 50, 51, 52, 53, 54, 55, 56, 57, 58, 59]
+    table.delete(11)
+    assert table.where(("id", "between", 10, 12)) == [10, 12]
+    with pytest.raises(ValueError):
+        table.where(("score", "prefix", "1"))
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_float_contains_matches_displayed_value(storage):
+    db, table = _people(storage)
+    db.insert_many("People", [(60, "x", 0.1), (61, "y", 1e20), (62, "z", -2.0)])
+    # Подстрока записи, которую показывает Python (и интерфейс): repr(float)
+    expected = [row[0] for row in table.get_all_rows(with_ids=True) if "1.5" in repr(row[3])]
+    assert table.where(("score", "contains", "1.5")) == expected
+    assert 1 in expected and 61 not in expected
+    assert table.where(("score", "contains", ".0")) == [
+        row[0] for row in table.get_all_rows(with_ids=True) if ".0" in repr(row[3])]
+    assert table.where(("score", "contains", "0.10000000149")) == [60]
+    assert table.where(("score", "contains", "e+20")) == [61]
+    assert table.where(("score", "contains", "-2.0")) == [62]
+
+
+@pytest.mark.parametrize("storage", [STORAGE_ROW, STORAGE_COLUMNAR])
+def test_string_predicates(storage):
+    db, table = _people(storage)
+    assert table.where(("name", "=", "bob")) == list(range(3, 60, 6))
+    assert table.where(Condition("name", "=", "BOB", ignore_case=True)) == list(range(3, 60, 6))
+    assert len(table.where(("name", "prefix", "Ан"))) == 20
+    assert table.where(Condition("name", "prefix", "ан", ignore_case=True)) == table.where(("name", "prefix", "Ан"))
+    assert table.where(Condition("name", "contains", "ЛК", ignore_case=True)) == list(range(4, 60, 6))
+    assert table.where(Condition("name", "contains", "o")) == sorted(list(range(2, 60, 6)) + list(range(3, 60, 6)))
+    assert table.where(("name", "=", "")) == list(range(5, 60, 6))  # NULL читается как пустая строка
+
+
+def test_and_or_combinations():
+    db, table = _people(STORAGE_COLUMNAR)
+    boris_or_bob = Condition("name", "prefix", "b", ignore_case=True)
+    assert table.where(boris_or_bob, ("id", "<", 10)) == [2, 3, 8, 9]
+    cond = (Condition("id", "<", 3) | Condition("id", ">", 57)) & Condition("score", "!=", 0.0)
+    assert table.where(cond) == [1, 2, 58, 59]
+    assert table.where(Condition("id", "=", 1) | (Condition("id", ">", 50) & Condition("name", "=", "bob"))) == [1, 51, 57]
+    assert table.fetch_by_ids(table.where(("id", "=", 8)), with_ids=True) == [(8, 8, "Boris", 12.0)]
+    assert table.where() == table.get_row_ids()
+
+
+def test_fractional_literal_on_int_column():
+    db, table = _people(STORAGE_ROW)
+    assert table.where(("id", "=", 3.7)) == []
+    assert table.where(("id", "!=", 3.7)) == table.get_row_ids()
+    assert table.where(("id", "<", 2.5)) == [0, 1, 2]
+    assert table.where(("id", "<=", "2.5")) == [0, 1, 2]
+    assert table.where(("id", ">", 57.5)) == [58, 59]
+    assert table.where(("id", ">=", 57.5)) == [58, 59]
+    assert table.where(("id", "between", 1.5, 3.5)) == [2, 3]
+    assert table.where(("id", "=", 4.0)) == [4]
+    db.set_primary_key("People", "id")
+    assert table.lookup("id", 3.7) == []
+
+
+def test_out_of_range_literal_on_int_column():
+    db, table = _people(STORAGE_ROW)
+    db.insert_many("People", [(2 ** 31 - 1, "max", 0.0), (-2 ** 31, "min", 0.0)])
+    every = table.get_row_ids()
+    for big in (3_000_000_000, 2 ** 32, 1e10, float("inf")):
+        assert table.where(("id", "<", big)) == every
+        assert table.where(("id", "<=", big)) == every
+        assert table.where(("id", ">", big)) == []
+        assert table.where(("id", ">=", big)) == []
+        assert table.where(("id", "=", big)) == []
+        assert table.where(("id", "!=", big)) == every
+        assert table.where(("id", ">", -big)) == every
+        assert table.where(("id", "<", -big)) == []
+        assert table.where(("id", "between", -big, big)) == every
+        assert table.where(("id", "between", big, big + 1)) == []
+    # Границы int32 остаются обычными значениями
+    assert table.where(("id", ">=", 2 ** 31 - 1)) == [60]
+    assert table.where(("id", "<=", -2 ** 31)) == [61]
+    assert table.where(("id", "=", float("nan"))) == []
+    assert table.where(("id", "<", float("nan"))) == []
+    db.set_primary_key("People", "id")
+    assert table.lookup("id", 2 ** 32 + 5) == []
+    assert table.lookup("id", 2 ** 31 - 1) == [60]
@@ -0,0 +1,471 @@
+#include "wal.h"
+#include "snapshot.h"
+#include "binfile.h"
+#include "storage.h"
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
+
+#define WAL_HEADER_SIZE 16
+#define WAL_MAX_RECORD  (1u << 30)
+#define WAL_NULL_STRING 0xFFFFFFFFu
+#define MAX_NAME_LEN    4096
+
+enum { WAL_OP_INSERT = 1, WAL_OP_UPDATE = 2, WAL_OP_DELETE = 3 };
+
+// Операции текущей транзакции, ещё не записанные в журнал
+typedef struct {
+    unsigned char* data;
+    size_t len;
+    size_t cap;
+    uint32_t ops;
+    int error;
+} WalBuffer;
+
+static FILE* wal_file = NULL;
+static char* wal_path = NULL;
+static char* snapshot_path = NULL;
+static int group_size = 1;
+static int unsynced = 0;             // фиксаций после последнего fsync
+static long wal_end = 0;             // конец последней целой записи
+static uint32_t generation = 0;
+static int logged_schema_version = 0;
+static WalBuffer pending = { NULL, 0, 0, 0, 0 };
+
+/* ---------- Буфер операций ---------- */
+
+static void buf_put(WalBuffer* b, const void* data, size_t len) {
+    if (b->error) return;
+    if (b->len + len > b->cap) {
+        size_t cap = b->cap ? b->cap : 256;
+        while (cap < b->len + len) cap *= 2;
+        unsigned char* temp = (unsigned char*)realloc(b->data, cap);
+        if (!temp) {
+            b->error = 1;
+            return;
+        }
+        b->data = temp;
+        b->cap = cap;
+    }
+    memcpy(b->data + b->len, data, len);
+    b->len += len;
+}
+
+static void buf_u8(WalBuffer* b, uint8_t v) {
+    buf_put(b, &v, 1);
+}
+
+static void buf_u32(WalBuffer* b, uint32_t v) {
+    buf_put(b, &v, sizeof(v));
+}
+
+static void buf_str(WalBuffer* b, const char* s, uint32_t len) {
+    buf_u32(b, len);
+    buf_put(b, s, len);
+}
+
+static void buf_value(WalBuffer* b, int type, DataValue value) {
+    buf_u8(b, (uint8_t)type);
+    if (type != TYPE_STRING) {
+        buf_put(b, &value, 4);  // i или f
+    } else if (!value.s) {
+        buf_u32(b, WAL_NULL_STRING);
+    } else {
+        buf_str(b, value.s, (uint32_t)strlen(value.s));
+    }
+}
+
+// Начинает операцию: при первой операции резервирует место под их число
+static void begin_op(int kind, const Table* table, int row_id) {
+    if (pending.len == 0) buf_u32(&pending, 0);
+    buf_u8(&pending, (uint8_t)kind);
+    buf_str(&pending, table->name, (uint32_t)strlen(table->name));
+    buf_u32(&pending, (uint32_t)row_id);
+    pending.ops++;
+}
+
+int wal_is_open(void) {
+    return wal_file != NULL;
+}
+
+void wal_log_insert(Table* table, int slot) {
+    if (!wal_file) return;
+    begin_op(WAL_OP_INSERT, table, table->row_ids[slot]);
+    buf_u32(&pending, (uint32_t)table->num_columns);
+    for (int j = 0; j < table->num_columns; j++) {
+        buf_value(&pending, table->columns[j].type, storage_get(table, slot, j));
+    }
+}
+
+void wal_log_update(Table* table, int slot, int col_index) {
+    if (!wal_file) return;
+    begin_op(WAL_OP_UPDATE, table, table->row_ids[slot]);
+    buf_u32(&pending, (uint32_t)col_index);
+    buf_value(&pending, table->columns[col_index].type, storage_get(table, slot, col_index));
+}
+
+void wal_log_delete(Table* table, int row_id) {
+    if (!wal_file) return;
+    begin_op(WAL_OP_DELETE, table, row_id);
+}
+
+void wal_discard(void) {
+    pending.len = 0;
+    pending.ops = 0;
+    pending.error = 0;
+}
+
+/* ---------- Файл журнала ---------- */
+
+static int sync_file(FILE* f) {
+    if (fflush(f) != 0) return -1;
+#ifdef _WIN32
+    return _commit(_fileno(f));
+#else
+    return fsync(fileno(f));
+#endif
+}
+
+static int truncate_file(FILE* f, long size) {
+    if (fflush(f) != 0) return -1;
+#ifdef _WIN32
+    return _chsize(_fileno(f), size);
+#else
+    return ftruncate(fileno(f), (off_t)size);
+#endif
+}
+
+// Создаёт пустой журнал заданного поколения
+static FILE* create_log(const char* path, uint32_t gen) {
+    FILE* f = fopen(path, "wb");
+    if (!f) return NULL;
+    uint32_t header[3] = { WAL_VERSION, BINFILE_BYTE_ORDER, gen };
+    if (fwrite(WAL_MAGIC, 1, 4, f) != 4 || fwrite(header, sizeof(header), 1, f) != 1 || sync_file(f) != 0) {
+        fclose(f);
+        return NULL;
+    }
+    return f;
+}
+
+static int checkpoint(void) {
+    uint32_t gen = generation + 1;
+    wal_discard();
+    // Сначала снимок с новой отметкой: до очистки журнала старый журнал
+    // распознаётся как уже вошедший в снимок
+    if (binfile_save_database(NULL, snapshot_path, gen) != 0) {
+        fprintf(stderr, "Контрольная точка: не удалось сохранить снимок %s\n", snapshot_path);
+        return -1;
+    }
+    fclose(wal_file);
+    wal_file = create_log(wal_path, gen);
+    if (!wal_file) {
+        fprintf(stderr, "Контрольная точка: не удалось создать журнал %s\n", wal_path);
+        return -1;
+    }
+    generation = gen;
+    wal_end = WAL_HEADER_SIZE;
+    unsynced = 0;
+    logged_schema_version = get_schema_version();
+    return 0;
+}
+
+/*
+ * Записывает операции транзакции одной записью. Если схема изменилась после
+ * последней записи, вместо записи выполняется контрольная точка (снимок уже
+ * содержит изменения транзакции). Возвращает 0 или -1 (транзакцию нужно откатить).
+ */
+int wal_commit(void) {
+    if (!wal_file) return 0;
+    if (get_schema_version() != logged_schema_version) {
+        return checkpoint();
+    }
+    if (pending.error) {
+        fprintf(stderr, "Ошибка выделения памяти для записи журнала\n");
+        wal_discard();
+        return -1;
+    }
+    if (pending.ops == 0) return 0;
+
+    memcpy(pending.data, &pending.ops, sizeof(pending.ops));
+    uint32_t head[2] = { (uint32_t)pending.len, binfile_crc32(0, pending.data, pending.len) };
+    int error = fwrite(head, sizeof(head), 1, wal_file) != 1 ||
+                fwrite(pending.data, 1, pending.len, wal_file) != pending.len ||
+                fflush(wal_file) != 0;
+    if (!error && ++unsynced >= group_size) {
+        error = sync_file(wal_file) != 0;
+        unsynced = 0;
+    }
+    wal_discard();
+    if (error) {
+        // Оборванная запись отбросила бы при повторении и все следующие
+        fprintf(stderr, "Ошибка записи журнала %s\n", wal_path);
+        truncate_file(wal_file, wal_end);
+        fseek(wal_file, wal_end, SEEK_SET);
+        return -1;
+    }
+    wal_end = ftell(wal_file);
+    return 0;
+}
+
+/* ---------- Повторение журнала ---------- */
+
+typedef struct {
+    const unsigned char* p;
+    size_t left;
+    int error;
+} Cursor;
+
+static const unsigned char* take(Cursor* c, size_t len) {
+    if (c->error || len > c->left) {
+        c->error = 1;
+        return NULL;
+    }
+    const unsigned char* p = c->p;
+    c->p += len;
+    c->left -= len;
+    return p;
+}
+
+static uint32_t take_u32(Cursor* c) {
+    uint32_t v = 0;
+    const unsigned char* p = take(c, sizeof(v));
+    if (p) memcpy(&v, p, sizeof(v));
+    return v;
+}
+
+// Строка записи как новая строка с нулём в конце (NULL для отсутствующей)
+static char* take_str(Cursor* c, uint32_t max_len, int* is_null) {
+    uint32_t len = take_u32(c);
+    *is_null = len == WAL_NULL_STRING;
+    if (c->error || *is_null) return NULL;
+    if (len > max_len) {
+        c->error = 1;
+        return NULL;
+    }
+    const unsigned char* p = take(c, len);
+    char* s = p ? (char*)malloc((size_t)len + 1) : NULL;
+    if (!s) {
+        c->error = 1;
+        return NULL;
+    }
+    memcpy(s, p, len);
+    s[len] = '\0';
+    return s;
+}
+
+// Значение столбца; строка выделяется malloc и освобождается вызывающим
+static DataValue take_value(Cursor* c, int type) {
+    DataValue value = {0};
+    const unsigned char* tag = take(c, 1);
+    if (!tag || *tag != type) {
+        c->error = 1;
+        return value;
+    }
+    if (type == TYPE_STRING) {
+        int is_null;
+        value.s = take_str(c, WAL_MAX_RECORD, &is_null);
+    } else {
+        const unsigned char* p = take(c, 4);
+        if (p) memcpy(&value, p, 4);
+    }
+    return value;
+}
+
+static int apply_record(const unsigned char* data, size_t len) {
+    Cursor c = { data, len, 0 };
+    uint32_t ops = take_u32(&c);
+    for (uint32_t k = 0; k < ops && !c.error; k++) {
+        const unsigned char* kind = take(&c, 1);
+        int is_null;
+        char* name = take_str(&c, MAX_NAME_LEN, &is_null);
+        int row_id = (int)take_u32(&c);
+        Table* table = name ? get_table_by_name(NULL, name) : NULL;
+        if (c.error || !table) {
+            fprintf(stderr, "Журнал: таблица %s не найдена\n", name ? name : "?");
+            free(name);
+            return -1;
+        }
+        free(name);
+
+        int result = -1;
+        if (*kind == WAL_OP_INSERT) {
+            uint32_t ncols = take_u32(&c);
+            DataValue* values = ncols == (uint32_t)table->num_columns
+                ? (DataValue*)calloc(ncols, sizeof(DataValue)) : NULL;
+            for (uint32_t j = 0; values && j < ncols && !c.error; j++) {
+                values[j] = take_value(&c, table->columns[j].type);
+            }
+            // Идентификаторы откатанных вставок пропущены и в исходной базе
+            if (values && !c.error && storage_skip_ids(table, row_id) == 0 &&
+                insert_rows(table, values, 1) == 1) {
+                result = 0;
+            }
+            for (uint32_t j = 0; values && j < ncols; j++) {
+                if (table->columns[j].type == TYPE_STRING) free(values[j].s);
+            }
+            free(values);
+        } else if (*kind == WAL_OP_UPDATE) {
+            uint32_t col = take_u32(&c);
+            if (!c.error && col < (uint32_t)table->num_columns) {
+                DataValue value = take_value(&c, table->columns[col].type);
+                if (!c.error) result = update_row(table, row_id, (int)col, value);
+                if (table->columns[col].type == TYPE_STRING) free(value.s);
+            }
+        } else if (*kind == WAL_OP_DELETE) {
+            result = delete_row(table, row_id);
+        }
+        if (c.error || result != 0) {
+            fprintf(stderr, "Журнал: не удалось применить операцию над строкой %d таблицы %s\n",
+                    row_id, table->name);
+            return -1;
+        }
+    }
+    return c.error || c.left != 0 ? -1 : 0;
+}
+
+/*
+ * Применяет записи журнала поколения mark. В *end возвращает конец последней
+ * целой записи (0 - журнал нужно создать заново). Возвращает число записей
+ * или -1, если целую запись не удалось применить.
+ */
+static int replay(FILE* f, uint32_t mark, long* end) {
+    unsigned char magic[4];
+    uint32_t header[3];
+    *end = 0;
+    if (fread(magic, 1, 4, f) != 4 || fread(header, sizeof(header), 1, f) != 1 ||
+        memcmp(magic, WAL_MAGIC, 4) != 0 || header[0] != WAL_VERSION ||
+        header[1] != BINFILE_BYTE_ORDER || header[2] != mark) {
+        return 0;  // пустой, чужой или уже вошедший в снимок журнал
+    }
+    *end = WAL_HEADER_SIZE;
+
+    int applied = 0;
+    uint32_t head[2];
+    while (fread(head, sizeof(head), 1, f) == 1) {
+        if (head[0] < 4 || head[0] > WAL_MAX_RECORD) break;
+        unsigned char* data = (unsigned char*)malloc(head[0]);
+        if (!data) return -1;
+        if (fread(data, 1, head[0], f) != head[0] || binfile_crc32(0, data, head[0]) != head[1]) {
+            free(data);
+            break;  // запись оборвана при сбое
+        }
+        int result = apply_record(data, head[0]);
+        free(data);
+        if (result != 0) return -1;
+        applied++;
+        *end += (long)sizeof(head) + (long)head[0];
+    }
+    return applied;
+}
+
+static char* copy_path(const char* path) {
+    char* copy = (char*)malloc(strlen(path) + 1);
+    if (copy) strcpy(copy, path);
+    return copy;
+}
+
+static int wal_open_locked(const char* path, const char* snapshot, int group_commit) {
+    if (!path || !snapshot) return -1;
+    wal_close();
+
+    uint32_t mark = 0;
+    int have_snapshot = binfile_read_mark(snapshot, &mark) == 0;
+    long end = 0;
+    int applied = 0;
+    FILE* f = fopen(path, "rb");
+    if (f) {
+        applied = replay(f, mark, &end);
+        fclose(f);
+        if (applied < 0) {
+            fprintf(stderr, "Ошибка применения журнала %s\n", path);
+            return -1;
+        }
+    }
+
+    // Хвост после последней целой записи отрезается, дальше журнал дописывается
+    if (end == 0) {
+        f = create_log(path, mark);
+    } else {
+        f = fopen(path, "r+b");
+        if (f && (truncate_file(f, end) != 0 || fseek(f, end, SEEK_SET) != 0)) {
+            fclose(f);
+            f = NULL;
+        }
+    }
+    wal_path = copy_path(path);
+    snapshot_path = copy_path(snapshot);
+    if (!f || !wal_path || !snapshot_path) {
+        fprintf(stderr, "Не удалось открыть журнал %s\n", path);
+        if (f) fclose(f);
+        free(wal_path);
+        free(snapshot_path);
+        wal_path = snapshot_path = NULL;
+        return -1;
+    }
+    wal_file = f;
+    wal_end = end ? end : WAL_HEADER_SIZE;
+    generation = mark;
+    group_size = group_commit > 0 ? group_commit : 1;
+    unsynced = 0;
+    logged_schema_version = get_schema_version();
+    wal_discard();
+
+    // Журнал без снимка не на что накладывать: текущее состояние становится снимком
+    if (!have_snapshot && checkpoint() != 0) {
+        wal_close();
+        return -1;
+    }
+    return applied;
+}
+
+API int wal_open(const char* path, const char* snapshot, int group_commit) {
+    lock_mutations();
+    int result = wal_open_locked(path, snapshot, group_commit);
+    unlock_mutations();
+    return result;
+}
+
+static int wal_checkpoint_locked(void) {
+    if (!wal_file) return -1;
+    if (transaction_in_progress()) {
+        fprintf(stderr, "Контрольная точка невозможна во время транзакции\n");
+        return -1;
+    }
+    return checkpoint();
+}
+
+API int wal_checkpoint(void) {
+    lock_mutations();
+    int result = wal_checkpoint_locked();
+    unlock_mutations();
+    return result;
+}
+
+API int wal_flush(void) {
+    if (!wal_file) return -1;
+    if (unsynced == 0) return 0;
+    unsynced = 0;
+    return sync_file(wal_file);
+}
+
+API void wal_close(void) {
+    if (wal_file) {
+        wal_flush();
+        fclose(wal_file);
+        wal_file = NULL;
+    }
+    free(wal_path);
+    free(snapshot_path);
+    wal_path = NULL;
+    snapshot_path = NULL;
+    free(pending.data);
+    pending.data = NULL;
+    pending.cap = 0;
+    wal_discard();
+}
@@ -0,0 +1,52 @@
+#ifndef WAL_H
+#define WAL_H
+
+#include "db_core.h"  // содержит определения DataValue, Column, Table, Database
+
+/*
+ * Журнал упреждающей записи (write-ahead log) для глобальной базы.
+ *
+ * Состояние базы = снимок (двоичный файл, binfile.h) + журнал. Каждая
+ * фиксация транзакции дописывает в журнал одну запись с её операциями;
+ * изменение вне транзакции записывается как транзакция из одной операции.
+ * Контрольная точка сохраняет новый снимок и очищает журнал.
+ *
+ *   заголовок  "MWAL", u32 версия, u32 метка порядка байтов, u32 поколение
+ *   запись     u32 длина, u32 CRC-32 содержимого, содержимое:
+ *              u32 число операций, операции (u8 вид, имя таблицы, i32 идентификатор
+ *              строки; вставка - u32 столбцов и значения, обновление - u32 столбец
+ *              и значение). Значение: u8 тип, затем i32 / f32 / u32 длина + байты
+ *              (длина 0xFFFFFFFF - NULL)
+ *
+ * Поколение журнала совпадает с отметкой снимка, записанной при контрольной
+ * точке. Если процесс прервался между сохранением снимка и очисткой журнала,
+ * поколения различаются, и уже вошедший в снимок журнал не применяется.
+ * Запись с неверной длиной или суммой (оборванная при сбое) и всё после неё
+ * отбрасываются.
+ *
+ * Изменение схемы журналом не описывается: при следующей фиксации после
+ * него вместо записи выполняется контрольная точка.
+ */
+
+#define WAL_MAGIC   "MWAL"
+#define WAL_VERSION 1
+
+// Применяет журнал к уже загруженному снимку и открывает журнал для записи.
+// group_commit - сколько фиксаций объединяется в один fsync (1 - каждая).
+// Если снимка ещё нет, он создаётся. Возвращает число применённых транзакций или -1
+API int wal_open(const char* wal_path, const char* snapshot_path, int group_commit);
+// Сохраняет снимок и очищает журнал; вне транзакции
+API int wal_checkpoint(void);
+// Сбрасывает на диск фиксации, ожидающие общего fsync
+API int wal_flush(void);
+API void wal_close(void);
+
+// Внутренние функции для func.c
+int wal_is_open(void);
+void wal_log_insert(Table* table, int slot);
+void wal_log_update(Table* table, int slot, int col_index);
+void wal_log_delete(Table* table, int row_id);
+int wal_commit(void);
+void wal_discard(void);
+
+#endif // WAL_H